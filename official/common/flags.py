@@ -44,11 +44,12 @@ def define_flags():
       'mode',
       default=None,
       enum_values=[
-          'train', 'eval', 'train_and_eval', 'continuous_eval',
-          'continuous_train_and_eval', 'train_and_validate'
+          'train', 'eval', 'train_and_eval', 'train_and_concurrent_eval',
+          'continuous_eval', 'continuous_train_and_eval', 'train_and_validate'
       ],
       help='Mode to run: `train`, `eval`, `train_and_eval`, '
-      '`continuous_eval`, `continuous_train_and_eval` and '
+      '`train_and_concurrent_eval`, `continuous_eval`, '
+      '`continuous_train_and_eval` and '
       '`train_and_validate` (which is not implemented in '
       'the open source version).')
 
@@ -0,0 +1,273 @@
+# Copyright 2021 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks the input pipelines of a registered experiment.
+
+The train and/or validation inputs of the experiment are built through
+`Task.build_inputs`, without building the model, and iterated for a number of
+batches on the host. For example:
+
+  python3 -m official.common.input_benchmark \
+    --experiment=bert/sentence_prediction \
+    --config_file=path/to/config.yaml \
+    --input_split=train \
+    --num_batches=200 \
+    --sweep_cycle_length=8,16,32
+"""
+
+import itertools
+import json
+import os
+import time
+from typing import Any, Dict, List, Mapping, Sequence
+
+from absl import app
+from absl import flags
+from absl import logging
+import numpy as np
+import tensorflow as tf
+
+# pylint: disable=unused-import
+from official.common import registry_imports
+# pylint: enable=unused-import
+from official.common import flags as tfm_flags
+from official.core import base_task
+from official.core import config_definitions
+from official.core import task_factory
+from official.core import train_utils
+
+FLAGS = flags.FLAGS
+
+# The `DataConfig` fields that can be swept over.
+SWEEPABLE_FIELDS = ('cycle_length', 'block_length', 'shuffle_buffer_size')
+
+
+def _get_batch_size(batch: Any) -> int:
+  """Returns the leading dimension of the first tensor in `batch`."""
+  for tensor in tf.nest.flatten(batch):
+    if tensor.shape.rank:
+      return int(tf.shape(tensor)[0])
+  return 1
+
+
+def _safe_div(numerator: float, denominator: float) -> float:
+  return numerator / denominator if denominator > 0 else 0.0
+
+
+def benchmark_dataset(dataset: tf.data.Dataset,
+                      num_batches: int,
+                      num_warmup_batches: int = 0) -> Dict[str, float]:
+  """Iterates over `dataset` and measures its throughput.
+
+  If the dataset is exhausted early, only the batches actually read are
+  measured, and a warning is logged.
+
+  Args:
+    dataset: The dataset to benchmark.
+    num_batches: The number of batches to time, after the warmup.
+    num_warmup_batches: The number of batches to read (and not time) first,
+      e.g. to fill shuffle buffers.
+
+  Returns:
+    A dictionary with the time to the first batch, the numbers of untimed
+    (first and warmup) and timed batches read, the steady-state throughput in
+    batches and examples per second, percentiles of the per-batch latency, and
+    the number of CPU cores used by the process on average. Rates are 0 if no
+    batches were timed.
+
+  Raises:
+    ValueError: If `num_batches` is not positive or `num_warmup_batches` is
+      negative.
+  """
+  if num_batches <= 0:
+    raise ValueError('`num_batches` should be > 0, got %d.' % num_batches)
+  if num_warmup_batches < 0:
+    raise ValueError(
+        '`num_warmup_batches` should be >= 0, got %d.' % num_warmup_batches)
+
+  start = time.time()
+  iterator = iter(dataset)
+  num_untimed_batches = 0
+  exhausted = False
+  try:
+    next(iterator)
+    num_untimed_batches += 1
+    first_batch_secs = time.time() - start
+    for _ in range(num_warmup_batches):
+      next(iterator)
+      num_untimed_batches += 1
+  except StopIteration:
+    exhausted = True
+    # The time it took to find out that the dataset is empty.
+    if not num_untimed_batches:
+      first_batch_secs = time.time() - start
+
+  latencies = []
+  num_examples = 0
+  start_cpu = os.times()
+  start = time.time()
+  while not exhausted and len(latencies) < num_batches:
+    batch_start = time.time()
+    try:
+      batch = next(iterator)
+    except StopIteration:
+      exhausted = True
+      break
+    latencies.append(time.time() - batch_start)
+    num_examples += _get_batch_size(batch)
+  elapsed = time.time() - start
+  end_cpu = os.times()
+  cpu_secs = ((end_cpu.user - start_cpu.user) +
+              (end_cpu.system - start_cpu.system))
+  if exhausted:
+    logging.warning(
+        'The dataset was exhausted after %d batches, of which %d were timed '
+        'out of the %d requested.', num_untimed_batches + len(latencies),
+        len(latencies), num_batches)
+
+  latencies_ms = np.array(latencies or [0.0]) * 1000
+  return {
+      'first_batch_secs': first_batch_secs,
+      'num_untimed_batches': num_untimed_batches,
+      'num_batches': len(latencies),
+      'batches_per_sec': _safe_div(len(latencies), elapsed),
+      'examples_per_sec': _safe_div(num_examples, elapsed),
+      'batch_latency_ms_p50': float(np.percentile(latencies_ms, 50)),
+      'batch_latency_ms_p90': float(np.percentile(latencies_ms, 90)),
+      'batch_latency_ms_p99': float(np.percentile(latencies_ms, 99)),
+      'batch_latency_ms_max': float(np.max(latencies_ms)),
+      'cpu_cores_used': _safe_div(cpu_secs, elapsed),
+  }
+
+
+def benchmark_task_inputs(task: base_task.Task,
+                          data_config: config_definitions.DataConfig,
+                          num_batches: int,
+                          num_warmup_batches: int = 0) -> Dict[str, float]:
+  """Builds the inputs of `task` for `data_config` and benchmarks them.
+
+  Args:
+    task: The task to build the inputs with.
+    data_config: The `DataConfig` of the inputs, e.g.
+      `params.task.train_data`.
+    num_batches: The number of batches to time, after the warmup.
+    num_warmup_batches: The number of batches to read (and not time) first.
+
+  Returns:
+    The results of `benchmark_dataset`, with the time spent in
+    `task.build_inputs` added as `build_inputs_secs`.
+  """
+  start = time.time()
+  dataset = task.build_inputs(data_config)
+  build_inputs_secs = time.time() - start
+  results = benchmark_dataset(dataset, num_batches, num_warmup_batches)
+  results['build_inputs_secs'] = build_inputs_secs
+  return results
+
+
+def sweep_task_inputs(
+    task: base_task.Task,
+    data_config: config_definitions.DataConfig,
+    sweep: Mapping[str, Sequence[Any]],
+    num_batches: int,
+    num_warmup_batches: int = 0) -> List[Dict[str, Any]]:
+  """Benchmarks the inputs of `task` for every combination of `sweep` values.
+
+  Args:
+    task: The task to build the inputs with.
+    data_config: The base `DataConfig` of the inputs.
+    sweep: A mapping from `DataConfig` field names to the values to try. If
+      empty, only `data_config` itself is benchmarked.
+    num_batches: The number of batches to time for each combination.
+    num_warmup_batches: The number of batches to read (and not time) first.
+
+  Returns:
+    A list with one dictionary per combination, containing the overridden
+    fields under `overrides` and the benchmark results under `results`.
+  """
+  names = list(sweep.keys())
+  all_results = []
+  for values in itertools.product(*[sweep[name] for name in names]):
+    overrides = dict(zip(names, values))
+    logging.info('Benchmarking inputs with %s...', overrides or 'no overrides')
+    results = benchmark_task_inputs(task, data_config.replace(**overrides),
+                                    num_batches, num_warmup_batches)
+    logging.info('Results for %s: %s', overrides, results)
+    all_results.append({'overrides': overrides, 'results': results})
+  return all_results
+
+
+def _get_sweep() -> Dict[str, List[int]]:
+  sweep = {}
+  for name in SWEEPABLE_FIELDS:
+    values = getattr(FLAGS, 'sweep_' + name)
+    if values:
+      sweep[name] = [int(v) for v in values]
+  return sweep
+
+
+def define_flags():
+  """Defines the flags of the input benchmark, in addition to TFM's flags."""
+  flags.DEFINE_enum(
+      'input_split',
+      default='train',
+      enum_values=['train', 'validation', 'both'],
+      help='Which inputs of the experiment to benchmark.')
+  flags.DEFINE_integer(
+      'num_batches', default=100, help='The number of batches to time.')
+  flags.DEFINE_integer(
+      'num_warmup_batches',
+      default=10,
+      help='The number of batches to read before timing.')
+  for name in SWEEPABLE_FIELDS:
+    flags.DEFINE_list(
+        'sweep_' + name,
+        default=None,
+        help='Comma separated values of the DataConfig `%s` to sweep over.' %
+        name)
+  flags.DEFINE_string(
+      'benchmark_output',
+      default=None,
+      help='An optional path to write the results to as JSON.')
+
+
+def main(_):
+  params = train_utils.parse_configuration(FLAGS)
+  task = task_factory.get_task(params.task)
+  splits = {
+      'train': ['train'],
+      'validation': ['validation'],
+      'both': ['train', 'validation']
+  }[FLAGS.input_split]
+
+  all_results = {}
+  for split in splits:
+    data_config = (
+        params.task.train_data
+        if split == 'train' else params.task.validation_data)
+    all_results[split] = sweep_task_inputs(task, data_config, _get_sweep(),
+                                           FLAGS.num_batches,
+                                           FLAGS.num_warmup_batches)
+
+  output = json.dumps(all_results, indent=2)
+  print(output)
+  if FLAGS.benchmark_output:
+    with tf.io.gfile.GFile(FLAGS.benchmark_output, 'w') as f:
+      f.write(output)
+
+
+if __name__ == '__main__':
+  tfm_flags.define_flags()
+  define_flags()
+  app.run(main)
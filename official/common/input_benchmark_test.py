@@ -0,0 +1,84 @@
+# Copyright 2021 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for official.common.input_benchmark."""
+
+import tensorflow as tf
+
+from official.common import input_benchmark
+from official.core import exp_factory
+from official.core import task_factory
+from official.utils.testing import mock_task  # pylint: disable=unused-import
+
+
+class InputBenchmarkTest(tf.test.TestCase):
+
+  def test_benchmark_dataset(self):
+    dataset = tf.data.Dataset.range(100).batch(4)
+    results = input_benchmark.benchmark_dataset(
+        dataset, num_batches=10, num_warmup_batches=2)
+    self.assertEqual(results['num_batches'], 10)
+    self.assertGreater(results['examples_per_sec'], 0)
+    self.assertAllClose(results['examples_per_sec'],
+                        4 * results['batches_per_sec'])
+    self.assertLessEqual(results['batch_latency_ms_p50'],
+                         results['batch_latency_ms_max'])
+
+  def test_benchmark_dataset_exhausted(self):
+    dataset = tf.data.Dataset.range(10).batch(5)
+    results = input_benchmark.benchmark_dataset(dataset, num_batches=10)
+    self.assertEqual(results['num_untimed_batches'], 1)
+    self.assertEqual(results['num_batches'], 1)
+
+  def test_benchmark_dataset_exhausted_before_timing(self):
+    for num_elements, num_untimed_batches in [(0, 0), (3, 3)]:
+      dataset = tf.data.Dataset.range(num_elements)
+      results = input_benchmark.benchmark_dataset(
+          dataset, num_batches=5, num_warmup_batches=4)
+      self.assertEqual(results['num_untimed_batches'], num_untimed_batches)
+      self.assertEqual(results['num_batches'], 0)
+      self.assertEqual(results['batches_per_sec'], 0.0)
+      self.assertEqual(results['examples_per_sec'], 0.0)
+
+  def test_benchmark_dataset_invalid_num_batches(self):
+    dataset = tf.data.Dataset.range(10)
+    with self.assertRaisesRegex(ValueError, 'num_batches'):
+      input_benchmark.benchmark_dataset(dataset, num_batches=0)
+    with self.assertRaisesRegex(ValueError, 'num_warmup_batches'):
+      input_benchmark.benchmark_dataset(
+          dataset, num_batches=1, num_warmup_batches=-1)
+
+  def test_sweep_task_inputs(self):
+    params = exp_factory.get_exp_config('mock')
+    task = task_factory.get_task(params.task)
+    all_results = input_benchmark.sweep_task_inputs(
+        task,
+        params.task.train_data,
+        sweep={
+            'cycle_length': [1, 2],
+            'block_length': [1, 4]
+        },
+        num_batches=5)
+    self.assertLen(all_results, 4)
+    self.assertEqual(all_results[-1]['overrides'], {
+        'cycle_length': 2,
+        'block_length': 4
+    })
+    for result in all_results:
+      self.assertEqual(result['results']['num_batches'], 5)
+      self.assertIn('build_inputs_secs', result['results'])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -84,6 +84,41 @@ class Recovery:
         "%f at step %d.", checkpoint_path, loss_value, global_step)
 
 
+class _GradientCapture:
+  """Records the gradients a task passes to `optimizer.apply_gradients`.
+
+  Tasks apply their gradients inside `Task.train_step`. To accumulate them over
+  several micro-batches, the trainer temporarily shadows the optimizer's
+  `apply_gradients` so that the (already unscaled) gradients are recorded
+  instead of applied.
+  """
+
+  def __init__(self, optimizer: tf.optimizers.Optimizer):
+    self._optimizer = optimizer
+    self.gradients = None
+    self.variables = None
+
+  def _apply_gradients(self, grads_and_vars, *args, **kwargs):
+    del args, kwargs  # Only used by the real `apply_gradients`.
+    if self.gradients is not None:
+      raise ValueError("`apply_gradients` is called more than once in a "
+                       "train step, which is not supported with gradient "
+                       "accumulation.")
+    self.gradients, self.variables = zip(*grads_and_vars)
+    return tf.no_op()
+
+  def __enter__(self):
+    self._optimizer.apply_gradients = self._apply_gradients
+    return self
+
+  def __exit__(self, *exc_info):
+    del self._optimizer.apply_gradients
+    if exc_info[0] is None and self.gradients is None:
+      raise ValueError("The task's `train_step` did not call "
+                       "`optimizer.apply_gradients`, which is required with "
+                       "gradient accumulation.")
+
+
 class _AsyncTrainer(orbit.StandardTrainer, orbit.StandardEvaluator):
   """Trainer class for both sync and async Strategy."""
 
@@ -223,6 +258,11 @@ class Trainer(_AsyncTrainer):
     # Runtime options are only applied to train_step.
     # We use default for eval_step.
     self._runtime_options = get_runtime_options(config)
+    self._gradient_accumulation_steps = (
+        config.trainer.gradient_accumulation_steps)
+    if self._gradient_accumulation_steps < 1:
+      raise ValueError("`gradient_accumulation_steps` must be positive, got "
+                       f"{self._gradient_accumulation_steps}.")
 
     # Creates a shadow copy of the weights to store weights moving average.
     if isinstance(self._optimizer, optimization.ExponentialMovingAverage
@@ -261,7 +301,8 @@ class Trainer(_AsyncTrainer):
           options=orbit.StandardTrainerOptions(
               use_tf_while_loop=config.trainer.train_tf_while_loop,
               use_tf_function=config.trainer.train_tf_function,
-              use_tpu_summary_optimization=config.trainer.allow_tpu_summary))
+              use_tpu_summary_optimization=config.trainer.allow_tpu_summary,
+              enable_input_wait_timing=config.trainer.enable_phase_timing))
 
     if evaluate:
       self._validation_metrics = self.task.build_metrics(
@@ -391,9 +432,12 @@ class Trainer(_AsyncTrainer):
 
   def train_step(self, iterator):
     """See base class."""
+    if self._gradient_accumulation_steps > 1:
+      self._accumulated_train_step(iterator)
+      return
 
     def step_fn(inputs):
-      if self.config.runtime.enable_xla and (self.config.runtime.num_gpus > 0):
+      if self._use_xla():
         task_train_step = tf.function(self.task.train_step, jit_compile=True)
       else:
         task_train_step = self.task.train_step
@@ -408,6 +452,63 @@ class Trainer(_AsyncTrainer):
     self.strategy.run(
         step_fn, args=(next(iterator),), options=self._runtime_options)
 
+  def _use_xla(self):
+    return self.config.runtime.enable_xla and self.config.runtime.num_gpus > 0
+
+  def _accumulated_train_step(self, iterator):
+    """Accumulates gradients over micro-batches and applies them once.
+
+    The task's `train_step` runs once per micro-batch with its
+    `apply_gradients` call intercepted. The averaged gradients are then applied
+    with the real optimizer, so a `LossScaleOptimizer` still skips the update
+    and lowers the loss scale if any micro-batch produced non-finite
+    gradients. The global step is incremented once per optimizer update.
+
+    Args:
+      iterator: the training data iterator. Each call consumes
+        `gradient_accumulation_steps` elements from it.
+    """
+    num_micro_steps = self._gradient_accumulation_steps
+    trainable_variables = []
+
+    def micro_step_fn(inputs):
+      with _GradientCapture(self.optimizer) as capture:
+        logs = self.task.train_step(
+            inputs,
+            model=self.model,
+            optimizer=self.optimizer,
+            metrics=self.train_metrics)
+      trainable_variables[:] = capture.variables
+      return logs[self.task.loss], list(capture.gradients)
+
+    def step_fn(micro_batches):
+      if self._use_xla():
+        micro_step = tf.function(micro_step_fn, jit_compile=True)
+      else:
+        micro_step = micro_step_fn
+      accumulated = None
+      for inputs in micro_batches:
+        # Runs the micro steps one after another so that only a single
+        # micro-batch worth of activations is alive at a time.
+        dependencies = [g for g in accumulated or [] if g is not None]
+        with tf.control_dependencies(dependencies):
+          loss, grads = micro_step(inputs)
+        self._train_loss.update_state(loss)
+        grads = [None if g is None else tf.convert_to_tensor(g) for g in grads]
+        if accumulated is None:
+          accumulated = grads
+        else:
+          accumulated = [
+              None if g is None else a + g for a, g in zip(accumulated, grads)
+          ]
+      grads = [None if g is None else g / num_micro_steps for g in accumulated]
+      self.optimizer.apply_gradients(list(zip(grads, trainable_variables)))
+      self.global_step.assign_add(1)
+
+    micro_batches = [next(iterator) for _ in range(num_micro_steps)]
+    self.strategy.run(
+        step_fn, args=(micro_batches,), options=self._runtime_options)
+
   def eval_begin(self):
     """Sets up metrics."""
     for metric in self.validation_metrics + [self.validation_loss]:
@@ -20,6 +20,7 @@ import os
 import sys
 
 from absl.testing import parameterized
+import numpy as np
 import orbit
 import portpicker
 import tensorflow as tf
@@ -91,6 +92,15 @@ def dataset_fn(input_context=None):
   return dataset
 
 
+class SquaredLossTask(mock_task.MockTask):
+  """Mock task with a squared loss, whose gradients depend on the weights."""
+
+  def build_losses(self, labels, model_outputs, aux_losses=None):
+    del aux_losses
+    return tf.reduce_mean(
+        tf.square(tf.cast(model_outputs, tf.float32) - labels))
+
+
 class MockAsyncTrainer(trainer_lib._AsyncTrainer):
   """Mock AsyncTrainer to test the _AsyncTrainer class."""
 
@@ -348,6 +358,94 @@ class TrainerTest(tf.test.TestCase, parameterized.TestCase):
     metrics = trainer.train(tf.convert_to_tensor(5, dtype=tf.int32))
     self.assertIn('training_loss', metrics)
 
+  @combinations.generate(
+      combinations.combine(
+          distribution=[
+              strategy_combinations.default_strategy,
+              strategy_combinations.one_device_strategy,
+          ],
+          mixed_precision_dtype=['float32', 'float16'],
+      ))
+  def test_trainer_gradient_accumulation(self, distribution,
+                                         mixed_precision_dtype):
+    config = cfg.ExperimentConfig(
+        runtime=cfg.RuntimeConfig(mixed_precision_dtype=mixed_precision_dtype),
+        trainer=cfg.TrainerConfig(
+            gradient_accumulation_steps=3,
+            optimizer_config=cfg.OptimizationConfig({
+                'optimizer': {
+                    'type': 'sgd'
+                },
+                'learning_rate': {
+                    'type': 'constant'
+                }
+            })))
+    with distribution.scope():
+      trainer = self.create_test_trainer(config)
+      logs = trainer.train(tf.convert_to_tensor(5, dtype=tf.int32))
+    self.assertIn('training_loss', logs)
+    # The global step counts optimizer updates rather than micro-batches.
+    self.assertEqual(trainer.global_step.numpy(), 5)
+    self.assertEqual(trainer.optimizer.iterations.numpy(), 5)
+
+  @parameterized.parameters('float32', 'float16')
+  def test_gradient_accumulation_matches_large_batch(self,
+                                                     mixed_precision_dtype):
+    rng = np.random.RandomState(0)
+    features = rng.uniform(-1, 1, (6, 2)).astype(np.float32)
+    labels = rng.uniform(-1, 1, (6, 1)).astype(np.float32)
+    initial_weights = None
+    weights = []
+    losses = []
+    # One step with 3 accumulated micro-batches of 2 and one with a batch of 6.
+    for accumulation_steps, batch_size in [(3, 2), (1, 6)]:
+      config = cfg.ExperimentConfig(
+          runtime=cfg.RuntimeConfig(
+              mixed_precision_dtype=mixed_precision_dtype),
+          trainer=cfg.TrainerConfig(
+              gradient_accumulation_steps=accumulation_steps,
+              optimizer_config=cfg.OptimizationConfig({
+                  'optimizer': {
+                      'type': 'sgd'
+                  },
+                  'learning_rate': {
+                      'type': 'constant'
+                  }
+              })))
+      task = SquaredLossTask(config.task)
+      model = task.build_model()
+      if initial_weights is None:
+        initial_weights = model.get_weights()
+      model.set_weights(initial_weights)
+      optimizer = task.create_optimizer(config.trainer.optimizer_config,
+                                        config.runtime)
+      if mixed_precision_dtype == 'float16':
+        self.assertIsInstance(optimizer,
+                              tf.keras.mixed_precision.LossScaleOptimizer)
+      trainer = trainer_lib.Trainer(
+          config,
+          task,
+          model=model,
+          optimizer=optimizer,
+          train_dataset=tf.data.Dataset.from_tensor_slices(
+              (features, labels)).batch(batch_size).repeat())
+      logs = trainer.train(tf.convert_to_tensor(1, dtype=tf.int32))
+      self.assertEqual(trainer.global_step.numpy(), 1)
+      weights.append(model.get_weights())
+      losses.append(logs['training_loss'].numpy())
+
+    for accumulated, large_batch, initial in zip(weights[0], weights[1],
+                                                 initial_weights):
+      self.assertNotAllClose(large_batch, initial)
+      self.assertAllClose(accumulated, large_batch, atol=1e-6)
+    # The training loss is averaged over the micro-batches.
+    self.assertAllClose(losses[0], losses[1], atol=1e-6)
+
+  def test_invalid_gradient_accumulation_steps(self):
+    config = self._config.replace(trainer={'gradient_accumulation_steps': 0})
+    with self.assertRaisesRegex(ValueError, 'gradient_accumulation_steps'):
+      self.create_test_trainer(config)
+
   def test_export_best_ckpt(self):
     config = cfg.ExperimentConfig(
         trainer=cfg.TrainerConfig(
@@ -75,6 +75,37 @@ class DataConfig(base_config.Config):
       features. The main use case is to skip the image/video decoding for better
       performance.
     seed: An optional seed to use for deterministic shuffling/preprocessing.
+    file_manifest_dir: An optional directory in which to cache the lists of
+      files matching the wildcard patterns in `input_path`, so that later runs
+      can skip listing the files. A cached list is invalidated when the
+      mtime of one of the directories of the pattern changes. Patterns on
+      filesystems without directory mtimes, such as GCS, are not cached.
+    source_weights: An optional dictionary mapping each key of a dictionary
+      `input_path` to its sampling weight. If set (and the task does not pass
+      a `combine_fn` to the `InputReader`), the sources are prefetched
+      independently and mixed by sampling according to these weights. A value
+      can also be a list of weights, one for each phase of the schedule
+      defined by `source_weight_boundaries`.
+    source_weight_boundaries: The numbers of examples sampled (per input
+      pipeline) at which the next phase of the `source_weights` schedule
+      starts.
+    source_stats: Whether to count the examples sampled from each source and
+      how often the mixer was starved waiting for it. This adds a small
+      per-example cost. The counters are logged periodically and available
+      through `InputReader.source_stats`.
+    snapshot_dir: An optional directory in which to materialize the decoded
+      examples (before sampling, parsing and augmentation) as a sharded on-disk
+      snapshot. The snapshot is written on the first run, keyed by a
+      fingerprint of the data source and this config, and read back with
+      parallel interleave on later runs. Unlike `cache`, the examples do not
+      need to fit in memory and persist across restarts. At most one of
+      `cache` and `snapshot_dir` can be set.
+    snapshot_key: An optional string identifying the decoder and dataset
+      functions in the snapshot fingerprint, e.g. a version bumped whenever
+      they change. If unset, their names and attribute values are
+      fingerprinted instead, which requires that they only hold plain Python
+      values, configs and other such objects. It has no effect without
+      `snapshot_dir`.
   """
   input_path: Union[Sequence[str], str, base_config.Config] = ""
   tfds_name: str = ""
@@ -95,6 +126,12 @@ class DataConfig(base_config.Config):
   tfds_as_supervised: bool = False
   tfds_skip_decoding_feature: str = ""
   seed: Optional[int] = None
+  file_manifest_dir: Optional[str] = None
+  source_weights: Optional[base_config.Config] = None
+  source_weight_boundaries: Sequence[int] = ()
+  source_stats: bool = False
+  snapshot_dir: Optional[str] = None
+  snapshot_key: Optional[str] = None
 
 
 @dataclasses.dataclass
@@ -179,10 +216,31 @@ class TrainerConfig(base_config.Config):
     eval_tf_function: whether or not to use tf_function for eval.
     allow_tpu_summary: Whether to allow summary happen inside the XLA program
       runs on TPU through automatic outside compilation.
+    gradient_accumulation_steps: number of micro-batches whose gradients are
+      averaged before the optimizer is applied once. Each train step then
+      consumes this many batches of `train_data.global_batch_size`, so the
+      effective batch size is multiplied by this value while `train_steps`,
+      the intervals and the learning rate schedule keep counting optimizer
+      updates.
     steps_per_loop: number of steps per loop to report training metrics. This
       can also be used to reduce host worker communication in a TPU setup.
+    max_steps_per_loop: if set, the number of steps per loop is autotuned
+      between `steps_per_loop` and this value (in multiples of
+      `steps_per_loop`), so that the host-side overhead per loop stays below
+      `target_host_overhead` of the loop time.
+    target_host_overhead: the target fraction of time spent outside of the
+      training steps when autotuning the number of steps per loop.
     summary_interval: number of steps between each summary.
+    enable_buffered_summaries: whether to buffer the training summaries in
+      memory and write them in bulk on a background thread, instead of writing
+      and flushing them after every loop.
+    enable_phase_timing: whether to write the seconds spent per phase of each
+      train loop (waiting for input, training, train actions, summaries and
+      checkpointing) as training summaries, and a timeline of the phases to
+      `model_dir/train/phase_timeline.json`.
     checkpoint_interval: number of steps between checkpoints.
+    enable_async_checkpointing: whether to write checkpoints on a background
+      thread, so that training continues while the files are written.
     max_to_keep: max checkpoints to keep.
     continuous_eval_timeout: maximum number of seconds to wait between
       checkpoints, if set to None, continuous eval will wait indefinitely. This
@@ -212,10 +270,16 @@ class TrainerConfig(base_config.Config):
   eval_tf_function: bool = True
   eval_tf_while_loop: bool = False
   allow_tpu_summary: bool = False
+  gradient_accumulation_steps: int = 1
   # Trainer intervals.
   steps_per_loop: int = 1000
+  max_steps_per_loop: Optional[int] = None
+  target_host_overhead: float = 0.05
   summary_interval: int = 1000
+  enable_buffered_summaries: bool = False
+  enable_phase_timing: bool = False
   checkpoint_interval: int = 1000
+  enable_async_checkpointing: bool = False
   # Checkpoint manager.
   max_to_keep: int = 5
   continuous_eval_timeout: int = 60 * 60
@@ -13,10 +13,19 @@
 # limitations under the License.
 
 """A common dataset reader."""
+import concurrent.futures
+import functools
+import hashlib
+import inspect
+import json
+import os
 import random
+import threading
+import time
 from typing import Any, Callable, Dict, List, Optional, Sequence, Text, Union
 
 from absl import logging
+import numpy as np
 import tensorflow as tf
 import tensorflow_datasets as tfds
 
@@ -34,9 +43,123 @@ def _maybe_map_fn(dataset: tf.data.Dataset,
       fn, num_parallel_calls=tf.data.experimental.AUTOTUNE)
 
 
-def match_files(input_path: Union[Sequence[str], str]) -> List[str]:
-  """Matches files from an input_path."""
-  matched_files = []
+# The maximum number of file patterns to glob concurrently.
+_MAX_GLOB_THREADS = 32
+
+
+def _get_glob_mtimes(pattern: str) -> Optional[Dict[str, int]]:
+  """Returns the mtimes of the directories listed when globbing `pattern`.
+
+  Adding or removing files in a directory updates its mtime on most local and
+  network filesystems. The directories are the deepest one of `pattern`
+  without wildcards and, if the file name's parent directories contain
+  wildcards (e.g. "dir/*/part-*"), all the directories matching them, so that
+  files added to a subdirectory and new subdirectories are noticed.
+
+  Args:
+    pattern: A file pattern containing wildcards.
+
+  Returns:
+    A dictionary from directory to mtime, or `None` if a directory has no
+    mtime, e.g. on object stores such as GCS.
+  """
+  components = pattern.split('/')
+  for i, component in enumerate(components):
+    if any(c in component for c in '*?['):
+      root = '/'.join(components[:i]) or '/'
+      break
+  else:
+    root = os.path.dirname(pattern)
+  directories = [root]
+  parent = os.path.dirname(pattern)
+  try:
+    if parent != root:
+      directories.extend(sorted(tf.io.gfile.glob(parent)))
+    mtimes = {}
+    for directory in directories:
+      mtime = tf.io.gfile.stat(directory).mtime_nsec
+      if not mtime:
+        return None
+      mtimes[directory] = mtime
+  except tf.errors.OpError:
+    return None
+  return mtimes
+
+
+def _glob(pattern: str, manifest_dir: Optional[str] = None) -> List[str]:
+  """Globs `pattern`, reusing a cached file-list manifest if possible.
+
+  Manifests are stored in `manifest_dir` under a name derived from a hash of
+  the pattern. A manifest is reused as long as the mtimes of the directories
+  of the pattern (see `_get_glob_mtimes`) are unchanged. If the directories
+  have no mtimes, e.g. on GCS, no manifest is used since it could not be
+  invalidated when files are added.
+
+  Args:
+    pattern: A file pattern containing wildcards.
+    manifest_dir: An optional directory to read/write file-list manifests.
+
+  Returns:
+    The list of files matching `pattern`.
+  """
+  if not manifest_dir:
+    return tf.io.gfile.glob(pattern)
+
+  mtimes = _get_glob_mtimes(pattern)
+  if mtimes is None:
+    logging.warning(
+        'Not using a file manifest for %s, its directories have no mtime to '
+        'detect new files with.', pattern)
+    return tf.io.gfile.glob(pattern)
+
+  key = hashlib.sha256(pattern.encode('utf-8')).hexdigest()
+  manifest_path = os.path.join(manifest_dir, 'file_manifest_%s.json' % key)
+  if tf.io.gfile.exists(manifest_path):
+    try:
+      with tf.io.gfile.GFile(manifest_path, 'r') as f:
+        manifest = json.load(f)
+      if manifest['pattern'] == pattern and manifest['mtimes'] == mtimes:
+        logging.info('Using file manifest %s for %s.', manifest_path, pattern)
+        return manifest['files']
+    except (ValueError, KeyError, tf.errors.OpError) as e:
+      logging.warning('Ignoring unreadable file manifest %s: %s',
+                      manifest_path, e)
+
+  matched_files = tf.io.gfile.glob(pattern)
+  if matched_files:
+    try:
+      tf.io.gfile.makedirs(manifest_dir)
+      # Writes to a temporary file first, so that concurrent readers never
+      # observe a partially written manifest.
+      tmp_path = '%s.tmp%d' % (manifest_path, _get_random_integer())
+      with tf.io.gfile.GFile(tmp_path, 'w') as f:
+        json.dump({
+            'pattern': pattern,
+            'mtimes': mtimes,
+            'files': matched_files
+        }, f)
+      tf.io.gfile.rename(tmp_path, manifest_path, overwrite=True)
+    except tf.errors.OpError as e:
+      logging.warning('Failed to write file manifest %s: %s', manifest_path, e)
+  return matched_files
+
+
+def match_files(input_path: Union[Sequence[str], str],
+                manifest_dir: Optional[str] = None) -> List[str]:
+  """Matches files from an input_path.
+
+  File patterns containing wildcards are globbed concurrently.
+
+  Args:
+    input_path: A file path/pattern, a comma separated string of them, or a
+      list of such strings.
+    manifest_dir: An optional directory in which to cache the results of
+      globbing as file-list manifests, so that later calls with the same
+      patterns can skip listing the files (see `_glob`).
+
+  Returns:
+    The list of matched files, in the order of the given patterns.
+  """
   # Read dataset from files.
   usage = ('`input_path` should be either (1) a str indicating a file '
            'path/pattern, or (2) a str indicating multiple file '
@@ -53,19 +176,29 @@ def match_files(input_path: Union[Sequence[str], str]) -> List[str]:
   else:
     raise ValueError(usage % input_path)
 
+  input_patterns = []
   for input_path in input_path_list:
-    input_patterns = input_path.strip().split(',')
-    for input_pattern in input_patterns:
+    for input_pattern in input_path.strip().split(','):
       input_pattern = input_pattern.strip()
-      if not input_pattern:
-        continue
-      if '*' in input_pattern or '?' in input_pattern:
-        tmp_matched_files = tf.io.gfile.glob(input_pattern)
-        if not tmp_matched_files:
-          raise ValueError('%s does not match any files.' % input_pattern)
-        matched_files.extend(tmp_matched_files)
-      else:
-        matched_files.append(input_pattern)
+      if input_pattern:
+        input_patterns.append(input_pattern)
+
+  glob_patterns = [p for p in input_patterns if '*' in p or '?' in p]
+  globbed_files = {}
+  if glob_patterns:
+    max_workers = min(len(glob_patterns), _MAX_GLOB_THREADS)
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+      results = executor.map(lambda p: _glob(p, manifest_dir), glob_patterns)
+      globbed_files = dict(zip(glob_patterns, results))
+
+  matched_files = []
+  for input_pattern in input_patterns:
+    if input_pattern in globbed_files:
+      if not globbed_files[input_pattern]:
+        raise ValueError('%s does not match any files.' % input_pattern)
+      matched_files.extend(globbed_files[input_pattern])
+    else:
+      matched_files.append(input_pattern)
 
   if not matched_files:
     raise ValueError('%s does not match any files.' % input_path)
@@ -147,6 +280,187 @@ def _shard_files_then_read(matched_files: List[str],
   return dataset
 
 
+# Elements that spend less than this many seconds between being produced by a
+# source and being consumed by the mixer are counted as "starved", i.e. the
+# mixer was most likely waiting for that source.
+_STARVATION_THRESHOLD_SECS = 1e-3
+_SOURCE_STATS_LOG_INTERVAL_SECS = 60
+
+# `DataConfig` fields that do not affect the content of decoded examples, and
+# are thus excluded from the snapshot fingerprint.
+_SNAPSHOT_FINGERPRINT_EXCLUDED_FIELDS = (
+    'global_batch_size', 'is_training', 'drop_remainder', 'shuffle_buffer_size',
+    'cache', 'cycle_length', 'block_length', 'deterministic', 'sharding',
+    'enable_tf_data_service', 'tf_data_service_address',
+    'tf_data_service_job_name', 'seed', 'file_manifest_dir', 'source_weights',
+    'source_weight_boundaries', 'source_stats', 'snapshot_dir')
+
+# Objects nested deeper than this in the decoder or dataset function are not
+# fingerprinted, which also guards against reference cycles.
+_SNAPSHOT_FINGERPRINT_MAX_DEPTH = 8
+
+
+def _describe_for_fingerprint(value: Any, depth: int = 0) -> Any:
+  """Returns a JSON serializable description of `value` for fingerprinting.
+
+  Functions are described by their qualified name along with their default
+  arguments and closure, bound methods by their function and their object, and
+  other objects by their config or attribute values. Objects whose content
+  cannot be described reproducibly, e.g. resources or symbolic tensors, raise
+  an error instead of being described by a `repr` that may or may not change
+  with their content.
+
+  Args:
+    value: The object to describe.
+    depth: The nesting depth of `value` from the described function.
+
+  Returns:
+    A structure of lists, dicts and scalars.
+
+  Raises:
+    ValueError: If `value` cannot be described.
+  """
+  if depth > _SNAPSHOT_FINGERPRINT_MAX_DEPTH:
+    raise ValueError('Objects are nested too deeply to be fingerprinted.')
+  describe = functools.partial(_describe_for_fingerprint, depth=depth + 1)
+  if value is None or isinstance(value, (bool, int, float, str)):
+    return value
+  if isinstance(value, bytes):
+    return repr(value)
+  if isinstance(value, (np.ndarray, np.generic)):
+    return value.tolist()
+  if isinstance(value, tf.dtypes.DType):
+    return value.name
+  if isinstance(value, tf.TensorShape):
+    return str(value)
+  if isinstance(value, tf.Tensor):
+    if not hasattr(value, 'numpy') or value.dtype == tf.resource:
+      raise ValueError('Cannot fingerprint the tensor %s.' % value)
+    return describe(value.numpy())
+  if isinstance(value, cfg.base_config.Config):
+    config = value.as_dict()
+    if isinstance(value, cfg.DataConfig):
+      # E.g. data loaders keeping the `DataConfig` they build a reader from.
+      for field in _SNAPSHOT_FINGERPRINT_EXCLUDED_FIELDS:
+        config.pop(field, None)
+    return describe(config)
+  if isinstance(value, tuple) and hasattr(value, '_asdict'):
+    return {type(value).__qualname__: describe(value._asdict())}
+  if isinstance(value, (list, tuple)):
+    return [describe(v) for v in value]
+  if isinstance(value, (set, frozenset)):
+    return sorted((describe(v) for v in value), key=repr)
+  if isinstance(value, dict):
+    return {str(k): describe(v) for k, v in value.items()}
+  if isinstance(value, functools.partial):
+    return {
+        'func': describe(value.func),
+        'args': describe(value.args),
+        'keywords': describe(value.keywords)
+    }
+  if inspect.ismethod(value):
+    return {
+        'method': value.__func__.__qualname__,
+        'self': describe(value.__self__)
+    }
+  if inspect.ismodule(value):
+    return value.__name__
+  if inspect.isclass(value) or inspect.isbuiltin(value):
+    return '%s.%s' % (value.__module__, value.__qualname__)
+  if inspect.isfunction(value):
+    closure = [cell.cell_contents for cell in value.__closure__ or ()]
+    return {
+        'function': '%s.%s' % (value.__module__, value.__qualname__),
+        'defaults': describe(value.__defaults__),
+        'kwdefaults': describe(value.__kwdefaults__),
+        'closure': describe(closure)
+    }
+  if hasattr(value, 'get_config'):
+    return {type(value).__qualname__: describe(value.get_config())}
+  if hasattr(value, '__dict__'):
+    return {type(value).__qualname__: describe(vars(value))}
+  raise ValueError('Cannot fingerprint the object %r of type %s.' %
+                   (value, type(value)))
+
+
+class SourceStats:
+  """Thread-safe per-source counters of the weighted source mixer.
+
+  For each source, this counts the number of examples sampled by the mixer, the
+  resulting throughput, the mean time examples spent in the source's prefetch
+  buffer, and the number of "starved" examples: examples that were consumed by
+  the mixer (almost) as soon as the source produced them, which means that the
+  mixer was waiting for the source instead of reading from its prefetch
+  buffer. The source with the highest starvation ratio and the lowest buffer
+  time is the bottleneck of the input pipeline.
+  """
+
+  def __init__(self, names: Sequence[str]):
+    self._names = list(names)
+    self._lock = threading.Lock()
+    self._examples = [0] * len(names)
+    self._starved = [0] * len(names)
+    self._buffered_secs = [0.0] * len(names)
+    self._start_time = None
+    self._last_log_time = None
+
+  def record(self, index, produced_time):
+    """Records an example of source `index`. Called from the tf.data graph."""
+    now = time.time()
+    with self._lock:
+      if self._start_time is None:
+        self._start_time = self._last_log_time = now
+      self._examples[index] += 1
+      self._buffered_secs[index] += now - produced_time
+      if now - produced_time < _STARVATION_THRESHOLD_SECS:
+        self._starved[index] += 1
+      should_log = now - self._last_log_time >= _SOURCE_STATS_LOG_INTERVAL_SECS
+      if should_log:
+        self._last_log_time = now
+    if should_log:
+      logging.info('Input source stats: %s', self.get())
+    return index
+
+  def get(self) -> Dict[str, Dict[str, float]]:
+    """Returns a dictionary of counters keyed by source name."""
+    with self._lock:
+      elapsed = time.time() - self._start_time if self._start_time else 0.0
+      stats = {}
+      for name, examples, starved, buffered_secs in zip(
+          self._names, self._examples, self._starved, self._buffered_secs):
+        stats[name] = {
+            'examples': examples,
+            'examples_per_sec': examples / elapsed if elapsed else 0.0,
+            'mean_buffered_secs':
+                buffered_secs / examples if examples else 0.0,
+            'starved': starved,
+            'starved_ratio': starved / examples if examples else 0.0,
+        }
+      return stats
+
+
+def _get_source_weights_dataset(
+    weights: List[List[float]], boundaries: Sequence[int]) -> tf.data.Dataset:
+  """Returns an infinite dataset of per-source weight vectors.
+
+  Args:
+    weights: A list with one list of weights for each phase of the schedule,
+      each containing one weight per source.
+    boundaries: The number of examples sampled after which each phase (but the
+      last) ends.
+  """
+  dataset = None
+  phase_start = 0
+  for phase_weights, phase_end in zip(weights[:-1], boundaries):
+    phase = tf.data.Dataset.from_tensors(
+        tf.constant(phase_weights, tf.float32)).repeat(phase_end - phase_start)
+    dataset = phase if dataset is None else dataset.concatenate(phase)
+    phase_start = phase_end
+  last_phase = tf.data.Dataset.from_tensors(
+      tf.constant(weights[-1], tf.float32)).repeat()
+  return last_phase if dataset is None else dataset.concatenate(last_phase)
+
+
 def _read_tfds(tfds_builder: tfds.core.DatasetBuilder,
                tfds_split: Text,
                tfds_skip_decoding_feature: Text,
@@ -210,7 +524,9 @@ class InputReader:
         and decodes them into the raw tensor dictionary.
       combine_fn: An optional `callable` that takes a dictionarty of
         `tf.data.Dataset` objects as input and outputs a combined dataset. It
-        will be executed after the decoder_fn and before the sample_fn.
+        will be executed after the decoder_fn and before the sample_fn. If not
+        provided for a dictionary `input_path`, the datasets are mixed
+        according to `params.source_weights`.
       sample_fn: An optional `callable` that takes a `tf.data.Dataset` object as
         input and outputs the transformed dataset. It performs sampling on the
         decoded raw tensors dict before the parser_fn.
@@ -231,13 +547,15 @@ class InputReader:
                        'specified, but got %s and %s.' %
                        (params.input_path, params.tfds_name))
 
-    if isinstance(params.input_path,
-                  cfg.base_config.Config) and combine_fn is None:
+    if isinstance(params.input_path, cfg.base_config.Config) and (
+        combine_fn is None and not params.source_weights):
       raise ValueError(
-          'A `combine_fn` is required if the `input_path` is a dictionary.')
+          'A `combine_fn` or `source_weights` is required if the `input_path` '
+          'is a dictionary.')
 
     self._tfds_builder = None
     self._matched_files = None
+    self._file_manifest_dir = params.file_manifest_dir
     if not params.input_path:
       # Read dataset from TFDS.
       if not params.tfds_split:
@@ -254,6 +572,9 @@ class InputReader:
     self._drop_remainder = params.drop_remainder
     self._shuffle_buffer_size = params.shuffle_buffer_size
     self._cache = params.cache
+    self._snapshot_dir = params.snapshot_dir
+    if self._cache and self._snapshot_dir:
+      raise ValueError('At most one of `cache` and `snapshot_dir` can be set.')
     self._cycle_length = params.cycle_length
     self._block_length = params.block_length
     self._deterministic = params.deterministic
@@ -270,6 +591,16 @@ class InputReader:
     self._transform_and_batch_fn = transform_and_batch_fn
     self._postprocess_fn = postprocess_fn
     self._seed = params.seed
+    if self._snapshot_dir:
+      self._snapshot_fingerprint = self._get_snapshot_fingerprint(params)
+
+    self._source_weights = None
+    self._source_weight_boundaries = list(params.source_weight_boundaries)
+    self._source_stats = None
+    if params.source_weights and combine_fn is None:
+      self._source_weights = self._get_source_weights(params)
+      if params.source_stats:
+        self._source_stats = SourceStats(list(self._source_weights.keys()))
 
     # When tf.data service is enabled, each data service worker should get
     # different random seeds. Thus, we set `seed` to None.
@@ -299,6 +630,135 @@ class InputReader:
       raise ValueError('tfds_info is not available, because the dataset '
                        'is not loaded from tfds.')
 
+  @property
+  def source_stats(self) -> Optional[SourceStats]:
+    """Returns the per-source mixing counters, if `source_stats` is enabled."""
+    return self._source_stats
+
+  def _get_source_weights(self,
+                          params: cfg.DataConfig) -> Dict[str, List[float]]:
+    """Returns the weight schedule of each source of a dict `input_path`."""
+    if not isinstance(params.input_path, cfg.base_config.Config):
+      raise ValueError('`source_weights` requires `input_path` to be a '
+                       'dictionary, but got %s.' % params.input_path)
+    source_weights = params.source_weights.as_dict()
+    if set(source_weights) != set(params.input_path.as_dict()):
+      raise ValueError(
+          'The keys of `source_weights` %s must match the keys of '
+          '`input_path` %s.' %
+          (sorted(source_weights), sorted(params.input_path.as_dict())))
+    num_phases = len(params.source_weight_boundaries) + 1
+    weights = {}
+    for name in params.input_path.as_dict():
+      schedule = source_weights[name]
+      if not isinstance(schedule, (list, tuple)):
+        schedule = [schedule] * num_phases
+      if len(schedule) != num_phases:
+        raise ValueError(
+            'Source %s has %d weights, but %d are required for '
+            '`source_weight_boundaries` %s.' %
+            (name, len(schedule), num_phases,
+             params.source_weight_boundaries))
+      weights[name] = [float(w) for w in schedule]
+    return weights
+
+  def _mix_sources(self,
+                   datasets: Dict[Text, tf.data.Dataset]) -> tf.data.Dataset:
+    """Samples from `datasets` according to the source weight schedule."""
+    names = list(self._source_weights.keys())
+    sources = []
+    for i, name in enumerate(names):
+      source = datasets[name]
+      if self._source_stats is not None:
+        source = source.map(
+            lambda *x, i=i: (tf.constant(i, tf.int64), tf.timestamp(), x))
+      # Prefetches each source independently, so that a slow source does not
+      # stall the others.
+      sources.append(source.prefetch(tf.data.experimental.AUTOTUNE))
+
+    schedule = [[self._source_weights[name][phase]
+                 for name in names]
+                for phase in range(len(self._source_weight_boundaries) + 1)]
+    if len(schedule) == 1:
+      weights = schedule[0]
+    else:
+      weights = _get_source_weights_dataset(schedule,
+                                            self._source_weight_boundaries)
+    dataset = tf.data.experimental.sample_from_datasets(
+        sources, weights=weights, seed=self._seed)
+
+    if self._source_stats is not None:
+
+      def _record_and_untag(index, produced_time, x):
+        recorded = tf.numpy_function(self._source_stats.record,
+                                     [index, produced_time], tf.int64)
+        with tf.control_dependencies([recorded]):
+          x = tf.nest.map_structure(tf.identity, x)
+        return x[0] if len(x) == 1 else x
+
+      dataset = dataset.map(_record_and_untag)
+    return dataset
+
+  def _get_snapshot_fingerprint(self, params: cfg.DataConfig) -> str:
+    """Returns a fingerprint of everything that determines decoded examples.
+
+    This covers the data source, the `DataConfig` fields other than those only
+    affecting how examples are shuffled, batched or read, and either the
+    `snapshot_key` or the names and state of the dataset and decoder functions,
+    e.g. the attributes of the object of a bound method. Changes to the code of
+    these functions are not detected, so `snapshot_key` or `snapshot_dir` should
+    be changed in that case.
+
+    Args:
+      params: The `DataConfig` of this reader.
+
+    Raises:
+      ValueError: If `snapshot_key` is not set and the dataset or decoder
+        function holds state that cannot be fingerprinted.
+    """
+    config = params.as_dict()
+    for field in _SNAPSHOT_FINGERPRINT_EXCLUDED_FIELDS:
+      config.pop(field, None)
+    fingerprint = {
+        'config': config,
+        'matched_files': self._matched_files,
+    }
+    if not params.snapshot_key:
+      try:
+        fingerprint['dataset_fn'] = _describe_for_fingerprint(self._dataset_fn)
+        fingerprint['decoder_fn'] = _describe_for_fingerprint(self._decoder_fn)
+      except ValueError as e:
+        raise ValueError(
+            'The dataset or decoder function cannot be fingerprinted for the '
+            'snapshot in %s, please set `snapshot_key` to identify them: %s' %
+            (params.snapshot_dir, e)) from e
+    serialized = json.dumps(fingerprint, sort_keys=True)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()[:16]
+
+  def _snapshot(
+      self,
+      dataset: tf.data.Dataset,
+      source_name: str = '',
+      input_context: Optional[tf.distribute.InputContext] = None
+  ) -> tf.data.Dataset:
+    """Materializes `dataset` to disk once and reads it back afterwards."""
+    path = os.path.join(self._snapshot_dir, self._snapshot_fingerprint,
+                        source_name)
+    if input_context and input_context.num_input_pipelines > 1:
+      path = os.path.join(
+          path, 'pipeline-%d-of-%d' % (input_context.input_pipeline_id,
+                                        input_context.num_input_pipelines))
+    logging.info('Using snapshot of decoded examples at %s.', path)
+
+    def _reader_fn(datasets):
+      return datasets.interleave(
+          lambda x: x,
+          cycle_length=self._cycle_length,
+          num_parallel_calls=tf.data.experimental.AUTOTUNE,
+          deterministic=self._deterministic)
+
+    return dataset.snapshot(path, compression='AUTO', reader_func=_reader_fn)
+
   def get_files(self, input_path):
     """Gets matched files. Can be overridden by subclasses."""
     if not input_path:
@@ -307,10 +767,10 @@ class InputReader:
     if isinstance(input_path, cfg.base_config.Config):
       matched_files = {}
       for k, v in input_path.as_dict().items():
-        matched_files[k] = match_files(v)
+        matched_files[k] = match_files(v, self._file_manifest_dir)
     # single dataset
     else:
-      matched_files = match_files(input_path)
+      matched_files = match_files(input_path, self._file_manifest_dir)
     return matched_files
 
   def _read_data_source(
@@ -320,6 +780,10 @@ class InputReader:
       input_context: Optional[tf.distribute.InputContext] = None,
       tfds_builder: Optional[tfds.core.DatasetBuilder] = None):
     """Reads the data source (files/tfds) to a dataset."""
+    # Snapshots are written from a deterministic (unshuffled and unrepeated)
+    # read of the data source. Shuffling and repeating happen after the
+    # snapshot, similar to `cache`.
+    shuffle_and_repeat = self._is_training and not self._snapshot_dir
 
     def _files_to_dataset(files: List[str]) -> tf.data.Dataset:
       if len(files) > 1:
@@ -334,14 +798,14 @@ class InputReader:
               dataset_fn,
               input_context,
               sharding=self._sharding,
-              repeat=self._is_training and not self._cache)
+              repeat=shuffle_and_repeat and not self._cache)
         else:
           return _shard_files_then_read(
               files,
               dataset_fn,
               input_context,
               seed=self._seed,
-              is_training=self._is_training,
+              is_training=shuffle_and_repeat,
               sharding=self._sharding,
               cache=self._cache,
               cycle_length=self._cycle_length,
@@ -353,7 +817,7 @@ class InputReader:
             dataset_fn,
             input_context,
             sharding=self._sharding,
-            repeat=self._is_training and not self._cache)
+            repeat=shuffle_and_repeat and not self._cache)
       else:
         raise ValueError('It is unexpected that `tfds_builder` is None and '
                          'there is also no `files`.')
@@ -366,7 +830,7 @@ class InputReader:
           tfds_as_supervised=self._tfds_as_supervised,
           input_context=input_context,
           seed=self._seed,
-          is_training=self._is_training,
+          is_training=shuffle_and_repeat,
           cache=self._cache,
           cycle_length=self._cycle_length,
           block_length=self._block_length)
@@ -389,17 +853,29 @@ class InputReader:
   ) -> tf.data.Dataset:
     """Returns a tf.data.Dataset object after shuffling, decoding, and parsing."""
 
-    def _shuffle_and_decode(ds):
-      # If cache is enabled, we will call `shuffle()` later after `cache()`.
-      if self._is_training and not self._cache:
+    def _shuffle_and_decode(ds, source_name=''):
+      # If cache or snapshot is enabled, we will call `shuffle()` later after
+      # `cache()` or `snapshot()`.
+      if self._is_training and not self._cache and not self._snapshot_dir:
         ds = ds.shuffle(self._shuffle_buffer_size, seed=self._seed)
       # Decode
       ds = _maybe_map_fn(ds, self._decoder_fn)
+      if self._snapshot_dir:
+        ds = self._snapshot(ds, source_name, input_context)
+        if self._is_training:
+          ds = ds.repeat()
+          ds = ds.shuffle(self._shuffle_buffer_size, seed=self._seed)
       return ds
 
-    dataset = tf.nest.map_structure(_shuffle_and_decode, dataset)
+    if isinstance(dataset, dict):
+      dataset = {k: _shuffle_and_decode(v, k) for k, v in dataset.items()}
+    else:
+      dataset = _shuffle_and_decode(dataset)
     if tf.nest.is_nested(dataset):
-      dataset = self._combine_fn(dataset)
+      if self._source_weights is not None:
+        dataset = self._mix_sources(dataset)
+      else:
+        dataset = self._combine_fn(dataset)
 
     if self._sample_fn is not None:
       dataset = dataset.apply(self._sample_fn)
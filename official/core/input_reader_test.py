@@ -0,0 +1,316 @@
+# Copyright 2021 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for official.core.input_reader."""
+import os
+import time
+from unittest import mock
+
+import tensorflow as tf
+
+from official.core import config_definitions as cfg
+from official.core import input_reader
+
+
+def _write_files(directory, names):
+  tf.io.gfile.makedirs(directory)
+  for name in names:
+    with tf.io.gfile.GFile(os.path.join(directory, name), 'w') as f:
+      f.write(name)
+
+
+def _write_examples(path, values):
+  with tf.io.TFRecordWriter(path) as writer:
+    for value in values:
+      example = tf.train.Example(
+          features=tf.train.Features(
+              feature={
+                  'x': tf.train.Feature(
+                      int64_list=tf.train.Int64List(value=[value]))
+              }))
+      writer.write(example.SerializeToString())
+
+
+class _Decoder:
+
+  def __init__(self, offset=0):
+    self._offset = offset
+    self._keys_to_features = {'x': tf.io.FixedLenFeature([], tf.int64)}
+
+  def decode(self, serialized_example):
+    parsed = tf.io.parse_single_example(serialized_example,
+                                        self._keys_to_features)
+    return parsed['x'] + self._offset
+
+
+def _bump_mtime(directory):
+  # Directory mtimes may be too coarse to change between two quick writes.
+  stat = os.stat(directory)
+  os.utime(directory, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+class MatchFilesTest(tf.test.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self._data_dir = os.path.join(self.get_temp_dir(), 'data')
+    self._manifest_dir = os.path.join(self.get_temp_dir(), 'manifests')
+    _write_files(self._data_dir, ['part-0', 'part-1', 'other'])
+
+  def _match_files_and_count_globs(self, pattern):
+    with mock.patch.object(
+        tf.io.gfile, 'glob', wraps=tf.io.gfile.glob) as mock_glob:
+      files = input_reader.match_files(pattern, self._manifest_dir)
+    return files, [call[0][0] for call in mock_glob.call_args_list]
+
+  def test_manifest_matches_glob_and_is_reused(self):
+    pattern = os.path.join(self._data_dir, 'part-*')
+    files, globbed = self._match_files_and_count_globs(pattern)
+    self.assertEqual(files, input_reader.match_files(pattern))
+    self.assertIn(pattern, globbed)
+    self.assertLen(tf.io.gfile.listdir(self._manifest_dir), 1)
+
+    files, globbed = self._match_files_and_count_globs(pattern)
+    self.assertEqual(files, input_reader.match_files(pattern))
+    self.assertNotIn(pattern, globbed)
+
+  def test_manifest_is_invalidated_by_new_files(self):
+    pattern = os.path.join(self._data_dir, 'part-*')
+    input_reader.match_files(pattern, self._manifest_dir)
+    _write_files(self._data_dir, ['part-2'])
+    _bump_mtime(self._data_dir)
+    files = input_reader.match_files(pattern, self._manifest_dir)
+    self.assertEqual(files, input_reader.match_files(pattern))
+    self.assertLen(files, 3)
+
+  def test_manifest_is_invalidated_by_new_files_in_subdirectories(self):
+    _write_files(os.path.join(self._data_dir, 'a'), ['part-0'])
+    _write_files(os.path.join(self._data_dir, 'b'), ['part-0'])
+    pattern = os.path.join(self._data_dir, '*', 'part-*')
+    self.assertLen(input_reader.match_files(pattern, self._manifest_dir), 2)
+
+    _write_files(os.path.join(self._data_dir, 'b'), ['part-1'])
+    _bump_mtime(os.path.join(self._data_dir, 'b'))
+    files = input_reader.match_files(pattern, self._manifest_dir)
+    self.assertEqual(files, input_reader.match_files(pattern))
+    self.assertLen(files, 3)
+
+    _write_files(os.path.join(self._data_dir, 'c'), ['part-0'])
+    files = input_reader.match_files(pattern, self._manifest_dir)
+    self.assertEqual(files, input_reader.match_files(pattern))
+    self.assertLen(files, 4)
+
+  def test_no_manifest_without_mtimes(self):
+    pattern = os.path.join(self._data_dir, 'part-*')
+    with mock.patch.object(
+        input_reader, '_get_glob_mtimes', return_value=None):
+      files, globbed = self._match_files_and_count_globs(pattern)
+    self.assertEqual(files, input_reader.match_files(pattern))
+    self.assertIn(pattern, globbed)
+    self.assertFalse(tf.io.gfile.exists(self._manifest_dir))
+
+
+class MixSourcesTest(tf.test.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    data_dir = os.path.join(self.get_temp_dir(), 'data')
+    _write_files(data_dir, ['a', 'b'])
+    self._input_path = {
+        'a': os.path.join(data_dir, 'a'),
+        'b': os.path.join(data_dir, 'b')
+    }
+
+  def _get_params(self, **kwargs):
+    params = dict(
+        input_path=self._input_path,
+        global_batch_size=1,
+        is_training=False,
+        seed=1)
+    params.update(kwargs)
+    return cfg.DataConfig(**params)
+
+  def _read(self, reader, num_examples=None, sizes=(None, None)):
+    # The sources are constant in-memory datasets of 0s for 'a' and 1s for 'b'.
+    sources = {}
+    for value, (name, size) in enumerate(zip(['a', 'b'], sizes)):
+      source = tf.data.Dataset.from_tensors(tf.constant(value, tf.int64))
+      sources[name] = source.repeat(size)
+    dataset = reader.read(dataset=sources).unbatch()
+    if num_examples is not None:
+      dataset = dataset.take(num_examples)
+    return list(dataset.as_numpy_iterator())
+
+  def test_mixing_ratio(self):
+    reader = input_reader.InputReader(
+        self._get_params(source_weights={'a': 0.8, 'b': 0.2}))
+    values = self._read(reader, num_examples=2000)
+    self.assertNear(values.count(0) / len(values), 0.8, 0.05)
+    self.assertNear(values.count(1) / len(values), 0.2, 0.05)
+
+  def test_mixing_schedule(self):
+    reader = input_reader.InputReader(
+        self._get_params(
+            source_weights={
+                'a': [0.75, 0.0],
+                'b': [0.25, 1.0]
+            },
+            source_weight_boundaries=[1000]))
+    values = self._read(reader, num_examples=1500)
+    self.assertNear(values[:1000].count(0) / 1000, 0.75, 0.05)
+    self.assertEqual(values[1000:], [1] * 500)
+
+  def test_source_stats(self):
+    reader = input_reader.InputReader(
+        self._get_params(source_weights={'a': 0.5, 'b': 0.5},
+                         source_stats=True))
+    self.assertEqual(reader.source_stats.get()['a']['examples'], 0)
+    values = self._read(reader, sizes=(30, 20))
+    self.assertCountEqual(values, [0] * 30 + [1] * 20)
+
+    stats = reader.source_stats.get()
+    self.assertEqual(stats['a']['examples'], 30)
+    self.assertEqual(stats['b']['examples'], 20)
+    for name in ['a', 'b']:
+      self.assertGreaterEqual(stats[name]['examples_per_sec'], 0.0)
+      self.assertGreaterEqual(stats[name]['mean_buffered_secs'], 0.0)
+      self.assertBetween(stats[name]['starved'], 0, stats[name]['examples'])
+      self.assertBetween(stats[name]['starved_ratio'], 0.0, 1.0)
+
+  def test_source_stats_starvation(self):
+    stats = input_reader.SourceStats(['a', 'b'])
+    now = time.time()
+    stats.record(0, now)
+    stats.record(0, now - 10.0)
+    stats.record(1, now - 20.0)
+    stats = stats.get()
+    self.assertEqual(stats['a']['examples'], 2)
+    self.assertEqual(stats['a']['starved'], 1)
+    self.assertEqual(stats['a']['starved_ratio'], 0.5)
+    self.assertGreaterEqual(stats['a']['mean_buffered_secs'], 5.0)
+    self.assertEqual(stats['b']['examples'], 1)
+    self.assertEqual(stats['b']['starved'], 0)
+    self.assertGreaterEqual(stats['b']['mean_buffered_secs'], 20.0)
+
+  def test_combine_fn_takes_precedence(self):
+    reader = input_reader.InputReader(
+        self._get_params(source_weights={'a': 1.0, 'b': 0.0},
+                         source_stats=True),
+        combine_fn=lambda datasets: datasets['b'])
+    self.assertIsNone(reader.source_stats)
+    self.assertEqual(self._read(reader, num_examples=10), [1] * 10)
+
+  def test_invalid_source_weights(self):
+    with self.assertRaisesRegex(ValueError, '2 are required'):
+      input_reader.InputReader(
+          self._get_params(
+              source_weights={
+                  'a': [0.5, 0.5, 0.5],
+                  'b': 0.5
+              },
+              source_weight_boundaries=[10]))
+    with self.assertRaisesRegex(ValueError, '2 are required'):
+      input_reader.InputReader(
+          self._get_params(
+              source_weights={
+                  'a': [0.5],
+                  'b': 0.5
+              },
+              source_weight_boundaries=[10]))
+    with self.assertRaisesRegex(ValueError, 'must match the keys'):
+      input_reader.InputReader(
+          self._get_params(source_weights={'a': 1.0}))
+    with self.assertRaisesRegex(ValueError, 'requires `input_path`'):
+      input_reader.InputReader(
+          self._get_params(
+              input_path=self._input_path['a'],
+              source_weights={'a': 1.0}))
+    with self.assertRaisesRegex(ValueError, '`combine_fn` or `source_weights`'):
+      input_reader.InputReader(self._get_params())
+
+
+class SnapshotTest(tf.test.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self._input_path = os.path.join(self.get_temp_dir(), 'examples.tfrecord')
+    _write_examples(self._input_path, range(5))
+
+  def _get_params(self, **kwargs):
+    params = dict(
+        input_path=self._input_path,
+        global_batch_size=8,
+        is_training=False,
+        drop_remainder=False,
+        snapshot_dir=os.path.join(self.get_temp_dir(), 'snapshots'))
+    params.update(kwargs)
+    return cfg.DataConfig(**params)
+
+  def _get_fingerprint(self, decoder_fn=None, **kwargs):
+    reader = input_reader.InputReader(
+        self._get_params(**kwargs),
+        decoder_fn=decoder_fn or _Decoder().decode)
+    return reader._snapshot_fingerprint
+
+  def _read(self, decoder_fn):
+    reader = input_reader.InputReader(
+        self._get_params(), decoder_fn=decoder_fn)
+    return [x for batch in reader.read().as_numpy_iterator() for x in batch]
+
+  def test_fingerprint_ignores_excluded_fields(self):
+    fingerprint = self._get_fingerprint()
+    self.assertEqual(
+        fingerprint,
+        self._get_fingerprint(
+            global_batch_size=2,
+            shuffle_buffer_size=7,
+            seed=3,
+            cycle_length=2,
+            deterministic=True,
+            snapshot_dir=os.path.join(self.get_temp_dir(), 'other')))
+    self.assertEqual(fingerprint, self._get_fingerprint(_Decoder().decode))
+
+  def test_fingerprint_changes_with_decoded_examples(self):
+    fingerprint = self._get_fingerprint()
+    self.assertNotEqual(fingerprint,
+                        self._get_fingerprint(tfds_skip_decoding_feature='x'))
+    self.assertNotEqual(fingerprint, self._get_fingerprint(_Decoder(1).decode))
+    self.assertNotEqual(fingerprint, self._get_fingerprint(snapshot_key='v2'))
+
+    other_input_path = os.path.join(self.get_temp_dir(), 'other.tfrecord')
+    _write_examples(other_input_path, range(5))
+    self.assertNotEqual(fingerprint,
+                        self._get_fingerprint(input_path=other_input_path))
+
+  def test_snapshot_key_is_required_for_stateful_decoders(self):
+    offset = tf.Variable(1, dtype=tf.int64)
+    decoder_fn = lambda x: _Decoder().decode(x) + offset
+    with self.assertRaisesRegex(ValueError, 'snapshot_key'):
+      self._get_fingerprint(decoder_fn)
+    self.assertNotEqual(
+        self._get_fingerprint(decoder_fn, snapshot_key='v1'),
+        self._get_fingerprint(decoder_fn, snapshot_key='v2'))
+
+  def test_snapshot_round_trip(self):
+    self.assertCountEqual(self._read(_Decoder().decode), range(5))
+    self.assertNotEmpty(tf.io.gfile.listdir(self._get_params().snapshot_dir))
+
+    # The second read comes from the snapshot rather than the input files.
+    _write_examples(self._input_path, range(10, 15))
+    self.assertCountEqual(self._read(_Decoder().decode), range(5))
+    self.assertCountEqual(self._read(_Decoder(1).decode), range(11, 16))
+
+
+if __name__ == '__main__':
+  tf.test.main()
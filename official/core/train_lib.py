@@ -32,6 +32,32 @@ from official.core import train_utils
 maybe_create_best_ckpt_exporter = train_utils.maybe_create_best_ckpt_exporter
 
 
+def _create_sidecar_eval_controller(
+    distribution_strategy: tf.distribute.Strategy,
+    task: base_task.Task,
+    params: config_definitions.ExperimentConfig,
+    model_dir: str,
+    eval_summary_dir: Optional[str],
+    controller_cls=orbit.Controller) -> orbit.Controller:
+  """Creates a controller evaluating checkpoints with a copy of the model."""
+  with distribution_strategy.scope():
+    evaluator = train_utils.create_trainer(
+        params,
+        task,
+        train=False,
+        evaluate=True,
+        checkpoint_exporter=maybe_create_best_ckpt_exporter(params, model_dir))
+  checkpoint_manager = tf.train.CheckpointManager(
+      evaluator.checkpoint, directory=model_dir, max_to_keep=None)
+  return controller_cls(
+      strategy=distribution_strategy,
+      evaluator=evaluator,
+      global_step=evaluator.global_step,
+      checkpoint_manager=checkpoint_manager,
+      eval_summary_dir=eval_summary_dir,
+      eval_actions=actions.get_eval_actions(params, evaluator, model_dir))
+
+
 def run_experiment(
     distribution_strategy: tf.distribute.Strategy,
     task: base_task.Task,
@@ -48,8 +74,10 @@ def run_experiment(
   Args:
     distribution_strategy: A distribution distribution_strategy.
     task: A Task instance.
-    mode: A 'str', specifying the mode. Can be 'train', 'eval', 'train_and_eval'
-      or 'continuous_eval'.
+    mode: A 'str', specifying the mode. Can be 'train', 'eval', 'train_and_eval',
+      'train_and_concurrent_eval' or 'continuous_eval'. In
+      'train_and_concurrent_eval' mode, a second copy of the model evaluates
+      the saved checkpoints on a side-car thread while training continues.
     params: ExperimentConfig instance.
     model_dir: A 'str', a path to store model checkpoints and summaries.
     run_post_eval: Whether to run post eval once after training, metrics logs
@@ -67,15 +95,16 @@ def run_experiment(
         otherwise, returns {}.
   """
 
+  concurrent_eval = mode == 'train_and_concurrent_eval'
   with distribution_strategy.scope():
     if not trainer:
       trainer = train_utils.create_trainer(
           params,
           task,
           train='train' in mode,
-          evaluate=('eval' in mode) or run_post_eval,
-          checkpoint_exporter=maybe_create_best_ckpt_exporter(
-              params, model_dir))
+          evaluate=('eval' in mode and not concurrent_eval) or run_post_eval,
+          checkpoint_exporter=None if concurrent_eval else
+          maybe_create_best_ckpt_exporter(params, model_dir))
 
   if trainer.checkpoint:
     if model_dir is None:
@@ -90,19 +119,25 @@ def run_experiment(
   else:
     checkpoint_manager = None
 
+  eval_summary_dir = os.path.join(
+      model_dir,
+      params.trainer.validation_summary_subdir) if (save_summary) else None
   controller = controller_cls(
       strategy=distribution_strategy,
       trainer=trainer if 'train' in mode else None,
       evaluator=trainer,
       global_step=trainer.global_step,
       steps_per_loop=params.trainer.steps_per_loop,
+      max_steps_per_loop=params.trainer.max_steps_per_loop,
+      target_host_overhead=params.trainer.target_host_overhead,
       checkpoint_manager=checkpoint_manager,
+      enable_async_checkpointing=params.trainer.enable_async_checkpointing,
       summary_dir=os.path.join(model_dir, 'train') if (save_summary) else None,
-      eval_summary_dir=os.path.join(model_dir,
-                                    params.trainer.validation_summary_subdir) if
-      (save_summary) else None,
+      eval_summary_dir=eval_summary_dir,
       summary_interval=params.trainer.summary_interval if
       (save_summary) else None,
+      enable_buffered_summaries=params.trainer.enable_buffered_summaries,
+      enable_phase_timing=params.trainer.enable_phase_timing,
       train_actions=actions.get_train_actions(
           params, trainer, model_dir, checkpoint_manager=checkpoint_manager),
       eval_actions=actions.get_eval_actions(params, trainer, model_dir))
@@ -116,6 +151,14 @@ def run_experiment(
           train_steps=params.trainer.train_steps,
           eval_steps=params.trainer.validation_steps,
           eval_interval=params.trainer.validation_interval)
+    elif concurrent_eval:
+      eval_controller = _create_sidecar_eval_controller(
+          distribution_strategy, task, params, model_dir, eval_summary_dir,
+          controller_cls)
+      controller.train_and_evaluate_concurrently(
+          eval_controller,
+          train_steps=params.trainer.train_steps,
+          eval_steps=params.trainer.validation_steps)
     elif mode == 'eval':
       controller.evaluate(steps=params.trainer.validation_steps)
     elif mode == 'continuous_eval':
@@ -70,7 +70,8 @@ class TrainTest(tf.test.TestCase, parameterized.TestCase):
               strategy_combinations.cloud_tpu_strategy,
               strategy_combinations.one_device_strategy_gpu,
           ],
-          flag_mode=['train', 'eval', 'train_and_eval'],
+          flag_mode=['train', 'eval', 'train_and_eval',
+                     'train_and_concurrent_eval'],
           run_post_eval=[True, False]))
   def test_end_to_end(self, distribution_strategy, flag_mode, run_post_eval):
     model_dir = self.get_temp_dir()
@@ -204,6 +205,36 @@ class TrainTest(tf.test.TestCase, parameterized.TestCase):
       for left, right in zip(before_weights, after_weights):
         self.assertAllEqual(left, right)
 
+  @parameterized.parameters('enable_buffered_summaries',
+                            'enable_async_checkpointing',
+                            'enable_phase_timing')
+  def test_controller_options(self, option):
+    model_dir = self.get_temp_dir()
+    self._test_config['trainer'][option] = True
+    flags_dict = dict(
+        experiment='mock',
+        mode='train_and_eval',
+        model_dir=model_dir,
+        params_override=json.dumps(self._test_config))
+    with flagsaver.flagsaver(**flags_dict):
+      params = train_utils.parse_configuration(flags.FLAGS)
+      task = task_factory.get_task(params.task, logging_dir=model_dir)
+      train_lib.run_experiment(
+          distribution_strategy=tf.distribute.get_strategy(),
+          task=task,
+          mode='train_and_eval',
+          params=params,
+          model_dir=model_dir)
+
+    self.assertNotEmpty(
+        tf.io.gfile.glob(os.path.join(model_dir, 'train', 'events*')))
+    self.assertNotEmpty(
+        tf.io.gfile.glob(os.path.join(model_dir, 'checkpoint')))
+    self.assertEqual(
+        tf.io.gfile.exists(
+            os.path.join(model_dir, 'train', 'phase_timeline.json')),
+        option == 'enable_phase_timing')
+
   def test_parse_configuration(self):
     model_dir = self.get_temp_dir()
     flags_dict = dict(
@@ -15,6 +15,10 @@
 """Translate text or files using trained transformer model."""
 
 # Import libraries
+import concurrent.futures
+import queue
+import threading
+
 from absl import logging
 import numpy as np
 import tensorflow as tf
@@ -188,3 +192,197 @@ def translate_from_text(model, subtokenizer, txt):
 def translate_from_input(outputs, subtokenizer):
   translation = _trim_and_decode(outputs, subtokenizer)
   logging.info("Translation: \"%s\"", translation)
+
+
+def _prefetch(iterable, buffer_size):
+  """Iterates over `iterable` in a background thread.
+
+  Args:
+    iterable: The iterable to consume.
+    buffer_size: The maximum number of items produced ahead of the consumer.
+
+  Yields:
+    The items of `iterable`. An exception raised by `iterable` is re-raised.
+  """
+  items = queue.Queue(maxsize=buffer_size)
+  done = object()
+  stop = threading.Event()
+
+  def _put(item, error=None):
+    """Puts an item in the queue unless the consumer stopped."""
+    while not stop.is_set():
+      try:
+        items.put((item, error), timeout=0.1)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  def _produce():
+    try:
+      for item in iterable:
+        if not _put(item):
+          return
+      _put(done)
+    except Exception as e:  # pylint: disable=broad-except
+      _put(done, e)
+
+  thread = threading.Thread(target=_produce, daemon=True)
+  thread.start()
+  try:
+    while True:
+      item, error = items.get()
+      if error is not None:
+        raise error
+      if item is done:
+        return
+      yield item
+  finally:
+    # Unblocks the producer if the consumer stops early.
+    stop.set()
+    thread.join()
+
+
+def _get_bucketed_batches(filename, subtokenizer, max_tokens_per_batch,
+                          max_buffered_lines, max_input_length=None):
+  """Reads and encodes lines, and groups them into batches of similar length.
+
+  The lines are read in windows of `max_buffered_lines` lines. The lines of a
+  window are sorted by their number of subtokens and split into batches whose
+  padded size is at most `max_tokens_per_batch` subtokens, so that only the
+  lines of one window are in memory at a time.
+
+  Args:
+    filename: String name of file to read inputs from.
+    subtokenizer: A subtokenizer object, used for encoding the lines.
+    max_tokens_per_batch: The maximum number of subtokens of a padded batch. A
+      single line longer than that forms a batch on its own.
+    max_buffered_lines: The number of lines sorted together.
+    max_input_length: If set, lines are truncated to that many subtokens,
+      including the EOS id.
+
+  Yields:
+    Tuples of the indices of the lines of a batch in the file, the lines, and
+    the padded int32 batch of subtoken ids with shape [batch_size, length].
+  """
+
+  def _make_batches(window):
+    window.sort(key=lambda x: len(x[2]), reverse=True)
+    start = 0
+    while start < len(window):
+      # The first line of a batch is its longest.
+      length = len(window[start][2])
+      size = max(1, min(len(window) - start, max_tokens_per_batch // length))
+      indices, lines, ids = zip(*window[start:start + size])
+      batch = np.zeros([size, length], dtype=np.int32)
+      for i, line_ids in enumerate(ids):
+        batch[i, :len(line_ids)] = line_ids
+      yield list(indices), list(lines), batch
+      start += size
+
+  window = []
+  with tf.io.gfile.GFile(filename) as f:
+    for index, record in enumerate(f):
+      line = record.strip()
+      ids = _encode_and_add_eos(line, subtokenizer)
+      if max_input_length and len(ids) > max_input_length:
+        ids = ids[:max_input_length - 1] + [tokenizer.EOS_ID]
+      window.append((index, line, ids))
+      if len(window) == max_buffered_lines:
+        yield from _make_batches(window)
+        window = []
+  yield from _make_batches(window)
+
+
+class _OrderedWriter(object):
+  """Writes translations in the order of the input lines as they complete."""
+
+  def __init__(self, f, subtokenizer, print_all_translations):
+    self._f = f
+    self._subtokenizer = subtokenizer
+    self._print_all_translations = print_all_translations
+    self._pending = {}
+    self.num_written = 0
+
+  def write_batch(self, indices, lines, outputs):
+    """Decodes a batch and writes all translations that are next in order."""
+    for index, line, ids in zip(indices, lines, outputs):
+      translation = _trim_and_decode(ids, self._subtokenizer)
+      if self._print_all_translations:
+        logging.info("Translating:\n\tInput: %s\n\tOutput: %s", line,
+                     translation)
+      self._pending[index] = translation
+    while self.num_written in self._pending:
+      self._f.write("%s\n" % self._pending.pop(self.num_written))
+      self.num_written += 1
+
+
+def translate_file_in_buckets(model,
+                              subtokenizer,
+                              input_file,
+                              output_file,
+                              max_tokens_per_batch=4096,
+                              max_buffered_lines=10000,
+                              max_input_length=None,
+                              print_all_translations=False):
+  """Translates the lines of a file with a `Seq2SeqTransformer`.
+
+  Unlike `translate_file`, the input file is streamed instead of being read and
+  sorted as a whole. Lines are sorted by subtoken length within windows of
+  `max_buffered_lines` lines and decoded in batches of at most
+  `max_tokens_per_batch` subtokens, which keeps the padding low. Subtokenizing
+  the input and detokenizing the translations run in background threads while
+  the model decodes, and the translations are written in the order of the
+  input lines as soon as all preceding lines are translated.
+
+  Args:
+    model: A `Seq2SeqTransformer` with `padded_decode=False`.
+    subtokenizer: A subtokenizer object, used for encoding and decoding source
+      and translated lines.
+    input_file: A file containing lines to translate.
+    output_file: A file that stores the generated translations.
+    max_tokens_per_batch: The maximum number of subtokens of a padded batch of
+      input lines.
+    max_buffered_lines: The number of input lines sorted together, which
+      bounds the number of lines and translations held in memory.
+    max_input_length: If set, input lines are truncated to that many
+      subtokens, including the EOS id.
+    print_all_translations: A bool. If true, all translations are logged.
+
+  Returns:
+    The number of translated lines.
+
+  Raises:
+    ValueError: if output file is invalid.
+  """
+  if tf.io.gfile.isdir(output_file):
+    raise ValueError("File output is a directory, will not save outputs to "
+                     "file.")
+
+  # A single trace handles all batch sizes and lengths.
+  @tf.function(input_signature=[tf.TensorSpec([None, None], tf.int32)])
+  def decode(inputs):
+    return model(dict(inputs=inputs), training=False)["outputs"]
+
+  batches = _prefetch(
+      _get_bucketed_batches(input_file, subtokenizer, max_tokens_per_batch,
+                            max_buffered_lines, max_input_length),
+      buffer_size=2)
+  with tf.io.gfile.GFile(output_file, "w") as f, \
+      concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+    writer = _OrderedWriter(f, subtokenizer, print_all_translations)
+    pending_write = None
+    for i, (indices, lines, batch) in enumerate(batches):
+      outputs = decode(tf.constant(batch)).numpy()
+      # Waits for the previous batch, which also surfaces write errors.
+      if pending_write is not None:
+        pending_write.result()
+      pending_write = executor.submit(writer.write_batch, indices, lines,
+                                      outputs)
+      if i % 100 == 0:
+        logging.info("Decoded batch %d with shape %s, %d lines written.", i,
+                     batch.shape, writer.num_written)
+    if pending_write is not None:
+      pending_write.result()
+  logging.info("Wrote %d translations to %s", writer.num_written, output_file)
+  return writer.num_written
@@ -0,0 +1,100 @@
+# Copyright 2021 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the streaming translation driver."""
+
+import os
+
+import tensorflow as tf
+
+from official.legacy.transformer import translate
+
+
+class _WordSubtokenizer(object):
+  """Encodes each word as one subtoken id."""
+
+  def __init__(self, words):
+    self._ids = {word: i + 2 for i, word in enumerate(words)}
+    self._words = {i: word for word, i in self._ids.items()}
+
+  def encode(self, line):
+    return [self._ids[word] for word in line.split()]
+
+  def decode(self, ids):
+    return " ".join(self._words[i] for i in ids if i)
+
+
+def _echo_model(inputs, training):
+  """Translates inputs to themselves."""
+  del training
+  return {"outputs": inputs["inputs"]}
+
+
+class TranslateTest(tf.test.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self._lines = ["a b c d e", "b", "", "c d", "e a b c d e a", "a", "d e c"]
+    self._subtokenizer = _WordSubtokenizer(["a", "b", "c", "d", "e"])
+    self._input_file = os.path.join(self.get_temp_dir(), "input.txt")
+    with tf.io.gfile.GFile(self._input_file, "w") as f:
+      f.write("\n".join(self._lines) + "\n")
+
+  def test_get_bucketed_batches(self):
+    batches = list(
+        translate._get_bucketed_batches(
+            self._input_file,
+            self._subtokenizer,
+            max_tokens_per_batch=6,
+            max_buffered_lines=4))
+    indices = sorted(i for batch_indices, _, _ in batches
+                     for i in batch_indices)
+    self.assertEqual(indices, list(range(len(self._lines))))
+    for batch_indices, lines, batch in batches:
+      # Batches only mix lines of the same window, and are within the budget
+      # unless they hold a single longer line.
+      self.assertLen(set(i // 4 for i in batch_indices), 1)
+      self.assertEqual(lines, [self._lines[i] for i in batch_indices])
+      if len(batch_indices) > 1:
+        self.assertLessEqual(batch.size, 6)
+    self.assertAllEqual(batches[0][2], [[2, 3, 4, 5, 6, 1]])
+
+  def test_translate_file_in_buckets(self):
+    output_file = os.path.join(self.get_temp_dir(), "output.txt")
+    num_translated = translate.translate_file_in_buckets(
+        _echo_model,
+        self._subtokenizer,
+        self._input_file,
+        output_file,
+        max_tokens_per_batch=8,
+        max_buffered_lines=3)
+    self.assertEqual(num_translated, len(self._lines))
+    with tf.io.gfile.GFile(output_file) as f:
+      self.assertEqual(f.read().split("\n")[:-1], self._lines)
+
+  def test_translate_file_in_buckets_truncates_inputs(self):
+    output_file = os.path.join(self.get_temp_dir(), "output.txt")
+    translate.translate_file_in_buckets(
+        _echo_model,
+        self._subtokenizer,
+        self._input_file,
+        output_file,
+        max_input_length=3)
+    with tf.io.gfile.GFile(output_file) as f:
+      self.assertEqual(f.read().split("\n")[:-1],
+                       [" ".join(line.split()[:2]) for line in self._lines])
+
+
+if __name__ == "__main__":
+  tf.test.main()
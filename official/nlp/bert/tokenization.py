@@ -177,11 +177,14 @@ class FullTokenizer(object):
   def tokenize(self, text):
     split_tokens = []
     for token in self.basic_tokenizer.tokenize(text):
-      for sub_token in self.wordpiece_tokenizer.tokenize(token):
-        split_tokens.append(sub_token)
+      split_tokens.extend(self.wordpiece_tokenizer.tokenize(token))
 
     return split_tokens
 
+  def tokenize_batch(self, texts):
+    """Tokenizes a batch of texts, sharing the wordpiece cache across them."""
+    return [self.tokenize(text) for text in texts]
+
   def convert_tokens_to_ids(self, tokens):
     return convert_by_vocab(self.vocab, tokens)
 
@@ -314,10 +317,31 @@ class BasicTokenizer(object):
 class WordpieceTokenizer(object):
   """Runs WordPiece tokenziation."""
 
-  def __init__(self, vocab, unk_token="[UNK]", max_input_chars_per_word=400):
+  def __init__(self,
+               vocab,
+               unk_token="[UNK]",
+               max_input_chars_per_word=400,
+               cache_size=65536):
+    """Constructs a WordpieceTokenizer.
+
+    Args:
+      vocab: A dictionary from wordpiece tokens to ids.
+      unk_token: The token emitted for words that cannot be tokenized.
+      max_input_chars_per_word: Words longer than this are mapped to
+        `unk_token`.
+      cache_size: The maximum number of words whose wordpieces are kept in a
+        least-recently-used cache. Set to 0 to disable caching.
+    """
     self.vocab = vocab
     self.unk_token = unk_token
     self.max_input_chars_per_word = max_input_chars_per_word
+    self.cache_size = cache_size
+    self._cache = collections.OrderedDict()
+    # Word-initial pieces can be any vocab entry, while continuation pieces are
+    # the vocab entries prefixed by "##", matched without that prefix.
+    self._prefix_trie = _build_trie((token, token) for token in vocab)
+    self._suffix_trie = _build_trie(
+        (token[2:], token) for token in vocab if token.startswith("##"))
 
   def tokenize(self, text):
     """Tokenizes a piece of text into its word pieces.
@@ -341,36 +365,68 @@ class WordpieceTokenizer(object):
 
     output_tokens = []
     for token in whitespace_tokenize(text):
-      chars = list(token)
-      if len(chars) > self.max_input_chars_per_word:
-        output_tokens.append(self.unk_token)
-        continue
+      output_tokens.extend(self._tokenize_word(token))
+    return output_tokens
 
-      is_bad = False
-      start = 0
-      sub_tokens = []
-      while start < len(chars):
-        end = len(chars)
-        cur_substr = None
-        while start < end:
-          substr = "".join(chars[start:end])
-          if start > 0:
-            substr = "##" + substr
-          if substr in self.vocab:
-            cur_substr = substr
-            break
-          end -= 1
-        if cur_substr is None:
-          is_bad = True
+  def _tokenize_word(self, word):
+    """Returns the wordpieces of a single word, using the cache if possible."""
+    if not self.cache_size:
+      return self._match_word(word)
+    sub_tokens = self._cache.get(word)
+    if sub_tokens is not None:
+      self._cache.move_to_end(word)
+      return sub_tokens
+    sub_tokens = self._match_word(word)
+    self._cache[word] = sub_tokens
+    if len(self._cache) > self.cache_size:
+      self._cache.popitem(last=False)
+    return sub_tokens
+
+  def _match_word(self, word):
+    """Greedily matches the longest vocab pieces of `word` using the tries."""
+    if len(word) > self.max_input_chars_per_word:
+      return (self.unk_token,)
+
+    sub_tokens = []
+    start = 0
+    trie = self._prefix_trie
+    while start < len(word):
+      # The deepest vocab entry on the trie path is the longest match.
+      node = trie
+      match = None
+      end = start
+      for end_candidate, char in enumerate(word[start:], start + 1):
+        node = node.get(char)
+        if node is None:
           break
-        sub_tokens.append(cur_substr)
-        start = end
-
-      if is_bad:
-        output_tokens.append(self.unk_token)
-      else:
-        output_tokens.extend(sub_tokens)
-    return output_tokens
+        token = node.get(_TRIE_TOKEN)
+        if token is not None:
+          match = token
+          end = end_candidate
+      if match is None:
+        return (self.unk_token,)
+      sub_tokens.append(match)
+      start = end
+      trie = self._suffix_trie
+    return tuple(sub_tokens)
+
+
+# The key under which a trie node stores the vocab token ending at that node.
+# It cannot collide with the single-character keys of the child nodes.
+_TRIE_TOKEN = ""
+
+
+def _build_trie(keys_and_tokens):
+  """Builds a character trie mapping each key to its vocab token."""
+  root = {}
+  for key, token in keys_and_tokens:
+    if not key:
+      continue
+    node = root
+    for char in key:
+      node = node.setdefault(char, {})
+    node[_TRIE_TOKEN] = token
+  return root
 
 
 def _is_whitespace(char):
@@ -462,30 +518,82 @@ def encode_pieces(sp_model, text, sample=False):
   Returns:
     A list of token pieces.
   """
-  if six.PY2 and isinstance(text, six.text_type):
-    text = six.ensure_binary(text, "utf-8")
+  return encode_pieces_batch(sp_model, [text], sample=sample)[0]
 
-  if not sample:
-    pieces = sp_model.EncodeAsPieces(text)
-  else:
-    pieces = sp_model.SampleEncodeAsPieces(text, 64, 0.1)
-  new_pieces = []
-  for piece in pieces:
-    piece = printable_text(piece)
-    if len(piece) > 1 and piece[-1] == "," and piece[-2].isdigit():
-      cur_pieces = sp_model.EncodeAsPieces(piece[:-1].replace(
-          SPIECE_UNDERLINE, ""))
-      if piece[0] != SPIECE_UNDERLINE and cur_pieces[0][0] == SPIECE_UNDERLINE:
-        if len(cur_pieces[0]) == 1:
-          cur_pieces = cur_pieces[1:]
-        else:
-          cur_pieces[0] = cur_pieces[0][1:]
-      cur_pieces.append(piece[-1])
-      new_pieces.extend(cur_pieces)
+
+def _is_digit_comma_piece(piece):
+  return len(piece) > 1 and piece[-1] == "," and piece[-2].isdigit()
+
+
+def _split_digit_comma_piece(piece, number_pieces):
+  """Returns the pieces replacing `piece`, given the pieces of its number."""
+  cur_pieces = list(number_pieces)
+  if piece[0] != SPIECE_UNDERLINE and cur_pieces[0][0] == SPIECE_UNDERLINE:
+    if len(cur_pieces[0]) == 1:
+      cur_pieces = cur_pieces[1:]
     else:
-      new_pieces.append(piece)
+      cur_pieces[0] = cur_pieces[0][1:]
+  cur_pieces.append(piece[-1])
+  return cur_pieces
+
+
+def encode_pieces_batch(sp_model, texts, sample=False):
+  """Segments a batch of texts into pieces.
+
+  The result is the same as calling `encode_pieces` on each text, but all the
+  texts are encoded with a single call into `sp_model`. Pieces ending with a
+  comma after a digit, which are split off the comma and re-encoded, are also
+  collected across the batch and re-encoded with a single call.
+
+  Args:
+    sp_model: A spm.SentencePieceProcessor object.
+    texts: A list of input texts to be segmented.
+    sample: Whether to randomly sample a segmentation output or return a
+      deterministic one.
+
+  Returns:
+    A list with the list of token pieces of each text.
+  """
+  if not texts:
+    return []
+  if six.PY2:
+    texts = [
+        six.ensure_binary(text, "utf-8")
+        if isinstance(text, six.text_type) else text for text in texts
+    ]
 
-  return new_pieces
+  if not sample:
+    batch_pieces = sp_model.EncodeAsPieces(list(texts))
+  else:
+    batch_pieces = sp_model.SampleEncodeAsPieces(list(texts), 64, 0.1)
+  batch_pieces = [[printable_text(piece)
+                   for piece in pieces]
+                  for pieces in batch_pieces]
+
+  digit_comma_pieces = sorted({
+      piece for pieces in batch_pieces for piece in pieces
+      if _is_digit_comma_piece(piece)
+  })
+  if not digit_comma_pieces:
+    return batch_pieces
+  number_pieces = sp_model.EncodeAsPieces([
+      piece[:-1].replace(SPIECE_UNDERLINE, "") for piece in digit_comma_pieces
+  ])
+  replacements = {
+      piece: _split_digit_comma_piece(piece, pieces)
+      for piece, pieces in zip(digit_comma_pieces, number_pieces)
+  }
+
+  new_batch_pieces = []
+  for pieces in batch_pieces:
+    new_pieces = []
+    for piece in pieces:
+      if piece in replacements:
+        new_pieces.extend(replacements[piece])
+      else:
+        new_pieces.append(piece)
+    new_batch_pieces.append(new_pieces)
+  return new_batch_pieces
 
 
 def encode_ids(sp_model, text, sample=False):
@@ -508,6 +616,25 @@ def encode_ids(sp_model, text, sample=False):
   return ids
 
 
+def encode_ids_batch(sp_model, texts, sample=False):
+  """Segments a batch of texts and returns their token ids.
+
+  See `encode_pieces_batch`.
+
+  Args:
+    sp_model: A spm.SentencePieceProcessor object.
+    texts: A list of input texts to be segmented.
+    sample: Whether to randomly sample a segmentation output or return a
+      deterministic one.
+
+  Returns:
+    A list with the list of token ids of each text.
+  """
+  return [[sp_model.PieceToId(piece)
+           for piece in pieces]
+          for pieces in encode_pieces_batch(sp_model, texts, sample=sample)]
+
+
 class FullSentencePieceTokenizer(object):
   """Runs end-to-end sentence piece tokenization.
 
@@ -515,11 +642,15 @@ class FullSentencePieceTokenizer(object):
   `FullTokenizer` class for easier usage.
   """
 
-  def __init__(self, sp_model_file):
+  def __init__(self, sp_model_file, cache_size=0):
     """Inits FullSentencePieceTokenizer.
 
     Args:
       sp_model_file: The path to the sentence piece model file.
+      cache_size: The maximum number of texts whose pieces are kept in a
+        least-recently-used cache. The cache is keyed by the text as passed
+        to `tokenize`, which callers are expected to have normalized with
+        `preprocess_text`. Set to 0 to disable caching.
     """
     self.sp_model = spm.SentencePieceProcessor()
     self.sp_model.Load(sp_model_file)
@@ -527,10 +658,32 @@ class FullSentencePieceTokenizer(object):
         self.sp_model.IdToPiece(i): i
         for i in six.moves.range(self.sp_model.GetPieceSize())
     }
+    self.cache_size = cache_size
+    self._cache = collections.OrderedDict()
 
   def tokenize(self, text):
     """Tokenizes text into pieces."""
-    return encode_pieces(self.sp_model, text)
+    return self.tokenize_batch([text])[0]
+
+  def tokenize_batch(self, texts):
+    """Tokenizes a batch of texts, encoding the uncached ones in one call."""
+    if not self.cache_size:
+      return encode_pieces_batch(self.sp_model, texts)
+    pieces = {}
+    for text in texts:
+      if text not in pieces and text in self._cache:
+        self._cache.move_to_end(text)
+        pieces[text] = self._cache[text]
+    missing_texts = [text for text in dict.fromkeys(texts)
+                     if text not in pieces]
+    for text, text_pieces in zip(
+        missing_texts, encode_pieces_batch(self.sp_model, missing_texts)):
+      pieces[text] = tuple(text_pieces)
+      self._cache[text] = pieces[text]
+    while len(self._cache) > self.cache_size:
+      self._cache.popitem(last=False)
+    # Callers may truncate the returned lists in place.
+    return [list(pieces[text]) for text in texts]
 
   def convert_tokens_to_ids(self, tokens):
     """Converts a list of tokens to a list of ids."""
@@ -18,6 +18,7 @@ import tempfile
 import six
 import tensorflow as tf
 
+from sentencepiece import SentencePieceTrainer
 from official.nlp.bert import tokenization
 
 
@@ -51,6 +52,10 @@ class TokenizationTest(tf.test.TestCase):
     self.assertAllEqual(
         tokenizer.convert_tokens_to_ids(tokens), [7, 4, 5, 10, 8, 9])
 
+    self.assertAllEqual(
+        tokenizer.tokenize_batch([u"UNwant\u00E9d,running", u"", u"wanted"]),
+        [["un", "##want", "##ed", ",", "runn", "##ing"], [], ["want", "##ed"]])
+
   def test_chinese(self):
     tokenizer = tokenization.BasicTokenizer()
 
@@ -109,6 +114,62 @@ class TokenizationTest(tf.test.TestCase):
     self.assertAllEqual(
         tokenizer.tokenize("unwantedX running"), ["[UNK]", "runn", "##ing"])
 
+  def test_wordpiece_tokenizer_cache(self):
+    vocab_tokens = [
+        "[UNK]", "a", "ab", "abc", "##b", "##bc", "##c", "##", "#", "##a#"
+    ]
+    vocab = {token: i for (i, token) in enumerate(vocab_tokens)}
+    cached_tokenizer = tokenization.WordpieceTokenizer(
+        vocab=vocab, cache_size=2)
+    uncached_tokenizer = tokenization.WordpieceTokenizer(
+        vocab=vocab, cache_size=0)
+
+    text = "abc abcbc ab# a#a# abcd #b ##c abc"
+    expected = [
+        "abc", "abc", "##bc", "[UNK]", "[UNK]", "[UNK]", "#", "##b", "##c",
+        "abc"
+    ]
+    self.assertAllEqual(uncached_tokenizer.tokenize(text), expected)
+    self.assertAllEqual(cached_tokenizer.tokenize(text), expected)
+    # Repeated calls are served from the cache, which stays bounded.
+    self.assertAllEqual(cached_tokenizer.tokenize(text), expected)
+    self.assertLen(cached_tokenizer._cache, 2)
+
+  def test_sentence_piece_tokenizer_batch_and_cache(self):
+    input_file = os.path.join(self.get_temp_dir(), "sp_input.txt")
+    with tf.io.gfile.GFile(input_file, "w") as f:
+      f.write("\n".join(["it cost 1,000 dollars in 2019, or 12, each"] * 50))
+    model_prefix = os.path.join(self.get_temp_dir(), "sp_model")
+    SentencePieceTrainer.Train(
+        "--input={} --model_prefix={} --vocab_size=100 "
+        "--hard_vocab_limit=false".format(
+            input_file, model_prefix))
+    sp_model_file = model_prefix + ".model"
+    cached_tokenizer = tokenization.FullSentencePieceTokenizer(
+        sp_model_file, cache_size=2)
+    uncached_tokenizer = tokenization.FullSentencePieceTokenizer(
+        sp_model_file, cache_size=0)
+
+    texts = ["it cost 12, each", "in 2019, or", "", "it cost 12, each", "1,"]
+    expected = [
+        tokenization.encode_pieces(uncached_tokenizer.sp_model, text)
+        for text in texts
+    ]
+    # A comma after a digit is split off its piece.
+    self.assertIn(",", expected[0])
+    self.assertEqual(uncached_tokenizer.tokenize_batch(texts), expected)
+    self.assertEqual(cached_tokenizer.tokenize_batch(texts), expected)
+    self.assertEqual([cached_tokenizer.tokenize(text) for text in texts],
+                     expected)
+    self.assertLen(cached_tokenizer._cache, 2)
+    # The cached pieces are not affected by changes to the returned lists.
+    cached_tokenizer.tokenize(texts[-1]).pop()
+    self.assertEqual(cached_tokenizer.tokenize(texts[-1]), expected[-1])
+    self.assertEqual(
+        tokenization.encode_ids_batch(uncached_tokenizer.sp_model, texts),
+        [uncached_tokenizer.convert_tokens_to_ids(pieces)
+         for pieces in expected])
+
   def test_convert_tokens_to_ids(self):
     vocab_tokens = [
         "[UNK]", "[CLS]", "[SEP]", "want", "##want", "##ed", "wa", "un", "runn",
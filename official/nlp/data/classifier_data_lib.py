@@ -16,8 +16,10 @@
 
 import collections
 import csv
+import functools
 import importlib
 import json
+import multiprocessing
 import os
 
 from absl import logging
@@ -1432,57 +1434,206 @@ class WiCProcessor(DefaultGLUEDataProcessor):
     return feature
 
 
+def _serialize_example(ex_index,
+                       example,
+                       label_list,
+                       max_seq_length,
+                       tokenizer,
+                       label_type=None,
+                       featurize_fn=None):
+  """Converts an `InputExample` into a serialized `tf.train.Example`."""
+  if featurize_fn:
+    feature = featurize_fn(ex_index, example, label_list, max_seq_length,
+                           tokenizer)
+  else:
+    feature = convert_single_example(ex_index, example, label_list,
+                                     max_seq_length, tokenizer)
+
+  def create_int_feature(values):
+    f = tf.train.Feature(int64_list=tf.train.Int64List(value=list(values)))
+    return f
+
+  def create_float_feature(values):
+    f = tf.train.Feature(float_list=tf.train.FloatList(value=list(values)))
+    return f
+
+  features = collections.OrderedDict()
+  features["input_ids"] = create_int_feature(feature.input_ids)
+  features["input_mask"] = create_int_feature(feature.input_mask)
+  features["segment_ids"] = create_int_feature(feature.segment_ids)
+  if label_type is not None and label_type == float:
+    features["label_ids"] = create_float_feature([feature.label_id])
+  elif feature.label_id is not None:
+    features["label_ids"] = create_int_feature([feature.label_id])
+  features["is_real_example"] = create_int_feature(
+      [int(feature.is_real_example)])
+  if feature.weight is not None:
+    features["weight"] = create_float_feature([feature.weight])
+  if feature.example_id is not None:
+    features["example_id"] = create_int_feature([feature.example_id])
+  else:
+    features["example_id"] = create_int_feature([ex_index])
+
+  tf_example = tf.train.Example(features=tf.train.Features(feature=features))
+  return tf_example.SerializeToString()
+
+
+def get_shard_output_file(output_file, shard_index, num_shards):
+  return "%s-%05d-of-%05d" % (output_file, shard_index, num_shards)
+
+
+# The tokenizer of a worker process, set by `_init_conversion_worker`.
+_worker_tokenizer = None
+
+
+def _init_conversion_worker(tokenizer):
+  global _worker_tokenizer
+  _worker_tokenizer = tokenizer
+
+
+def _serialize_with_worker_tokenizer(serialize_fn, indexed_example):
+  ex_index, example = indexed_example
+  return serialize_fn(ex_index, example, tokenizer=_worker_tokenizer)
+
+
+def _tokenize_in_batches(examples, tokenizer, batch_size=128):
+  """Yields `examples`, tokenizing their texts in batches ahead of time.
+
+  Tokenizers with a cache, such as a `FullSentencePieceTokenizer` with a
+  positive `cache_size`, tokenize the texts of `batch_size` examples with one
+  `tokenize_batch` call, so that featurizing the examples hits the cache.
+  Other tokenizers leave the examples to be tokenized one by one.
+
+  Args:
+    examples: A list of `InputExample`s.
+    tokenizer: The tokenizer featurizing the examples.
+    batch_size: The maximum number of examples tokenized together.
+
+  Yields:
+    The examples.
+  """
+  cache_size = getattr(tokenizer, "cache_size", 0)
+  if not cache_size or not hasattr(tokenizer, "tokenize_batch"):
+    yield from examples
+    return
+  # Each example has up to two texts, which must all stay in the cache.
+  batch_size = max(1, min(batch_size, cache_size // 4))
+  for start in range(0, len(examples), batch_size):
+    batch = examples[start:start + batch_size]
+    tokenizer.tokenize_batch([
+        text for example in batch for text in (example.text_a, example.text_b)
+        if text
+    ])
+    yield from batch
+
+
+def _write_shard(serialize_fn, output_file, num_shards, shard, tokenizer):
+  """Writes a contiguous range of examples to an output shard."""
+  shard_index, start_index, examples = shard
+  shard_output_file = get_shard_output_file(output_file, shard_index,
+                                            num_shards)
+  with tf.io.TFRecordWriter(shard_output_file) as writer:
+    for ex_index, example in enumerate(
+        _tokenize_in_batches(examples, tokenizer), start_index):
+      writer.write(serialize_fn(ex_index, example, tokenizer=tokenizer))
+  logging.info("Wrote %d examples to %s", len(examples), shard_output_file)
+  return len(examples)
+
+
+def _write_shard_with_worker_tokenizer(serialize_fn, output_file, num_shards,
+                                       shard):
+  return _write_shard(serialize_fn, output_file, num_shards, shard,
+                      _worker_tokenizer)
+
+
+def _write_records(records, output_file, num_records):
+  """Writes serialized records to a TFRecord file and returns their number."""
+  with tf.io.TFRecordWriter(output_file) as writer:
+    for index, record in enumerate(records):
+      if index % 10000 == 0:
+        logging.info("Writing example %d of %d", index, num_records)
+      writer.write(record)
+  return num_records
+
+
 def file_based_convert_examples_to_features(examples,
                                             label_list,
                                             max_seq_length,
                                             tokenizer,
                                             output_file,
                                             label_type=None,
-                                            featurize_fn=None):
-  """Convert a set of `InputExample`s to a TFRecord file."""
-
-  tf.io.gfile.makedirs(os.path.dirname(output_file))
-  writer = tf.io.TFRecordWriter(output_file)
+                                            featurize_fn=None,
+                                            num_shards=0,
+                                            num_workers=0):
+  """Convert a set of `InputExample`s to a TFRecord file.
+
+  If `num_shards` is positive, the examples are split into that many
+  contiguous, evenly sized ranges written to the TFRecord files
+  `get_shard_output_file(output_file, i, num_shards)` instead of
+  `output_file`. If `num_workers` is positive, the examples are converted by
+  that many worker processes, which write one shard at a time in the sharded
+  mode. Either way the records are the same as with a sequential conversion.
 
-  for ex_index, example in enumerate(examples):
-    if ex_index % 10000 == 0:
-      logging.info("Writing example %d of %d", ex_index, len(examples))
+  Args:
+    examples: A list of `InputExample`s.
+    label_list: The list of labels of the task.
+    max_seq_length: The maximum sequence length of the features.
+    tokenizer: The tokenizer. It is sent to each worker process once.
+    output_file: The output TFRecord file, or the prefix of the shards.
+    label_type: The type of the labels, if they are not class indexes.
+    featurize_fn: An optional function converting an `InputExample` into
+      `InputFeatures`, with the signature of `convert_single_example`. It must
+      be picklable if `num_workers` is positive.
+    num_shards: If positive, the number of output shards.
+    num_workers: If positive, the number of worker processes.
 
-    if featurize_fn:
-      feature = featurize_fn(ex_index, example, label_list, max_seq_length,
-                             tokenizer)
-    else:
-      feature = convert_single_example(ex_index, example, label_list,
-                                       max_seq_length, tokenizer)
-
-    def create_int_feature(values):
-      f = tf.train.Feature(int64_list=tf.train.Int64List(value=list(values)))
-      return f
-
-    def create_float_feature(values):
-      f = tf.train.Feature(float_list=tf.train.FloatList(value=list(values)))
-      return f
-
-    features = collections.OrderedDict()
-    features["input_ids"] = create_int_feature(feature.input_ids)
-    features["input_mask"] = create_int_feature(feature.input_mask)
-    features["segment_ids"] = create_int_feature(feature.segment_ids)
-    if label_type is not None and label_type == float:
-      features["label_ids"] = create_float_feature([feature.label_id])
-    elif feature.label_id is not None:
-      features["label_ids"] = create_int_feature([feature.label_id])
-    features["is_real_example"] = create_int_feature(
-        [int(feature.is_real_example)])
-    if feature.weight is not None:
-      features["weight"] = create_float_feature([feature.weight])
-    if feature.example_id is not None:
-      features["example_id"] = create_int_feature([feature.example_id])
-    else:
-      features["example_id"] = create_int_feature([ex_index])
+  Returns:
+    The number of examples written.
+  """
 
-    tf_example = tf.train.Example(features=tf.train.Features(feature=features))
-    writer.write(tf_example.SerializeToString())
-  writer.close()
+  tf.io.gfile.makedirs(os.path.dirname(output_file))
+  serialize_fn = functools.partial(
+      _serialize_example,
+      label_list=label_list,
+      max_seq_length=max_seq_length,
+      label_type=label_type,
+      featurize_fn=featurize_fn)
+
+  if num_shards > 0:
+    boundaries = [
+        i * len(examples) // num_shards for i in range(num_shards + 1)
+    ]
+    shards = [(i, boundaries[i], examples[boundaries[i]:boundaries[i + 1]])
+              for i in range(num_shards)]
+    if num_workers <= 0:
+      return sum(
+          _write_shard(serialize_fn, output_file, num_shards, shard, tokenizer)
+          for shard in shards)
+    with multiprocessing.Pool(
+        num_workers,
+        initializer=_init_conversion_worker,
+        initargs=(tokenizer,)) as pool:
+      return sum(
+          pool.imap_unordered(
+              functools.partial(_write_shard_with_worker_tokenizer,
+                                serialize_fn, output_file, num_shards),
+              shards))
+
+  if num_workers <= 0:
+    records = (serialize_fn(ex_index, example, tokenizer=tokenizer)
+               for ex_index, example in enumerate(
+                   _tokenize_in_batches(examples, tokenizer)))
+    return _write_records(records, output_file, len(examples))
+  with multiprocessing.Pool(
+      num_workers,
+      initializer=_init_conversion_worker,
+      initargs=(tokenizer,)) as pool:
+    # `imap` keeps the order of the examples.
+    records = pool.imap(
+        functools.partial(_serialize_with_worker_tokenizer, serialize_fn),
+        enumerate(examples),
+        chunksize=64)
+    return _write_records(records, output_file, len(examples))
 
 
 def _truncate_seq_pair(tokens_a, tokens_b, max_length):
@@ -1508,7 +1659,9 @@ def generate_tf_record_from_data_file(processor,
                                       train_data_output_path=None,
                                       eval_data_output_path=None,
                                       test_data_output_path=None,
-                                      max_seq_length=128):
+                                      max_seq_length=128,
+                                      num_shards=0,
+                                      num_workers=0):
   """Generates and saves training data into a tf record file.
 
   Args:
@@ -1525,6 +1678,10 @@ def generate_tf_record_from_data_file(processor,
         language specific test data.
       max_seq_length: Maximum sequence length of the to be generated
         training/eval data.
+      num_shards: If positive, each output is written to that many TFRecord
+        shards named `get_shard_output_file(path, i, num_shards)`.
+      num_workers: If positive, the number of worker processes used to convert
+        the examples.
 
   Returns:
       A dictionary containing input meta data.
@@ -1535,24 +1692,32 @@ def generate_tf_record_from_data_file(processor,
   label_type = getattr(processor, "label_type", None)
   is_regression = getattr(processor, "is_regression", False)
   has_sample_weights = getattr(processor, "weight_key", False)
+  # The default featurization is done with a plain function, so that worker
+  # processes do not need to unpickle the processor.
+  if type(processor).featurize_example is DataProcessor.featurize_example:
+    featurize_fn = None
+  else:
+    featurize_fn = processor.featurize_example
+  convert_fn = functools.partial(
+      file_based_convert_examples_to_features,
+      label_list=label_list,
+      max_seq_length=max_seq_length,
+      tokenizer=tokenizer,
+      label_type=label_type,
+      featurize_fn=featurize_fn,
+      num_shards=num_shards,
+      num_workers=num_workers)
 
   num_training_data = 0
   if train_data_output_path:
     train_input_data_examples = processor.get_train_examples(data_dir)
-    file_based_convert_examples_to_features(train_input_data_examples,
-                                            label_list, max_seq_length,
-                                            tokenizer, train_data_output_path,
-                                            label_type,
-                                            processor.featurize_example)
-    num_training_data = len(train_input_data_examples)
+    num_training_data = convert_fn(
+        train_input_data_examples, output_file=train_data_output_path)
 
   if eval_data_output_path:
     eval_input_data_examples = processor.get_dev_examples(data_dir)
-    file_based_convert_examples_to_features(eval_input_data_examples,
-                                            label_list, max_seq_length,
-                                            tokenizer, eval_data_output_path,
-                                            label_type,
-                                            processor.featurize_example)
+    num_eval_data = convert_fn(
+        eval_input_data_examples, output_file=eval_data_output_path)
 
   meta_data = {
       "processor_type": processor.get_processor_name(),
@@ -1564,18 +1729,11 @@ def generate_tf_record_from_data_file(processor,
     test_input_data_examples = processor.get_test_examples(data_dir)
     if isinstance(test_input_data_examples, dict):
       for language, examples in test_input_data_examples.items():
-        file_based_convert_examples_to_features(
-            examples, label_list, max_seq_length, tokenizer,
-            test_data_output_path.format(language), label_type,
-            processor.featurize_example)
-        meta_data["test_{}_data_size".format(language)] = len(examples)
+        meta_data["test_{}_data_size".format(language)] = convert_fn(
+            examples, output_file=test_data_output_path.format(language))
     else:
-      file_based_convert_examples_to_features(test_input_data_examples,
-                                              label_list, max_seq_length,
-                                              tokenizer, test_data_output_path,
-                                              label_type,
-                                              processor.featurize_example)
-      meta_data["test_data_size"] = len(test_input_data_examples)
+      meta_data["test_data_size"] = convert_fn(
+          test_input_data_examples, output_file=test_data_output_path)
 
   if is_regression:
     meta_data["task_type"] = "bert_regression"
@@ -1587,6 +1745,6 @@ def generate_tf_record_from_data_file(processor,
     meta_data["has_sample_weights"] = True
 
   if eval_data_output_path:
-    meta_data["eval_data_size"] = len(eval_input_data_examples)
+    meta_data["eval_data_size"] = num_eval_data
 
   return meta_data
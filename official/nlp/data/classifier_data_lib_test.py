@@ -90,6 +90,46 @@ class BertClassifierLibTest(tf.test.TestCase, parameterized.TestCase):
       # including data type/shapes are met.
       _ = next(iter(train_dataset))
 
+  @parameterized.parameters((0, 2), (3, 0), (3, 2))
+  def test_file_based_convert_examples_in_parallel(self, num_shards,
+                                                   num_workers):
+    examples = [
+        classifier_data_lib.InputExample(
+            guid="train-%d" % i,
+            text_a="unwanted running" * (i % 3 + 1),
+            text_b="want" if i % 2 else None,
+            label=str(i % 2)) for i in range(10)
+    ]
+    label_list = ["0", "1"]
+    expected_file = os.path.join(self.model_dir, "expected")
+    self.assertEqual(
+        10,
+        classifier_data_lib.file_based_convert_examples_to_features(
+            examples, label_list, 16, self.tokenizer, expected_file))
+
+    output_file = os.path.join(self.model_dir, "output")
+    self.assertEqual(
+        10,
+        classifier_data_lib.file_based_convert_examples_to_features(
+            examples,
+            label_list,
+            16,
+            self.tokenizer,
+            output_file,
+            num_shards=num_shards,
+            num_workers=num_workers))
+
+    if num_shards:
+      output_files = [
+          classifier_data_lib.get_shard_output_file(output_file, i, num_shards)
+          for i in range(num_shards)
+      ]
+    else:
+      output_files = [output_file]
+    expected = [r.numpy() for r in tf.data.TFRecordDataset(expected_file)]
+    self.assertEqual(
+        expected, [r.numpy() for r in tf.data.TFRecordDataset(output_files)])
+
 
 if __name__ == "__main__":
   tf.test.main()
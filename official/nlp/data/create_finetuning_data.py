@@ -119,6 +119,19 @@ flags.DEFINE_bool(
     "If true, then data will be preprocessed in a paragraph, query, class order"
     " instead of the BERT-style class, paragraph, query order.")
 
+flags.DEFINE_integer(
+    "num_workers", 0,
+    "If positive, the number of worker processes used to convert the "
+    "examples into features for the squad, classification, regression and "
+    "tagging tasks. The output is the same as with the default sequential "
+    "conversion.")
+
+flags.DEFINE_integer(
+    "num_output_shards", 0,
+    "If positive, the classification and regression data is written to that "
+    "many TFRecord shards named `<output path>-%05d-of-%05d`, each holding a "
+    "contiguous range of the examples.")
+
 # XTREME specific flags.
 flags.DEFINE_bool("only_use_en_dev", True, "Whether only use english dev data.")
 
@@ -159,6 +172,12 @@ flags.DEFINE_integer(
 flags.DEFINE_string("sp_model_file", "",
                     "The path to the model used by sentence piece tokenizer.")
 
+flags.DEFINE_integer(
+    "sp_cache_size", 10000,
+    "The number of preprocessed texts whose pieces are kept in a "
+    "least-recently-used cache by the sentence piece tokenizer, which pays "
+    "off for repeated premises or paragraphs. Set to 0 to disable caching.")
+
 flags.DEFINE_enum(
     "tokenization", "WordPiece", ["WordPiece", "SentencePiece"],
     "Specifies the tokenizer implementation, i.e., whether to use WordPiece "
@@ -200,7 +219,8 @@ def generate_classifier_dataset():
     processor_text_fn = tokenization.convert_to_unicode
   else:
     assert FLAGS.tokenization == "SentencePiece"
-    tokenizer = tokenization.FullSentencePieceTokenizer(FLAGS.sp_model_file)
+    tokenizer = tokenization.FullSentencePieceTokenizer(
+        FLAGS.sp_model_file, cache_size=FLAGS.sp_cache_size)
     processor_text_fn = functools.partial(
         tokenization.preprocess_text, lower=FLAGS.do_lower_case)
 
@@ -214,7 +234,9 @@ def generate_classifier_dataset():
         train_data_output_path=FLAGS.train_data_output_path,
         eval_data_output_path=FLAGS.eval_data_output_path,
         test_data_output_path=FLAGS.test_data_output_path,
-        max_seq_length=FLAGS.max_seq_length)
+        max_seq_length=FLAGS.max_seq_length,
+        num_shards=FLAGS.num_output_shards,
+        num_workers=FLAGS.num_workers)
   else:
     processors = {
         "ax":
@@ -281,7 +303,9 @@ def generate_classifier_dataset():
         train_data_output_path=FLAGS.train_data_output_path,
         eval_data_output_path=FLAGS.eval_data_output_path,
         test_data_output_path=FLAGS.test_data_output_path,
-        max_seq_length=FLAGS.max_seq_length)
+        max_seq_length=FLAGS.max_seq_length,
+        num_shards=FLAGS.num_output_shards,
+        num_workers=FLAGS.num_workers)
 
 
 def generate_regression_dataset():
@@ -292,7 +316,8 @@ def generate_regression_dataset():
     processor_text_fn = tokenization.convert_to_unicode
   else:
     assert FLAGS.tokenization == "SentencePiece"
-    tokenizer = tokenization.FullSentencePieceTokenizer(FLAGS.sp_model_file)
+    tokenizer = tokenization.FullSentencePieceTokenizer(
+        FLAGS.sp_model_file, cache_size=FLAGS.sp_cache_size)
     processor_text_fn = functools.partial(
         tokenization.preprocess_text, lower=FLAGS.do_lower_case)
 
@@ -306,7 +331,9 @@ def generate_regression_dataset():
         train_data_output_path=FLAGS.train_data_output_path,
         eval_data_output_path=FLAGS.eval_data_output_path,
         test_data_output_path=FLAGS.test_data_output_path,
-        max_seq_length=FLAGS.max_seq_length)
+        max_seq_length=FLAGS.max_seq_length,
+        num_shards=FLAGS.num_output_shards,
+        num_workers=FLAGS.num_workers)
   else:
     raise ValueError("No data processor found for the given regression task.")
 
@@ -325,7 +352,8 @@ def generate_squad_dataset():
         max_query_length=FLAGS.max_query_length,
         doc_stride=FLAGS.doc_stride,
         version_2_with_negative=FLAGS.version_2_with_negative,
-        xlnet_format=FLAGS.xlnet_format)
+        xlnet_format=FLAGS.xlnet_format,
+        num_workers=FLAGS.num_workers)
   else:
     assert FLAGS.tokenization == "SentencePiece"
     return squad_lib_sp.generate_tf_record_from_json_file(
@@ -338,7 +366,9 @@ def generate_squad_dataset():
         max_query_length=FLAGS.max_query_length,
         doc_stride=FLAGS.doc_stride,
         xlnet_format=FLAGS.xlnet_format,
-        version_2_with_negative=FLAGS.version_2_with_negative)
+        version_2_with_negative=FLAGS.version_2_with_negative,
+        num_workers=FLAGS.num_workers,
+        sp_cache_size=FLAGS.sp_cache_size)
 
 
 def generate_retrieval_dataset():
@@ -350,7 +380,8 @@ def generate_retrieval_dataset():
     processor_text_fn = tokenization.convert_to_unicode
   else:
     assert FLAGS.tokenization == "SentencePiece"
-    tokenizer = tokenization.FullSentencePieceTokenizer(FLAGS.sp_model_file)
+    tokenizer = tokenization.FullSentencePieceTokenizer(
+        FLAGS.sp_model_file, cache_size=FLAGS.sp_cache_size)
     processor_text_fn = functools.partial(
         tokenization.preprocess_text, lower=FLAGS.do_lower_case)
 
@@ -393,7 +424,8 @@ def generate_tagging_dataset():
         vocab_file=FLAGS.vocab_file, do_lower_case=FLAGS.do_lower_case)
     processor_text_fn = tokenization.convert_to_unicode
   elif FLAGS.tokenization == "SentencePiece":
-    tokenizer = tokenization.FullSentencePieceTokenizer(FLAGS.sp_model_file)
+    tokenizer = tokenization.FullSentencePieceTokenizer(
+        FLAGS.sp_model_file, cache_size=FLAGS.sp_cache_size)
     processor_text_fn = functools.partial(
         tokenization.preprocess_text, lower=FLAGS.do_lower_case)
   else:
@@ -403,7 +435,8 @@ def generate_tagging_dataset():
   return tagging_data_lib.generate_tf_record_from_data_file(
       processor, FLAGS.input_data_dir, tokenizer, FLAGS.max_seq_length,
       FLAGS.train_data_output_path, FLAGS.eval_data_output_path,
-      FLAGS.test_data_output_path, processor_text_fn)
+      FLAGS.test_data_output_path, processor_text_fn,
+      num_workers=FLAGS.num_workers)
 
 
 def main(_):
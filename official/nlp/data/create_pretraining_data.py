@@ -15,13 +15,16 @@
 """Create masked LM/next sentence masked_lm TF examples for BERT."""
 
 import collections
+import functools
 import itertools
+import multiprocessing
 import random
 
 # Import libraries
 from absl import app
 from absl import flags
 from absl import logging
+import numpy as np
 import tensorflow as tf
 
 from official.nlp.bert import tokenization
@@ -79,10 +82,35 @@ flags.DEFINE_float(
     "Probability of creating sequences which are shorter than the "
     "maximum length.")
 
+flags.DEFINE_bool(
+    "use_token_ids", False,
+    "Whether to represent documents and training instances as NumPy arrays of "
+    "token ids instead of lists of token strings. This uses much less memory "
+    "and masks with vectorized ops, but draws different random numbers so the "
+    "output differs from the default mode.")
+
+flags.DEFINE_integer(
+    "num_workers", 0,
+    "If positive, the input files are split into shards of about "
+    "`input_shard_size_mb` (cut at document boundaries), which are processed "
+    "independently by this many worker processes. Each worker tokenizes one "
+    "shard at a time and writes its instances to "
+    "`<output_file>-<shard>-of-<num_shards>` one `dupe_factor` pass at a time, "
+    "so memory is bounded by the shard size rather than the corpus. Random "
+    "next sentences are then sampled from the same shard.")
+
+flags.DEFINE_integer(
+    "input_shard_size_mb", 64,
+    "The approximate size of the input shards when `num_workers` is set. If "
+    "not positive, every input file is a single shard.")
+
 
 class TrainingInstance(object):
   """A single training instance (sentence pair)."""
 
+  __slots__ = ("tokens", "segment_ids", "is_random_next", "masked_lm_positions",
+               "masked_lm_labels")
+
   def __init__(self, tokens, segment_ids, masked_lm_positions, masked_lm_labels,
                is_random_next):
     self.tokens = tokens
@@ -108,6 +136,103 @@ class TrainingInstance(object):
     return self.__str__()
 
 
+class IdTrainingInstance(object):
+  """A single training instance (sentence pair) holding token id arrays.
+
+  This is the compact counterpart of `TrainingInstance`: `input_ids`,
+  `segment_ids`, `masked_lm_positions` and `masked_lm_ids` are unpadded NumPy
+  int32 arrays, and the masked LM labels are token ids instead of strings.
+  """
+
+  __slots__ = ("input_ids", "segment_ids", "is_random_next",
+               "masked_lm_positions", "masked_lm_ids")
+
+  def __init__(self, input_ids, segment_ids, masked_lm_positions,
+               masked_lm_ids, is_random_next):
+    self.input_ids = input_ids
+    self.segment_ids = segment_ids
+    self.is_random_next = is_random_next
+    self.masked_lm_positions = masked_lm_positions
+    self.masked_lm_ids = masked_lm_ids
+
+  def __str__(self):
+    s = ""
+    s += "input_ids: %s\n" % " ".join(str(x) for x in self.input_ids)
+    s += "segment_ids: %s\n" % " ".join(str(x) for x in self.segment_ids)
+    s += "is_random_next: %s\n" % self.is_random_next
+    s += "masked_lm_positions: %s\n" % " ".join(
+        str(x) for x in self.masked_lm_positions)
+    s += "masked_lm_ids: %s\n" % " ".join(str(x) for x in self.masked_lm_ids)
+    s += "\n"
+    return s
+
+  def __repr__(self):
+    return self.__str__()
+
+
+class VocabIds(object):
+  """The token ids needed to create `IdTrainingInstance`s."""
+
+  __slots__ = ("cls_id", "sep_id", "mask_id", "word_ids", "is_subword")
+
+  def __init__(self, vocab):
+    """Initializes the ids from a token to id dictionary.
+
+    Args:
+      vocab: A dictionary from wordpiece tokens to ids.
+    """
+    self.cls_id = vocab["[CLS]"]
+    self.sep_id = vocab["[SEP]"]
+    self.mask_id = vocab["[MASK]"]
+    # Random replacements are drawn from all vocab entries.
+    self.word_ids = np.array(list(vocab.values()), dtype=np.int32)
+    self.is_subword = np.zeros(self.word_ids.max() + 1, dtype=bool)
+    for token, token_id in vocab.items():
+      self.is_subword[token_id] = token.startswith("##")
+
+
+def _get_padded_features(instance, tokenizer, max_seq_length,
+                         max_predictions_per_seq):
+  """Returns the padded feature values of a training instance as lists."""
+  if isinstance(instance, IdTrainingInstance):
+    num_tokens = len(instance.input_ids)
+    assert num_tokens <= max_seq_length
+    num_padding = max_seq_length - num_tokens
+    input_ids = np.pad(instance.input_ids, (0, num_padding)).tolist()
+    input_mask = [1] * num_tokens + [0] * num_padding
+    segment_ids = np.pad(instance.segment_ids, (0, num_padding)).tolist()
+
+    num_predictions = len(instance.masked_lm_positions)
+    num_padding = max_predictions_per_seq - num_predictions
+    masked_lm_positions = np.pad(instance.masked_lm_positions,
+                                 (0, num_padding)).tolist()
+    masked_lm_ids = np.pad(instance.masked_lm_ids, (0, num_padding)).tolist()
+    masked_lm_weights = [1.0] * num_predictions + [0.0] * num_padding
+    return (input_ids, input_mask, segment_ids, masked_lm_positions,
+            masked_lm_ids, masked_lm_weights)
+
+  input_ids = tokenizer.convert_tokens_to_ids(instance.tokens)
+  input_mask = [1] * len(input_ids)
+  segment_ids = list(instance.segment_ids)
+  assert len(input_ids) <= max_seq_length
+
+  while len(input_ids) < max_seq_length:
+    input_ids.append(0)
+    input_mask.append(0)
+    segment_ids.append(0)
+
+  masked_lm_positions = list(instance.masked_lm_positions)
+  masked_lm_ids = tokenizer.convert_tokens_to_ids(instance.masked_lm_labels)
+  masked_lm_weights = [1.0] * len(masked_lm_ids)
+
+  while len(masked_lm_positions) < max_predictions_per_seq:
+    masked_lm_positions.append(0)
+    masked_lm_ids.append(0)
+    masked_lm_weights.append(0.0)
+  return (input_ids, input_mask, segment_ids, masked_lm_positions,
+          masked_lm_ids, masked_lm_weights)
+
+
 def write_instance_to_example_files(instances, tokenizer, max_seq_length,
                                     max_predictions_per_seq, output_files,
                                     gzip_compress, use_v2_feature_names):
@@ -122,29 +247,15 @@ def write_instance_to_example_files(instances, tokenizer, max_seq_length,
 
   total_written = 0
   for (inst_index, instance) in enumerate(instances):
-    input_ids = tokenizer.convert_tokens_to_ids(instance.tokens)
-    input_mask = [1] * len(input_ids)
-    segment_ids = list(instance.segment_ids)
-    assert len(input_ids) <= max_seq_length
-
-    while len(input_ids) < max_seq_length:
-      input_ids.append(0)
-      input_mask.append(0)
-      segment_ids.append(0)
+    (input_ids, input_mask, segment_ids, masked_lm_positions, masked_lm_ids,
+     masked_lm_weights) = _get_padded_features(instance, tokenizer,
+                                               max_seq_length,
+                                               max_predictions_per_seq)
 
     assert len(input_ids) == max_seq_length
     assert len(input_mask) == max_seq_length
     assert len(segment_ids) == max_seq_length
 
-    masked_lm_positions = list(instance.masked_lm_positions)
-    masked_lm_ids = tokenizer.convert_tokens_to_ids(instance.masked_lm_labels)
-    masked_lm_weights = [1.0] * len(masked_lm_ids)
-
-    while len(masked_lm_positions) < max_predictions_per_seq:
-      masked_lm_positions.append(0)
-      masked_lm_ids.append(0)
-      masked_lm_weights.append(0.0)
-
     next_sentence_label = 1 if instance.is_random_next else 0
 
     features = collections.OrderedDict()
@@ -170,8 +281,12 @@ def write_instance_to_example_files(instances, tokenizer, max_seq_length,
 
     if inst_index < 20:
       logging.info("*** Example ***")
+      if isinstance(instance, IdTrainingInstance):
+        tokens = tokenizer.convert_ids_to_tokens(instance.input_ids.tolist())
+      else:
+        tokens = instance.tokens
       logging.info("tokens: %s", " ".join(
-          [tokenization.printable_text(x) for x in instance.tokens]))
+          [tokenization.printable_text(x) for x in tokens]))
 
       for feature_name in features.keys():
         feature = features[feature_name]
@@ -186,6 +301,7 @@ def write_instance_to_example_files(instances, tokenizer, max_seq_length,
     writer.close()
 
   logging.info("Wrote %d total instances", total_written)
+  return total_written
 
 
 def create_int_feature(values):
@@ -198,68 +314,347 @@ def create_float_feature(values):
   return feature
 
 
-def create_training_instances(input_files,
-                              tokenizer,
-                              max_seq_length,
-                              dupe_factor,
-                              short_seq_prob,
-                              masked_lm_prob,
-                              max_predictions_per_seq,
-                              rng,
-                              do_whole_word_mask=False,
-                              max_ngram_size=None):
-  """Create `TrainingInstance`s from raw text."""
-  all_documents = [[]]
+def _is_blank_line(line):
+  return not tokenization.convert_to_unicode(line).strip()
 
-  # Input file format:
-  # (1) One sentence per line. These should ideally be actual sentences, not
-  # entire paragraphs or arbitrary spans of text. (Because we use the
-  # sentence boundaries for the "next sentence prediction" task).
-  # (2) Blank lines between documents. Document boundaries are needed so
-  # that the "next sentence prediction" task doesn't span between documents.
+
+def _read_lines(input_files):
+  """Yields the raw lines of `input_files`."""
   for input_file in input_files:
     with tf.io.gfile.GFile(input_file, "rb") as reader:
       while True:
-        line = tokenization.convert_to_unicode(reader.readline())
+        line = reader.readline()
         if not line:
           break
-        line = line.strip()
+        yield line
+
+
+def _read_shard_lines(input_file, start, end):
+  """Yields the raw lines of the documents starting in a byte range of a file.
 
-        # Empty lines are used as document delimiters
+  A document starts at the beginning of the file or after a blank line, and
+  belongs to the byte range `[start, end)` in which the blank line before it
+  (or the file) starts. Splitting a file into consecutive ranges thus yields
+  every document exactly once.
+
+  Args:
+    input_file: A raw text file.
+    start: The start offset of the range in bytes.
+    end: The end offset of the range in bytes.
+
+  Yields:
+    The raw lines of the documents, without the blank lines at the range
+    boundaries.
+  """
+  with tf.io.gfile.GFile(input_file, "rb") as reader:
+    if start > 0:
+      # Skips the rest of the line starting before `start`, and the lines up to
+      # the first blank line, which belong to a document of a previous range.
+      reader.seek(start - 1)
+      reader.readline()
+      while True:
+        offset = reader.tell()
+        line = reader.readline()
         if not line:
-          all_documents.append([])
-        tokens = tokenizer.tokenize(line)
-        if tokens:
-          all_documents[-1].append(tokens)
+          return
+        if _is_blank_line(line):
+          if offset >= end:
+            return
+          break
+    while True:
+      offset = reader.tell()
+      line = reader.readline()
+      if not line or (offset >= end and _is_blank_line(line)):
+        break
+      yield line
+
+
+def _tokenize_documents(lines, tokenizer, use_token_ids=False):
+  """Tokenizes raw text lines into non-empty documents.
+
+  Args:
+    lines: An iterable of raw text lines.
+    tokenizer: The tokenizer used to split each line into tokens.
+    use_token_ids: Whether to store each line as a NumPy int32 array of token
+      ids instead of a list of token strings.
+
+  Returns:
+    A list of documents, each of which is a list of tokenized lines.
+  """
+  all_documents = [[]]
+
+  # Input file format:
+  # (1) One sentence per line. These should ideally be actual sentences, not
+  # entire paragraphs or arbitrary spans of text. (Because we use the
+  # sentence boundaries for the "next sentence prediction" task).
+  # (2) Blank lines between documents. Document boundaries are needed so
+  # that the "next sentence prediction" task doesn't span between documents.
+  for line in lines:
+    line = tokenization.convert_to_unicode(line).strip()
+
+    # Empty lines are used as document delimiters
+    if not line:
+      all_documents.append([])
+    tokens = tokenizer.tokenize(line)
+    if tokens:
+      if use_token_ids:
+        tokens = np.array(
+            tokenizer.convert_tokens_to_ids(tokens), dtype=np.int32)
+      all_documents[-1].append(tokens)
 
   # Remove empty documents
-  all_documents = [x for x in all_documents if x]
+  return [x for x in all_documents if x]
+
+
+def _read_documents(input_files, tokenizer, use_token_ids=False):
+  """Reads and tokenizes the non-empty documents of `input_files`."""
+  return _tokenize_documents(
+      _read_lines(input_files), tokenizer, use_token_ids)
+
+
+def create_training_instances(input_files,
+                              tokenizer,
+                              max_seq_length,
+                              dupe_factor,
+                              short_seq_prob,
+                              masked_lm_prob,
+                              max_predictions_per_seq,
+                              rng,
+                              do_whole_word_mask=False,
+                              max_ngram_size=None,
+                              use_token_ids=False):
+  """Create `TrainingInstance`s from raw text.
+
+  If `use_token_ids` is True, `IdTrainingInstance`s are created instead.
+  """
+  all_documents = _read_documents(input_files, tokenizer, use_token_ids)
   rng.shuffle(all_documents)
 
-  vocab_words = list(tokenizer.vocab.keys())
   instances = []
+  for pass_instances in _create_instances_per_pass(
+      all_documents, tokenizer, max_seq_length, dupe_factor, short_seq_prob,
+      masked_lm_prob, max_predictions_per_seq, rng, do_whole_word_mask,
+      max_ngram_size, use_token_ids):
+    instances.extend(pass_instances)
+
+  rng.shuffle(instances)
+  return instances
+
+
+def _create_instances_per_pass(all_documents,
+                               tokenizer,
+                               max_seq_length,
+                               dupe_factor,
+                               short_seq_prob,
+                               masked_lm_prob,
+                               max_predictions_per_seq,
+                               rng,
+                               do_whole_word_mask=False,
+                               max_ngram_size=None,
+                               use_token_ids=False):
+  """Yields the instances of each of the `dupe_factor` passes over documents."""
+  if use_token_ids:
+    vocab_ids = VocabIds(tokenizer.vocab)
+    np_rng = np.random.default_rng(rng.getrandbits(64))
+    create_instances_fn = functools.partial(
+        create_id_instances_from_document,
+        vocab_ids=vocab_ids,
+        np_rng=np_rng)
+  else:
+    vocab_words = list(tokenizer.vocab.keys())
+    create_instances_fn = functools.partial(
+        create_instances_from_document, vocab_words=vocab_words)
   for _ in range(dupe_factor):
+    instances = []
     for document_index in range(len(all_documents)):
       instances.extend(
-          create_instances_from_document(
-              all_documents, document_index, max_seq_length, short_seq_prob,
-              masked_lm_prob, max_predictions_per_seq, vocab_words, rng,
-              do_whole_word_mask, max_ngram_size))
+          create_instances_fn(
+              all_documents=all_documents,
+              document_index=document_index,
+              max_seq_length=max_seq_length,
+              short_seq_prob=short_seq_prob,
+              masked_lm_prob=masked_lm_prob,
+              max_predictions_per_seq=max_predictions_per_seq,
+              rng=rng,
+              do_whole_word_mask=do_whole_word_mask,
+              max_ngram_size=max_ngram_size))
+    yield instances
 
-  rng.shuffle(instances)
-  return instances
 
+# The tokenizer of a worker process, created once by `_init_shard_worker`.
+_worker_tokenizer = None
 
-def create_instances_from_document(
-    all_documents, document_index, max_seq_length, short_seq_prob,
-    masked_lm_prob, max_predictions_per_seq, vocab_words, rng,
-    do_whole_word_mask=False,
-    max_ngram_size=None):
-  """Creates `TrainingInstance`s for a single document."""
-  document = all_documents[document_index]
 
-  # Account for [CLS], [SEP], [SEP]
-  max_num_tokens = max_seq_length - 3
+def _init_shard_worker(vocab_file, do_lower_case):
+  global _worker_tokenizer
+  _worker_tokenizer = tokenization.FullTokenizer(
+      vocab_file=vocab_file, do_lower_case=do_lower_case)
+
+
+def get_shard_output_file(output_file, shard_index, num_shards):
+  return "%s-%05d-of-%05d" % (output_file, shard_index, num_shards)
+
+
+def get_input_shards(input_files, shard_size_bytes=None):
+  """Splits `input_files` into consecutive byte ranges.
+
+  Args:
+    input_files: A list of raw text files.
+    shard_size_bytes: The size of the byte ranges. If `None` or not positive,
+      every file is a single range.
+
+  Returns:
+    A list of `(input_file, start, end)` tuples. The documents of a range are
+    read with `_read_shard_lines`.
+  """
+  shards = []
+  for input_file in input_files:
+    size = tf.io.gfile.stat(input_file).length
+    if not shard_size_bytes or shard_size_bytes <= 0:
+      shards.append((input_file, 0, size))
+      continue
+    for start in range(0, max(size, 1), shard_size_bytes):
+      shards.append((input_file, start, min(start + shard_size_bytes, size)))
+  return shards
+
+
+def _create_shard_examples(shard, output_file, num_shards, random_seed,
+                           max_seq_length, dupe_factor, short_seq_prob,
+                           masked_lm_prob, max_predictions_per_seq,
+                           do_whole_word_mask, max_ngram_size, gzip_compress,
+                           use_v2_feature_names, use_token_ids):
+  """Creates and writes the training instances of one input shard."""
+  shard_index, (input_file, start, end) = shard
+  # The seed only depends on the shard so that the output does not depend on
+  # the number of workers or the order in which shards are processed. The
+  # module-level generator is seeded too since n-gram masking draws from it.
+  seed = "%d-%d" % (random_seed, shard_index)
+  random.seed(seed)
+  rng = random.Random(seed)
+  all_documents = _tokenize_documents(
+      _read_shard_lines(input_file, start, end), _worker_tokenizer,
+      use_token_ids)
+  rng.shuffle(all_documents)
+
+  def _shuffled_instances():
+    # Each pass is shuffled and written before the next one is created, so
+    # only a single pass of instances is held in memory.
+    for instances in _create_instances_per_pass(
+        all_documents, _worker_tokenizer, max_seq_length, dupe_factor,
+        short_seq_prob, masked_lm_prob, max_predictions_per_seq, rng,
+        do_whole_word_mask, max_ngram_size, use_token_ids):
+      rng.shuffle(instances)
+      yield from instances
+
+  shard_output_file = get_shard_output_file(output_file, shard_index,
+                                            num_shards)
+  num_written = write_instance_to_example_files(
+      _shuffled_instances(), _worker_tokenizer, max_seq_length,
+      max_predictions_per_seq, [shard_output_file], gzip_compress,
+      use_v2_feature_names)
+  logging.info("Wrote %d instances from bytes [%d, %d) of %s to %s",
+               num_written, start, end, input_file, shard_output_file)
+  return num_written
+
+
+def create_sharded_examples(input_files,
+                            output_file,
+                            vocab_file,
+                            do_lower_case,
+                            num_workers,
+                            random_seed,
+                            max_seq_length,
+                            dupe_factor,
+                            short_seq_prob,
+                            masked_lm_prob,
+                            max_predictions_per_seq,
+                            do_whole_word_mask=False,
+                            max_ngram_size=None,
+                            gzip_compress=False,
+                            use_v2_feature_names=False,
+                            use_token_ids=False,
+                            shard_size_bytes=None):
+  """Creates TF example files with one output shard per input shard.
+
+  The input files are split into shards of about `shard_size_bytes` at
+  document boundaries (see `get_input_shards`), so that a corpus in a single
+  large file is processed in parallel too. The shards are processed
+  independently by a pool of `num_workers` worker processes, which tokenize
+  the shard, create its `TrainingInstance`s and write them to
+  `get_shard_output_file(output_file, i, num_shards)`. A worker holds the
+  documents of one shard and the instances of one `dupe_factor` pass in
+  memory at a time, and every shard uses its own seed derived from
+  `random_seed`, so the output is deterministic. Instances are shuffled within
+  each pass over a shard.
+
+  Args:
+    input_files: A list of raw text files.
+    output_file: The prefix of the output TFRecord shards.
+    vocab_file: The vocabulary file of the `FullTokenizer`.
+    do_lower_case: Whether to lower case the input text.
+    num_workers: The number of worker processes.
+    random_seed: The seed from which the per-shard seeds are derived.
+    max_seq_length: Maximum sequence length.
+    dupe_factor: Number of times to duplicate each input shard.
+    short_seq_prob: Probability of creating shorter sequences.
+    masked_lm_prob: Masked LM probability.
+    max_predictions_per_seq: Maximum number of masked LM predictions.
+    do_whole_word_mask: Whether to use whole word masking.
+    max_ngram_size: The maximum n-gram size for n-gram masking.
+    gzip_compress: Whether to GZIP compress the output files.
+    use_v2_feature_names: Whether to use the v2 feature names.
+    use_token_ids: Whether to create `IdTrainingInstance`s.
+    shard_size_bytes: The approximate size of the input shards. If `None`,
+      every input file is a single shard.
+
+  Returns:
+    The total number of written instances.
+  """
+  shards = get_input_shards(input_files, shard_size_bytes)
+  create_shard_fn = functools.partial(
+      _create_shard_examples,
+      output_file=output_file,
+      num_shards=len(shards),
+      random_seed=random_seed,
+      max_seq_length=max_seq_length,
+      dupe_factor=dupe_factor,
+      short_seq_prob=short_seq_prob,
+      masked_lm_prob=masked_lm_prob,
+      max_predictions_per_seq=max_predictions_per_seq,
+      do_whole_word_mask=do_whole_word_mask,
+      max_ngram_size=max_ngram_size,
+      gzip_compress=gzip_compress,
+      use_v2_feature_names=use_v2_feature_names,
+      use_token_ids=use_token_ids)
+  with multiprocessing.Pool(
+      num_workers,
+      initializer=_init_shard_worker,
+      initargs=(vocab_file, do_lower_case)) as pool:
+    total_written = sum(
+        pool.imap_unordered(create_shard_fn, enumerate(shards)))
+  logging.info("Wrote %d total instances to %d shards", total_written,
+               len(shards))
+  return total_written
+
+
+def _create_segment_pairs(all_documents, document_index, max_num_tokens,
+                          short_seq_prob, rng):
+  """Yields the "A" and "B" segments of the instances of a single document.
+
+  Args:
+    all_documents: A list of documents, each of which is a list of tokenized
+      lines.
+    document_index: The index of the document in `all_documents`.
+    max_num_tokens: The maximum number of tokens of both segments.
+    short_seq_prob: Probability of targeting a shorter sequence length.
+    rng: `random.Random` generator.
+
+  Yields:
+    Tuples `(a_lines, b_lines, is_random_next)`, where `a_lines` and `b_lines`
+    are the lists of tokenized lines that make up the "A" and "B" segments.
+    The caller may draw from `rng` between iterations.
+  """
+  document = all_documents[document_index]
 
   # We *usually* want to fill up the entire sequence since we are padding
   # to `max_seq_length` anyways, so short sequences are generally wasted
@@ -277,7 +672,6 @@ def create_instances_from_document(
   # next sentence prediction task too easy. Instead, we split the input into
   # segments "A" and "B" based on the actual "sentences" provided by the user
   # input.
-  instances = []
   current_chunk = []
   current_length = 0
   i = 0
@@ -293,16 +687,15 @@ def create_instances_from_document(
         if len(current_chunk) >= 2:
           a_end = rng.randint(1, len(current_chunk) - 1)
 
-        tokens_a = []
-        for j in range(a_end):
-          tokens_a.extend(current_chunk[j])
+        a_lines = current_chunk[:a_end]
+        a_length = sum(len(line) for line in a_lines)
 
-        tokens_b = []
+        b_lines = []
         # Random next
         is_random_next = False
         if len(current_chunk) == 1 or rng.random() < 0.5:
           is_random_next = True
-          target_b_length = target_seq_length - len(tokens_a)
+          target_b_length = target_seq_length - a_length
 
           # This should rarely go for more than one iteration for large
           # corpora. However, just to be careful, we try to make sure that
@@ -315,9 +708,11 @@ def create_instances_from_document(
 
           random_document = all_documents[random_document_index]
           random_start = rng.randint(0, len(random_document) - 1)
+          b_length = 0
           for j in range(random_start, len(random_document)):
-            tokens_b.extend(random_document[j])
-            if len(tokens_b) >= target_b_length:
+            b_lines.append(random_document[j])
+            b_length += len(random_document[j])
+            if b_length >= target_b_length:
               break
           # We didn't actually use these segments so we "put them back" so
           # they don't go to waste.
@@ -326,45 +721,99 @@ def create_instances_from_document(
         # Actual next
         else:
           is_random_next = False
-          for j in range(a_end, len(current_chunk)):
-            tokens_b.extend(current_chunk[j])
-        truncate_seq_pair(tokens_a, tokens_b, max_num_tokens, rng)
-
-        assert len(tokens_a) >= 1
-        assert len(tokens_b) >= 1
-
-        tokens = []
-        segment_ids = []
-        tokens.append("[CLS]")
-        segment_ids.append(0)
-        for token in tokens_a:
-          tokens.append(token)
-          segment_ids.append(0)
-
-        tokens.append("[SEP]")
-        segment_ids.append(0)
-
-        for token in tokens_b:
-          tokens.append(token)
-          segment_ids.append(1)
-        tokens.append("[SEP]")
-        segment_ids.append(1)
-
-        (tokens, masked_lm_positions,
-         masked_lm_labels) = create_masked_lm_predictions(
-             tokens, masked_lm_prob, max_predictions_per_seq, vocab_words, rng,
-             do_whole_word_mask, max_ngram_size)
-        instance = TrainingInstance(
-            tokens=tokens,
-            segment_ids=segment_ids,
-            is_random_next=is_random_next,
-            masked_lm_positions=masked_lm_positions,
-            masked_lm_labels=masked_lm_labels)
-        instances.append(instance)
+          b_lines = current_chunk[a_end:]
+        yield a_lines, b_lines, is_random_next
       current_chunk = []
       current_length = 0
     i += 1
 
+
+def create_instances_from_document(
+    all_documents, document_index, max_seq_length, short_seq_prob,
+    masked_lm_prob, max_predictions_per_seq, vocab_words, rng,
+    do_whole_word_mask=False,
+    max_ngram_size=None):
+  """Creates `TrainingInstance`s for a single document."""
+  # Account for [CLS], [SEP], [SEP]
+  max_num_tokens = max_seq_length - 3
+
+  instances = []
+  for a_lines, b_lines, is_random_next in _create_segment_pairs(
+      all_documents, document_index, max_num_tokens, short_seq_prob, rng):
+    tokens_a = list(itertools.chain.from_iterable(a_lines))
+    tokens_b = list(itertools.chain.from_iterable(b_lines))
+    truncate_seq_pair(tokens_a, tokens_b, max_num_tokens, rng)
+
+    assert len(tokens_a) >= 1
+    assert len(tokens_b) >= 1
+
+    tokens = []
+    segment_ids = []
+    tokens.append("[CLS]")
+    segment_ids.append(0)
+    for token in tokens_a:
+      tokens.append(token)
+      segment_ids.append(0)
+
+    tokens.append("[SEP]")
+    segment_ids.append(0)
+
+    for token in tokens_b:
+      tokens.append(token)
+      segment_ids.append(1)
+    tokens.append("[SEP]")
+    segment_ids.append(1)
+
+    (tokens, masked_lm_positions,
+     masked_lm_labels) = create_masked_lm_predictions(
+         tokens, masked_lm_prob, max_predictions_per_seq, vocab_words, rng,
+         do_whole_word_mask, max_ngram_size)
+    instance = TrainingInstance(
+        tokens=tokens,
+        segment_ids=segment_ids,
+        is_random_next=is_random_next,
+        masked_lm_positions=masked_lm_positions,
+        masked_lm_labels=masked_lm_labels)
+    instances.append(instance)
+
+  return instances
+
+
+def create_id_instances_from_document(
+    all_documents, document_index, max_seq_length, short_seq_prob,
+    masked_lm_prob, max_predictions_per_seq, vocab_ids, rng, np_rng,
+    do_whole_word_mask=False,
+    max_ngram_size=None):
+  """Creates `IdTrainingInstance`s for a single document of id arrays."""
+  # Account for [CLS], [SEP], [SEP]
+  max_num_tokens = max_seq_length - 3
+
+  instances = []
+  for a_lines, b_lines, is_random_next in _create_segment_pairs(
+      all_documents, document_index, max_num_tokens, short_seq_prob, rng):
+    ids_a, ids_b = truncate_id_seq_pair(
+        np.concatenate(a_lines), np.concatenate(b_lines), max_num_tokens, rng)
+
+    assert len(ids_a) >= 1
+    assert len(ids_b) >= 1
+
+    input_ids = np.concatenate([[vocab_ids.cls_id], ids_a, [vocab_ids.sep_id],
+                                ids_b, [vocab_ids.sep_id]]).astype(np.int32)
+    segment_ids = np.zeros_like(input_ids)
+    segment_ids[len(ids_a) + 2:] = 1
+
+    (input_ids, masked_lm_positions,
+     masked_lm_ids) = create_masked_lm_predictions_from_ids(
+         input_ids, masked_lm_prob, max_predictions_per_seq, vocab_ids, rng,
+         np_rng, do_whole_word_mask, max_ngram_size)
+    instances.append(
+        IdTrainingInstance(
+            input_ids=input_ids,
+            segment_ids=segment_ids,
+            is_random_next=is_random_next,
+            masked_lm_positions=masked_lm_positions,
+            masked_lm_ids=masked_lm_ids))
+
   return instances
 
 
@@ -493,13 +942,14 @@ def _masking_ngrams(grams, max_ngram_size, max_masked_tokens, rng):
       itertools.accumulate([1./n for n in range(1, max_ngram_size+1)]))
 
   output_ngrams = []
-  # Keep a bitmask of which tokens have been masked.
+  # Keep a bitmask of which tokens have been masked, and how many.
   masked_tokens = [False] * num_tokens
+  num_masked_tokens = 0
   # Loop until we have enough masked tokens or there are no more candidate
   # n-grams of any length.
   # Each code path should ensure one or more elements from `ngrams` are removed
   # to guarentee this loop terminates.
-  while (sum(masked_tokens) < max_masked_tokens and
+  while (num_masked_tokens < max_masked_tokens and
          sum(len(s) for s in ngrams.values())):
     # Pick an n-gram size based on our weights.
     sz = random.choices(range(1, max_ngram_size+1),
@@ -507,7 +957,7 @@ def _masking_ngrams(grams, max_ngram_size, max_masked_tokens, rng):
 
     # Ensure this size doesn't result in too many masked tokens.
     # E.g., a two-gram contains _at least_ two tokens.
-    if sum(masked_tokens) + sz > max_masked_tokens:
+    if num_masked_tokens + sz > max_masked_tokens:
       # All n-grams of this length are too long and can be removed from
       # consideration.
       ngrams[sz].clear()
@@ -522,15 +972,16 @@ def _masking_ngrams(grams, max_ngram_size, max_masked_tokens, rng):
     num_gram_tokens = gram.end-gram.begin
 
     # Check if this would add too many tokens.
-    if num_gram_tokens + sum(masked_tokens) > max_masked_tokens:
+    if num_gram_tokens + num_masked_tokens > max_masked_tokens:
       continue
 
     # Check if any of the tokens in this gram have already been masked.
-    if sum(masked_tokens[gram.begin:gram.end]):
+    if any(masked_tokens[gram.begin:gram.end]):
       continue
 
     # Found a usable n-gram!  Mark its tokens as masked and add it to return.
     masked_tokens[gram.begin:gram.end] = [True] * (gram.end-gram.begin)
+    num_masked_tokens += num_gram_tokens
     output_ngrams.append(gram)
   return output_ngrams
 
@@ -633,6 +1084,113 @@ def truncate_seq_pair(tokens_a, tokens_b, max_num_tokens, rng):
       trunc_tokens.pop()
 
 
+def truncate_id_seq_pair(ids_a, ids_b, max_num_tokens, rng):
+  """Truncates a pair of id arrays like `truncate_seq_pair`, without copies."""
+  a_begin, a_end = 0, len(ids_a)
+  b_begin, b_end = 0, len(ids_b)
+  while (a_end - a_begin) + (b_end - b_begin) > max_num_tokens:
+    truncate_a = (a_end - a_begin) > (b_end - b_begin)
+    # We want to sometimes truncate from the front and sometimes from the
+    # back to add more randomness and avoid biases.
+    truncate_front = rng.random() < 0.5
+    if truncate_a and truncate_front:
+      a_begin += 1
+    elif truncate_a:
+      a_end -= 1
+    elif truncate_front:
+      b_begin += 1
+    else:
+      b_end -= 1
+  return ids_a[a_begin:a_end], ids_b[b_begin:b_end]
+
+
+def _ids_to_grams(input_ids, vocab_ids, do_whole_word_mask):
+  """Returns the begin and end arrays of the maskable grams of `input_ids`."""
+  is_special = ((input_ids == vocab_ids.cls_id) |
+                (input_ids == vocab_ids.sep_id))
+  if not do_whole_word_mask:
+    begins = np.flatnonzero(~is_special)
+    return begins, begins + 1
+  # Like `_wordpieces_to_grams`, a word starts at every non-special token that
+  # is not a "##" continuation of a previous non-special token.
+  follows_special = np.concatenate([[True], is_special[:-1]])
+  is_begin = ~is_special & (~vocab_ids.is_subword[input_ids] | follows_special)
+  begins = np.flatnonzero(is_begin)
+  boundaries = np.append(np.flatnonzero(is_begin | is_special), len(input_ids))
+  ends = boundaries[np.searchsorted(boundaries, begins, side="right")]
+  return begins, ends
+
+
+def create_masked_lm_predictions_from_ids(input_ids,
+                                          masked_lm_prob,
+                                          max_predictions_per_seq,
+                                          vocab_ids,
+                                          rng,
+                                          np_rng,
+                                          do_whole_word_mask,
+                                          max_ngram_size=None):
+  """Creates the masked LM predictions of an int32 array of token ids.
+
+  This is the counterpart of `create_masked_lm_predictions` for
+  `IdTrainingInstance`s. Token level masking and the replacements are
+  vectorized with `np_rng`, while whole word and n-gram masking select their
+  grams with `_masking_ngrams`.
+
+  Args:
+    input_ids: An int32 array of token ids, including [CLS] and [SEP].
+    masked_lm_prob: Masked LM probability.
+    max_predictions_per_seq: Maximum number of masked LM predictions.
+    vocab_ids: A `VocabIds` instance.
+    rng: `random.Random` generator used to select whole word grams.
+    np_rng: `np.random.Generator` used for the vectorized ops.
+    do_whole_word_mask: Whether to use whole word masking.
+    max_ngram_size: The maximum n-gram size for n-gram masking.
+
+  Returns:
+    A tuple of the masked input ids, the sorted masked positions and the
+    original ids at these positions, all as int32 arrays.
+  """
+  if max_ngram_size and not do_whole_word_mask:
+    raise ValueError("cannot use ngram masking without whole word masking")
+
+  num_to_predict = min(max_predictions_per_seq,
+                       max(1, int(round(len(input_ids) * masked_lm_prob))))
+  begins, ends = _ids_to_grams(input_ids, vocab_ids, do_whole_word_mask)
+  if not do_whole_word_mask:
+    # Every gram is a single token, so sampling positions without replacement
+    # selects the same distribution of masks as `_masking_ngrams`.
+    selected = np_rng.choice(
+        len(begins), size=min(num_to_predict, len(begins)), replace=False)
+    begins = begins[selected]
+    ends = ends[selected]
+  elif len(begins):
+    masked_grams = _masking_ngrams(
+        [_Gram(b, e) for b, e in zip(begins.tolist(), ends.tolist())],
+        max_ngram_size or 1, num_to_predict, rng)
+    begins = np.array([g.begin for g in masked_grams], dtype=np.int64)
+    ends = np.array([g.end for g in masked_grams], dtype=np.int64)
+
+  # Expands the grams to the positions of their tokens.
+  lengths = ends - begins
+  gram_index = np.repeat(np.arange(len(begins)), lengths)
+  positions = (np.repeat(begins, lengths) + np.arange(len(gram_index)) -
+               np.repeat(np.cumsum(lengths) - lengths, lengths))
+
+  # 80% of the time, replace all n-gram tokens with [MASK], 10% of the time
+  # keep them, and 10% of the time replace each with a random word.
+  action = np_rng.random(len(begins))[gram_index]
+  output_ids = input_ids.copy()
+  output_ids[positions[action < 0.8]] = vocab_ids.mask_id
+  random_positions = positions[action >= 0.9]
+  output_ids[random_positions] = np_rng.choice(
+      vocab_ids.word_ids, size=len(random_positions))
+
+  order = np.argsort(positions, kind="stable")
+  positions = positions[order].astype(np.int32)
+  assert len(positions) <= num_to_predict
+  return output_ids, positions, input_ids[positions]
+
+
 def main(_):
   tokenizer = tokenization.FullTokenizer(
       vocab_file=FLAGS.vocab_file, do_lower_case=FLAGS.do_lower_case)
@@ -645,11 +1203,25 @@ def main(_):
   for input_file in input_files:
     logging.info("  %s", input_file)
 
+  if FLAGS.num_workers > 0:
+    if "," in FLAGS.output_file:
+      raise ValueError("`output_file` must be a single path prefix when "
+                       "`num_workers` is set.")
+    create_sharded_examples(
+        input_files, FLAGS.output_file, FLAGS.vocab_file, FLAGS.do_lower_case,
+        FLAGS.num_workers, FLAGS.random_seed, FLAGS.max_seq_length,
+        FLAGS.dupe_factor, FLAGS.short_seq_prob, FLAGS.masked_lm_prob,
+        FLAGS.max_predictions_per_seq, FLAGS.do_whole_word_mask,
+        FLAGS.max_ngram_size, FLAGS.gzip_compress, FLAGS.use_v2_feature_names,
+        FLAGS.use_token_ids, FLAGS.input_shard_size_mb * 1024 * 1024)
+    return
+
   rng = random.Random(FLAGS.random_seed)
   instances = create_training_instances(
       input_files, tokenizer, FLAGS.max_seq_length, FLAGS.dupe_factor,
       FLAGS.short_seq_prob, FLAGS.masked_lm_prob, FLAGS.max_predictions_per_seq,
-      rng, FLAGS.do_whole_word_mask, FLAGS.max_ngram_size)
+      rng, FLAGS.do_whole_word_mask, FLAGS.max_ngram_size,
+      FLAGS.use_token_ids)
 
   output_files = FLAGS.output_file.split(",")
   logging.info("*** Writing to output files ***")
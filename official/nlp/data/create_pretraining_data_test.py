@@ -13,8 +13,10 @@
 # limitations under the License.
 
 """Tests for official.nlp.data.create_pretraining_data."""
+import os
 import random
 
+import numpy as np
 import tensorflow as tf
 
 from official.nlp.data import create_pretraining_data as cpd
@@ -123,6 +125,167 @@ class CreatePretrainingDataTest(tf.test.TestCase):
       self.assertEqual(len(masked_labels), 76)
       self.assertTokens(tokens, output_tokens, masked_positions, masked_labels)
 
+  def test_create_masked_lm_predictions_from_ids(self):
+    tokens = ["[CLS]", "a", "##a", "b", "##b", "c", "##c", "[SEP]"]
+    vocab = {
+        token: i
+        for i, token in enumerate(["[MASK]"] + _VOCAB_WORDS + tokens)
+    }
+    vocab_ids = cpd.VocabIds(vocab)
+    input_ids = np.array([vocab[token] for token in tokens], dtype=np.int32)
+    rng = random.Random(123)
+    np_rng = np.random.default_rng(123)
+    for do_whole_word_mask in (False, True):
+      output_ids, masked_positions, masked_ids = (
+          cpd.create_masked_lm_predictions_from_ids(
+              input_ids,
+              masked_lm_prob=1.0,
+              max_predictions_per_seq=3,
+              vocab_ids=vocab_ids,
+              rng=rng,
+              np_rng=np_rng,
+              do_whole_word_mask=do_whole_word_mask))
+      # Whole words can't make up exactly three tokens, so only two are taken.
+      self.assertLen(masked_positions, 2 if do_whole_word_mask else 3)
+      self.assertEqual(masked_positions.dtype, np.int32)
+      self.assertAllEqual(masked_positions, np.sort(masked_positions))
+      self.assertAllEqual(masked_ids, input_ids[masked_positions])
+      self.assertNotIn(0, masked_positions)
+      self.assertNotIn(len(tokens) - 1, masked_positions)
+      unmasked = np.ones_like(input_ids, dtype=bool)
+      unmasked[masked_positions] = False
+      self.assertAllEqual(output_ids[unmasked], input_ids[unmasked])
+      if do_whole_word_mask:
+        masked_tokens = [tokens[i] for i in masked_positions]
+        self.assertIn(masked_tokens, [["a", "##a"], ["b", "##b"], ["c", "##c"]])
+
+  def test_truncate_id_seq_pair(self):
+    tokens_a = ["a%d" % i for i in range(7)]
+    tokens_b = ["b%d" % i for i in range(4)]
+    ids_a, ids_b = cpd.truncate_id_seq_pair(
+        np.array(tokens_a), np.array(tokens_b), 6, random.Random(1))
+    cpd.truncate_seq_pair(tokens_a, tokens_b, 6, random.Random(1))
+    self.assertEqual(ids_a.tolist(), tokens_a)
+    self.assertEqual(ids_b.tolist(), tokens_b)
+
+  def test_create_sharded_examples(self):
+    vocab_file = os.path.join(self.get_temp_dir(), "vocab.txt")
+    with tf.io.gfile.GFile(vocab_file, "w") as f:
+      f.write("\n".join(
+          ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "a", "b", "c", "d"]))
+    input_files = []
+    for i in range(3):
+      input_file = os.path.join(self.get_temp_dir(), "input_%d.txt" % i)
+      with tf.io.gfile.GFile(input_file, "w") as f:
+        f.write("a b c\nd a b\n\nc d\nb a c d\n\na a\nb b\n")
+      input_files.append(input_file)
+
+    def create_shards(output_file, num_workers, use_token_ids=False):
+      return cpd.create_sharded_examples(
+          input_files,
+          output_file,
+          vocab_file,
+          do_lower_case=True,
+          num_workers=num_workers,
+          random_seed=1,
+          max_seq_length=16,
+          dupe_factor=2,
+          short_seq_prob=0.1,
+          masked_lm_prob=0.15,
+          max_predictions_per_seq=2,
+          use_token_ids=use_token_ids)
+
+    output_file = os.path.join(self.get_temp_dir(), "train.tfrecord")
+    other_output_file = os.path.join(self.get_temp_dir(), "other.tfrecord")
+    num_written = create_shards(output_file, num_workers=2)
+    self.assertGreater(num_written, 0)
+    self.assertEqual(create_shards(other_output_file, num_workers=1),
+                     num_written)
+
+    for i in range(3):
+      shard = cpd.get_shard_output_file(output_file, i, 3)
+      other_shard = cpd.get_shard_output_file(other_output_file, i, 3)
+      # The output only depends on the seed, not on the number of workers.
+      self.assertEqual(
+          list(tf.data.TFRecordDataset(shard).as_numpy_iterator()),
+          list(tf.data.TFRecordDataset(other_shard).as_numpy_iterator()))
+
+    id_output_file = os.path.join(self.get_temp_dir(), "ids.tfrecord")
+    self.assertGreater(
+        create_shards(id_output_file, num_workers=2, use_token_ids=True), 0)
+
+  def test_read_shard_lines(self):
+    input_file = os.path.join(self.get_temp_dir(), "input.txt")
+    text = "a b c\nd a b\n\nc d\n\n\nb a c d\n \na a\nb b\n\nd\n"
+    with tf.io.gfile.GFile(input_file, "w") as f:
+      f.write(text)
+
+    def split_documents(lines):
+      documents = [[]]
+      for line in lines:
+        if line.strip():
+          documents[-1].append(line)
+        else:
+          documents.append([])
+      return [d for d in documents if d]
+
+    expected = split_documents(cpd._read_lines([input_file]))
+    self.assertLen(expected, 5)
+    # Every split of the file yields each document exactly once.
+    for shard_size in range(1, len(text) + 2):
+      shards = cpd.get_input_shards([input_file], shard_size)
+      self.assertLen(shards, -(-len(text) // shard_size))
+      documents = []
+      for shard in shards:
+        shard_documents = split_documents(cpd._read_shard_lines(*shard))
+        documents.extend(shard_documents)
+      self.assertEqual(documents, expected)
+
+  def test_create_sharded_examples_splits_files(self):
+    vocab_file = os.path.join(self.get_temp_dir(), "vocab.txt")
+    with tf.io.gfile.GFile(vocab_file, "w") as f:
+      f.write("\n".join(
+          ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "a", "b", "c", "d"]))
+    input_file = os.path.join(self.get_temp_dir(), "input.txt")
+    with tf.io.gfile.GFile(input_file, "w") as f:
+      f.write("a b c\nd a b\n\nc d\nb a c d\n\na a\nb b\n" * 8)
+
+    def create_shards(output_file, num_workers, shard_size_bytes):
+      return cpd.create_sharded_examples([input_file],
+                                         output_file,
+                                         vocab_file,
+                                         do_lower_case=True,
+                                         num_workers=num_workers,
+                                         random_seed=1,
+                                         max_seq_length=16,
+                                         dupe_factor=3,
+                                         short_seq_prob=0.0,
+                                         masked_lm_prob=0.15,
+                                         max_predictions_per_seq=2,
+                                         shard_size_bytes=shard_size_bytes)
+
+    output_file = os.path.join(self.get_temp_dir(), "train.tfrecord")
+    num_written = create_shards(output_file, 2, shard_size_bytes=100)
+    num_shards = len(cpd.get_input_shards([input_file], 100))
+    self.assertGreater(num_shards, 1)
+    # Every document makes at least one instance per pass, whichever shard it
+    # is in.
+    self.assertGreaterEqual(num_written, 24 * 3)
+
+    other_output_file = os.path.join(self.get_temp_dir(), "other.tfrecord")
+    self.assertEqual(
+        create_shards(other_output_file, 1, shard_size_bytes=100), num_written)
+    for i in range(num_shards):
+      self.assertEqual(
+          list(
+              tf.data.TFRecordDataset(
+                  cpd.get_shard_output_file(output_file, i,
+                                            num_shards)).as_numpy_iterator()),
+          list(
+              tf.data.TFRecordDataset(
+                  cpd.get_shard_output_file(other_output_file, i,
+                                            num_shards)).as_numpy_iterator()))
+
 
 if __name__ == "__main__":
   tf.test.main()
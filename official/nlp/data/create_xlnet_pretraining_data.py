@@ -14,12 +14,15 @@
 
 """Create LM TF examples for XLNet."""
 
+import functools
 import json
 import math
+import multiprocessing
 import os
 
 import random
-from typing import Iterable, Mapping, List, Optional, Tuple
+import tempfile
+from typing import Iterable, Iterator, Mapping, List, Optional, Tuple
 import unicodedata
 
 # Import libraries
@@ -78,6 +81,12 @@ flags.DEFINE_integer("task_id", None,
 flags.DEFINE_integer("num_tasks", None,
                      "The total number of tasks.")
 flags.DEFINE_integer("num_passes", 1, "The number of times to run the script.")
+flags.DEFINE_integer(
+    "num_workers", 0,
+    "If positive, the input files of this task are split among that many "
+    "worker processes. Each worker writes its own TFRecord files, and keeps "
+    "its tokenized documents and shuffled token stream on local disk instead "
+    "of in memory.")
 
 
 @dataclasses.dataclass
@@ -145,6 +154,107 @@ def _preprocess_line(line: str, do_lower_case: bool = False) -> str:
   return line
 
 
+# The number of lines tokenized by one call into the SentencePiece processor.
+_TOKENIZATION_BATCH_SIZE = 1024
+
+
+def _append_tokenized_lines(
+    lines: List[Optional[str]],
+    tokenizer: tokenization.FullSentencePieceTokenizer,
+    eod_symbol: int,
+    sentence_id: bool,
+    all_tokens: List[int],
+    all_sentence_ids: List[bool]) -> bool:
+  """Tokenizes a batch of preprocessed lines and appends their token IDs.
+
+  Args:
+    lines: The preprocessed lines, with `None` for the end of a document.
+    tokenizer: The SentencePiece tokenizer.
+    eod_symbol: The token ID of the end of a document.
+    sentence_id: The sentence ID of the first line.
+    all_tokens: The token IDs of the file, extended in place.
+    all_sentence_ids: The sentence IDs of the file, extended in place.
+
+  Returns:
+    The sentence ID of the line following `lines`.
+  """
+  texts = [line for line in lines if line is not None]
+  text_token_ids = iter(
+      tokenization.encode_ids_batch(sp_model=tokenizer.sp_model, texts=texts))
+  for line in lines:
+    if line is None:
+      token_ids = [eod_symbol]
+      sentence_id = not sentence_id
+    else:
+      token_ids = next(text_token_ids)
+    all_tokens.extend(token_ids)
+    all_sentence_ids.extend([sentence_id] * len(token_ids))
+    sentence_id = not sentence_id
+  return sentence_id
+
+
+def _preprocess_and_tokenize_file(
+    input_file: str,
+    tokenizer: tokenization.FullSentencePieceTokenizer,
+    use_eod: bool = True,
+    do_lower_case: bool = False,
+    log_example_freq: int = 100000) -> Optional[Tuple[np.array, np.array]]:
+  """Preprocesses and encodes the raw text of a single input file.
+
+  See `preprocess_and_tokenize_input_files`.
+
+  Returns:
+    A tuple of the token IDs and the sentence IDs of the file, or `None` if the
+    file is empty.
+  """
+  eod_symbol = special_symbols["<eod>"]
+  line_count = 0
+  logging.info("Preprocessing %s", input_file)
+
+  all_tokens = []
+  all_sentence_ids = []
+
+  sentence_id = True
+  # Preprocessed lines waiting to be tokenized in a batch, with `None` for the
+  # end of a document.
+  lines = []
+
+  with tf.io.gfile.GFile(input_file, "rb") as reader:
+    while True:
+      line = tokenization.convert_to_unicode(reader.readline())
+      if not line:
+        break
+
+      line_count += 1
+      if line_count % log_example_freq == 0:
+        logging.info("Loading line %d", line_count)
+
+      line = line.strip()
+
+      if not line:
+        if use_eod:
+          lines.append(None)
+        else:
+          continue
+      else:
+        lines.append(_preprocess_line(line=line, do_lower_case=do_lower_case))
+
+      if len(lines) >= _TOKENIZATION_BATCH_SIZE:
+        sentence_id = _append_tokenized_lines(lines, tokenizer, eod_symbol,
+                                              sentence_id, all_tokens,
+                                              all_sentence_ids)
+        lines = []
+  sentence_id = _append_tokenized_lines(lines, tokenizer, eod_symbol,
+                                        sentence_id, all_tokens,
+                                        all_sentence_ids)
+  logging.info("Finished processing %s. Number of lines: %d",
+               input_file, line_count)
+  if line_count == 0:
+    return None
+  return (np.array(all_tokens, dtype=np.int64),
+          np.array(all_sentence_ids, dtype=np.bool_))
+
+
 def preprocess_and_tokenize_input_files(
     input_files: Iterable[str],
     tokenizer: tokenization.FullSentencePieceTokenizer,
@@ -173,9 +283,6 @@ def preprocess_and_tokenize_input_files(
 
   """
   all_data = []
-  eod_symbol = special_symbols["<eod>"]
-
-  total_number_of_lines = 0
 
   # Input file format:
   # (1) One sentence per line. These should ideally be actual sentences, not
@@ -184,52 +291,17 @@ def preprocess_and_tokenize_input_files(
   # (2) Blank lines between documents. Document boundaries are needed so
   # that the "next sentence prediction" task doesn't span between documents.
   for input_file in input_files:
-    line_count = 0
-    logging.info("Preprocessing %s", input_file)
-
-    all_tokens = []
-    all_sentence_ids = []
-
-    sentence_id = True
-
-    with tf.io.gfile.GFile(input_file, "rb") as reader:
-      while True:
-        line = tokenization.convert_to_unicode(reader.readline())
-        if not line:
-          break
-
-        line_count += 1
-        if line_count % log_example_freq == 0:
-          logging.info("Loading line %d", line_count)
-
-        line = line.strip()
-
-        if not line:
-          if use_eod:
-            token_ids = [eod_symbol]
-            sentence_id = not sentence_id
-          else:
-            continue
-        else:
-          preprocessed_line = _preprocess_line(
-              line=line, do_lower_case=do_lower_case)
-          token_ids = tokenization.encode_ids(
-              sp_model=tokenizer.sp_model, text=preprocessed_line)
-
-        all_tokens.extend(token_ids)
-        all_sentence_ids.extend([sentence_id] * len(token_ids))
-        sentence_id = not sentence_id
-      logging.info("Finished processing %s. Number of lines: %d",
-                   input_file, line_count)
-      if line_count == 0:
-        continue
-      total_number_of_lines += line_count
-      all_tokens = np.array(all_tokens, dtype=np.int64)
-      all_sentence_ids = np.array(all_sentence_ids, dtype=np.bool)
-      all_data.append((all_tokens, all_sentence_ids))
+    data = _preprocess_and_tokenize_file(
+        input_file=input_file,
+        tokenizer=tokenizer,
+        use_eod=use_eod,
+        do_lower_case=do_lower_case,
+        log_example_freq=log_example_freq)
+    if data is not None:
+      all_data.append(data)
 
-  logging.info("Completed text preprocessing. Total number of lines: %d",
-               total_number_of_lines)
+  logging.info("Completed text preprocessing. Number of documents: %d",
+               len(all_data))
   return all_data
 
 
@@ -377,6 +449,35 @@ def _convert_tokens_to_instances(
     logging_frequency: int = 500) -> List[TrainingInstance]:
   """Converts tokens and sentence IDs into individual training instances.
 
+  See `_generate_instances`, which creates the same instances one at a time.
+
+  Returns:
+    A list of `TrainingInstance` objects.
+  """
+  return list(_generate_instances(
+      tokens=tokens,
+      sentence_ids=sentence_ids,
+      per_host_batch_size=per_host_batch_size,
+      seq_length=seq_length,
+      reuse_length=reuse_length,
+      bi_data=bi_data,
+      tokenizer=tokenizer,
+      num_cores_per_host=num_cores_per_host,
+      logging_frequency=logging_frequency))
+
+
+def _generate_instances(
+    tokens: np.array,
+    sentence_ids: np.array,
+    per_host_batch_size: int,
+    seq_length: int,
+    reuse_length: int,
+    bi_data: bool,
+    tokenizer: tokenization.FullSentencePieceTokenizer,
+    num_cores_per_host: int = 0,
+    logging_frequency: int = 500) -> Iterator[TrainingInstance]:
+  """Generates individual training instances from tokens and sentence IDs.
+
   The format of data in the XLNet pretraining task is very similar to the
   BERT pretraining task. Two segments A and B are randomly sampled, and the
   contatenation of A and B into a single sequence is used to perform
@@ -402,11 +503,9 @@ def _convert_tokens_to_instances(
       `bi_data` = `True`.
     logging_frequency: The frequency at which to log status updates.
 
-  Returns:
-    A list of `TrainingInstance` objects.
+  Yields:
+    `TrainingInstance` objects.
   """
-  instances = []
-
   per_core_batch_size = (per_host_batch_size // num_cores_per_host
                          if bi_data else None)
 
@@ -481,14 +580,13 @@ def _convert_tokens_to_instances(
       assert len(segment_ids) == seq_length
       assert len(boundary_indices) > 0  # pylint: disable=g-explicit-length-test
 
-      instances.append(TrainingInstance(
+      yield TrainingInstance(
           data=data,
           segment_ids=segment_ids,
           boundary_indices=boundary_indices,
-          label=label))
+          label=label)
     batch_number += 1
     data_index += step_size
-  return instances
 
 
 def write_instances_to_tfrecord(
@@ -532,6 +630,61 @@ def shuffle_and_combine_preprocessed_data(
   return np.concatenate(all_tokens), np.concatenate(all_sentence_ids)
 
 
+def shuffle_and_combine_preprocessed_files(
+    document_files: List[Tuple[str, int]],
+    output_dir: str) -> Tuple[np.array, np.array]:
+  """Shuffles and combines preprocessed documents stored on disk.
+
+  This is the same as `shuffle_and_combine_preprocessed_data`, but the
+  documents are `.npz` files with `tokens` and `sentence_ids` arrays, which are
+  read one at a time. The combined arrays are memory-mapped `.npy` files in
+  `output_dir`, so only one document is held in memory.
+
+  Args:
+    document_files: A list of `(path, number of tokens)` tuples.
+    output_dir: A local directory for the combined arrays. Files from a
+      previous call are overwritten.
+
+  Returns:
+    The combined tokens and sentence IDs.
+  """
+  document_permutation = np.random.permutation(len(document_files))
+  total_length = sum(length for _, length in document_files)
+  all_tokens = np.lib.format.open_memmap(
+      os.path.join(output_dir, "tokens.npy"),
+      mode="w+",
+      dtype=np.int64,
+      shape=(total_length,))
+  all_sentence_ids = np.lib.format.open_memmap(
+      os.path.join(output_dir, "sentence_ids.npy"),
+      mode="w+",
+      dtype=np.bool_,
+      shape=(total_length,))
+
+  previous_sentence_id = None
+  offset = 0
+  for document_index in document_permutation:
+    path, length = document_files[document_index]
+    if length == 0:
+      continue
+    with np.load(path) as document:
+      tokens = document["tokens"]
+      sentence_ids = document["sentence_ids"]
+    if (previous_sentence_id is not None and
+        sentence_ids[0] == previous_sentence_id):
+      sentence_ids = np.logical_not(sentence_ids)
+
+    all_tokens[offset:offset + length] = tokens
+    all_sentence_ids[offset:offset + length] = sentence_ids
+    offset += length
+
+    previous_sentence_id = sentence_ids[-1]
+
+  all_tokens.flush()
+  all_sentence_ids.flush()
+  return all_tokens, all_sentence_ids
+
+
 def get_tfrecord_name(
     per_host_batch_size: int,
     num_cores_per_host: int,
@@ -585,6 +738,150 @@ def get_tfrecord_name(
   return s + "-{}-of-{}".format(current_shard, total_shards)
 
 
+# The tokenizer of a worker process, set by `_init_worker`.
+_worker_tokenizer = None
+
+
+def _init_worker(tokenizer):
+  global _worker_tokenizer
+  _worker_tokenizer = tokenizer
+
+
+def _create_task_tfrecords(
+    task: Tuple[int, List[str]],
+    num_tasks: int,
+    random_seed: int,
+    use_eod_token: bool,
+    do_lower_case: bool,
+    per_host_batch_size: int,
+    seq_length: int,
+    reuse_length: int,
+    bi_data: bool,
+    num_cores_per_host: int,
+    save_dir: str,
+    prefix: str,
+    suffix: str,
+    num_passes: int) -> List[str]:
+  """Creates the TFRecord files of one task in a worker process.
+
+  The input files are tokenized one at a time and saved to a local temporary
+  directory. Each pass then streams them into memory-mapped arrays with
+  `shuffle_and_combine_preprocessed_files` and writes its instances as they
+  are generated.
+
+  Returns:
+    The names of the TFRecord files of the task, one per pass.
+  """
+  task_id, input_files = task
+  # Seeded by task so that the output does not depend on scheduling.
+  np.random.seed([random_seed, task_id])
+  random.seed("%d-%d" % (random_seed, task_id))
+  filenames = []
+  with tempfile.TemporaryDirectory() as temp_dir:
+    document_files = []
+    for i, input_file in enumerate(input_files):
+      data = _preprocess_and_tokenize_file(
+          input_file=input_file,
+          tokenizer=_worker_tokenizer,
+          use_eod=use_eod_token,
+          do_lower_case=do_lower_case)
+      if data is None:
+        continue
+      path = os.path.join(temp_dir, "document-%d.npz" % i)
+      np.savez(path, tokens=data[0], sentence_ids=data[1])
+      document_files.append((path, len(data[0])))
+    if not document_files:
+      logging.warning("Task %d has no input data.", task_id)
+
+    for pass_id in range(num_passes):
+      logging.info("Task %d: beginning pass %d of %d", task_id, pass_id,
+                   num_passes)
+      filename = get_tfrecord_name(
+          per_host_batch_size=per_host_batch_size,
+          num_cores_per_host=num_cores_per_host,
+          seq_length=seq_length,
+          bi_data=bi_data,
+          use_eod_token=use_eod_token,
+          reuse_length=reuse_length,
+          do_lower_case=do_lower_case,
+          prefix=prefix,
+          suffix=suffix,
+          pass_id=pass_id,
+          num_passes=num_passes,
+          num_tasks=num_tasks,
+          task_id=task_id)
+      filenames.append(filename)
+      if not document_files:
+        continue
+      tokens, sentence_ids = shuffle_and_combine_preprocessed_files(
+          document_files, temp_dir)
+      save_path = os.path.join(save_dir, filename)
+      if os.path.exists(save_path):
+        # If the path already exists, then we were probably preempted but
+        # previously wrote this file.
+        logging.info("%s already exists, skipping this batch.", save_path)
+      else:
+        instances = _generate_instances(
+            tokenizer=_worker_tokenizer,
+            tokens=tokens,
+            sentence_ids=sentence_ids,
+            per_host_batch_size=per_host_batch_size,
+            seq_length=seq_length,
+            reuse_length=reuse_length,
+            bi_data=bi_data,
+            num_cores_per_host=num_cores_per_host)
+        write_instances_to_tfrecord(instances=instances, save_path=save_path)
+      # Releases the memory maps before the next pass overwrites them.
+      del tokens, sentence_ids
+  return filenames
+
+
+def create_tfrecords_in_parallel(
+    tokenizer: tokenization.FullSentencePieceTokenizer,
+    input_files: List[str],
+    num_workers: int,
+    task_id_offset: int = 0,
+    num_tasks: int = 1,
+    random_seed: int = 0,
+    **kwargs) -> List[str]:
+  """Creates TFRecord files with a pool of worker processes.
+
+  The input files are split round-robin into `num_workers` tasks. Each task is
+  processed independently by a worker, as if the script had been run with
+  `task_id=task_id_offset + i` and `num_tasks=num_tasks`, and writes the
+  TFRecord files named accordingly by `get_tfrecord_name`. Workers keep their
+  documents on local disk, so their memory use is bounded by the largest input
+  file rather than by the size of the corpus.
+
+  Args:
+    tokenizer: The SentencePiece tokenizer. It is sent to each worker once.
+    input_files: The input files.
+    num_workers: The number of worker processes and tasks.
+    task_id_offset: The task id of the first worker.
+    num_tasks: The total number of tasks.
+    random_seed: The seed from which the per-task seeds are derived.
+    **kwargs: The remaining arguments of `create_tfrecords`, from
+      `use_eod_token` to `num_passes`.
+
+  Returns:
+    The names of the TFRecord files of each task, ordered by task and pass.
+  """
+  tasks = [(task_id_offset + i, input_files[i::num_workers])
+           for i in range(num_workers)]
+  with multiprocessing.Pool(
+      num_workers, initializer=_init_worker, initargs=(tokenizer,)) as pool:
+    filenames = pool.map(
+        functools.partial(
+            _create_task_tfrecords,
+            num_tasks=num_tasks,
+            random_seed=random_seed,
+            **kwargs),
+        tasks,
+        chunksize=1)
+  return [filename for task_filenames in filenames
+          for filename in task_filenames]
+
+
 def create_tfrecords(
     tokenizer: tokenization.FullSentencePieceTokenizer,
     input_file_or_files: str,
@@ -600,8 +897,14 @@ def create_tfrecords(
     suffix: str = "",
     num_tasks: Optional[int] = None,
     task_id: Optional[int] = None,
-    num_passes: int = 1):
-  """Runs the end-to-end preprocessing pipeline."""
+    num_passes: int = 1,
+    num_workers: int = 0):
+  """Runs the end-to-end preprocessing pipeline.
+
+  If `num_workers` is positive, the input files of this task are processed by
+  `create_tfrecords_in_parallel`, each worker acting as one of
+  `num_tasks * num_workers` tasks.
+  """
 
   logging.info("Input configuration:")
   logging.info("input file(s): %s", input_file_or_files)
@@ -634,47 +937,68 @@ def create_tfrecords(
                  num_tasks, len(input_files) // num_tasks)
     input_files = input_files[task_id::num_tasks]
 
-  all_data = preprocess_and_tokenize_input_files(
-      input_files=input_files,
-      tokenizer=tokenizer,
-      use_eod=use_eod_token,
-      do_lower_case=do_lower_case)
-  for pass_id in range(num_passes):
-    logging.info("Beginning pass %d of %d", pass_id, num_passes)
-    tokens, sentence_ids = shuffle_and_combine_preprocessed_data(all_data)
-
-    assert len(tokens) == len(sentence_ids)
-
-    filename = get_tfrecord_name(
+  if num_workers > 0:
+    filenames = create_tfrecords_in_parallel(
+        tokenizer=tokenizer,
+        input_files=input_files,
+        num_workers=num_workers,
+        task_id_offset=(task_id or 0) * num_workers,
+        num_tasks=(num_tasks or 1) * num_workers,
+        use_eod_token=use_eod_token,
+        do_lower_case=do_lower_case,
         per_host_batch_size=per_host_batch_size,
-        num_cores_per_host=num_cores_per_host,
         seq_length=seq_length,
-        bi_data=bi_data,
-        use_eod_token=use_eod_token,
         reuse_length=reuse_length,
-        do_lower_case=do_lower_case,
+        bi_data=bi_data,
+        num_cores_per_host=num_cores_per_host,
+        save_dir=save_dir,
         prefix=prefix,
         suffix=suffix,
-        pass_id=pass_id,
-        num_passes=num_passes,
-        num_tasks=num_tasks,
-        task_id=task_id)
-    save_path = os.path.join(save_dir, filename)
-    if os.path.exists(save_path):
-      # If the path already exists, then we were probably preempted but
-      # previously wrote this file.
-      logging.info("%s already exists, skipping this batch.", save_path)
-    else:
-      instances = _convert_tokens_to_instances(
-          tokenizer=tokenizer,
-          tokens=tokens,
-          sentence_ids=sentence_ids,
+        num_passes=num_passes)
+    # The corpus info is named after the last file of the first worker.
+    filename = filenames[num_passes - 1]
+  else:
+    all_data = preprocess_and_tokenize_input_files(
+        input_files=input_files,
+        tokenizer=tokenizer,
+        use_eod=use_eod_token,
+        do_lower_case=do_lower_case)
+    for pass_id in range(num_passes):
+      logging.info("Beginning pass %d of %d", pass_id, num_passes)
+      tokens, sentence_ids = shuffle_and_combine_preprocessed_data(all_data)
+
+      assert len(tokens) == len(sentence_ids)
+
+      filename = get_tfrecord_name(
           per_host_batch_size=per_host_batch_size,
+          num_cores_per_host=num_cores_per_host,
           seq_length=seq_length,
-          reuse_length=reuse_length,
           bi_data=bi_data,
-          num_cores_per_host=num_cores_per_host)
-      write_instances_to_tfrecord(instances=instances, save_path=save_path)
+          use_eod_token=use_eod_token,
+          reuse_length=reuse_length,
+          do_lower_case=do_lower_case,
+          prefix=prefix,
+          suffix=suffix,
+          pass_id=pass_id,
+          num_passes=num_passes,
+          num_tasks=num_tasks,
+          task_id=task_id)
+      save_path = os.path.join(save_dir, filename)
+      if os.path.exists(save_path):
+        # If the path already exists, then we were probably preempted but
+        # previously wrote this file.
+        logging.info("%s already exists, skipping this batch.", save_path)
+      else:
+        instances = _convert_tokens_to_instances(
+            tokenizer=tokenizer,
+            tokens=tokens,
+            sentence_ids=sentence_ids,
+            per_host_batch_size=per_host_batch_size,
+            seq_length=seq_length,
+            reuse_length=reuse_length,
+            bi_data=bi_data,
+            num_cores_per_host=num_cores_per_host)
+        write_instances_to_tfrecord(instances=instances, save_path=save_path)
 
   if task_id is None or task_id == 0:
     corpus_info = {
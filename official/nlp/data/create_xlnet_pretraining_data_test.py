@@ -266,6 +266,30 @@ class CreateInstancesTest(tf.test.TestCase):
       self.assertIsInstance(instance.boundary_indices, list)
 
 
+class ShuffleAndCombineTest(tf.test.TestCase):
+
+  def test_files_match_in_memory_data(self):
+    rng = np.random.RandomState(0)
+    all_data = []
+    document_files = []
+    for i, length in enumerate([5, 0, 3, 8]):
+      tokens = rng.randint(100, size=length).astype(np.int64)
+      sentence_ids = rng.randint(2, size=length).astype(np.bool_)
+      all_data.append((tokens, sentence_ids))
+      path = os.path.join(self.get_temp_dir(), "document-%d.npz" % i)
+      np.savez(path, tokens=tokens, sentence_ids=sentence_ids)
+      document_files.append((path, length))
+
+    np.random.seed(1)
+    expected_tokens, expected_sentence_ids = (
+        cpd.shuffle_and_combine_preprocessed_data(all_data))
+    np.random.seed(1)
+    tokens, sentence_ids = cpd.shuffle_and_combine_preprocessed_files(
+        document_files, self.get_temp_dir())
+    self.assertAllEqual(expected_tokens, tokens)
+    self.assertAllEqual(expected_sentence_ids, sentence_ids)
+
+
 class TFRecordPathTests(tf.test.TestCase):
 
   def test_basic(self):
@@ -348,6 +372,35 @@ class TestCreateTFRecords(parameterized.TestCase, tf.test.TestCase):
     self.assertTrue(any(filter(lambda x: x.endswith(".tfrecord"),
                                os.listdir(save_dir))))
 
+  @parameterized.named_parameters(("bi_data", True), ("uni_data", False))
+  def test_end_to_end_in_parallel(self, bi_data: bool):
+    documents = [["a " * 50 for _ in range(10)] for _ in range(5)]
+    save_dir = tempfile.mkdtemp(dir=self.get_temp_dir())
+    files = _create_files(temp_dir=self.get_temp_dir(), file_contents=documents)
+
+    cpd.create_tfrecords(
+        tokenizer=_get_mock_tokenizer(),
+        input_file_or_files=",".join(files),
+        use_eod_token=True,
+        do_lower_case=True,
+        per_host_batch_size=8,
+        seq_length=8,
+        reuse_length=4,
+        bi_data=bi_data,
+        num_cores_per_host=2,
+        save_dir=save_dir,
+        num_passes=2,
+        num_workers=2)
+
+    prefix = "seqlen-8_reuse-4_bs-8_cores-2_uncased_eod_%s.tfrecord" % (
+        "bi" if bi_data else "uni")
+    expected_files = ["%s-%d-of-4" % (prefix, i) for i in range(4)]
+    self.assertCountEqual(expected_files + [expected_files[1] + ".json"],
+                          os.listdir(save_dir))
+    for filename in expected_files:
+      dataset = tf.data.TFRecordDataset(os.path.join(save_dir, filename))
+      self.assertGreater(len(list(dataset)), 0)
+
 
 if __name__ == "__main__":
   np.random.seed(0)
@@ -42,6 +42,18 @@ class BertPretrainDataConfig(cfg.DataConfig):
   enable_round_robin_tf_data_service: bool = False
   tf_data_service_job_name: str = 'bert_pretrain'
   use_v2_feature_names: bool = False
+  # If positive, the batch size of each bucket is chosen so that a global batch
+  # holds at most this many (padded) tokens, instead of `global_batch_size`
+  # examples. Short sequences then come in larger batches.
+  max_tokens_per_batch: int = 0
+  # Whether to pack consecutive examples into sequences of up to the largest
+  # bucket length. Each packed example must start with [CLS] and keeps its own
+  # segment ids, and its position ids restart from 0. Requires
+  # `use_next_sentence_label=False` and a positive `max_predictions_per_seq`.
+  pack_sequences: bool = False
+  # The number of masked LM predictions of a packed sequence. Examples are only
+  # packed together while their predictions fit.
+  max_predictions_per_seq: int = 0
 
 
 @data_loader_factory.register_data_loader_cls(BertPretrainDataConfig)
@@ -57,6 +69,13 @@ class PretrainingDynamicDataLoader(pretrain_dataloader.BertPretrainDataLoader):
 
   The dataloader does not filter out empty masks. Make sure to handle this
   in the model.
+
+  With `max_tokens_per_batch`, the batch size of each bucket is inversely
+  proportional to its sequence length. All the batches of a global step still
+  come from the same bucket, so the replicas agree on their shapes. With
+  `pack_sequences`, short examples are concatenated into longer sequences
+  first; the model must then keep the packed examples apart, e.g. with
+  `PackedSequenceEmbedding(pack_multiple_sequences=True)`.
   """
 
   def __init__(self, params):
@@ -75,6 +94,16 @@ class PretrainingDynamicDataLoader(pretrain_dataloader.BertPretrainDataLoader):
     self._mask_keys = [
         'masked_lm_positions', 'masked_lm_ids', 'masked_lm_weights'
     ]
+    self._max_tokens_per_batch = params.max_tokens_per_batch
+    self._pack_sequences = params.pack_sequences
+    self._max_predictions_per_seq = params.max_predictions_per_seq
+    if self._pack_sequences:
+      if self._use_next_sentence_label:
+        raise ValueError(
+            'Packed sequences do not support the next sentence labels.')
+      if self._max_predictions_per_seq <= 0:
+        raise ValueError('`max_predictions_per_seq` must be positive to pack '
+                         'sequences, got %d.' % self._max_predictions_per_seq)
 
   def _decode(self, record: tf.Tensor):
     """Decodes a serialized tf.Example."""
@@ -127,6 +156,71 @@ class PretrainingDynamicDataLoader(pretrain_dataloader.BertPretrainDataLoader):
 
     return example
 
+  def _pack(self, dataset):
+    """Greedily packs consecutive examples into longer sequences."""
+    max_length = max(self._seq_bucket_lengths)
+    max_predictions = self._max_predictions_per_seq
+    seq_keys = [key for key in dataset.element_spec
+                if key not in self._mask_keys]
+
+    def strip_mask_padding(example):
+      example = dict(example)
+      mask = tf.math.greater(example['masked_lm_weights'], 0)
+      for key in self._mask_keys:
+        example[key] = tf.boolean_mask(example[key], mask)
+      if self._use_position_id:
+        example['position_ids'] = tf.range(
+            tf.shape(example['input_word_ids'])[0],
+            dtype=example['position_ids'].dtype)
+      return example
+
+    def pack_fn(packed, example):
+      length = tf.shape(packed['input_word_ids'])[0]
+      num_predictions = tf.shape(packed['masked_lm_ids'])[0]
+      fits = tf.math.logical_and(
+          length + tf.shape(example['input_word_ids'])[0] <= max_length,
+          num_predictions + tf.shape(example['masked_lm_ids'])[0] <=
+          max_predictions)
+
+      def append():
+        shifted = dict(example)
+        shifted['masked_lm_positions'] += tf.cast(
+            length, shifted['masked_lm_positions'].dtype)
+        appended = {
+            key: tf.concat([packed[key], shifted[key]], axis=0)
+            for key in packed
+        }
+        return appended, (False, packed)
+
+      def flush():
+        return example, (length > 0, packed)
+
+      return tf.cond(fits, append, flush)
+
+    def pad_predictions(packed):
+      num_padding = max_predictions - tf.shape(packed['masked_lm_ids'])[0]
+      for key in self._mask_keys:
+        packed[key] = tf.pad(
+            packed[key], [[0, num_padding]],
+            constant_values=-1 if key == 'masked_lm_ids' else 0)
+      return packed
+
+    dataset = dataset.map(strip_mask_padding)
+    empty = {
+        key: tf.zeros([0], spec.dtype)
+        for key, spec in dataset.element_spec.items()
+    }
+    # An example longer than `max_length` flushes the last packed sequence.
+    flush_example = dict(empty)
+    for key in seq_keys:
+      flush_example[key] = tf.zeros([max_length + 1],
+                                    dataset.element_spec[key].dtype)
+    dataset = dataset.concatenate(
+        tf.data.Dataset.from_tensors(flush_example))
+    dataset = dataset.scan(empty, pack_fn)
+    dataset = dataset.filter(lambda is_packed, _: is_packed)
+    return dataset.map(lambda _, packed: pad_predictions(packed))
+
   def _bucketize_and_batch(
       self,
       dataset,
@@ -138,8 +232,23 @@ class PretrainingDynamicDataLoader(pretrain_dataloader.BertPretrainDataLoader):
     def element_length_func(example, seq_len_dim):
       return tf.shape(example['input_word_ids'])[seq_len_dim]
 
+    if self._pack_sequences:
+      dataset = self._pack(dataset)
+
     bucket_boundaries = [length + 1 for length in self._seq_bucket_lengths]
-    bucket_batch_sizes = [per_replica_batch_size] * (len(bucket_boundaries) + 1)
+    if self._max_tokens_per_batch > 0:
+      per_replica_max_tokens = input_context.get_per_replica_batch_size(
+          self._max_tokens_per_batch
+      ) if input_context else self._max_tokens_per_batch
+      bucket_batch_sizes = [
+          max(1, per_replica_max_tokens // length)
+          for length in self._seq_bucket_lengths
+      ]
+      # Longer sequences fail in `bucket_by_sequence_length` anyway.
+      bucket_batch_sizes.append(bucket_batch_sizes[-1])
+    else:
+      bucket_batch_sizes = [per_replica_batch_size] * (
+          len(bucket_boundaries) + 1)
 
     # Bucketize and batch the dataset with per replica batch size first.
     dataset = dataset.apply(
@@ -172,6 +281,10 @@ class PretrainingDynamicDataLoader(pretrain_dataloader.BertPretrainDataLoader):
       dataset = dataset.flat_map(lambda x: x)
 
     def _remove_pads_from_bucketize(features):
+      if self._max_tokens_per_batch > 0:
+        batch_size = tf.shape(features['masked_lm_ids'])[0]
+      else:
+        batch_size = per_replica_batch_size
       # All mask features must have the same effective length.
       # The real masked ids padding token is -1 and 0 comes from
       # bucket_by_sequence_length.
@@ -181,14 +294,14 @@ class PretrainingDynamicDataLoader(pretrain_dataloader.BertPretrainDataLoader):
       normalized = tf.cast(
           mask_per_example / tf.math.reduce_max(mask_per_example), tf.int32)
       assert_op = tf.debugging.assert_equal(
-          tf.math.reduce_sum(normalized), per_replica_batch_size,
+          tf.math.reduce_sum(normalized), batch_size,
           'Number of non padded mask tokens is not the same for each example '
           'in the same sequence length.')
       with tf.control_dependencies([assert_op]):
         for key in self._mask_keys:
           features[key] = tf.reshape(
               tf.boolean_mask(
-                  features[key], mask), [per_replica_batch_size, -1])
+                  features[key], mask), [batch_size, -1])
       # Revert masked_lm_ids to be 0-padded.
       mask = tf.math.not_equal(features['masked_lm_ids'], -1)
       features['masked_lm_ids'] = tf.where(
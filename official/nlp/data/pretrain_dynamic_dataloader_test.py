@@ -209,6 +209,90 @@ class PretrainDynamicDataLoaderTest(tf.test.TestCase, parameterized.TestCase):
     self.assertEqual(features['position_ids'].shape, (batch_size, 128))
     self.assertEqual(features['masked_lm_positions'].shape, (batch_size, 70))
 
+  def test_load_dataset_with_token_budget(self):
+    max_seq_length = 128
+    input_path_1 = os.path.join(self.get_temp_dir(), 'train_5.tf_record')
+    _create_fake_dataset(
+        input_path_1,
+        seq_length=60,
+        num_masked_tokens=20,
+        max_seq_length=max_seq_length,
+        num_examples=4)
+    input_path_2 = os.path.join(self.get_temp_dir(), 'train_6.tf_record')
+    _create_fake_dataset(
+        input_path_2,
+        seq_length=100,
+        num_masked_tokens=70,
+        max_seq_length=max_seq_length,
+        num_examples=2)
+    input_paths = ','.join([input_path_1, input_path_2])
+    data_config = pretrain_dynamic_dataloader.BertPretrainDataConfig(
+        is_training=False,
+        input_path=input_paths,
+        seq_bucket_lengths=[64, 128],
+        global_batch_size=1,
+        max_tokens_per_batch=256,
+        deterministic=True)
+    dataset = pretrain_dynamic_dataloader.PretrainingDynamicDataLoader(
+        data_config).load()
+    batch_shapes = [(features['input_word_ids'].shape,
+                     features['masked_lm_positions'].shape)
+                    for features in dataset]
+    self.assertEqual([((4, 64), (4, 20)), ((2, 128), (2, 70))], batch_shapes)
+
+  def test_load_dataset_with_packing(self):
+    max_seq_length = 128
+    input_path = os.path.join(self.get_temp_dir(), 'train_7.tf_record')
+    _create_fake_dataset(
+        input_path,
+        seq_length=40,
+        num_masked_tokens=10,
+        max_seq_length=max_seq_length,
+        num_examples=6)
+    data_config = pretrain_dynamic_dataloader.BertPretrainDataConfig(
+        is_training=False,
+        input_path=input_path,
+        seq_bucket_lengths=[64, 128],
+        use_next_sentence_label=False,
+        use_position_id=True,
+        global_batch_size=2,
+        pack_sequences=True,
+        max_predictions_per_seq=32,
+        deterministic=True)
+    dataset = pretrain_dynamic_dataloader.PretrainingDynamicDataLoader(
+        data_config).load()
+    features = next(iter(dataset))
+    # Three examples of 40 tokens are packed into each sequence.
+    self.assertEqual(features['input_word_ids'].shape, (2, 128))
+    self.assertEqual(features['masked_lm_positions'].shape, (2, 32))
+    self.assertAllEqual(features['input_mask'][:, :120],
+                        tf.ones((2, 120), tf.int32))
+    self.assertAllEqual(features['position_ids'][0, 38:42], [38, 39, 0, 1])
+    self.assertAllEqual(features['masked_lm_weights'][:, 30:],
+                        tf.zeros((2, 2)))
+
+    data_config.pack_sequences = False
+    data_config.global_batch_size = 1
+    unpacked = pretrain_dynamic_dataloader.PretrainingDynamicDataLoader(
+        data_config).load()
+    unpacked = [next(iter(unpacked.skip(i))) for i in range(3)]
+    self.assertAllEqual(
+        features['input_word_ids'][0, :120],
+        tf.concat([x['input_word_ids'][0, :40] for x in unpacked], axis=0))
+    self.assertAllEqual(
+        features['masked_lm_positions'][0, :30],
+        tf.concat([x['masked_lm_positions'][0] + 40 * i
+                   for i, x in enumerate(unpacked)], axis=0))
+    self.assertAllEqual(
+        features['masked_lm_ids'][0, :30],
+        tf.concat([x['masked_lm_ids'][0] for x in unpacked], axis=0))
+
+  def test_packing_requires_max_predictions(self):
+    data_config = pretrain_dynamic_dataloader.BertPretrainDataConfig(
+        use_next_sentence_label=False, pack_sequences=True)
+    with self.assertRaisesRegex(ValueError, 'max_predictions_per_seq'):
+      pretrain_dynamic_dataloader.PretrainingDynamicDataLoader(data_config)
+
   def test_load_dataset_not_same_masks(self):
     max_seq_length = 128
     batch_size = 2
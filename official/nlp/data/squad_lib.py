@@ -16,13 +16,16 @@
 # pylint: disable=g-bad-import-order
 import collections
 import copy
+import functools
 import json
 import math
+import multiprocessing
 import os
 
 import six
 
 from absl import logging
+import numpy as np
 import tensorflow as tf
 
 from official.nlp.bert import tokenization
@@ -249,6 +252,298 @@ def read_squad_examples(input_file, is_training,
   return examples
 
 
+# The tokenizer of a worker process, set by `_init_conversion_worker`.
+_worker_tokenizer = None
+
+
+def _init_conversion_worker(tokenizer):
+  global _worker_tokenizer
+  _worker_tokenizer = tokenizer
+
+
+def _convert_with_worker_tokenizer(convert_fn, indexed_example):
+  example_index, example = indexed_example
+  return convert_fn(example_index, example, tokenizer=_worker_tokenizer)
+
+
+def map_examples_to_features(convert_fn, examples, tokenizer, num_workers=0):
+  """Applies `convert_fn` to each example, optionally in worker processes.
+
+  Args:
+    convert_fn: A function called as `convert_fn(example_index, example,
+      tokenizer=tokenizer)` that returns the list of features of the example.
+      It must be picklable if `num_workers` is positive.
+    examples: A sequence of examples.
+    tokenizer: The tokenizer passed to `convert_fn`. It is sent to each worker
+      process once.
+    num_workers: If positive, the number of worker processes used to convert
+      the examples. Otherwise, the examples are converted in this process.
+
+  Yields:
+    The lists of features of the examples, in the order of `examples`.
+  """
+  if num_workers <= 0:
+    for example_index, example in enumerate(examples):
+      yield convert_fn(example_index, example, tokenizer=tokenizer)
+    return
+
+  with multiprocessing.Pool(
+      num_workers,
+      initializer=_init_conversion_worker,
+      initargs=(tokenizer,)) as pool:
+    # `imap` keeps the order of the examples, so the features get the same
+    # unique ids as with the sequential conversion.
+    for features in pool.imap(
+        functools.partial(_convert_with_worker_tokenizer, convert_fn),
+        enumerate(examples),
+        chunksize=16):
+      yield features
+
+
+def get_max_context_span_indexes(doc_spans, num_tokens):
+  """Finds the 'max context' doc span of every token of a document.
+
+  Because of the sliding window approach taken to scoring documents, a single
+  token can appear in multiple documents. E.g.
+   Doc: the man went to the store and bought a gallon of milk
+   Span A: the man went to the
+   Span B: to the store and bought
+   Span C: and bought a gallon of
+   ...
+
+  Now the word 'bought' will have two scores from spans B and C. We only
+  want to consider the score with "maximum context", which we define as
+  the *minimum* of its left and right context (the *sum* of left and
+  right context will always be the same, of course).
+
+  In the example the maximum context for 'bought' would be span C since
+  it has 1 left context and 3 right context, while span B has 4 left context
+  and 0 right context.
+
+  Computing this once per document takes time linear in the total length of
+  the spans, instead of rescanning all spans for every token of every span.
+
+  Args:
+    doc_spans: A list of spans with `start` and `length` attributes.
+    num_tokens: The number of tokens in the document.
+
+  Returns:
+    A list with the index of the max context span of each token, where ties
+    go to the earliest span. Tokens outside of all spans get `None`.
+  """
+  best_scores = [None] * num_tokens
+  best_span_indexes = [None] * num_tokens
+  for (span_index, doc_span) in enumerate(doc_spans):
+    end = doc_span.start + doc_span.length - 1
+    for position in range(doc_span.start, end + 1):
+      num_left_context = position - doc_span.start
+      num_right_context = end - position
+      score = min(num_left_context, num_right_context) + 0.01 * doc_span.length
+      if best_scores[position] is None or score > best_scores[position]:
+        best_scores[position] = score
+        best_span_indexes[position] = span_index
+  return best_span_indexes
+
+
+def _convert_example_to_features(example_index, example, tokenizer,
+                                 max_seq_length, doc_stride, max_query_length,
+                                 is_training, xlnet_format):
+  """Converts a `SquadExample` to `InputFeatures` without unique ids."""
+  query_tokens = tokenizer.tokenize(example.question_text)
+
+  if len(query_tokens) > max_query_length:
+    query_tokens = query_tokens[0:max_query_length]
+
+  tok_to_orig_index = []
+  orig_to_tok_index = []
+  all_doc_tokens = []
+  for (i, token) in enumerate(example.doc_tokens):
+    orig_to_tok_index.append(len(all_doc_tokens))
+    sub_tokens = tokenizer.tokenize(token)
+    for sub_token in sub_tokens:
+      tok_to_orig_index.append(i)
+      all_doc_tokens.append(sub_token)
+
+  tok_start_position = None
+  tok_end_position = None
+  if is_training and example.is_impossible:
+    tok_start_position = -1
+    tok_end_position = -1
+  if is_training and not example.is_impossible:
+    tok_start_position = orig_to_tok_index[example.start_position]
+    if example.end_position < len(example.doc_tokens) - 1:
+      tok_end_position = orig_to_tok_index[example.end_position + 1] - 1
+    else:
+      tok_end_position = len(all_doc_tokens) - 1
+    (tok_start_position, tok_end_position) = _improve_answer_span(
+        all_doc_tokens, tok_start_position, tok_end_position, tokenizer,
+        example.orig_answer_text)
+
+  # The -3 accounts for [CLS], [SEP] and [SEP]
+  max_tokens_for_doc = max_seq_length - len(query_tokens) - 3
+
+  # We can have documents that are longer than the maximum sequence length.
+  # To deal with this we do a sliding window approach, where we take chunks
+  # of the up to our max length with a stride of `doc_stride`.
+  _DocSpan = collections.namedtuple(  # pylint: disable=invalid-name
+      "DocSpan", ["start", "length"])
+  doc_spans = []
+  start_offset = 0
+  while start_offset < len(all_doc_tokens):
+    length = len(all_doc_tokens) - start_offset
+    if length > max_tokens_for_doc:
+      length = max_tokens_for_doc
+    doc_spans.append(_DocSpan(start=start_offset, length=length))
+    if start_offset + length == len(all_doc_tokens):
+      break
+    start_offset += min(length, doc_stride)
+  max_context_span_indexes = get_max_context_span_indexes(
+      doc_spans, len(all_doc_tokens))
+
+  features = []
+  for (doc_span_index, doc_span) in enumerate(doc_spans):
+    tokens = []
+    token_to_orig_map = {}
+    token_is_max_context = {}
+    segment_ids = []
+
+    # Paragraph mask used in XLNet.
+    # 1 represents paragraph and class tokens.
+    # 0 represents query and other special tokens.
+    paragraph_mask = []
+
+    # pylint: disable=cell-var-from-loop
+    def process_query(seg_q):
+      for token in query_tokens:
+        tokens.append(token)
+        segment_ids.append(seg_q)
+        paragraph_mask.append(0)
+      tokens.append("[SEP]")
+      segment_ids.append(seg_q)
+      paragraph_mask.append(0)
+
+    def process_paragraph(seg_p):
+      for i in range(doc_span.length):
+        split_token_index = doc_span.start + i
+        token_to_orig_map[len(tokens)] = tok_to_orig_index[split_token_index]
+
+        is_max_context = (
+            max_context_span_indexes[split_token_index] == doc_span_index)
+        token_is_max_context[len(tokens)] = is_max_context
+        tokens.append(all_doc_tokens[split_token_index])
+        segment_ids.append(seg_p)
+        paragraph_mask.append(1)
+      tokens.append("[SEP]")
+      segment_ids.append(seg_p)
+      paragraph_mask.append(0)
+
+    def process_class(seg_class):
+      class_index = len(segment_ids)
+      tokens.append("[CLS]")
+      segment_ids.append(seg_class)
+      paragraph_mask.append(1)
+      return class_index
+
+    if xlnet_format:
+      seg_p, seg_q, seg_class, seg_pad = 0, 1, 2, 3
+      process_paragraph(seg_p)
+      process_query(seg_q)
+      class_index = process_class(seg_class)
+    else:
+      seg_p, seg_q, seg_class, seg_pad = 1, 0, 0, 0
+      class_index = process_class(seg_class)
+      process_query(seg_q)
+      process_paragraph(seg_p)
+
+    input_ids = tokenizer.convert_tokens_to_ids(tokens)
+
+    # The mask has 1 for real tokens and 0 for padding tokens. Only real
+    # tokens are attended to.
+    input_mask = [1] * len(input_ids)
+
+    # Zero-pad up to the sequence length.
+    while len(input_ids) < max_seq_length:
+      input_ids.append(0)
+      input_mask.append(0)
+      segment_ids.append(seg_pad)
+      paragraph_mask.append(0)
+
+    assert len(input_ids) == max_seq_length
+    assert len(input_mask) == max_seq_length
+    assert len(segment_ids) == max_seq_length
+    assert len(paragraph_mask) == max_seq_length
+
+    start_position = 0
+    end_position = 0
+    span_contains_answer = False
+
+    if is_training and not example.is_impossible:
+      # For training, if our document chunk does not contain an annotation
+      # we throw it out, since there is nothing to predict.
+      doc_start = doc_span.start
+      doc_end = doc_span.start + doc_span.length - 1
+      span_contains_answer = (tok_start_position >= doc_start and
+                              tok_end_position <= doc_end)
+      if span_contains_answer:
+        doc_offset = 0 if xlnet_format else len(query_tokens) + 2
+        start_position = tok_start_position - doc_start + doc_offset
+        end_position = tok_end_position - doc_start + doc_offset
+
+    features.append(
+        InputFeatures(
+            unique_id=None,
+            example_index=example_index,
+            doc_span_index=doc_span_index,
+            tokens=tokens,
+            paragraph_mask=paragraph_mask,
+            class_index=class_index,
+            token_to_orig_map=token_to_orig_map,
+            token_is_max_context=token_is_max_context,
+            input_ids=input_ids,
+            input_mask=input_mask,
+            segment_ids=segment_ids,
+            start_position=start_position,
+            end_position=end_position,
+            is_impossible=not span_contains_answer))
+  return features
+
+
+def _log_feature(feature, is_training):
+  """Logs the content of a feature."""
+  logging.info("*** Example ***")
+  logging.info("unique_id: %s", (feature.unique_id))
+  logging.info("example_index: %s", (feature.example_index))
+  logging.info("doc_span_index: %s", (feature.doc_span_index))
+  logging.info("tokens: %s", " ".join(
+      [tokenization.printable_text(x) for x in feature.tokens]))
+  logging.info(
+      "token_to_orig_map: %s", " ".join([
+          "%d:%d" % (x, y)
+          for (x, y) in six.iteritems(feature.token_to_orig_map)
+      ]))
+  logging.info(
+      "token_is_max_context: %s", " ".join([
+          "%d:%s" % (x, y)
+          for (x, y) in six.iteritems(feature.token_is_max_context)
+      ]))
+  logging.info("input_ids: %s", " ".join([str(x) for x in feature.input_ids]))
+  logging.info("input_mask: %s", " ".join([str(x) for x in feature.input_mask]))
+  logging.info("segment_ids: %s",
+               " ".join([str(x) for x in feature.segment_ids]))
+  logging.info("paragraph_mask: %s", " ".join(
+      [str(x) for x in feature.paragraph_mask]))
+  logging.info("class_index: %d", feature.class_index)
+  if is_training:
+    if not feature.is_impossible:
+      answer_text = " ".join(
+          feature.tokens[feature.start_position:(feature.end_position + 1)])
+      logging.info("start_position: %d", (feature.start_position))
+      logging.info("end_position: %d", (feature.end_position))
+      logging.info("answer: %s", tokenization.printable_text(answer_text))
+    else:
+      logging.info("document span doesn't contain answer")
+
+
 def convert_examples_to_features(examples,
                                  tokenizer,
                                  max_seq_length,
@@ -257,196 +552,31 @@ def convert_examples_to_features(examples,
                                  is_training,
                                  output_fn,
                                  xlnet_format=False,
-                                 batch_size=None):
-  """Loads a data file into a list of `InputBatch`s."""
+                                 batch_size=None,
+                                 num_workers=0):
+  """Loads a data file into a list of `InputBatch`s.
+
+  Features are passed to `output_fn` as soon as they are created. If
+  `num_workers` is positive, examples are converted by that many worker
+  processes, while unique ids are still assigned in the order of `examples`.
+  """
 
   base_id = 1000000000
   unique_id = base_id
   feature = None
-  for (example_index, example) in enumerate(examples):
-    query_tokens = tokenizer.tokenize(example.question_text)
-
-    if len(query_tokens) > max_query_length:
-      query_tokens = query_tokens[0:max_query_length]
-
-    tok_to_orig_index = []
-    orig_to_tok_index = []
-    all_doc_tokens = []
-    for (i, token) in enumerate(example.doc_tokens):
-      orig_to_tok_index.append(len(all_doc_tokens))
-      sub_tokens = tokenizer.tokenize(token)
-      for sub_token in sub_tokens:
-        tok_to_orig_index.append(i)
-        all_doc_tokens.append(sub_token)
-
-    tok_start_position = None
-    tok_end_position = None
-    if is_training and example.is_impossible:
-      tok_start_position = -1
-      tok_end_position = -1
-    if is_training and not example.is_impossible:
-      tok_start_position = orig_to_tok_index[example.start_position]
-      if example.end_position < len(example.doc_tokens) - 1:
-        tok_end_position = orig_to_tok_index[example.end_position + 1] - 1
-      else:
-        tok_end_position = len(all_doc_tokens) - 1
-      (tok_start_position, tok_end_position) = _improve_answer_span(
-          all_doc_tokens, tok_start_position, tok_end_position, tokenizer,
-          example.orig_answer_text)
-
-    # The -3 accounts for [CLS], [SEP] and [SEP]
-    max_tokens_for_doc = max_seq_length - len(query_tokens) - 3
-
-    # We can have documents that are longer than the maximum sequence length.
-    # To deal with this we do a sliding window approach, where we take chunks
-    # of the up to our max length with a stride of `doc_stride`.
-    _DocSpan = collections.namedtuple(  # pylint: disable=invalid-name
-        "DocSpan", ["start", "length"])
-    doc_spans = []
-    start_offset = 0
-    while start_offset < len(all_doc_tokens):
-      length = len(all_doc_tokens) - start_offset
-      if length > max_tokens_for_doc:
-        length = max_tokens_for_doc
-      doc_spans.append(_DocSpan(start=start_offset, length=length))
-      if start_offset + length == len(all_doc_tokens):
-        break
-      start_offset += min(length, doc_stride)
-
-    for (doc_span_index, doc_span) in enumerate(doc_spans):
-      tokens = []
-      token_to_orig_map = {}
-      token_is_max_context = {}
-      segment_ids = []
-
-      # Paragraph mask used in XLNet.
-      # 1 represents paragraph and class tokens.
-      # 0 represents query and other special tokens.
-      paragraph_mask = []
-
-      # pylint: disable=cell-var-from-loop
-      def process_query(seg_q):
-        for token in query_tokens:
-          tokens.append(token)
-          segment_ids.append(seg_q)
-          paragraph_mask.append(0)
-        tokens.append("[SEP]")
-        segment_ids.append(seg_q)
-        paragraph_mask.append(0)
-
-      def process_paragraph(seg_p):
-        for i in range(doc_span.length):
-          split_token_index = doc_span.start + i
-          token_to_orig_map[len(tokens)] = tok_to_orig_index[split_token_index]
-
-          is_max_context = _check_is_max_context(doc_spans, doc_span_index,
-                                                 split_token_index)
-          token_is_max_context[len(tokens)] = is_max_context
-          tokens.append(all_doc_tokens[split_token_index])
-          segment_ids.append(seg_p)
-          paragraph_mask.append(1)
-        tokens.append("[SEP]")
-        segment_ids.append(seg_p)
-        paragraph_mask.append(0)
-
-      def process_class(seg_class):
-        class_index = len(segment_ids)
-        tokens.append("[CLS]")
-        segment_ids.append(seg_class)
-        paragraph_mask.append(1)
-        return class_index
-
-      if xlnet_format:
-        seg_p, seg_q, seg_class, seg_pad = 0, 1, 2, 3
-        process_paragraph(seg_p)
-        process_query(seg_q)
-        class_index = process_class(seg_class)
-      else:
-        seg_p, seg_q, seg_class, seg_pad = 1, 0, 0, 0
-        class_index = process_class(seg_class)
-        process_query(seg_q)
-        process_paragraph(seg_p)
-
-      input_ids = tokenizer.convert_tokens_to_ids(tokens)
-
-      # The mask has 1 for real tokens and 0 for padding tokens. Only real
-      # tokens are attended to.
-      input_mask = [1] * len(input_ids)
-
-      # Zero-pad up to the sequence length.
-      while len(input_ids) < max_seq_length:
-        input_ids.append(0)
-        input_mask.append(0)
-        segment_ids.append(seg_pad)
-        paragraph_mask.append(0)
-
-      assert len(input_ids) == max_seq_length
-      assert len(input_mask) == max_seq_length
-      assert len(segment_ids) == max_seq_length
-      assert len(paragraph_mask) == max_seq_length
-
-      start_position = 0
-      end_position = 0
-      span_contains_answer = False
-
-      if is_training and not example.is_impossible:
-        # For training, if our document chunk does not contain an annotation
-        # we throw it out, since there is nothing to predict.
-        doc_start = doc_span.start
-        doc_end = doc_span.start + doc_span.length - 1
-        span_contains_answer = (tok_start_position >= doc_start and
-                                tok_end_position <= doc_end)
-        if span_contains_answer:
-          doc_offset = 0 if xlnet_format else len(query_tokens) + 2
-          start_position = tok_start_position - doc_start + doc_offset
-          end_position = tok_end_position - doc_start + doc_offset
-
-      if example_index < 20:
-        logging.info("*** Example ***")
-        logging.info("unique_id: %s", (unique_id))
-        logging.info("example_index: %s", (example_index))
-        logging.info("doc_span_index: %s", (doc_span_index))
-        logging.info("tokens: %s",
-                     " ".join([tokenization.printable_text(x) for x in tokens]))
-        logging.info(
-            "token_to_orig_map: %s", " ".join([
-                "%d:%d" % (x, y) for (x, y) in six.iteritems(token_to_orig_map)
-            ]))
-        logging.info(
-            "token_is_max_context: %s", " ".join([
-                "%d:%s" % (x, y)
-                for (x, y) in six.iteritems(token_is_max_context)
-            ]))
-        logging.info("input_ids: %s", " ".join([str(x) for x in input_ids]))
-        logging.info("input_mask: %s", " ".join([str(x) for x in input_mask]))
-        logging.info("segment_ids: %s", " ".join([str(x) for x in segment_ids]))
-        logging.info("paragraph_mask: %s", " ".join(
-            [str(x) for x in paragraph_mask]))
-        logging.info("class_index: %d", class_index)
-        if is_training:
-          if span_contains_answer:
-            answer_text = " ".join(tokens[start_position:(end_position + 1)])
-            logging.info("start_position: %d", (start_position))
-            logging.info("end_position: %d", (end_position))
-            logging.info("answer: %s", tokenization.printable_text(answer_text))
-          else:
-            logging.info("document span doesn't contain answer")
-
-      feature = InputFeatures(
-          unique_id=unique_id,
-          example_index=example_index,
-          doc_span_index=doc_span_index,
-          tokens=tokens,
-          paragraph_mask=paragraph_mask,
-          class_index=class_index,
-          token_to_orig_map=token_to_orig_map,
-          token_is_max_context=token_is_max_context,
-          input_ids=input_ids,
-          input_mask=input_mask,
-          segment_ids=segment_ids,
-          start_position=start_position,
-          end_position=end_position,
-          is_impossible=not span_contains_answer)
+  convert_fn = functools.partial(
+      _convert_example_to_features,
+      max_seq_length=max_seq_length,
+      doc_stride=doc_stride,
+      max_query_length=max_query_length,
+      is_training=is_training,
+      xlnet_format=xlnet_format)
+  for features in map_examples_to_features(convert_fn, examples, tokenizer,
+                                           num_workers):
+    for feature in features:
+      feature.unique_id = unique_id
+      if feature.example_index < 20:
+        _log_feature(feature, is_training)
 
       # Run callback
       if is_training:
@@ -511,43 +641,6 @@ def _improve_answer_span(doc_tokens, input_start, input_end, tokenizer,
   return (input_start, input_end)
 
 
-def _check_is_max_context(doc_spans, cur_span_index, position):
-  """Check if this is the 'max context' doc span for the token."""
-
-  # Because of the sliding window approach taken to scoring documents, a single
-  # token can appear in multiple documents. E.g.
-  #  Doc: the man went to the store and bought a gallon of milk
-  #  Span A: the man went to the
-  #  Span B: to the store and bought
-  #  Span C: and bought a gallon of
-  #  ...
-  #
-  # Now the word 'bought' will have two scores from spans B and C. We only
-  # want to consider the score with "maximum context", which we define as
-  # the *minimum* of its left and right context (the *sum* of left and
-  # right context will always be the same, of course).
-  #
-  # In the example the maximum context for 'bought' would be span C since
-  # it has 1 left context and 3 right context, while span B has 4 left context
-  # and 0 right context.
-  best_score = None
-  best_span_index = None
-  for (span_index, doc_span) in enumerate(doc_spans):
-    end = doc_span.start + doc_span.length - 1
-    if position < doc_span.start:
-      continue
-    if position > end:
-      continue
-    num_left_context = position - doc_span.start
-    num_right_context = end - position
-    score = min(num_left_context, num_right_context) + 0.01 * doc_span.length
-    if best_score is None or score > best_score:
-      best_score = score
-      best_span_index = span_index
-
-  return cur_span_index == best_span_index
-
-
 def write_predictions(all_examples,
                       all_features,
                       all_results,
@@ -612,7 +705,7 @@ def postprocess_output(all_examples,
   for (example_index, example) in enumerate(all_examples):
     features = example_index_to_features[example_index]
 
-    prelim_predictions = []
+    prelim_spans = []
     # keep track of the minimum score of null start+end of position 0
     score_null = 1000000  # large and positive
     min_null_feature_index = 0  # the paragraph slice with min mull score
@@ -635,49 +728,24 @@ def postprocess_output(all_examples,
           min_null_feature_index = feature_index
           null_start_logit = result.start_logits[0]
           null_end_logit = result.end_logits[0]
-      for (start_index, start_logit,
-           end_index, end_logit) in _get_best_indexes_and_logits(
-               result=result,
-               n_best_size=n_best_size,
-               xlnet_format=xlnet_format):
-        # We could hypothetically create invalid predictions, e.g., predict
-        # that the start of the span is in the question. We throw out all
-        # invalid predictions.
-        if start_index >= len(feature.tokens):
-          continue
-        if end_index >= len(feature.tokens):
-          continue
-        if start_index not in feature.token_to_orig_map:
-          continue
-        if end_index not in feature.token_to_orig_map:
-          continue
-        if not feature.token_is_max_context.get(start_index, False):
-          continue
-        if end_index < start_index:
-          continue
-        length = end_index - start_index + 1
-        if length > max_answer_length:
-          continue
-        prelim_predictions.append(
-            _PrelimPrediction(
-                feature_index=feature_index,
-                start_index=start_index,
-                end_index=end_index,
-                start_logit=start_logit,
-                end_logit=end_logit))
+
+      # We could hypothetically create invalid predictions, e.g., predict
+      # that the start of the span is in the question. We throw out all
+      # invalid predictions.
+      spans = get_valid_spans(
+          result=result,
+          n_best_size=n_best_size,
+          max_answer_length=max_answer_length,
+          is_valid_start=functools.partial(_is_valid_start, feature),
+          is_valid_end=functools.partial(_is_valid_end, feature),
+          xlnet_format=xlnet_format)
+      prelim_spans.append((np.full(len(spans[0]), feature_index),) + spans)
 
     if version_2_with_negative and not xlnet_format:
-      prelim_predictions.append(
-          _PrelimPrediction(
-              feature_index=min_null_feature_index,
-              start_index=0,
-              end_index=0,
-              start_logit=null_start_logit,
-              end_logit=null_end_logit))
-    prelim_predictions = sorted(
-        prelim_predictions,
-        key=lambda x: (x.start_logit + x.end_logit),
-        reverse=True)
+      prelim_spans.append(([min_null_feature_index], [0], [0],
+                           [null_start_logit], [null_end_logit]))
+    prelim_predictions = (
+        _PrelimPrediction(*span) for span in rank_spans(prelim_spans))
 
     _NbestPrediction = collections.namedtuple(  # pylint: disable=invalid-name
         "NbestPrediction", ["text", "start_logit", "end_logit"])
@@ -885,29 +953,125 @@ def get_final_text(pred_text, orig_text, do_lower_case, verbose=False):
   return output_text
 
 
+def _top_k_indexes(logits, k):
+  """Returns the indexes of the `k` largest logits, largest first.
+
+  Only the `k` selected logits are sorted. Ties are broken by position, so the
+  result is the same as the first `k` entries of a stable descending sort.
+  """
+  logits = np.asarray(logits)
+  if k < logits.size:
+    kth = np.partition(logits, logits.size - k)[logits.size - k]
+    above = np.flatnonzero(logits > kth)
+    ties = np.flatnonzero(logits == kth)[:k - above.size]
+    indexes = np.sort(np.concatenate([above, ties]))
+  else:
+    indexes = np.arange(logits.size)
+  return indexes[np.argsort(-logits[indexes], kind="stable")]
+
+
 def _get_best_indexes_and_logits(result,
                                  n_best_size,
                                  xlnet_format=False):
-  """Generates the n-best indexes and logits from a list."""
+  """Returns the n-best start and end indexes and logits of a result.
+
+  Returns:
+    A tuple `(start_indexes, end_indexes, start_logits, end_logits)` of arrays.
+    The start arrays have shape `[n_best_size, 1]` and the end arrays have
+    shape `[1, n_best_size]` (`[n_best_size, n_best_size]` in XLNet format),
+    so that broadcasting them enumerates all candidate spans.
+  """
   if xlnet_format:
-    for i in range(n_best_size):
-      for j in range(n_best_size):
-        j_index = i * n_best_size + j
-        yield (result.start_indexes[i], result.start_logits[i],
-               result.end_indexes[j_index], result.end_logits[j_index])
+    start_indexes = np.asarray(result.start_indexes)[:n_best_size, None]
+    start_logits = np.asarray(result.start_logits)[:n_best_size, None]
+    end_shape = [n_best_size, n_best_size]
+    end_indexes = np.reshape(
+        np.asarray(result.end_indexes)[:n_best_size**2], end_shape)
+    end_logits = np.reshape(
+        np.asarray(result.end_logits)[:n_best_size**2], end_shape)
   else:
-    start_index_and_score = sorted(enumerate(result.start_logits),
-                                   key=lambda x: x[1], reverse=True)
-    end_index_and_score = sorted(enumerate(result.end_logits),
-                                 key=lambda x: x[1], reverse=True)
-    for i in range(len(start_index_and_score)):
-      if i >= n_best_size:
-        break
-      for j in range(len(end_index_and_score)):
-        if j >= n_best_size:
-          break
-        yield (start_index_and_score[i][0], start_index_and_score[i][1],
-               end_index_and_score[j][0], end_index_and_score[j][1])
+    start_indexes = _top_k_indexes(result.start_logits, n_best_size)
+    end_indexes = _top_k_indexes(result.end_logits, n_best_size)
+    start_logits = np.asarray(result.start_logits)[start_indexes][:, None]
+    end_logits = np.asarray(result.end_logits)[end_indexes][None, :]
+    start_indexes = start_indexes[:, None]
+    end_indexes = end_indexes[None, :]
+  return start_indexes, end_indexes, start_logits, end_logits
+
+
+def _index_mask(predicate, indexes):
+  """Evaluates `predicate` once per distinct index of an array."""
+  unique_indexes, inverse = np.unique(indexes, return_inverse=True)
+  mask = np.array([predicate(i) for i in unique_indexes.tolist()], dtype=bool)
+  return mask[inverse].reshape(indexes.shape)
+
+
+def get_valid_spans(result,
+                    n_best_size,
+                    max_answer_length,
+                    is_valid_start,
+                    is_valid_end,
+                    xlnet_format=False):
+  """Selects the valid spans among the n-best candidates of a result.
+
+  All `n_best_size**2` start/end pairs are checked at once: the token
+  predicates are evaluated once per distinct index and the ordering and
+  length constraints on the whole candidate grid.
+
+  Args:
+    result: A raw result with `start_logits` and `end_logits`, plus
+      `start_indexes` and `end_indexes` in XLNet format.
+    n_best_size: The number of start and end candidates to consider.
+    max_answer_length: The maximum number of tokens in an answer.
+    is_valid_start: A function that returns whether the token at a given index
+      may start an answer.
+    is_valid_end: A function that returns whether the token at a given index
+      may end an answer.
+    xlnet_format: Whether the result is in XLNet format.
+
+  Returns:
+    A tuple `(start_indexes, end_indexes, start_logits, end_logits)` of 1-D
+    arrays with one entry per valid span, in candidate order.
+  """
+  start_indexes, end_indexes, start_logits, end_logits = (
+      _get_best_indexes_and_logits(result, n_best_size, xlnet_format))
+  valid = (_index_mask(is_valid_start, start_indexes) &
+           _index_mask(is_valid_end, end_indexes) &
+           (end_indexes >= start_indexes) &
+           (end_indexes - start_indexes + 1 <= max_answer_length))
+  return tuple(np.broadcast_to(x, valid.shape)[valid]
+               for x in (start_indexes, end_indexes, start_logits, end_logits))
+
+
+def rank_spans(spans):
+  """Yields candidate spans from the best to the worst score.
+
+  Args:
+    spans: A list of tuples `(feature_indexes, start_indexes, end_indexes,
+      start_logits, end_logits)` of equal-length sequences.
+
+  Yields:
+    Tuples `(feature_index, start_index, end_index, start_logit, end_logit)`
+    by decreasing `start_logit + end_logit`. Spans with equal scores keep
+    their input order.
+  """
+  if not spans:
+    return
+  columns = [np.concatenate(column) for column in zip(*spans)]
+  scores = columns[3] + columns[4]
+  for i in np.argsort(-scores, kind="stable"):
+    yield tuple(column[i] for column in columns)
+
+
+def _is_valid_end(feature, index):
+  """Returns whether an answer may end at a token of a feature."""
+  return index < len(feature.tokens) and index in feature.token_to_orig_map
+
+
+def _is_valid_start(feature, index):
+  """Returns whether an answer may start at a token of a feature."""
+  return (_is_valid_end(feature, index) and
+          feature.token_is_max_context.get(index, False))
 
 
 def _compute_softmax(scores):
@@ -942,7 +1106,8 @@ def generate_tf_record_from_json_file(input_file_path,
                                       max_query_length=64,
                                       doc_stride=128,
                                       version_2_with_negative=False,
-                                      xlnet_format=False):
+                                      xlnet_format=False,
+                                      num_workers=0):
   """Generates and saves training data into a tf record file."""
   train_examples = read_squad_examples(
       input_file=input_file_path,
@@ -960,7 +1125,8 @@ def generate_tf_record_from_json_file(input_file_path,
       max_query_length=max_query_length,
       is_training=True,
       output_fn=train_writer.process_feature,
-      xlnet_format=xlnet_format)
+      xlnet_format=xlnet_format,
+      num_workers=num_workers)
   train_writer.close()
 
   meta_data = {
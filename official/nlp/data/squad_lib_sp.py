@@ -20,6 +20,7 @@ https://github.com/google-research/ALBERT/blob/master/run_squad_sp.py
 """
 import collections
 import copy
+import functools
 import json
 import math
 import os
@@ -29,6 +30,7 @@ import numpy as np
 import tensorflow as tf
 
 from official.nlp.bert import tokenization
+from official.nlp.data import squad_lib
 
 
 class SquadExample(object):
@@ -200,6 +202,327 @@ def _convert_index(index, pos, m=None, is_start=True):
       return index[front]
 
 
+def _convert_example_to_features(example_index, example, tokenizer,
+                                 max_seq_length, doc_stride, max_query_length,
+                                 is_training, do_lower_case, xlnet_format):
+  """Converts a `SquadExample` to `InputFeatures` without unique ids."""
+  # The questions of a paragraph are usually consecutive examples, so a
+  # tokenizer with a cache only encodes the paragraph once.
+  query_pieces, para_tokens = tokenizer.tokenize_batch([
+      tokenization.preprocess_text(example.question_text, lower=do_lower_case),
+      tokenization.preprocess_text(
+          example.paragraph_text, lower=do_lower_case)
+  ])
+  query_tokens = tokenizer.convert_tokens_to_ids(query_pieces)
+
+  if len(query_tokens) > max_query_length:
+    query_tokens = query_tokens[0:max_query_length]
+
+  paragraph_text = example.paragraph_text
+
+  chartok_to_tok_index = []
+  tok_start_to_chartok_index = []
+  tok_end_to_chartok_index = []
+  char_cnt = 0
+  for i, token in enumerate(para_tokens):
+    new_token = token.replace(tokenization.SPIECE_UNDERLINE, " ")
+    chartok_to_tok_index.extend([i] * len(new_token))
+    tok_start_to_chartok_index.append(char_cnt)
+    char_cnt += len(new_token)
+    tok_end_to_chartok_index.append(char_cnt - 1)
+
+  tok_cat_text = "".join(para_tokens).replace(tokenization.SPIECE_UNDERLINE,
+                                              " ")
+  n, m = len(paragraph_text), len(tok_cat_text)
+
+  f = np.zeros((max(n, 1024), max(m, 1024)), dtype=np.float32)
+
+  g = {}
+
+  def _lcs_match(max_dist, n=n, m=m):
+    """Longest-common-substring algorithm."""
+    f.fill(0)
+    g.clear()
+
+    ### longest common sub sequence
+    # f[i, j] = max(f[i - 1, j], f[i, j - 1], f[i - 1, j - 1] + match(i, j))
+    for i in range(n):
+
+      # unlike standard LCS, this is specifically optimized for the setting
+      # because the mismatch between sentence pieces and original text will
+      # be small
+      for j in range(i - max_dist, i + max_dist):
+        if j >= m or j < 0:
+          continue
+
+        if i > 0:
+          g[(i, j)] = 0
+          f[i, j] = f[i - 1, j]
+
+        if j > 0 and f[i, j - 1] > f[i, j]:
+          g[(i, j)] = 1
+          f[i, j] = f[i, j - 1]
+
+        f_prev = f[i - 1, j - 1] if i > 0 and j > 0 else 0
+        if (tokenization.preprocess_text(
+            paragraph_text[i], lower=do_lower_case,
+            remove_space=False) == tok_cat_text[j] and f_prev + 1 > f[i, j]):
+          g[(i, j)] = 2
+          f[i, j] = f_prev + 1
+
+  max_dist = abs(n - m) + 5
+  for _ in range(2):
+    _lcs_match(max_dist)
+    if f[n - 1, m - 1] > 0.8 * n:
+      break
+    max_dist *= 2
+
+  orig_to_chartok_index = [None] * n
+  chartok_to_orig_index = [None] * m
+  i, j = n - 1, m - 1
+  while i >= 0 and j >= 0:
+    if (i, j) not in g:
+      break
+    if g[(i, j)] == 2:
+      orig_to_chartok_index[i] = j
+      chartok_to_orig_index[j] = i
+      i, j = i - 1, j - 1
+    elif g[(i, j)] == 1:
+      j = j - 1
+    else:
+      i = i - 1
+
+  if (all(v is None for v in orig_to_chartok_index) or
+      f[n - 1, m - 1] < 0.8 * n):
+    logging.info("MISMATCH DETECTED!")
+    return []
+
+  tok_start_to_orig_index = []
+  tok_end_to_orig_index = []
+  for i in range(len(para_tokens)):
+    start_chartok_pos = tok_start_to_chartok_index[i]
+    end_chartok_pos = tok_end_to_chartok_index[i]
+    start_orig_pos = _convert_index(
+        chartok_to_orig_index, start_chartok_pos, n, is_start=True)
+    end_orig_pos = _convert_index(
+        chartok_to_orig_index, end_chartok_pos, n, is_start=False)
+
+    tok_start_to_orig_index.append(start_orig_pos)
+    tok_end_to_orig_index.append(end_orig_pos)
+
+  if not is_training:
+    tok_start_position = tok_end_position = None
+
+  if is_training and example.is_impossible:
+    tok_start_position = 0
+    tok_end_position = 0
+
+  if is_training and not example.is_impossible:
+    start_position = example.start_position
+    end_position = start_position + len(example.orig_answer_text) - 1
+
+    start_chartok_pos = _convert_index(
+        orig_to_chartok_index, start_position, is_start=True)
+    tok_start_position = chartok_to_tok_index[start_chartok_pos]
+
+    end_chartok_pos = _convert_index(
+        orig_to_chartok_index, end_position, is_start=False)
+    tok_end_position = chartok_to_tok_index[end_chartok_pos]
+    assert tok_start_position <= tok_end_position
+
+  def _piece_to_id(x):
+    return tokenizer.sp_model.PieceToId(x)
+
+  all_doc_tokens = list(map(_piece_to_id, para_tokens))
+
+  # The -3 accounts for [CLS], [SEP] and [SEP]
+  max_tokens_for_doc = max_seq_length - len(query_tokens) - 3
+
+  # We can have documents that are longer than the maximum sequence length.
+  # To deal with this we do a sliding window approach, where we take chunks
+  # of the up to our max length with a stride of `doc_stride`.
+  _DocSpan = collections.namedtuple(  # pylint: disable=invalid-name
+      "DocSpan", ["start", "length"])
+  doc_spans = []
+  start_offset = 0
+
+  while start_offset < len(all_doc_tokens):
+    length = len(all_doc_tokens) - start_offset
+    if length > max_tokens_for_doc:
+      length = max_tokens_for_doc
+    doc_spans.append(_DocSpan(start=start_offset, length=length))
+    if start_offset + length == len(all_doc_tokens):
+      break
+    start_offset += min(length, doc_stride)
+  max_context_span_indexes = squad_lib.get_max_context_span_indexes(
+      doc_spans, len(all_doc_tokens))
+
+  features = []
+  for (doc_span_index, doc_span) in enumerate(doc_spans):
+    tokens = []
+    token_is_max_context = {}
+    segment_ids = []
+
+    # Paragraph mask used in XLNet.
+    # 1 represents paragraph and class tokens.
+    # 0 represents query and other special tokens.
+    paragraph_mask = []
+
+    cur_tok_start_to_orig_index = []
+    cur_tok_end_to_orig_index = []
+
+    # pylint: disable=cell-var-from-loop
+    def process_query(seg_q):
+      for token in query_tokens:
+        tokens.append(token)
+        segment_ids.append(seg_q)
+        paragraph_mask.append(0)
+      tokens.append(tokenizer.sp_model.PieceToId("[SEP]"))
+      segment_ids.append(seg_q)
+      paragraph_mask.append(0)
+
+    def process_paragraph(seg_p):
+      for i in range(doc_span.length):
+        split_token_index = doc_span.start + i
+
+        cur_tok_start_to_orig_index.append(
+            tok_start_to_orig_index[split_token_index])
+        cur_tok_end_to_orig_index.append(
+            tok_end_to_orig_index[split_token_index])
+
+        is_max_context = (
+            max_context_span_indexes[split_token_index] == doc_span_index)
+        token_is_max_context[len(tokens)] = is_max_context
+        tokens.append(all_doc_tokens[split_token_index])
+        segment_ids.append(seg_p)
+        paragraph_mask.append(1)
+      tokens.append(tokenizer.sp_model.PieceToId("[SEP]"))
+      segment_ids.append(seg_p)
+      paragraph_mask.append(0)
+      return len(tokens)
+
+    def process_class(seg_class):
+      class_index = len(segment_ids)
+      tokens.append(tokenizer.sp_model.PieceToId("[CLS]"))
+      segment_ids.append(seg_class)
+      paragraph_mask.append(1)
+      return class_index
+
+    if xlnet_format:
+      seg_p, seg_q, seg_class, seg_pad = 0, 1, 2, 3
+      paragraph_len = process_paragraph(seg_p)
+      process_query(seg_q)
+      class_index = process_class(seg_class)
+    else:
+      seg_p, seg_q, seg_class, seg_pad = 1, 0, 0, 0
+      class_index = process_class(seg_class)
+      process_query(seg_q)
+      paragraph_len = process_paragraph(seg_p)
+
+    input_ids = tokens
+
+    # The mask has 1 for real tokens and 0 for padding tokens. Only real
+    # tokens are attended to.
+    input_mask = [1] * len(input_ids)
+
+    # Zero-pad up to the sequence length.
+    while len(input_ids) < max_seq_length:
+      input_ids.append(0)
+      input_mask.append(0)
+      segment_ids.append(seg_pad)
+      paragraph_mask.append(0)
+
+    assert len(input_ids) == max_seq_length
+    assert len(input_mask) == max_seq_length
+    assert len(segment_ids) == max_seq_length
+    assert len(paragraph_mask) == max_seq_length
+
+    span_is_impossible = example.is_impossible
+    start_position = None
+    end_position = None
+    if is_training and not span_is_impossible:
+      # For training, if our document chunk does not contain an annotation
+      # we throw it out, since there is nothing to predict.
+      doc_start = doc_span.start
+      doc_end = doc_span.start + doc_span.length - 1
+      out_of_span = False
+      if not (tok_start_position >= doc_start and
+              tok_end_position <= doc_end):
+        out_of_span = True
+      if out_of_span:
+        # continue
+        start_position = 0
+        end_position = 0
+        span_is_impossible = True
+      else:
+        doc_offset = 0 if xlnet_format else len(query_tokens) + 2
+        start_position = tok_start_position - doc_start + doc_offset
+        end_position = tok_end_position - doc_start + doc_offset
+
+    if is_training and span_is_impossible:
+      start_position = class_index
+      end_position = class_index
+
+    if is_training:
+      feat_example_index = None
+    else:
+      feat_example_index = example_index
+
+    features.append(
+        InputFeatures(
+            unique_id=None,
+            example_index=feat_example_index,
+            doc_span_index=doc_span_index,
+            tok_start_to_orig_index=cur_tok_start_to_orig_index,
+            tok_end_to_orig_index=cur_tok_end_to_orig_index,
+            token_is_max_context=token_is_max_context,
+            tokens=[tokenizer.sp_model.IdToPiece(x) for x in tokens],
+            input_ids=input_ids,
+            input_mask=input_mask,
+            paragraph_mask=paragraph_mask,
+            segment_ids=segment_ids,
+            paragraph_len=paragraph_len,
+            class_index=class_index,
+            start_position=start_position,
+            end_position=end_position,
+            is_impossible=span_is_impossible))
+  return features
+
+
+def _log_feature(feature, example_index, tokenizer, is_training):
+  """Logs the content of a feature."""
+  logging.info("*** Example ***")
+  logging.info("unique_id: %s", (feature.unique_id))
+  logging.info("example_index: %s", (example_index))
+  logging.info("doc_span_index: %s", (feature.doc_span_index))
+  logging.info("tok_start_to_orig_index: %s",
+               " ".join([str(x) for x in feature.tok_start_to_orig_index]))
+  logging.info("tok_end_to_orig_index: %s",
+               " ".join([str(x) for x in feature.tok_end_to_orig_index]))
+  logging.info(
+      "token_is_max_context: %s", " ".join([
+          "%d:%s" % (x, y) for (x, y) in feature.token_is_max_context.items()
+      ]))
+  logging.info("input_pieces: %s", " ".join(feature.tokens))
+  logging.info("input_ids: %s", " ".join([str(x) for x in feature.input_ids]))
+  logging.info("input_mask: %s", " ".join([str(x) for x in feature.input_mask]))
+  logging.info("segment_ids: %s",
+               " ".join([str(x) for x in feature.segment_ids]))
+  logging.info("paragraph_mask: %s", " ".join(
+      [str(x) for x in feature.paragraph_mask]))
+  logging.info("class_index: %d", feature.class_index)
+
+  if is_training and feature.is_impossible:
+    logging.info("impossible example span")
+
+  if is_training and not feature.is_impossible:
+    pieces = feature.tokens[feature.start_position:(feature.end_position + 1)]
+    answer_text = tokenizer.sp_model.DecodePieces(pieces)
+    logging.info("start_position: %d", (feature.start_position))
+    logging.info("end_position: %d", (feature.end_position))
+    logging.info("answer: %s", (tokenization.printable_text(answer_text)))
+
+
 def convert_examples_to_features(examples,
                                  tokenizer,
                                  max_seq_length,
@@ -209,341 +532,38 @@ def convert_examples_to_features(examples,
                                  output_fn,
                                  do_lower_case,
                                  xlnet_format=False,
-                                 batch_size=None):
-  """Loads a data file into a list of `InputBatch`s."""
+                                 batch_size=None,
+                                 num_workers=0):
+  """Loads a data file into a list of `InputBatch`s.
+
+  Features are passed to `output_fn` as soon as they are created. If
+  `num_workers` is positive, examples are converted by that many worker
+  processes, while unique ids are still assigned in the order of `examples`.
+  """
   cnt_pos, cnt_neg = 0, 0
   base_id = 1000000000
   unique_id = base_id
-  max_n, max_m = 1024, 1024
-  f = np.zeros((max_n, max_m), dtype=np.float32)
-
-  for (example_index, example) in enumerate(examples):
+  feature = None
+  convert_fn = functools.partial(
+      _convert_example_to_features,
+      max_seq_length=max_seq_length,
+      doc_stride=doc_stride,
+      max_query_length=max_query_length,
+      is_training=is_training,
+      do_lower_case=do_lower_case,
+      xlnet_format=xlnet_format)
+  for example_index, features in enumerate(
+      squad_lib.map_examples_to_features(convert_fn, examples, tokenizer,
+                                         num_workers)):
 
     if example_index % 100 == 0:
       logging.info("Converting %d/%d pos %d neg %d", example_index,
                    len(examples), cnt_pos, cnt_neg)
 
-    query_tokens = tokenization.encode_ids(
-        tokenizer.sp_model,
-        tokenization.preprocess_text(
-            example.question_text, lower=do_lower_case))
-
-    if len(query_tokens) > max_query_length:
-      query_tokens = query_tokens[0:max_query_length]
-
-    paragraph_text = example.paragraph_text
-    para_tokens = tokenization.encode_pieces(
-        tokenizer.sp_model,
-        tokenization.preprocess_text(
-            example.paragraph_text, lower=do_lower_case))
-
-    chartok_to_tok_index = []
-    tok_start_to_chartok_index = []
-    tok_end_to_chartok_index = []
-    char_cnt = 0
-    for i, token in enumerate(para_tokens):
-      new_token = token.replace(tokenization.SPIECE_UNDERLINE, " ")
-      chartok_to_tok_index.extend([i] * len(new_token))
-      tok_start_to_chartok_index.append(char_cnt)
-      char_cnt += len(new_token)
-      tok_end_to_chartok_index.append(char_cnt - 1)
-
-    tok_cat_text = "".join(para_tokens).replace(tokenization.SPIECE_UNDERLINE,
-                                                " ")
-    n, m = len(paragraph_text), len(tok_cat_text)
-
-    if n > max_n or m > max_m:
-      max_n = max(n, max_n)
-      max_m = max(m, max_m)
-      f = np.zeros((max_n, max_m), dtype=np.float32)
-
-    g = {}
-
-    # pylint: disable=cell-var-from-loop
-    def _lcs_match(max_dist, n=n, m=m):
-      """Longest-common-substring algorithm."""
-      f.fill(0)
-      g.clear()
-
-      ### longest common sub sequence
-      # f[i, j] = max(f[i - 1, j], f[i, j - 1], f[i - 1, j - 1] + match(i, j))
-      for i in range(n):
-
-        # unlike standard LCS, this is specifically optimized for the setting
-        # because the mismatch between sentence pieces and original text will
-        # be small
-        for j in range(i - max_dist, i + max_dist):
-          if j >= m or j < 0:
-            continue
-
-          if i > 0:
-            g[(i, j)] = 0
-            f[i, j] = f[i - 1, j]
-
-          if j > 0 and f[i, j - 1] > f[i, j]:
-            g[(i, j)] = 1
-            f[i, j] = f[i, j - 1]
-
-          f_prev = f[i - 1, j - 1] if i > 0 and j > 0 else 0
-          if (tokenization.preprocess_text(
-              paragraph_text[i], lower=do_lower_case,
-              remove_space=False) == tok_cat_text[j] and f_prev + 1 > f[i, j]):
-            g[(i, j)] = 2
-            f[i, j] = f_prev + 1
-
-    # pylint: enable=cell-var-from-loop
-
-    max_dist = abs(n - m) + 5
-    for _ in range(2):
-      _lcs_match(max_dist)
-      if f[n - 1, m - 1] > 0.8 * n:
-        break
-      max_dist *= 2
-
-    orig_to_chartok_index = [None] * n
-    chartok_to_orig_index = [None] * m
-    i, j = n - 1, m - 1
-    while i >= 0 and j >= 0:
-      if (i, j) not in g:
-        break
-      if g[(i, j)] == 2:
-        orig_to_chartok_index[i] = j
-        chartok_to_orig_index[j] = i
-        i, j = i - 1, j - 1
-      elif g[(i, j)] == 1:
-        j = j - 1
-      else:
-        i = i - 1
-
-    if (all(v is None for v in orig_to_chartok_index) or
-        f[n - 1, m - 1] < 0.8 * n):
-      logging.info("MISMATCH DETECTED!")
-      continue
-
-    tok_start_to_orig_index = []
-    tok_end_to_orig_index = []
-    for i in range(len(para_tokens)):
-      start_chartok_pos = tok_start_to_chartok_index[i]
-      end_chartok_pos = tok_end_to_chartok_index[i]
-      start_orig_pos = _convert_index(
-          chartok_to_orig_index, start_chartok_pos, n, is_start=True)
-      end_orig_pos = _convert_index(
-          chartok_to_orig_index, end_chartok_pos, n, is_start=False)
-
-      tok_start_to_orig_index.append(start_orig_pos)
-      tok_end_to_orig_index.append(end_orig_pos)
-
-    if not is_training:
-      tok_start_position = tok_end_position = None
-
-    if is_training and example.is_impossible:
-      tok_start_position = 0
-      tok_end_position = 0
-
-    if is_training and not example.is_impossible:
-      start_position = example.start_position
-      end_position = start_position + len(example.orig_answer_text) - 1
-
-      start_chartok_pos = _convert_index(
-          orig_to_chartok_index, start_position, is_start=True)
-      tok_start_position = chartok_to_tok_index[start_chartok_pos]
-
-      end_chartok_pos = _convert_index(
-          orig_to_chartok_index, end_position, is_start=False)
-      tok_end_position = chartok_to_tok_index[end_chartok_pos]
-      assert tok_start_position <= tok_end_position
-
-    def _piece_to_id(x):
-      return tokenizer.sp_model.PieceToId(x)
-
-    all_doc_tokens = list(map(_piece_to_id, para_tokens))
-
-    # The -3 accounts for [CLS], [SEP] and [SEP]
-    max_tokens_for_doc = max_seq_length - len(query_tokens) - 3
-
-    # We can have documents that are longer than the maximum sequence length.
-    # To deal with this we do a sliding window approach, where we take chunks
-    # of the up to our max length with a stride of `doc_stride`.
-    _DocSpan = collections.namedtuple(  # pylint: disable=invalid-name
-        "DocSpan", ["start", "length"])
-    doc_spans = []
-    start_offset = 0
-
-    while start_offset < len(all_doc_tokens):
-      length = len(all_doc_tokens) - start_offset
-      if length > max_tokens_for_doc:
-        length = max_tokens_for_doc
-      doc_spans.append(_DocSpan(start=start_offset, length=length))
-      if start_offset + length == len(all_doc_tokens):
-        break
-      start_offset += min(length, doc_stride)
-
-    for (doc_span_index, doc_span) in enumerate(doc_spans):
-      tokens = []
-      token_is_max_context = {}
-      segment_ids = []
-
-      # Paragraph mask used in XLNet.
-      # 1 represents paragraph and class tokens.
-      # 0 represents query and other special tokens.
-      paragraph_mask = []
-
-      cur_tok_start_to_orig_index = []
-      cur_tok_end_to_orig_index = []
-
-      # pylint: disable=cell-var-from-loop
-      def process_query(seg_q):
-        for token in query_tokens:
-          tokens.append(token)
-          segment_ids.append(seg_q)
-          paragraph_mask.append(0)
-        tokens.append(tokenizer.sp_model.PieceToId("[SEP]"))
-        segment_ids.append(seg_q)
-        paragraph_mask.append(0)
-
-      def process_paragraph(seg_p):
-        for i in range(doc_span.length):
-          split_token_index = doc_span.start + i
-
-          cur_tok_start_to_orig_index.append(
-              tok_start_to_orig_index[split_token_index])
-          cur_tok_end_to_orig_index.append(
-              tok_end_to_orig_index[split_token_index])
-
-          is_max_context = _check_is_max_context(doc_spans, doc_span_index,
-                                                 split_token_index)
-          token_is_max_context[len(tokens)] = is_max_context
-          tokens.append(all_doc_tokens[split_token_index])
-          segment_ids.append(seg_p)
-          paragraph_mask.append(1)
-        tokens.append(tokenizer.sp_model.PieceToId("[SEP]"))
-        segment_ids.append(seg_p)
-        paragraph_mask.append(0)
-        return len(tokens)
-
-      def process_class(seg_class):
-        class_index = len(segment_ids)
-        tokens.append(tokenizer.sp_model.PieceToId("[CLS]"))
-        segment_ids.append(seg_class)
-        paragraph_mask.append(1)
-        return class_index
-
-      if xlnet_format:
-        seg_p, seg_q, seg_class, seg_pad = 0, 1, 2, 3
-        paragraph_len = process_paragraph(seg_p)
-        process_query(seg_q)
-        class_index = process_class(seg_class)
-      else:
-        seg_p, seg_q, seg_class, seg_pad = 1, 0, 0, 0
-        class_index = process_class(seg_class)
-        process_query(seg_q)
-        paragraph_len = process_paragraph(seg_p)
-
-      input_ids = tokens
-
-      # The mask has 1 for real tokens and 0 for padding tokens. Only real
-      # tokens are attended to.
-      input_mask = [1] * len(input_ids)
-
-      # Zero-pad up to the sequence length.
-      while len(input_ids) < max_seq_length:
-        input_ids.append(0)
-        input_mask.append(0)
-        segment_ids.append(seg_pad)
-        paragraph_mask.append(0)
-
-      assert len(input_ids) == max_seq_length
-      assert len(input_mask) == max_seq_length
-      assert len(segment_ids) == max_seq_length
-      assert len(paragraph_mask) == max_seq_length
-
-      span_is_impossible = example.is_impossible
-      start_position = None
-      end_position = None
-      if is_training and not span_is_impossible:
-        # For training, if our document chunk does not contain an annotation
-        # we throw it out, since there is nothing to predict.
-        doc_start = doc_span.start
-        doc_end = doc_span.start + doc_span.length - 1
-        out_of_span = False
-        if not (tok_start_position >= doc_start and
-                tok_end_position <= doc_end):
-          out_of_span = True
-        if out_of_span:
-          # continue
-          start_position = 0
-          end_position = 0
-          span_is_impossible = True
-        else:
-          doc_offset = 0 if xlnet_format else len(query_tokens) + 2
-          start_position = tok_start_position - doc_start + doc_offset
-          end_position = tok_end_position - doc_start + doc_offset
-
-      if is_training and span_is_impossible:
-        start_position = class_index
-        end_position = class_index
-
+    for feature in features:
+      feature.unique_id = unique_id
       if example_index < 20:
-        logging.info("*** Example ***")
-        logging.info("unique_id: %s", (unique_id))
-        logging.info("example_index: %s", (example_index))
-        logging.info("doc_span_index: %s", (doc_span_index))
-        logging.info("tok_start_to_orig_index: %s",
-                     " ".join([str(x) for x in cur_tok_start_to_orig_index]))
-        logging.info("tok_end_to_orig_index: %s",
-                     " ".join([str(x) for x in cur_tok_end_to_orig_index]))
-        logging.info(
-            "token_is_max_context: %s", " ".join(
-                ["%d:%s" % (x, y) for (x, y) in token_is_max_context.items()]))
-        logging.info(
-            "input_pieces: %s",
-            " ".join([tokenizer.sp_model.IdToPiece(x) for x in tokens]))
-        logging.info("input_ids: %s", " ".join([str(x) for x in input_ids]))
-        logging.info("input_mask: %s", " ".join([str(x) for x in input_mask]))
-        logging.info("segment_ids: %s", " ".join([str(x) for x in segment_ids]))
-        logging.info("paragraph_mask: %s", " ".join(
-            [str(x) for x in paragraph_mask]))
-        logging.info("class_index: %d", class_index)
-
-        if is_training and span_is_impossible:
-          logging.info("impossible example span")
-
-        if is_training and not span_is_impossible:
-          pieces = [
-              tokenizer.sp_model.IdToPiece(token)
-              for token in tokens[start_position:(end_position + 1)]
-          ]
-          answer_text = tokenizer.sp_model.DecodePieces(pieces)
-          logging.info("start_position: %d", (start_position))
-          logging.info("end_position: %d", (end_position))
-          logging.info("answer: %s", (tokenization.printable_text(answer_text)))
-
-          # With multi processing, the example_index is actually the index
-          # within the current process therefore we use example_index=None
-          # to avoid being used in the future.
-          # The current code does not use example_index of training data.
-      if is_training:
-        feat_example_index = None
-      else:
-        feat_example_index = example_index
-
-      feature = InputFeatures(
-          unique_id=unique_id,
-          example_index=feat_example_index,
-          doc_span_index=doc_span_index,
-          tok_start_to_orig_index=cur_tok_start_to_orig_index,
-          tok_end_to_orig_index=cur_tok_end_to_orig_index,
-          token_is_max_context=token_is_max_context,
-          tokens=[tokenizer.sp_model.IdToPiece(x) for x in tokens],
-          input_ids=input_ids,
-          input_mask=input_mask,
-          paragraph_mask=paragraph_mask,
-          segment_ids=segment_ids,
-          paragraph_len=paragraph_len,
-          class_index=class_index,
-          start_position=start_position,
-          end_position=end_position,
-          is_impossible=span_is_impossible)
+        _log_feature(feature, example_index, tokenizer, is_training)
 
       # Run callback
       if is_training:
@@ -552,7 +572,7 @@ def convert_examples_to_features(examples,
         output_fn(feature, is_padding=False)
 
       unique_id += 1
-      if span_is_impossible:
+      if feature.is_impossible:
         cnt_neg += 1
       else:
         cnt_pos += 1
@@ -576,43 +596,6 @@ def convert_examples_to_features(examples,
   return unique_id - base_id
 
 
-def _check_is_max_context(doc_spans, cur_span_index, position):
-  """Check if this is the 'max context' doc span for the token."""
-
-  # Because of the sliding window approach taken to scoring documents, a single
-  # token can appear in multiple documents. E.g.
-  #  Doc: the man went to the store and bought a gallon of milk
-  #  Span A: the man went to the
-  #  Span B: to the store and bought
-  #  Span C: and bought a gallon of
-  #  ...
-  #
-  # Now the word 'bought' will have two scores from spans B and C. We only
-  # want to consider the score with "maximum context", which we define as
-  # the *minimum* of its left and right context (the *sum* of left and
-  # right context will always be the same, of course).
-  #
-  # In the example the maximum context for 'bought' would be span C since
-  # it has 1 left context and 3 right context, while span B has 4 left context
-  # and 0 right context.
-  best_score = None
-  best_span_index = None
-  for (span_index, doc_span) in enumerate(doc_spans):
-    end = doc_span.start + doc_span.length - 1
-    if position < doc_span.start:
-      continue
-    if position > end:
-      continue
-    num_left_context = position - doc_span.start
-    num_right_context = end - position
-    score = min(num_left_context, num_right_context) + 0.01 * doc_span.length
-    if best_score is None or score > best_score:
-      best_score = score
-      best_span_index = span_index
-
-  return cur_span_index == best_span_index
-
-
 def write_predictions(all_examples,
                       all_features,
                       all_results,
@@ -679,7 +662,7 @@ def postprocess_output(all_examples,
   for (example_index, example) in enumerate(all_examples):
     features = example_index_to_features[example_index]
 
-    prelim_predictions = []
+    prelim_spans = []
     # keep track of the minimum score of null start+end of position 0
     score_null = 1000000  # large and positive
     min_null_feature_index = 0  # the paragraph slice with min mull score
@@ -705,45 +688,30 @@ def postprocess_output(all_examples,
 
       doc_offset = 0 if xlnet_format else feature.tokens.index("[SEP]") + 1
 
-      for (start_index, start_logit,
-           end_index, end_logit) in _get_best_indexes_and_logits(
-               result=result,
-               n_best_size=n_best_size,
-               xlnet_format=xlnet_format):
-        # We could hypothetically create invalid predictions, e.g., predict
-        # that the start of the span is in the question. We throw out all
-        # invalid predictions.
-        if start_index - doc_offset >= len(feature.tok_start_to_orig_index):
-          continue
-        if end_index - doc_offset >= len(feature.tok_end_to_orig_index):
-          continue
-        if not feature.token_is_max_context.get(start_index, False):
-          continue
-        if end_index < start_index:
-          continue
-        length = end_index - start_index + 1
-        if length > max_answer_length:
-          continue
-        prelim_predictions.append(
-            _PrelimPrediction(
-                feature_index=feature_index,
-                start_index=start_index - doc_offset,
-                end_index=end_index - doc_offset,
-                start_logit=start_logit,
-                end_logit=end_logit))
+      # We could hypothetically create invalid predictions, e.g., predict
+      # that the start of the span is in the question. We throw out all
+      # invalid predictions.
+      start_indexes, end_indexes, start_logits, end_logits = (
+          squad_lib.get_valid_spans(
+              result=result,
+              n_best_size=n_best_size,
+              max_answer_length=max_answer_length,
+              is_valid_start=functools.partial(
+                  _is_valid_start, feature, doc_offset),
+              is_valid_end=functools.partial(
+                  _is_valid_end, feature, doc_offset),
+              xlnet_format=xlnet_format))
+      prelim_spans.append(
+          (np.full(len(start_indexes), feature_index),
+           start_indexes - doc_offset, end_indexes - doc_offset,
+           start_logits, end_logits))
 
     if version_2_with_negative and not xlnet_format:
-      prelim_predictions.append(
-          _PrelimPrediction(
-              feature_index=min_null_feature_index,
-              start_index=-1,
-              end_index=-1,
-              start_logit=null_start_logit,
-              end_logit=null_end_logit))
-    prelim_predictions = sorted(
-        prelim_predictions,
-        key=lambda x: (x.start_logit + x.end_logit),
-        reverse=True)
+      prelim_spans.append(([min_null_feature_index], [-1], [-1],
+                           [null_start_logit], [null_end_logit]))
+    prelim_predictions = (
+        _PrelimPrediction(*span)
+        for span in squad_lib.rank_spans(prelim_spans))
 
     _NbestPrediction = collections.namedtuple(  # pylint: disable=invalid-name
         "NbestPrediction", ["text", "start_logit", "end_logit"])
@@ -840,29 +808,15 @@ def write_to_json_files(json_records, json_file):
     writer.write(json.dumps(json_records, indent=4) + "\n")
 
 
-def _get_best_indexes_and_logits(result,
-                                 n_best_size,
-                                 xlnet_format=False):
-  """Generates the n-best indexes and logits from a list."""
-  if xlnet_format:
-    for i in range(n_best_size):
-      for j in range(n_best_size):
-        j_index = i * n_best_size + j
-        yield (result.start_indexes[i], result.start_logits[i],
-               result.end_indexes[j_index], result.end_logits[j_index])
-  else:
-    start_index_and_score = sorted(enumerate(result.start_logits),
-                                   key=lambda x: x[1], reverse=True)
-    end_index_and_score = sorted(enumerate(result.end_logits),
-                                 key=lambda x: x[1], reverse=True)
-    for i in range(len(start_index_and_score)):
-      if i >= n_best_size:
-        break
-      for j in range(len(end_index_and_score)):
-        if j >= n_best_size:
-          break
-        yield (start_index_and_score[i][0], start_index_and_score[i][1],
-               end_index_and_score[j][0], end_index_and_score[j][1])
+def _is_valid_end(feature, doc_offset, index):
+  """Returns whether an answer may end at a token of a feature."""
+  return index - doc_offset < len(feature.tok_end_to_orig_index)
+
+
+def _is_valid_start(feature, doc_offset, index):
+  """Returns whether an answer may start at a token of a feature."""
+  return (index - doc_offset < len(feature.tok_start_to_orig_index) and
+          feature.token_is_max_context.get(index, False))
 
 
 def _compute_softmax(scores):
@@ -941,15 +895,21 @@ def generate_tf_record_from_json_file(input_file_path,
                                       max_query_length=64,
                                       doc_stride=128,
                                       xlnet_format=False,
-                                      version_2_with_negative=False):
-  """Generates and saves training data into a tf record file."""
+                                      version_2_with_negative=False,
+                                      num_workers=0,
+                                      sp_cache_size=0):
+  """Generates and saves training data into a tf record file.
+
+  `sp_cache_size` is the number of texts whose pieces are cached by the
+  SentencePiece tokenizer, see `tokenization.FullSentencePieceTokenizer`.
+  """
   train_examples = read_squad_examples(
       input_file=input_file_path,
       is_training=True,
       version_2_with_negative=version_2_with_negative,
       translated_input_folder=translated_input_folder)
   tokenizer = tokenization.FullSentencePieceTokenizer(
-      sp_model_file=sp_model_file)
+      sp_model_file=sp_model_file, cache_size=sp_cache_size)
   train_writer = FeatureWriter(
       filename=output_path, is_training=True)
   number_of_examples = convert_examples_to_features(
@@ -961,7 +921,8 @@ def generate_tf_record_from_json_file(input_file_path,
       is_training=True,
       output_fn=train_writer.process_feature,
       xlnet_format=xlnet_format,
-      do_lower_case=do_lower_case)
+      do_lower_case=do_lower_case,
+      num_workers=num_workers)
   train_writer.close()
 
   meta_data = {
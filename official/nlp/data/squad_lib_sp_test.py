@@ -0,0 +1,326 @@
+# Copyright 2021 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for official.nlp.data.squad_lib_sp."""
+import collections
+import os
+from unittest import mock
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+
+from sentencepiece import SentencePieceTrainer
+from official.nlp.bert import tokenization
+from official.nlp.data import squad_lib
+from official.nlp.data import squad_lib_sp
+
+_WORDS = ['the', 'cat', 'dog', 'sat', 'on', 'mat', 'and', 'ran', 'away']
+_RawResult = collections.namedtuple('RawResult', [
+    'unique_id', 'start_logits', 'end_logits', 'start_indexes', 'end_indexes',
+    'class_logits'
+])
+
+
+def _reference_is_max_context(doc_spans, cur_span_index, position):
+  """The per-token scan over all spans that was used before the index."""
+  best_score = None
+  best_span_index = None
+  for (span_index, (start, length)) in enumerate(doc_spans):
+    end = start + length - 1
+    if position < start or position > end:
+      continue
+    score = min(position - start, end - position) + 0.01 * length
+    if best_score is None or score > best_score:
+      best_score = score
+      best_span_index = span_index
+  return cur_span_index == best_span_index
+
+
+def _reference_get_valid_spans(result, n_best_size, max_answer_length,
+                               is_valid_start, is_valid_end,
+                               xlnet_format=False):
+  """The nested loop over candidate pairs used before the vectorization.
+
+  It has the signature of `squad_lib.get_valid_spans` but ignores the
+  predicates, except for the feature and offset they are bound to.
+  """
+  del is_valid_end
+  feature, doc_offset = is_valid_start.args
+  if xlnet_format:
+    candidates = [(result.start_indexes[i], result.start_logits[i],
+                   result.end_indexes[i * n_best_size + j],
+                   result.end_logits[i * n_best_size + j])
+                  for i in range(n_best_size)
+                  for j in range(n_best_size)]
+  else:
+    start_index_and_score = sorted(enumerate(result.start_logits),
+                                   key=lambda x: x[1], reverse=True)
+    end_index_and_score = sorted(enumerate(result.end_logits),
+                                 key=lambda x: x[1], reverse=True)
+    candidates = [(start_index, start_logit, end_index, end_logit)
+                  for start_index, start_logit in
+                  start_index_and_score[:n_best_size]
+                  for end_index, end_logit in
+                  end_index_and_score[:n_best_size]]
+  spans = []
+  for start_index, start_logit, end_index, end_logit in candidates:
+    if start_index - doc_offset >= len(feature.tok_start_to_orig_index):
+      continue
+    if end_index - doc_offset >= len(feature.tok_end_to_orig_index):
+      continue
+    if not feature.token_is_max_context.get(start_index, False):
+      continue
+    if end_index < start_index:
+      continue
+    length = end_index - start_index + 1
+    if length > max_answer_length:
+      continue
+    spans.append((start_index, end_index, start_logit, end_logit))
+  if not spans:
+    return (np.zeros(0, int),) * 4
+  return tuple(np.asarray(column) for column in zip(*spans))
+
+
+def _reference_rank_spans(spans):
+  """Sorts the spans of all features as before the vectorization."""
+  rows = []
+  for columns in spans:
+    rows.extend(zip(*columns))
+  return sorted(rows, key=lambda x: (x[3] + x[4]), reverse=True)
+
+
+def _create_fake_sentencepiece_model(output_dir):
+  model_prefix = os.path.join(output_dir, 'spm_model')
+  input_text_file_path = os.path.join(output_dir, 'train_input.txt')
+  with tf.io.gfile.GFile(input_text_file_path, 'w') as f:
+    f.write(' '.join(_WORDS + ['\n']))
+  # Add 7 more tokens: <pad>, <unk>, [CLS], [SEP], [MASK], <s>, </s>.
+  full_vocab_size = len(_WORDS) + 7
+  flags = dict(
+      model_prefix=model_prefix,
+      model_type='word',
+      input=input_text_file_path,
+      pad_id=0,
+      unk_id=1,
+      control_symbols='[CLS],[SEP],[MASK]',
+      vocab_size=full_vocab_size,
+      bos_id=full_vocab_size - 2,
+      eos_id=full_vocab_size - 1)
+  SentencePieceTrainer.Train(' '.join(
+      ['--{}={}'.format(k, v) for k, v in flags.items()]))
+  return model_prefix + '.model'
+
+
+def _create_examples(seed):
+  """Creates examples of various lengths, each question twice in a row."""
+  rng = np.random.RandomState(seed)
+  examples = []
+  for i, num_words in enumerate([1, 4, 17, 40, 63]):
+    words = list(rng.choice(_WORDS, size=num_words))
+    answer_index = rng.randint(num_words)
+    for j in range(2):
+      examples.append(
+          squad_lib_sp.SquadExample(
+              qas_id='q%d_%d' % (i, j),
+              question_text=' '.join(rng.choice(_WORDS, size=1 + 3 * j)),
+              paragraph_text=' '.join(words),
+              orig_answer_text=words[answer_index],
+              start_position=len(' '.join(words[:answer_index] + [''])),
+              is_impossible=i == 2))
+  return examples
+
+
+class ConvertExamplesToFeaturesTest(tf.test.TestCase, parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self._sp_model_file = _create_fake_sentencepiece_model(self.get_temp_dir())
+
+  def _convert(self, examples, num_workers, doc_stride, is_training,
+               xlnet_format, cache_size=0):
+    features = []
+
+    def _output_fn(feature, is_padding=False):
+      features.append(dict(vars(feature), is_padding=is_padding))
+
+    squad_lib_sp.convert_examples_to_features(
+        examples=examples,
+        tokenizer=tokenization.FullSentencePieceTokenizer(
+            self._sp_model_file, cache_size=cache_size),
+        max_seq_length=16,
+        doc_stride=doc_stride,
+        max_query_length=5,
+        is_training=is_training,
+        output_fn=_output_fn,
+        do_lower_case=True,
+        xlnet_format=xlnet_format,
+        batch_size=4,
+        num_workers=num_workers)
+    return [f for f in features if not f['is_padding']]
+
+  @parameterized.product(
+      doc_stride=[1, 4, 128],
+      is_training=[True, False],
+      xlnet_format=[True, False])
+  def test_max_context_matches_reference(self, doc_stride, is_training,
+                                         xlnet_format):
+    examples = _create_examples(seed=doc_stride)
+    features = self._convert(examples, 0, doc_stride, is_training,
+                             xlnet_format)
+    # Training features have no `example_index`, so the features of each
+    # example are found from their `doc_span_index` starting over.
+    features_per_example = []
+    for feature in features:
+      if feature['doc_span_index'] == 0:
+        features_per_example.append([])
+      features_per_example[-1].append(feature)
+    self.assertLen(features_per_example, len(examples))
+
+    has_overlaps = False
+    for example_features in features_per_example:
+      self.assertEqual([f['doc_span_index'] for f in example_features],
+                       list(range(len(example_features))))
+      # Lays out the spans as in the sliding window of the conversion.
+      doc_spans = []
+      for feature in example_features:
+        start = 0
+        if doc_spans:
+          start = doc_spans[-1][0] + min(doc_spans[-1][1], doc_stride)
+        doc_spans.append((start, len(feature['token_is_max_context'])))
+      has_overlaps |= any(
+          a[0] + a[1] > b[0] for a, b in zip(doc_spans, doc_spans[1:]))
+
+      for feature in example_features:
+        span_index = feature['doc_span_index']
+        positions = sorted(feature['token_is_max_context'])
+        for i, position in enumerate(positions):
+          self.assertEqual(
+              feature['token_is_max_context'][position],
+              _reference_is_max_context(doc_spans, span_index,
+                                        doc_spans[span_index][0] + i))
+    self.assertEqual(has_overlaps, doc_stride < 128)
+
+  @parameterized.parameters((1, True, 0), (2, True, 4), (3, False, 0))
+  def test_workers_match_sequential_conversion(self, num_workers, is_training,
+                                               cache_size):
+    examples = _create_examples(seed=1) * 7
+    expected = self._convert(
+        examples,
+        num_workers=0,
+        doc_stride=3,
+        is_training=is_training,
+        xlnet_format=False)
+    self.assertEqual(
+        self._convert(
+            examples,
+            num_workers=num_workers,
+            doc_stride=3,
+            is_training=is_training,
+            xlnet_format=False,
+            cache_size=cache_size), expected)
+    self.assertEqual([f['unique_id'] for f in expected],
+                     list(range(1000000000, 1000000000 + len(expected))))
+
+
+class PostprocessOutputTest(tf.test.TestCase, parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    sp_model_file = _create_fake_sentencepiece_model(self.get_temp_dir())
+    self._examples = _create_examples(seed=3)
+    self._features = []
+    squad_lib_sp.convert_examples_to_features(
+        examples=self._examples,
+        tokenizer=tokenization.FullSentencePieceTokenizer(sp_model_file),
+        max_seq_length=16,
+        doc_stride=4,
+        max_query_length=5,
+        is_training=False,
+        output_fn=lambda feature, is_padding: self._features.append(feature),
+        do_lower_case=True,
+        batch_size=1)
+
+  def _create_random_results(self, n_best_size, xlnet_format, seed):
+    """Creates results with logits in a small range of integers.
+
+    Postprocessing asserts that SQuAD 2.0 examples have a non-null prediction,
+    so the best span of each feature is a valid single token.
+
+    Args:
+      n_best_size: The number of start indexes in XLNet format.
+      xlnet_format: Whether the results are in XLNet format.
+      seed: The random seed.
+
+    Returns:
+      A list of results, one per feature.
+    """
+    rng = np.random.RandomState(seed)
+    results = []
+    for feature in self._features:
+      num_tokens = len(feature.input_ids)
+      num_end_logits = n_best_size**2 if xlnet_format else num_tokens
+      num_start_logits = n_best_size if xlnet_format else num_tokens
+      start_logits = rng.randint(-3, 3, num_start_logits).astype(float)
+      end_logits = rng.randint(-3, 3, num_end_logits).astype(float)
+      start_indexes = rng.randint(0, num_tokens, num_start_logits)
+      end_indexes = rng.randint(0, num_tokens, num_end_logits)
+      best_index = rng.choice(
+          [i for i, v in feature.token_is_max_context.items() if v])
+      if xlnet_format:
+        start_indexes[0] = end_indexes[0] = best_index
+        start_logits[0] = end_logits[0] = 10.
+      else:
+        start_logits[best_index] = end_logits[best_index] = 10.
+      results.append(
+          _RawResult(
+              unique_id=feature.unique_id,
+              start_logits=start_logits,
+              end_logits=end_logits,
+              start_indexes=start_indexes,
+              end_indexes=end_indexes,
+              class_logits=float(rng.randint(-3, 3))))
+    return results
+
+  @parameterized.product(
+      n_best_size=[1, 3, 40],
+      max_answer_length=[1, 4],
+      version_2_with_negative=[True, False],
+      xlnet_format=[True, False])
+  def test_predictions_match_reference(self, n_best_size, max_answer_length,
+                                       version_2_with_negative, xlnet_format):
+    kwargs = dict(
+        all_examples=self._examples,
+        all_features=self._features,
+        all_results=self._create_random_results(
+            n_best_size, xlnet_format, seed=n_best_size),
+        n_best_size=n_best_size,
+        max_answer_length=max_answer_length,
+        do_lower_case=True,
+        version_2_with_negative=version_2_with_negative,
+        xlnet_format=xlnet_format)
+    outputs = squad_lib_sp.postprocess_output(**kwargs)
+    with mock.patch.object(squad_lib, 'get_valid_spans',
+                           _reference_get_valid_spans), mock.patch.object(
+                               squad_lib, 'rank_spans', _reference_rank_spans):
+      expected = squad_lib_sp.postprocess_output(**kwargs)
+    self.assertEqual(outputs, expected)
+    if n_best_size > 16 and max_answer_length > 1:
+      # There are fewer valid spans than `n_best_size`.
+      self.assertTrue(
+          any(len(nbest) < n_best_size for nbest in outputs[1].values()))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,400 @@
+# Copyright 2021 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for official.nlp.data.squad_lib."""
+import collections
+import functools
+import os
+from unittest import mock
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+
+from official.nlp.bert import tokenization
+from official.nlp.data import squad_lib
+
+_DocSpan = collections.namedtuple('DocSpan', ['start', 'length'])
+_RawResult = collections.namedtuple('RawResult', [
+    'unique_id', 'start_logits', 'end_logits', 'start_indexes', 'end_indexes',
+    'class_logits'
+])
+
+_WORDS = ['the', 'cat', 'dog', 'sat', 'on', 'mat', 'and', 'ran', 'away']
+
+
+def _reference_is_max_context(doc_spans, cur_span_index, position):
+  """The per-token scan over all spans that was used before the index."""
+  best_score = None
+  best_span_index = None
+  for (span_index, doc_span) in enumerate(doc_spans):
+    end = doc_span.start + doc_span.length - 1
+    if position < doc_span.start:
+      continue
+    if position > end:
+      continue
+    num_left_context = position - doc_span.start
+    num_right_context = end - position
+    score = min(num_left_context, num_right_context) + 0.01 * doc_span.length
+    if best_score is None or score > best_score:
+      best_score = score
+      best_span_index = span_index
+  return cur_span_index == best_span_index
+
+
+def _reference_best_indexes_and_logits(result, n_best_size, xlnet_format):
+  """The n-best candidate pairs as enumerated before the vectorization."""
+  if xlnet_format:
+    for i in range(n_best_size):
+      for j in range(n_best_size):
+        j_index = i * n_best_size + j
+        yield (result.start_indexes[i], result.start_logits[i],
+               result.end_indexes[j_index], result.end_logits[j_index])
+  else:
+    start_index_and_score = sorted(enumerate(result.start_logits),
+                                   key=lambda x: x[1], reverse=True)
+    end_index_and_score = sorted(enumerate(result.end_logits),
+                                 key=lambda x: x[1], reverse=True)
+    for i in range(len(start_index_and_score)):
+      if i >= n_best_size:
+        break
+      for j in range(len(end_index_and_score)):
+        if j >= n_best_size:
+          break
+        yield (start_index_and_score[i][0], start_index_and_score[i][1],
+               end_index_and_score[j][0], end_index_and_score[j][1])
+
+
+def _reference_get_valid_spans(result, n_best_size, max_answer_length,
+                               is_valid_start, is_valid_end,
+                               xlnet_format=False):
+  """The nested loop over candidate pairs used before the vectorization.
+
+  It has the signature of `squad_lib.get_valid_spans` but ignores the
+  predicates, except for the feature they are bound to.
+  """
+  del is_valid_end
+  feature = is_valid_start.args[0]
+  spans = []
+  for (start_index, start_logit, end_index,
+       end_logit) in _reference_best_indexes_and_logits(
+           result, n_best_size, xlnet_format):
+    if start_index >= len(feature.tokens):
+      continue
+    if end_index >= len(feature.tokens):
+      continue
+    if start_index not in feature.token_to_orig_map:
+      continue
+    if end_index not in feature.token_to_orig_map:
+      continue
+    if not feature.token_is_max_context.get(start_index, False):
+      continue
+    if end_index < start_index:
+      continue
+    length = end_index - start_index + 1
+    if length > max_answer_length:
+      continue
+    spans.append((start_index, end_index, start_logit, end_logit))
+  return tuple(list(column) for column in zip(*spans)) or ([],) * 4
+
+
+def _reference_rank_spans(spans):
+  """Sorts the spans of all features as before the vectorization."""
+  rows = []
+  for columns in spans:
+    rows.extend(zip(*columns))
+  return sorted(rows, key=lambda x: (x[3] + x[4]), reverse=True)
+
+
+def _create_random_results(features, n_best_size, xlnet_format, seed):
+  """Creates results with logits in a small range of integers, so with ties."""
+  rng = np.random.RandomState(seed)
+  results = []
+  for feature in features:
+    num_tokens = len(feature.input_ids)
+    num_end_logits = n_best_size**2 if xlnet_format else num_tokens
+    num_start_logits = n_best_size if xlnet_format else num_tokens
+    results.append(
+        _RawResult(
+            unique_id=feature.unique_id,
+            start_logits=rng.randint(-3, 3, num_start_logits).astype(float),
+            end_logits=rng.randint(-3, 3, num_end_logits).astype(float),
+            start_indexes=rng.randint(0, num_tokens + 2, num_start_logits),
+            end_indexes=rng.randint(0, num_tokens + 2, num_end_logits),
+            class_logits=float(rng.randint(-3, 3))))
+  return results
+
+
+def _create_vocab_file(vocab_file_path):
+  tokens = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '##s'] + _WORDS
+  with tf.io.gfile.GFile(vocab_file_path, 'w') as f:
+    f.write('\n'.join(tokens))
+
+
+def _create_examples(seed):
+  """Creates examples of various lengths, with plural words as subtokens."""
+  rng = np.random.RandomState(seed)
+  examples = []
+  for i, num_words in enumerate([1, 4, 17, 40, 63]):
+    doc_tokens = [
+        rng.choice(_WORDS) + ('s' if rng.rand() < 0.3 else '')
+        for _ in range(num_words)
+    ]
+    question = ' '.join(rng.choice(_WORDS, size=rng.randint(1, 8)))
+    start_position = rng.randint(num_words)
+    end_position = min(start_position + rng.randint(3), num_words - 1)
+    examples.append(
+        squad_lib.SquadExample(
+            qas_id='q%d' % i,
+            question_text=question,
+            doc_tokens=doc_tokens,
+            orig_answer_text=' '.join(
+                doc_tokens[start_position:end_position + 1]),
+            start_position=start_position,
+            end_position=end_position,
+            is_impossible=i == 2))
+  return examples
+
+
+def _get_doc_spans(features, doc_stride):
+  """Recovers the doc spans of the features of each example.
+
+  The spans are laid out as in the sliding window of the conversion, from the
+  number of document tokens in each feature.
+
+  Args:
+    features: The features of a sequence of examples, in order.
+    doc_stride: The stride of the sliding window.
+
+  Returns:
+    A dict from the example index to its list of `_DocSpan`s.
+  """
+  doc_spans = collections.defaultdict(list)
+  for feature in features:
+    spans = doc_spans[feature['example_index']]
+    assert feature['doc_span_index'] == len(spans)
+    start = 0
+    if spans:
+      start = spans[-1].start + min(spans[-1].length, doc_stride)
+    spans.append(_DocSpan(start, len(feature['token_is_max_context'])))
+  return doc_spans
+
+
+class GetMaxContextSpanIndexesTest(tf.test.TestCase):
+
+  def test_matches_reference(self):
+    rng = np.random.RandomState(0)
+    for _ in range(50):
+      num_tokens = rng.randint(1, 40)
+      # Unordered spans of random and equal lengths cover ties and tokens that
+      # are not in any span.
+      doc_spans = []
+      for _ in range(rng.randint(1, 6)):
+        start = rng.randint(num_tokens)
+        length = rng.choice([3, rng.randint(1, num_tokens - start + 1)])
+        doc_spans.append(_DocSpan(start, min(length, num_tokens - start)))
+
+      span_indexes = squad_lib.get_max_context_span_indexes(
+          doc_spans, num_tokens)
+      self.assertLen(span_indexes, num_tokens)
+      for position in range(num_tokens):
+        for span_index in range(len(doc_spans)):
+          self.assertEqual(
+              span_indexes[position] == span_index,
+              _reference_is_max_context(doc_spans, span_index, position))
+
+  def test_ties_go_to_earliest_span(self):
+    doc_spans = [_DocSpan(0, 4), _DocSpan(2, 4), _DocSpan(8, 1)]
+    self.assertEqual(
+        squad_lib.get_max_context_span_indexes(doc_spans, 10),
+        [0, 0, 0, 1, 1, 1, None, None, 2, None])
+
+
+class ConvertExamplesToFeaturesTest(tf.test.TestCase, parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    vocab_file = os.path.join(self.get_temp_dir(), 'vocab.txt')
+    _create_vocab_file(vocab_file)
+    self._tokenizer = tokenization.FullTokenizer(vocab_file)
+
+  def _convert(self, examples, num_workers, doc_stride, is_training,
+               xlnet_format):
+    features = []
+
+    def _output_fn(feature, is_padding=False):
+      features.append(dict(vars(feature), is_padding=is_padding))
+
+    squad_lib.convert_examples_to_features(
+        examples=examples,
+        tokenizer=self._tokenizer,
+        max_seq_length=20,
+        doc_stride=doc_stride,
+        max_query_length=5,
+        is_training=is_training,
+        output_fn=_output_fn,
+        xlnet_format=xlnet_format,
+        batch_size=4,
+        num_workers=num_workers)
+    return features
+
+  @parameterized.product(
+      doc_stride=[1, 4, 128],
+      is_training=[True, False],
+      xlnet_format=[True, False])
+  def test_max_context_matches_reference(self, doc_stride, is_training,
+                                         xlnet_format):
+    examples = _create_examples(seed=doc_stride)
+    features = [
+        f for f in self._convert(examples, 0, doc_stride, is_training,
+                                 xlnet_format) if not f['is_padding']
+    ]
+    doc_spans = _get_doc_spans(features, doc_stride)
+    self.assertEqual(sorted(doc_spans), list(range(len(examples))))
+    if doc_stride < 128:
+      self.assertTrue(
+          any(a.start + a.length > b.start
+              for spans in doc_spans.values()
+              for a, b in zip(spans, spans[1:])))
+
+    for feature in features:
+      spans = doc_spans[feature['example_index']]
+      span_index = feature['doc_span_index']
+      positions = sorted(feature['token_is_max_context'])
+      for i, position in enumerate(positions):
+        self.assertEqual(
+            feature['token_is_max_context'][position],
+            _reference_is_max_context(spans, span_index,
+                                      spans[span_index].start + i))
+
+  @parameterized.parameters((1, True), (2, True), (3, False))
+  def test_workers_match_sequential_conversion(self, num_workers,
+                                               is_training):
+    examples = _create_examples(seed=1) * 7
+    expected = self._convert(
+        examples,
+        num_workers=0,
+        doc_stride=3,
+        is_training=is_training,
+        xlnet_format=False)
+    self.assertEqual(
+        self._convert(
+            examples,
+            num_workers=num_workers,
+            doc_stride=3,
+            is_training=is_training,
+            xlnet_format=False), expected)
+    unique_ids = [f['unique_id'] for f in expected if not f['is_padding']]
+    self.assertEqual(unique_ids,
+                     list(range(1000000000, 1000000000 + len(unique_ids))))
+
+
+class PostprocessOutputTest(tf.test.TestCase, parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    vocab_file = os.path.join(self.get_temp_dir(), 'vocab.txt')
+    _create_vocab_file(vocab_file)
+    self._examples = _create_examples(seed=3)
+    self._features = []
+    squad_lib.convert_examples_to_features(
+        examples=self._examples,
+        tokenizer=tokenization.FullTokenizer(vocab_file),
+        max_seq_length=20,
+        doc_stride=4,
+        max_query_length=5,
+        is_training=False,
+        output_fn=lambda feature, is_padding: self._features.append(feature),
+        batch_size=1)
+
+  def test_top_k_indexes_match_stable_sort(self):
+    rng = np.random.RandomState(0)
+    for _ in range(50):
+      logits = rng.randint(-2, 2, rng.randint(1, 20)).astype(float)
+      expected = [
+          i for i, _ in sorted(
+              enumerate(logits), key=lambda x: x[1], reverse=True)
+      ]
+      for k in [1, 2, 5, len(logits), len(logits) + 3]:
+        self.assertEqual(
+            squad_lib._top_k_indexes(logits, k).tolist(), expected[:k])
+
+  @parameterized.product(
+      n_best_size=[1, 3, 40],
+      max_answer_length=[1, 4, 30],
+      xlnet_format=[True, False])
+  def test_ranked_spans_match_reference(self, n_best_size, max_answer_length,
+                                        xlnet_format):
+    results = _create_random_results(
+        self._features, n_best_size, xlnet_format, seed=n_best_size)
+    spans = []
+    expected_spans = []
+    for feature_index, (feature, result) in enumerate(
+        zip(self._features, results)):
+      kwargs = dict(
+          result=result,
+          n_best_size=n_best_size,
+          max_answer_length=max_answer_length,
+          is_valid_start=functools.partial(squad_lib._is_valid_start, feature),
+          is_valid_end=functools.partial(squad_lib._is_valid_end, feature),
+          xlnet_format=xlnet_format)
+      valid_spans = squad_lib.get_valid_spans(**kwargs)
+      spans.append((np.full(len(valid_spans[0]), feature_index),) +
+                   valid_spans)
+      expected_valid_spans = _reference_get_valid_spans(**kwargs)
+      expected_spans.append(
+          ([feature_index] * len(expected_valid_spans[0]),) +
+          expected_valid_spans)
+
+    expected = _reference_rank_spans(expected_spans)
+    if n_best_size > 20:
+      # Spans are ranked across features and with ties.
+      scores = [x[3] + x[4] for x in expected]
+      self.assertLess(len(set(scores)), len(scores))
+      self.assertLen(set(x[0] for x in expected), len(self._features))
+    ranked = [tuple(x.tolist() for x in span)
+              for span in squad_lib.rank_spans(spans)]
+    self.assertEqual(ranked, expected)
+
+  @parameterized.product(
+      n_best_size=[1, 3, 40],
+      version_2_with_negative=[True, False],
+      xlnet_format=[True, False])
+  def test_predictions_match_reference(self, n_best_size,
+                                       version_2_with_negative, xlnet_format):
+    results = _create_random_results(
+        self._features, n_best_size, xlnet_format, seed=n_best_size)
+    kwargs = dict(
+        all_examples=self._examples,
+        all_features=self._features,
+        all_results=results,
+        n_best_size=n_best_size,
+        max_answer_length=4,
+        do_lower_case=True,
+        version_2_with_negative=version_2_with_negative,
+        xlnet_format=xlnet_format)
+    outputs = squad_lib.postprocess_output(**kwargs)
+    with mock.patch.object(squad_lib, 'get_valid_spans',
+                           _reference_get_valid_spans), mock.patch.object(
+                               squad_lib, 'rank_spans', _reference_rank_spans):
+      expected = squad_lib.postprocess_output(**kwargs)
+    self.assertEqual(outputs, expected)
+    if n_best_size > 20:
+      # There are fewer valid spans than `n_best_size`.
+      self.assertTrue(
+          any(len(nbest) < n_best_size for nbest in outputs[1].values()))
+
+
+if __name__ == '__main__':
+  tf.test.main()
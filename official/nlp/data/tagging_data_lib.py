@@ -14,6 +14,8 @@
 
 """Library to process data for tagging task such as NER/POS."""
 import collections
+import functools
+import multiprocessing
 import os
 
 from absl import logging
@@ -51,37 +53,92 @@ class InputExample(object):
     self.label_ids.append(label_id)
 
 
-def _read_one_file(file_name, label_list):
-  """Reads one file and returns a list of `InputExample` instances."""
-  lines = tf.io.gfile.GFile(file_name, "r").readlines()
-  examples = []
+def _iter_one_file(file_name, label_list):
+  """Reads one file line by line and yields `InputExample` instances."""
   label_id_map = {label: i for i, label in enumerate(label_list)}
   sentence_id = 0
   example = InputExample(sentence_id=0)
-  for line in lines:
-    line = line.strip("\n")
-    if line:
-      # The format is: <token>\t<label> for train/dev set and <token> for test.
-      items = line.split("\t")
-      assert len(items) == 2 or len(items) == 1
-      token = items[0].strip()
-
-      # Assign a dummy label_id for test set
-      label_id = label_id_map[items[1].strip()] if len(items) == 2 else 0
-      example.add_word_and_label_id(token, label_id)
-    else:
-      # Empty line indicates a new sentence.
-      if example.words:
-        examples.append(example)
-        sentence_id += 1
-        example = InputExample(sentence_id=sentence_id)
+  with tf.io.gfile.GFile(file_name, "r") as reader:
+    for line in reader:
+      line = line.strip("\n")
+      if line:
+        # The format is: <token>\t<label> for train/dev set and <token> for
+        # test.
+        items = line.split("\t")
+        assert len(items) == 2 or len(items) == 1
+        token = items[0].strip()
+
+        # Assign a dummy label_id for test set
+        label_id = label_id_map[items[1].strip()] if len(items) == 2 else 0
+        example.add_word_and_label_id(token, label_id)
+      else:
+        # Empty line indicates a new sentence.
+        if example.words:
+          yield example
+          sentence_id += 1
+          example = InputExample(sentence_id=sentence_id)
 
   if example.words:
-    examples.append(example)
-  return examples
+    yield example
+
+
+def _read_one_file(file_name, label_list):
+  """Reads one file and returns a list of `InputExample` instances."""
+  return list(_iter_one_file(file_name, label_list))
+
+
+def _iter_files(file_names, label_list):
+  """Yields the `InputExample` instances of several files in turn."""
+  for file_name in file_names:
+    yield from _iter_one_file(file_name, label_list)
+
+
+class TaggingDataProcessor(classifier_data_lib.DataProcessor):
+  """Base class for tagging data sets stored as one or more tsv files.
+
+  Subclasses list the files of each split. The examples can then be read into
+  lists with `get_*_examples`, or streamed with `iter_*_examples`.
+  """
+
+  def get_train_files(self, data_dir):
+    """Gets the list of training files."""
+    raise NotImplementedError()
+
+  def get_dev_files(self, data_dir):
+    """Gets the list of dev files."""
+    raise NotImplementedError()
+
+  def get_test_files(self, data_dir):
+    """Gets a dictionary of test files, keyed by language."""
+    raise NotImplementedError()
+
+  def iter_train_examples(self, data_dir):
+    return _iter_files(self.get_train_files(data_dir), self.get_labels())
+
+  def iter_dev_examples(self, data_dir):
+    return _iter_files(self.get_dev_files(data_dir), self.get_labels())
+
+  def iter_test_examples(self, data_dir):
+    """Returns a dictionary of example iterators, keyed by language."""
+    return {
+        language: _iter_one_file(file_name, self.get_labels())
+        for language, file_name in self.get_test_files(data_dir).items()
+    }
+
+  def get_train_examples(self, data_dir):
+    return list(self.iter_train_examples(data_dir))
+
+  def get_dev_examples(self, data_dir):
+    return list(self.iter_dev_examples(data_dir))
+
+  def get_test_examples(self, data_dir):
+    return {
+        language: list(examples)
+        for language, examples in self.iter_test_examples(data_dir).items()
+    }
 
 
-class PanxProcessor(classifier_data_lib.DataProcessor):
+class PanxProcessor(TaggingDataProcessor):
   """Processor for the Panx data set."""
   supported_languages = [
       "ar", "he", "vi", "id", "jv", "ms", "tl", "eu", "ml", "ta", "te", "af",
@@ -107,38 +164,29 @@ class PanxProcessor(classifier_data_lib.DataProcessor):
     self.only_use_en_train = only_use_en_train
     self.only_use_en_dev = only_use_en_dev
 
-  def get_train_examples(self, data_dir):
-    examples = _read_one_file(
-        os.path.join(data_dir, "train-en.tsv"), self.get_labels())
+  def get_train_files(self, data_dir):
+    files = [os.path.join(data_dir, "train-en.tsv")]
     if not self.only_use_en_train:
       for language in self.supported_languages:
         if language == "en":
           continue
-        examples.extend(
-            _read_one_file(
-                os.path.join(data_dir, f"train-{language}.tsv"),
-                self.get_labels()))
-    return examples
+        files.append(os.path.join(data_dir, f"train-{language}.tsv"))
+    return files
 
-  def get_dev_examples(self, data_dir):
-    examples = _read_one_file(
-        os.path.join(data_dir, "dev-en.tsv"), self.get_labels())
+  def get_dev_files(self, data_dir):
+    files = [os.path.join(data_dir, "dev-en.tsv")]
     if not self.only_use_en_dev:
       for language in self.supported_languages:
         if language == "en":
           continue
-        examples.extend(
-            _read_one_file(
-                os.path.join(data_dir, f"dev-{language}.tsv"),
-                self.get_labels()))
-    return examples
+        files.append(os.path.join(data_dir, f"dev-{language}.tsv"))
+    return files
 
-  def get_test_examples(self, data_dir):
-    examples_dict = {}
-    for language in self.supported_languages:
-      examples_dict[language] = _read_one_file(
-          os.path.join(data_dir, "test-%s.tsv" % language), self.get_labels())
-    return examples_dict
+  def get_test_files(self, data_dir):
+    return {
+        language: os.path.join(data_dir, "test-%s.tsv" % language)
+        for language in self.supported_languages
+    }
 
   def get_labels(self):
     return ["O", "B-PER", "I-PER", "B-LOC", "I-LOC", "B-ORG", "I-ORG"]
@@ -148,7 +196,7 @@ class PanxProcessor(classifier_data_lib.DataProcessor):
     return "panx"
 
 
-class UdposProcessor(classifier_data_lib.DataProcessor):
+class UdposProcessor(TaggingDataProcessor):
   """Processor for the Udpos data set."""
   supported_languages = [
       "af", "ar", "bg", "de", "el", "en", "es", "et", "eu", "fa", "fi", "fr",
@@ -173,39 +221,22 @@ class UdposProcessor(classifier_data_lib.DataProcessor):
     self.only_use_en_train = only_use_en_train
     self.only_use_en_dev = only_use_en_dev
 
-  def get_train_examples(self, data_dir):
+  def get_train_files(self, data_dir):
     if self.only_use_en_train:
-      examples = _read_one_file(
-          os.path.join(data_dir, "train-en.tsv"), self.get_labels())
-    else:
-      examples = []
-      # Uses glob because some languages are missing in train.
-      for filepath in tf.io.gfile.glob(os.path.join(data_dir, "train-*.tsv")):
-        examples.extend(
-            _read_one_file(
-                filepath,
-                self.get_labels()))
-    return examples
+      return [os.path.join(data_dir, "train-en.tsv")]
+    # Uses glob because some languages are missing in train.
+    return tf.io.gfile.glob(os.path.join(data_dir, "train-*.tsv"))
 
-  def get_dev_examples(self, data_dir):
+  def get_dev_files(self, data_dir):
     if self.only_use_en_dev:
-      examples = _read_one_file(
-          os.path.join(data_dir, "dev-en.tsv"), self.get_labels())
-    else:
-      examples = []
-      for filepath in tf.io.gfile.glob(os.path.join(data_dir, "dev-*.tsv")):
-        examples.extend(
-            _read_one_file(
-                filepath,
-                self.get_labels()))
-    return examples
+      return [os.path.join(data_dir, "dev-en.tsv")]
+    return tf.io.gfile.glob(os.path.join(data_dir, "dev-*.tsv"))
 
-  def get_test_examples(self, data_dir):
-    examples_dict = {}
-    for language in self.supported_languages:
-      examples_dict[language] = _read_one_file(
-          os.path.join(data_dir, "test-%s.tsv" % language), self.get_labels())
-    return examples_dict
+  def get_test_files(self, data_dir):
+    return {
+        language: os.path.join(data_dir, "test-%s.tsv" % language)
+        for language in self.supported_languages
+    }
 
   def get_labels(self):
     return [
@@ -289,11 +320,38 @@ def _convert_single_example(example, max_seq_length, tokenizer):
   return tf_example
 
 
+def _tokenize_and_serialize_example(example, max_seq_length, tokenizer,
+                                    text_preprocessing=None):
+  """Returns the serialized `tf.train.Example`s of a tokenized example."""
+  return [
+      _convert_single_example(tokenized_example, max_seq_length,
+                              tokenizer).SerializeToString()
+      for tokenized_example in _tokenize_example(example, max_seq_length,
+                                                 tokenizer, text_preprocessing)
+  ]
+
+
+# The tokenizer of a worker process, set by `_init_tokenization_worker`.
+_worker_tokenizer = None
+
+
+def _init_tokenization_worker(tokenizer):
+  global _worker_tokenizer
+  _worker_tokenizer = tokenizer
+
+
+def _serialize_with_worker_tokenizer(example, max_seq_length,
+                                     text_preprocessing):
+  return _tokenize_and_serialize_example(example, max_seq_length,
+                                         _worker_tokenizer, text_preprocessing)
+
+
 def write_example_to_file(examples,
                           tokenizer,
                           max_seq_length,
                           output_file,
-                          text_preprocessing=None):
+                          text_preprocessing=None,
+                          num_workers=0):
   """Writes `InputExample`s into a tfrecord file with `tf.train.Example` protos.
 
   Note that the words inside each example will be tokenized and be applied by
@@ -330,33 +388,50 @@ def write_example_to_file(examples,
     calculating loss, metrics, etc...
 
   Args:
-    examples: A list of `InputExample` instances.
+    examples: A list or an iterable of `InputExample` instances. Iterables are
+      consumed lazily.
     tokenizer: The tokenizer to be applied on the data.
     max_seq_length: Maximum length of generated sequences.
     output_file: The name of the output tfrecord file.
     text_preprocessing: optional preprocessing run on each word prior to
       tokenization.
+    num_workers: If positive, the number of worker processes used to tokenize
+      the examples. The output is the same as with the sequential tokenization.
 
   Returns:
     The total number of tf.train.Example proto written to file.
   """
   tf.io.gfile.makedirs(os.path.dirname(output_file))
-  writer = tf.io.TFRecordWriter(output_file)
+  if num_workers <= 0:
+    return _write_serialized_examples(
+        (_tokenize_and_serialize_example(example, max_seq_length, tokenizer,
+                                         text_preprocessing)
+         for example in examples), output_file)
+  with multiprocessing.Pool(
+      num_workers,
+      initializer=_init_tokenization_worker,
+      initargs=(tokenizer,)) as pool:
+    # `imap` keeps the order of the examples.
+    return _write_serialized_examples(
+        pool.imap(
+            functools.partial(
+                _serialize_with_worker_tokenizer,
+                max_seq_length=max_seq_length,
+                text_preprocessing=text_preprocessing),
+            examples,
+            chunksize=64), output_file)
+
+
+def _write_serialized_examples(serialized_examples, output_file):
+  """Writes the serialized examples of each input example to a file."""
   num_tokenized_examples = 0
-  for (ex_index, example) in enumerate(examples):
-    if ex_index % 10000 == 0:
-      logging.info("Writing example %d of %d to %s", ex_index, len(examples),
-                   output_file)
-
-    tokenized_examples = _tokenize_example(example, max_seq_length, tokenizer,
-                                           text_preprocessing)
-    num_tokenized_examples += len(tokenized_examples)
-    for per_tokenized_example in tokenized_examples:
-      tf_example = _convert_single_example(per_tokenized_example,
-                                           max_seq_length, tokenizer)
-      writer.write(tf_example.SerializeToString())
-
-  writer.close()
+  with tf.io.TFRecordWriter(output_file) as writer:
+    for ex_index, records in enumerate(serialized_examples):
+      if ex_index % 10000 == 0:
+        logging.info("Writing example %d to %s", ex_index, output_file)
+      num_tokenized_examples += len(records)
+      for record in records:
+        writer.write(record)
   return num_tokenized_examples
 
 
@@ -392,21 +467,34 @@ def generate_tf_record_from_data_file(processor, data_dir, tokenizer,
                                       max_seq_length, train_data_output_path,
                                       eval_data_output_path,
                                       test_data_output_path,
-                                      text_preprocessing):
-  """Generates tfrecord files from the raw data."""
+                                      text_preprocessing,
+                                      num_workers=0):
+  """Generates tfrecord files from the raw data.
+
+  Examples of a `TaggingDataProcessor` are streamed from the input files
+  rather than read into memory. If `num_workers` is positive, they are
+  tokenized by that many worker processes.
+  """
   common_kwargs = dict(
       tokenizer=tokenizer,
       max_seq_length=max_seq_length,
-      text_preprocessing=text_preprocessing)
-  train_examples = processor.get_train_examples(data_dir)
+      text_preprocessing=text_preprocessing,
+      num_workers=num_workers)
+  if isinstance(processor, TaggingDataProcessor):
+    train_examples = processor.iter_train_examples(data_dir)
+    eval_examples = processor.iter_dev_examples(data_dir)
+    test_input_data_examples = processor.iter_test_examples(data_dir)
+  else:
+    train_examples = processor.get_train_examples(data_dir)
+    eval_examples = processor.get_dev_examples(data_dir)
+    test_input_data_examples = processor.get_test_examples(data_dir)
+
   train_data_size = write_example_to_file(
       train_examples, output_file=train_data_output_path, **common_kwargs)
 
-  eval_examples = processor.get_dev_examples(data_dir)
   eval_data_size = write_example_to_file(
       eval_examples, output_file=eval_data_output_path, **common_kwargs)
 
-  test_input_data_examples = processor.get_test_examples(data_dir)
   test_data_size = {}
   for language, examples in test_input_data_examples.items():
     test_data_size[language] = write_example_to_file(
@@ -103,6 +103,34 @@ class TaggingDataLibTest(tf.test.TestCase, parameterized.TestCase):
 
     self.assertCountEqual(files, expected_files)
 
+  def test_write_example_to_file_in_parallel(self):
+    processor = tagging_data_lib.PanxProcessor()
+    input_file = os.path.join(self.get_temp_dir(), "train-en.tsv")
+    _create_fake_file(input_file, processor.get_labels(), is_test=False)
+    examples = processor.get_train_examples(self.get_temp_dir())
+    self.assertEqual([0, 1], [example.sentence_id for example in examples])
+
+    tokenizer = tokenization.FullTokenizer(
+        vocab_file=self.vocab_file, do_lower_case=True)
+    output_files = []
+    for num_workers in [0, 2]:
+      output_file = os.path.join(self.get_temp_dir(),
+                                 "train_%d.tfrecord" % num_workers)
+      num_examples = tagging_data_lib.write_example_to_file(
+          processor.iter_train_examples(self.get_temp_dir()),
+          tokenizer,
+          max_seq_length=8,
+          output_file=output_file,
+          num_workers=num_workers)
+      self.assertEqual(5, num_examples)
+      output_files.append(output_file)
+
+    expected, actual = [
+        [record.numpy() for record in tf.data.TFRecordDataset(output_file)]
+        for output_file in output_files
+    ]
+    self.assertEqual(expected, actual)
+
 
 if __name__ == "__main__":
   tf.test.main()
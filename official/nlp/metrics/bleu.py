@@ -19,7 +19,9 @@ https://github.com/tensorflow/tensor2tensor/blob/master/tensor2tensor/utils/bleu
 """
 
 import collections
+import functools
 import math
+import multiprocessing
 import re
 import sys
 import unicodedata
@@ -84,65 +86,125 @@ def bleu_wrapper(ref_filename, hyp_filename, case_sensitive=False):
   return bleu_on_list(ref_lines, hyp_lines, case_sensitive)
 
 
-def _get_ngrams_with_counter(segment, max_order):
-  """Extracts all n-grams up to a given maximum order from an input segment.
+# Integer n-gram statistics of a corpus, which add up over its segments.
+_BleuStats = collections.namedtuple("_BleuStats", [
+    "matches_by_order", "possible_matches_by_order", "reference_length",
+    "translation_length"
+])
 
-  Args:
-    segment: text segment from which n-grams will be extracted.
-    max_order: maximum length in tokens of the n-grams returned by this methods.
-
-  Returns:
-    The Counter containing all n-grams upto max_order in segment
-    with a count of how many times each n-gram occurred.
-  """
-  ngram_counts = collections.Counter()
-  for order in range(1, max_order + 1):
-    for i in range(0, len(segment) - order + 1):
-      ngram = tuple(segment[i:i + order])
-      ngram_counts[ngram] += 1
-  return ngram_counts
 
+def _get_bleu_stats(reference_corpus, translation_corpus, max_order):
+  """Computes the clipped n-gram matches of a corpus with NumPy.
 
-def compute_bleu(reference_corpus,
-                 translation_corpus,
-                 max_order=4,
-                 use_bp=True):
-  """Computes BLEU score of translated segments against one or more references.
+  Tokens are mapped to integer ids, and the n-grams of each order are mapped
+  to dense integer ids by ranking the pairs of (n-1)-gram id and next token id
+  with `np.unique`, which is exact unlike hashing with collisions. The clipped
+  matches of a segment are then the minimum counts of the (segment, n-gram)
+  keys found in both the reference and the translation, computed with a
+  sorted-array intersection.
 
   Args:
     reference_corpus: list of references for each translation. Each reference
       should be tokenized into a list of tokens.
     translation_corpus: list of translations to score. Each translation should
       be tokenized into a list of tokens.
-    max_order: Maximum n-gram order to use when computing BLEU score.
-    use_bp: boolean, whether to apply brevity penalty.
+    max_order: Maximum n-gram order.
 
   Returns:
-    BLEU score.
+    A `_BleuStats`.
   """
-  reference_length = 0
-  translation_length = 0
-  bp = 1.0
-  geo_mean = 0
+  num_segments = min(len(reference_corpus), len(translation_corpus))
+  corpus = list(reference_corpus[:num_segments]) + list(
+      translation_corpus[:num_segments])
+  lengths = np.array([len(segment) for segment in corpus], dtype=np.int64)
+  vocab = {}
+  tokens = np.fromiter(
+      (vocab.setdefault(token, len(vocab))
+       for segment in corpus
+       for token in segment),
+      dtype=np.int64,
+      count=int(lengths.sum()))
+  # The segment of each token, and the index of its reference/translation pair.
+  segment_ids = np.repeat(np.arange(len(corpus), dtype=np.int64), lengths)
+  pair_ids = segment_ids % max(num_segments, 1)
+  reference_length = int(lengths[:num_segments].sum())
+  num_reference_tokens = reference_length
 
   matches_by_order = [0] * max_order
   possible_matches_by_order = [0] * max_order
-  precisions = []
-
-  for (references, translations) in zip(reference_corpus, translation_corpus):
-    reference_length += len(references)
-    translation_length += len(translations)
-    ref_ngram_counts = _get_ngrams_with_counter(references, max_order)
-    translation_ngram_counts = _get_ngrams_with_counter(translations, max_order)
-
-    overlap = dict((ngram, min(count, translation_ngram_counts[ngram]))
-                   for ngram, count in ref_ngram_counts.items())
-
-    for ngram in overlap:
-      matches_by_order[len(ngram) - 1] += overlap[ngram]
-    for ngram in translation_ngram_counts:
-      possible_matches_by_order[len(ngram) -
-                                1] += translation_ngram_counts[ngram]
+  vocab_size = max(len(vocab), 1)
+  ngram_ids = tokens
+  num_ngram_ids = vocab_size
+  for order in range(1, max_order + 1):
+    if order > 1:
+      # The n-gram starting at a position extends the (n-1)-gram there.
+      keys = ngram_ids[:-1] * vocab_size + tokens[order - 1:]
+      unique_keys, ngram_ids = np.unique(keys, return_inverse=True)
+      num_ngram_ids = max(len(unique_keys), 1)
+    num_starts = len(ngram_ids)
+    in_segment = segment_ids[:num_starts] == segment_ids[order - 1:]
+    is_reference = np.arange(num_starts) < num_reference_tokens
+    keys = pair_ids[:num_starts] * num_ngram_ids + ngram_ids
+    ref_keys, ref_counts = np.unique(
+        keys[in_segment & is_reference], return_counts=True)
+    translation_keys, translation_counts = np.unique(
+        keys[in_segment & ~is_reference], return_counts=True)
+    _, ref_indices, translation_indices = np.intersect1d(
+        ref_keys, translation_keys, assume_unique=True, return_indices=True)
+    matches_by_order[order - 1] = int(
+        np.minimum(ref_counts[ref_indices],
+                   translation_counts[translation_indices]).sum())
+    possible_matches_by_order[order - 1] = int(translation_counts.sum())
+
+  return _BleuStats(matches_by_order, possible_matches_by_order,
+                    reference_length, int(lengths[num_segments:].sum()))
+
+
+def _sum_bleu_stats(stats):
+  """Adds up the `_BleuStats` of shards of a corpus."""
+  return _BleuStats(
+      matches_by_order=[
+          sum(x) for x in zip(*[s.matches_by_order for s in stats])
+      ],
+      possible_matches_by_order=[
+          sum(x) for x in zip(*[s.possible_matches_by_order for s in stats])
+      ],
+      reference_length=sum(s.reference_length for s in stats),
+      translation_length=sum(s.translation_length for s in stats))
+
+
+def _get_bleu_stats_of_lines(ref_lines, hyp_lines, case_sensitive, max_order):
+  """Tokenizes lines and computes their `_BleuStats`."""
+  if not case_sensitive:
+    ref_lines = [x.lower() for x in ref_lines]
+    hyp_lines = [x.lower() for x in hyp_lines]
+  ref_tokens = [bleu_tokenize(x) for x in ref_lines]
+  hyp_tokens = [bleu_tokenize(x) for x in hyp_lines]
+  return _get_bleu_stats(ref_tokens, hyp_tokens, max_order)
+
+
+def _get_bleu_stats_in_parallel(stats_fn, reference_corpus, translation_corpus,
+                                num_workers, **kwargs):
+  """Computes `_BleuStats` of contiguous shards of a corpus in processes."""
+  num_segments = min(len(reference_corpus), len(translation_corpus))
+  boundaries = [
+      i * num_segments // num_workers for i in range(num_workers + 1)
+  ]
+  shards = [(reference_corpus[start:end], translation_corpus[start:end])
+            for start, end in zip(boundaries[:-1], boundaries[1:])]
+  with multiprocessing.Pool(num_workers) as pool:
+    return _sum_bleu_stats(
+        pool.starmap(functools.partial(stats_fn, **kwargs), shards))
+
+
+def _compute_bleu_from_stats(stats, max_order, use_bp):
+  """Computes the BLEU score from the n-gram statistics of a corpus."""
+  matches_by_order = stats.matches_by_order
+  possible_matches_by_order = stats.possible_matches_by_order
+  reference_length = stats.reference_length
+  translation_length = stats.translation_length
+  bp = 1.0
+  geo_mean = 0
 
   precisions = [0] * max_order
   smooth = 1.0
@@ -171,16 +233,59 @@ def compute_bleu(reference_corpus,
   return np.float32(bleu)
 
 
-def bleu_on_list(ref_lines, hyp_lines, case_sensitive=False):
-  """Compute BLEU for two list of strings (reference and hypothesis)."""
+def compute_bleu(reference_corpus,
+                 translation_corpus,
+                 max_order=4,
+                 use_bp=True,
+                 num_workers=0):
+  """Computes BLEU score of translated segments against one or more references.
+
+  Args:
+    reference_corpus: list of references for each translation. Each reference
+      should be tokenized into a list of tokens.
+    translation_corpus: list of translations to score. Each translation should
+      be tokenized into a list of tokens.
+    max_order: Maximum n-gram order to use when computing BLEU score.
+    use_bp: boolean, whether to apply brevity penalty.
+    num_workers: If positive, the n-gram statistics of contiguous shards of the
+      corpus are computed by that many worker processes.
+
+  Returns:
+    BLEU score.
+  """
+  if num_workers > 0:
+    stats = _get_bleu_stats_in_parallel(
+        _get_bleu_stats,
+        reference_corpus,
+        translation_corpus,
+        num_workers,
+        max_order=max_order)
+  else:
+    stats = _get_bleu_stats(reference_corpus, translation_corpus, max_order)
+  return _compute_bleu_from_stats(stats, max_order, use_bp)
+
+
+def bleu_on_list(ref_lines, hyp_lines, case_sensitive=False, num_workers=0):
+  """Compute BLEU for two list of strings (reference and hypothesis).
+
+  If `num_workers` is positive, contiguous shards of the lines are tokenized
+  and counted by that many worker processes.
+  """
   if len(ref_lines) != len(hyp_lines):
     raise ValueError(
         "Reference and translation files have different number of "
         "lines (%d VS %d). If training only a few steps (100-200), the "
         "translation may be empty." % (len(ref_lines), len(hyp_lines)))
-  if not case_sensitive:
-    ref_lines = [x.lower() for x in ref_lines]
-    hyp_lines = [x.lower() for x in hyp_lines]
-  ref_tokens = [bleu_tokenize(x) for x in ref_lines]
-  hyp_tokens = [bleu_tokenize(x) for x in hyp_lines]
-  return compute_bleu(ref_tokens, hyp_tokens) * 100
+  max_order = 4
+  if num_workers > 0:
+    stats = _get_bleu_stats_in_parallel(
+        _get_bleu_stats_of_lines,
+        ref_lines,
+        hyp_lines,
+        num_workers,
+        case_sensitive=case_sensitive,
+        max_order=max_order)
+  else:
+    stats = _get_bleu_stats_of_lines(ref_lines, hyp_lines, case_sensitive,
+                                     max_order)
+  return _compute_bleu_from_stats(stats, max_order, use_bp=True) * 100
@@ -67,6 +67,26 @@ class ComputeBleuTest(tf.test.TestCase):
     self.assertEqual(uncased_score, 100)
     self.assertLess(cased_score, 100)
 
+  def test_compute_bleu_clips_ngram_counts(self):
+    references = [["the", "cat"], ["a", "dog"]]
+    translations = [["the", "the", "the", "the"], ["a", "dog", "a", "dog"]]
+    # Unigrams: "the" matches once and "a" and "dog" once each, out of 8.
+    score = bleu.compute_bleu(
+        references, translations, max_order=1, use_bp=False)
+    self.assertAllClose(score, 3. / 8)
+    # Bigrams: only "a dog" matches, once out of 6.
+    score = bleu.compute_bleu(
+        references, translations, max_order=2, use_bp=False)
+    self.assertAllClose(score, (3. / 8 * 1. / 6)**0.5)
+
+  def test_bleu_list_in_parallel(self):
+    ref = ["test 1 two 3", "more tests!", "", "a b c d, e"] * 5
+    hyp = ["test 1 two", "More tests!", "a", "a b c e, d"] * 5
+    for case_sensitive in [False, True]:
+      self.assertEqual(
+          bleu.bleu_on_list(ref, hyp, case_sensitive),
+          bleu.bleu_on_list(ref, hyp, case_sensitive, num_workers=3))
+
 
 if __name__ == "__main__":
   tf.test.main()
@@ -49,6 +49,7 @@ class Seq2SeqTransformer(tf.keras.Model):
                encoder_layer=None,
                decoder_layer=None,
                eos_id=EOS_ID,
+               compact_beam_search_batch=False,
                **kwargs):
     """Initialize layers to build Transformer model.
 
@@ -65,6 +66,9 @@ class Seq2SeqTransformer(tf.keras.Model):
       encoder_layer: An initialized encoder layer.
       decoder_layer: An initialized decoder layer.
       eos_id: Id of end of sentence token.
+      compact_beam_search_batch: Whether beam search stops decoding the batch
+        items whose results are final, so that the decoder only runs on the
+        batch items still being decoded. Requires `padded_decode` to be False.
       **kwargs: other keyword arguments.
     """
     super().__init__(**kwargs)
@@ -77,6 +81,7 @@ class Seq2SeqTransformer(tf.keras.Model):
     self._beam_size = beam_size
     self._alpha = alpha
     self._eos_id = eos_id
+    self._compact_beam_search_batch = compact_beam_search_batch
     self.embedding_lookup = layers.OnDeviceEmbedding(
         vocab_size=self._vocab_size,
         embedding_width=self._embedding_width,
@@ -101,6 +106,7 @@ class Seq2SeqTransformer(tf.keras.Model):
         "extra_decode_length": self._extra_decode_length,
         "beam_size": self._beam_size,
         "alpha": self._alpha,
+        "compact_beam_search_batch": self._compact_beam_search_batch,
         "encoder_layer": self.encoder_layer,
         "decoder_layer": self.decoder_layer,
     }
@@ -252,7 +258,8 @@ class Seq2SeqTransformer(tf.keras.Model):
           max_decode_length=max_decode_length,
           eos_id=self._eos_id,
           padded_decode=self._padded_decode,
-          dtype=self.compute_dtype)
+          dtype=self.compute_dtype,
+          compact_batch=self._compact_beam_search_batch)
 
       # Get the top sequence for each batch element
       top_decoded_ids = decoded_ids[:, 0, 1:]
@@ -560,6 +560,47 @@ class RelativePositionEmbedding(Module):
         axis=0)  # shape (1, num_heads, qlen, klen)
     return values
 
+  @tf.Module.with_name_scope
+  def decode_bias_table(self, max_decode_len):
+    """Returns the biases of all relative positions of a decoding run.
+
+    The bias only depends on memory_position - query_position, so the
+    (max_decode_len, max_decode_len) bias of `__call__` is a Toeplitz matrix
+    whose rows are all windows of this table, see `decode_position_bias`.
+
+    Args:
+      max_decode_len: the maximum decoding length.
+
+    Returns:
+      A Tensor of shape (1, num_heads, 2 * max_decode_len - 1) whose entry j
+      is the bias of the relative position j - max_decode_len + 1.
+    """
+    relative_position = tf.range(1 - max_decode_len, max_decode_len)
+    rp_bucket = self._relative_position_bucket(
+        relative_position,
+        bidirectional=self.bidirectional,
+        num_buckets=self.relative_attention_num_buckets,
+        max_distance=self.relative_attention_max_distance)
+    values = self.relative_attention_bias(rp_bucket)
+    return tf.expand_dims(tf.transpose(values, [1, 0]), axis=0)
+
+  @staticmethod
+  def decode_position_bias(bias_table, decode_position, max_decode_len):
+    """Returns the bias of the decoded position from `decode_bias_table`.
+
+    Args:
+      bias_table: the output of `decode_bias_table(max_decode_len)`.
+      decode_position: which position of the sequence we are decoding for.
+      max_decode_len: the maximum decoding length.
+
+    Returns:
+      A Tensor of shape (1, num_heads, 1, max_decode_len), the row
+      `decode_position` of `__call__(max_decode_len, max_decode_len)`.
+    """
+    values = tf.slice(bias_table, [0, 0, max_decode_len - 1 - decode_position],
+                      [-1, -1, max_decode_len])
+    return tf.expand_dims(values, axis=2)
+
 
 class MultiHeadAttention(Module):
   """T5 Attention from Mesh TensorFlow."""
@@ -573,6 +614,7 @@ class MultiHeadAttention(Module):
                rescale_query: bool = False,
                weight_initializer: Optional[Initializer] = None,
                bias_initializer: Optional[Initializer] = None,
+               one_hot_cache_update: bool = True,
                **kwargs):
     super().__init__(**kwargs)
     with self.name_scope:
@@ -581,6 +623,7 @@ class MultiHeadAttention(Module):
       self.num_heads = num_heads
       self.rescale_query = rescale_query
       self.use_bias = use_bias
+      self.one_hot_cache_update = one_hot_cache_update
 
       if rescale_query or weight_initializer is None:
         query_w_init = weight_initializer
@@ -630,6 +673,18 @@ class MultiHeadAttention(Module):
 
   def _update_cache(self, key, value, cache, decode_position):
     """Updates cache states and gets full-length key/value tensors."""
+    if not self.one_hot_cache_update:
+      # Only writes the decoded position, instead of rewriting the whole cache.
+      batch_size = tf_utils.get_shape_list(key)[0]
+      indices = tf.stack(
+          [tf.range(batch_size),
+           tf.fill([batch_size], decode_position)], axis=1)
+      key = tf.tensor_scatter_nd_update(cache["key"], indices, key[:, 0])
+      value = tf.tensor_scatter_nd_update(cache["value"], indices, value[:, 0])
+      cache["key"] = key
+      cache["value"] = value
+      return key, value
+
     # Combines cached keys and values with new keys and values.
     # TPU one-hot handling.
     key_seq_dim = cache["key"].shape.as_list()[1]
@@ -695,7 +750,9 @@ class MultiHeadAttention(Module):
     if position_bias is not None:
       # If position_bias is None, the input embedings should already include
       # position embeddings.
-      if use_cache:
+      # A position bias of a single query, e.g. from
+      # `RelativePositionEmbedding.decode_position_bias`, is used as is.
+      if use_cache and position_bias.shape[2] != 1:
         bias_shape = position_bias.shape.as_list()
         position_bias = tf.slice(
             position_bias, [0, 0, decode_position, 0],
@@ -735,6 +792,7 @@ class SelfAttention(Module):
                rescale_query: bool = False,
                weight_initializer: Optional[Initializer] = None,
                bias_initializer: Optional[Initializer] = None,
+               one_hot_cache_update: bool = True,
                **kwargs):
     super().__init__(**kwargs)
     with self.name_scope:
@@ -746,6 +804,7 @@ class SelfAttention(Module):
           rescale_query=rescale_query,
           weight_initializer=weight_initializer,
           bias_initializer=bias_initializer,
+          one_hot_cache_update=one_hot_cache_update,
           dtype=self.dtype,
           name="attention")
       self.layer_norm = RMSNorm(
@@ -918,6 +977,7 @@ class EncDecoderBlock(Module):
                rescale_query: bool = False,
                weight_initializer: Optional[Initializer] = None,
                bias_initializer: Optional[Initializer] = None,
+               one_hot_cache_update: bool = True,
                **kwargs):
     super().__init__(**kwargs)
     with self.name_scope:
@@ -929,6 +989,7 @@ class EncDecoderBlock(Module):
           rescale_query=rescale_query,
           weight_initializer=weight_initializer,
           bias_initializer=bias_initializer,
+          one_hot_cache_update=one_hot_cache_update,
           dtype=self.dtype,
           name="self_attention")
       self.cross_attention = CrossAttention(
@@ -1019,6 +1080,9 @@ class T5TransformerParams:
   logits_via_embedding: bool = True
   num_decoder_layers: Optional[int] = None
   one_hot_embedding: bool = True
+  # Whether decoding updates the cache through a one-hot mask of its whole
+  # length (TPU friendly) rather than by only writing the decoded position.
+  one_hot_cache_update: bool = True
   layer_sharing: bool = False
 
 
@@ -1174,6 +1238,7 @@ class Decoder(Module):
                   rescale_query=self.config.rescale_query,
                   weight_initializer=self.config.weight_initializer,
                   bias_initializer=self.config.bias_initializer,
+                  one_hot_cache_update=self.config.one_hot_cache_update,
                   dtype=self.dtype,
                   name="decoder_block_%d" % layer_idx))
       self.output_norm = RMSNorm(
@@ -1200,6 +1265,7 @@ class Decoder(Module):
                decode_position=None,
                cache=None,
                max_decode_len=None,
+               position_bias_table=None,
                training=False):
     """Applies Transformer model on the inputs.
 
@@ -1214,6 +1280,10 @@ class Decoder(Module):
       max_decode_len: An optional integer specifying the maximum decoding
         length. Note that this is only used for defining the relative position
         embedding parameters.
+      position_bias_table: Optional output of
+        `relative_embedding.decode_bias_table(max_decode_len)`, computed once
+        before the decoding loop and reused by every step. Computed at every
+        step if not given.
       training: Whether it is training pass, affecting dropouts.
 
     Returns:
@@ -1231,7 +1301,11 @@ class Decoder(Module):
     tensor_shape[-2] = 1
     x = self.target_dropout(x, noise_shape=tensor_shape, training=training)
     if cache is not None:
-      position_bias = self.relative_embedding(max_decode_len, max_decode_len)
+      if position_bias_table is None:
+        position_bias_table = self.relative_embedding.decode_bias_table(
+            max_decode_len)
+      position_bias = self.relative_embedding.decode_position_bias(
+          position_bias_table, decode_position, max_decode_len)
     else:
       input_length = tf_utils.get_shape_list(decoder_input_tokens)[1]
       position_bias = self.relative_embedding(input_length, input_length)
@@ -1331,6 +1405,7 @@ class T5Transformer(Module):
       decode_position=None,
       cache=None,
       max_decode_len=None,
+      position_bias_table=None,
       decode=False,
       training=False):
     if decode:
@@ -1384,6 +1459,7 @@ class T5Transformer(Module):
         encoder_decoder_mask=encoder_decoder_mask,
         cache=cache,
         max_decode_len=max_decode_len,
+        position_bias_table=position_bias_table,
         decode=decode,
         training=training)
     return dict(logits=logits, encoded=encoded, cache=cache)
@@ -154,6 +154,24 @@ class ModulesTest(tf.test.TestCase, parameterized.TestCase):
     self.assertEqual(outputs.shape, (1, 4, 4, 2))
     self.assertEqual(outputs.dtype, dtype)
 
+  @parameterized.named_parameters(("bidirectional", True),
+                                  ("unidirectional", False))
+  def test_relative_position_decode_bias(self, bidirectional):
+    l = t5.RelativePositionEmbedding(
+        num_heads=4,
+        relative_attention_num_buckets=8,
+        relative_attention_max_distance=16,
+        bidirectional=bidirectional,
+        name="foo")
+    max_decode_len = 24
+    position_bias = l(max_decode_len, max_decode_len)
+    bias_table = l.decode_bias_table(max_decode_len)
+    self.assertEqual(bias_table.shape, (1, 4, 2 * max_decode_len - 1))
+    for decode_position in [0, 5, max_decode_len - 1]:
+      self.assertAllEqual(
+          l.decode_position_bias(bias_table, decode_position, max_decode_len),
+          position_bias[:, :, decode_position:decode_position + 1, :])
+
   def test_masks(self):
     causal_mask = t5.make_causal_mask(np.zeros((2, 5)))
     self.assertEqual(causal_mask.shape, (2, 1, 5, 5))
@@ -390,6 +408,45 @@ class T5Test(tf.test.TestCase, parameterized.TestCase):
       for tensor in entry.values():
         self.assertNotAllEqual(tensor.numpy()[:, 2, :, :], 0.0)
 
+  def test_decoder_slice_cache_update(self):
+    max_decode_len = 6
+    config = t5.T5TransformerParams(
+        num_layers=2,
+        d_model=4,
+        d_kv=3,
+        num_heads=4,
+        d_ff=16,
+        vocab_size=10)
+    decoder = t5.Decoder(config)
+    batch_size = 2
+    encoded = tf.random.normal((batch_size, 8, config.d_model))
+    bias_table = decoder.relative_embedding.decode_bias_table(max_decode_len)
+    all_logits = []
+    for one_hot_cache_update in [True, False]:
+      for layer in decoder.decoder_layers:
+        layer.self_attention.self_attention.one_hot_cache_update = (
+            one_hot_cache_update)
+      cache = {}
+      for i in range(config.num_layers):
+        cache[i] = _create_cache(batch_size, max_decode_len, config.num_heads,
+                                 config.d_kv)
+      targets = tf.ones((batch_size, 1), dtype=tf.int32)
+      logits = []
+      for decode_position in range(max_decode_len):
+        step_logits, cache = decoder(
+            targets,
+            encoded,
+            decode_position=decode_position,
+            cache=cache,
+            decode=True,
+            max_decode_len=max_decode_len,
+            position_bias_table=(
+                None if one_hot_cache_update else bias_table))
+        logits.append(step_logits)
+        targets = tf.argmax(step_logits, axis=-1, output_type=tf.int32)
+      all_logits.append(tf.concat(logits, axis=1))
+    self.assertAllClose(all_logits[0], all_logits[1])
+
   @parameterized.named_parameters(
       ("t5_10", ("relu",), True, 26, False, tf.float32),
       ("t5_11", ("gelu", "linear"), False, 29, False, tf.float32),
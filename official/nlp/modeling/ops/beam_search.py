@@ -70,6 +70,17 @@ class _StateKeys(object):
   # True -> finished sequence, False -> filler. Shape [batch_size, beam_size]
   FINISHED_FLAGS = "FINISHED_FLAGS"
 
+  # The following keys are only used when the batch is compacted, in which case
+  # the keys above only hold the batch items that are still searched.
+  # Indices of the searched batch items in the input batch.
+  # Shape [live_batch_size]
+  BATCH_INDICES = "BATCH_INDICES"
+  # Decoded sequences of the input batch, filled in as batch items are removed
+  # from the search. Has shape [batch_size, beam_size, CUR_INDEX + 1]
+  OUTPUT_SEQ = "OUTPUT_SEQ"
+  # Scores of the decoded sequences. Shape [batch_size, beam_size]
+  OUTPUT_SCORES = "OUTPUT_SCORES"
+
 
 def _expand_to_same_rank(tensor, target):
   """Expands a given tensor to target's rank to be broadcastable.
@@ -107,7 +118,8 @@ class SequenceBeamSearch(tf.Module):
                max_decode_length,
                eos_id,
                padded_decode,
-               dtype=tf.float32):
+               dtype=tf.float32,
+               compact_batch=False):
     """Initialize sequence beam search.
 
     Args:
@@ -130,7 +142,18 @@ class SequenceBeamSearch(tf.Module):
         for beam search.
       dtype: A tensorflow data type used for score computation. The default is
         tf.float32.
+      compact_batch: A bool, whether to remove batch items from the search as
+        soon as all their top sequences are finished and no alive sequence can
+        beat them, so that `symbols_to_logits_fn` is only called on the batch
+        items still being decoded. The results are the same as without
+        compaction. Requires `padded_decode` to be False.
+
+    Raises:
+      ValueError: If both `padded_decode` and `compact_batch` are True.
     """
+    if padded_decode and compact_batch:
+      raise ValueError("compact_batch requires padded_decode to be False, as "
+                       "the decoded batch size changes during the search.")
     self.symbols_to_logits_fn = symbols_to_logits_fn
     self.vocab_size = vocab_size
     self.beam_size = beam_size
@@ -139,6 +162,7 @@ class SequenceBeamSearch(tf.Module):
     self.eos_id = eos_id
     self.padded_decode = padded_decode
     self.dtype = tf.as_dtype(dtype)
+    self.compact_batch = compact_batch
 
   def search(self, initial_ids, initial_cache):
     """Beam search for sequences with highest scores.
@@ -158,7 +182,7 @@ class SequenceBeamSearch(tf.Module):
     state, state_shapes = self._create_initial_state(initial_ids, initial_cache,
                                                      batch_size)
 
-    def _grow_alive_seq(state):
+    def _grow_alive_seq(state, batch_size):
       """Grow alive sequences by one token, collect top 2*beam_size sequences.
 
       2*beam_size sequences are collected because some sequences may have
@@ -167,6 +191,7 @@ class SequenceBeamSearch(tf.Module):
 
       Args:
         state: A dictionary with the current loop state.
+        batch_size: The number of batch items in `state`.
 
       Returns:
         Tuple of
@@ -236,7 +261,7 @@ class SequenceBeamSearch(tf.Module):
       return topk_seq, topk_log_probs, topk_ids, new_cache
 
     def _get_new_alive_state(new_seq, new_log_probs, new_finished_flags,
-                             new_cache):
+                             new_cache, batch_size):
       """Gather the top k sequences that are still alive.
 
       Args:
@@ -247,6 +272,7 @@ class SequenceBeamSearch(tf.Module):
         new_finished_flags: A boolean Tensor indicates which sequences are live
           inside the beam.
         new_cache: Dict of cached values for each sequence.
+        batch_size: The number of batch items.
 
       Returns:
         Dictionary with alive keys from _StateKeys:
@@ -271,7 +297,7 @@ class SequenceBeamSearch(tf.Module):
       }
 
     def _get_new_finished_state(state, new_seq, new_log_probs,
-                                new_finished_flags):
+                                new_finished_flags, batch_size):
       """Combine new and old finished sequences, and gather the top k sequences.
 
       Args:
@@ -282,6 +308,7 @@ class SequenceBeamSearch(tf.Module):
           shape [batch_size, beam_size]
         new_finished_flags: A boolean Tensor indicates which sequences are live
           inside the beam.
+        batch_size: The number of batch items in `state`.
 
       Returns:
         Dictionary with finished keys from _StateKeys:
@@ -345,22 +372,36 @@ class SequenceBeamSearch(tf.Module):
       Returns:
         new state dictionary.
       """
+      if self.compact_batch:
+        live_batch_size = tf.shape(state[_StateKeys.ALIVE_LOG_PROBS])[0]
+      else:
+        live_batch_size = batch_size
       # Grow alive sequences by one token.
-      new_seq, new_log_probs, topk_ids, new_cache = _grow_alive_seq(state)
+      new_seq, new_log_probs, topk_ids, new_cache = _grow_alive_seq(
+          state, live_batch_size)
       new_finished_flags = tf.equal(topk_ids, self.eos_id)
       # Collect top beam_size alive sequences
       alive_state = _get_new_alive_state(new_seq, new_log_probs,
-                                         new_finished_flags, new_cache)
+                                         new_finished_flags, new_cache,
+                                         live_batch_size)
 
       # Combine newly finished sequences with existing finished sequences, and
       # collect the top k scoring sequences.
       finished_state = _get_new_finished_state(state, new_seq, new_log_probs,
-                                               new_finished_flags)
+                                               new_finished_flags,
+                                               live_batch_size)
 
       # Increment loop index and create new state dictionary
       new_state = {_StateKeys.CUR_INDEX: state[_StateKeys.CUR_INDEX] + 1}
       new_state.update(alive_state)
       new_state.update(finished_state)
+      if self.compact_batch:
+        new_state[_StateKeys.BATCH_INDICES] = state[_StateKeys.BATCH_INDICES]
+        # Keep the output sequences as long as the searched ones.
+        new_state[_StateKeys.OUTPUT_SEQ] = tf.pad(
+            state[_StateKeys.OUTPUT_SEQ], [[0, 0], [0, 0], [0, 1]])
+        new_state[_StateKeys.OUTPUT_SCORES] = state[_StateKeys.OUTPUT_SCORES]
+        new_state = self._remove_done_batch_items(new_state)
       return [new_state]
 
     finished_state = tf.nest.map_structure(
@@ -372,8 +413,80 @@ class SequenceBeamSearch(tf.Module):
             shape_invariants=[state_shapes],
             parallel_iterations=1))
     finished_state = finished_state[0]
+    if self.compact_batch:
+      all_batch_items = tf.ones_like(finished_state[_StateKeys.BATCH_INDICES],
+                                     dtype=tf.bool)
+      return self._scatter_to_output(finished_state, all_batch_items)
     return self._process_finished_state(finished_state)
 
+  def _scatter_to_output(self, state, mask):
+    """Scatters the results of the masked batch items into the output.
+
+    Args:
+      state: A dictionary with the loop state of a compacted batch.
+      mask: A boolean tensor with shape [live_batch_size], selecting the batch
+        items whose results are final.
+
+    Returns:
+      The output sequences and scores of the input batch.
+    """
+    masked_state = {
+        key: tf.nest.map_structure(lambda t: tf.boolean_mask(t, mask), value)
+        for key, value in state.items()
+        if key not in (_StateKeys.CUR_INDEX, _StateKeys.ALIVE_CACHE,
+                       _StateKeys.OUTPUT_SEQ, _StateKeys.OUTPUT_SCORES)
+    }
+    seq, scores = self._process_finished_state(masked_state)
+    indices = tf.expand_dims(masked_state[_StateKeys.BATCH_INDICES], axis=1)
+    return (tf.tensor_scatter_nd_update(state[_StateKeys.OUTPUT_SEQ], indices,
+                                        seq),
+            tf.tensor_scatter_nd_update(state[_StateKeys.OUTPUT_SCORES],
+                                        indices, scores))
+
+  def _remove_done_batch_items(self, state):
+    """Moves the batch items whose search is done from `state` to the output.
+
+    A batch item is done when all its top sequences are finished and the best
+    alive sequence cannot beat the worst of them even at the maximum decode
+    length, so that further steps would not change its results.
+
+    Args:
+      state: A dictionary with the loop state of a compacted batch.
+
+    Returns:
+      The loop state holding only the batch items that are not done.
+    """
+    alive_log_probs = state[_StateKeys.ALIVE_LOG_PROBS]
+    finished_scores = state[_StateKeys.FINISHED_SCORES]
+    finished_flags = state[_StateKeys.FINISHED_FLAGS]
+
+    max_length_norm = _length_normalization(
+        self.alpha, self.max_decode_length, dtype=self.dtype)
+    best_alive_scores = tf.squeeze(tf.slice(alive_log_probs, [0, 0], [-1, 1]),
+                                   axis=1) / max_length_norm
+    lowest_finished_scores = tf.reduce_min(finished_scores, axis=1)
+    done = tf.logical_and(
+        tf.reduce_all(finished_flags, axis=1),
+        tf.greater(lowest_finished_scores, best_alive_scores))
+
+    def _remove():
+      output_seq, output_scores = self._scatter_to_output(state, done)
+      # Gather the remaining batch items, including their cache.
+      live_indices = tf.squeeze(tf.where(tf.logical_not(done)), axis=1)
+      new_state = {
+          key: tf.nest.map_structure(lambda t: tf.gather(t, live_indices),
+                                     value)
+          for key, value in state.items()
+          if key not in (_StateKeys.CUR_INDEX, _StateKeys.OUTPUT_SEQ,
+                         _StateKeys.OUTPUT_SCORES)
+      }
+      new_state[_StateKeys.CUR_INDEX] = state[_StateKeys.CUR_INDEX]
+      new_state[_StateKeys.OUTPUT_SEQ] = output_seq
+      new_state[_StateKeys.OUTPUT_SCORES] = output_scores
+      return new_state
+
+    return tf.cond(tf.reduce_any(done), _remove, lambda: state)
+
   def _process_finished_state(self, finished_state):
     alive_seq = finished_state[_StateKeys.ALIVE_SEQ]
     alive_log_probs = finished_state[_StateKeys.ALIVE_LOG_PROBS]
@@ -443,6 +556,11 @@ class SequenceBeamSearch(tf.Module):
         _StateKeys.FINISHED_SCORES: finished_scores,
         _StateKeys.FINISHED_FLAGS: finished_flags
     }
+    if self.compact_batch:
+      state[_StateKeys.BATCH_INDICES] = tf.range(batch_size)
+      state[_StateKeys.OUTPUT_SEQ] = tf.zeros(tf.shape(alive_seq), tf.int32)
+      state[_StateKeys.OUTPUT_SCORES] = tf.zeros([batch_size, self.beam_size],
+                                                 dtype=self.dtype)
 
     # Create state invariants for each value in the state dictionary. Each
     # dimension must be a constant or None. A None dimension means either:
@@ -486,6 +604,15 @@ class SequenceBeamSearch(tf.Module):
           _StateKeys.FINISHED_FLAGS:
               tf.TensorShape([None, self.beam_size])
       }
+      if self.compact_batch:
+        state_shape_invariants.update({
+            _StateKeys.BATCH_INDICES:
+                tf.TensorShape([None]),
+            _StateKeys.OUTPUT_SEQ:
+                tf.TensorShape([None, self.beam_size, None]),
+            _StateKeys.OUTPUT_SCORES:
+                tf.TensorShape([None, self.beam_size])
+        })
 
     return state, state_shape_invariants
 
@@ -587,7 +714,8 @@ def sequence_beam_search(symbols_to_logits_fn,
                          max_decode_length,
                          eos_id,
                          padded_decode=False,
-                         dtype="float32"):
+                         dtype="float32",
+                         compact_batch=False):
   """Search for sequence of subtoken ids with the largest probability.
 
   Args:
@@ -612,13 +740,16 @@ def sequence_beam_search(symbols_to_logits_fn,
       beam search.
     dtype: A tensorflow data type used for score computation. The default is
       tf.float32.
+    compact_batch: A bool, whether to stop decoding batch items as soon as
+      their results are final, see `SequenceBeamSearch`.
 
   Returns:
     Top decoded sequences [batch_size, beam_size, max_decode_length]
     sequence scores [batch_size, beam_size]
   """
   sbs = SequenceBeamSearch(symbols_to_logits_fn, vocab_size, beam_size, alpha,
-                           max_decode_length, eos_id, padded_decode, dtype)
+                           max_decode_length, eos_id, padded_decode, dtype,
+                           compact_batch)
   return sbs.search(initial_ids, initial_cache)
 
 
@@ -94,6 +94,55 @@ class BeamSearchTests(tf.test.TestCase, parameterized.TestCase):
         dtype=tf.float32)
     self.assertAllEqual([[[0, 1, 0, 1], [0, 1, 1, 2]]], predictions)
 
+  def test_sequence_beam_search_with_compact_batch(self):
+    # The first batch item finishes after two steps, while the second one only
+    # finishes at the maximum decode length.
+    logits = tf.constant([[[0., 5., 0.], [0., 0., 9.], [0., 0., 9.],
+                           [0., 0., 9.]],
+                          [[3., 2., 0.], [1., 3., 0.], [3., 1., 0.],
+                           [2., 1., 1.]]])
+    x = tf.zeros([2, 3, 2, 4], dtype=tf.float32)
+    cache = {'layer_%d' % layer: {'k': x, 'v': x} for layer in range(2)}
+    cache['batch_item'] = tf.constant([[0.], [1.]])
+    decoded_batch_sizes = []
+
+    def symbols_to_logits_fn(_, i, cache):
+      decoded_batch_sizes.append(int(tf.shape(cache['batch_item'])[0]))
+      batch_items = tf.cast(cache['batch_item'][:, 0], tf.int32)
+      return tf.gather(logits, batch_items)[:, i, :], cache
+
+    def search(compact_batch):
+      return beam_search.sequence_beam_search(
+          symbols_to_logits_fn=symbols_to_logits_fn,
+          initial_ids=tf.zeros([2], dtype=tf.int32),
+          initial_cache=cache,
+          vocab_size=3,
+          beam_size=2,
+          alpha=0.6,
+          max_decode_length=4,
+          eos_id=2,
+          compact_batch=compact_batch)
+
+    expected_predictions, expected_scores = search(compact_batch=False)
+    self.assertEqual(decoded_batch_sizes, [4] * 4)
+    decoded_batch_sizes.clear()
+    predictions, scores = search(compact_batch=True)
+    self.assertEqual(decoded_batch_sizes, [4, 4, 2, 2])
+    self.assertAllEqual(expected_predictions, predictions)
+    self.assertAllClose(expected_scores, scores)
+
+  def test_compact_batch_requires_dynamic_shapes(self):
+    with self.assertRaisesRegex(ValueError, 'padded_decode'):
+      beam_search.SequenceBeamSearch(
+          symbols_to_logits_fn=None,
+          vocab_size=3,
+          beam_size=2,
+          alpha=0.6,
+          max_decode_length=3,
+          eos_id=2,
+          padded_decode=True,
+          compact_batch=True)
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -0,0 +1,311 @@
+# Copyright 2021 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Speculative decoding with a draft model for top_k, top_p and greedy."""
+
+from typing import Any, Callable, Dict, Optional
+
+import tensorflow as tf
+
+from official.nlp.modeling.ops import decoding_module
+from official.nlp.modeling.ops import sampling_module
+
+
+class _StateKeys(decoding_module.StateKeys):
+  """Keys to the state of the speculative decoding loop."""
+
+  # Dictionary of cached values of the draft model. It covers the same
+  # positions as ALIVE_CACHE.
+  DRAFT_CACHE = "DRAFT_CACHE"
+
+
+def truncate_cache(cache: Dict[str, Any], length) -> Dict[str, Any]:
+  """Keeps the first `length` positions of the cached keys and values.
+
+  Every dictionary of `cache` holding both a "key" and a "value" tensor, as
+  written by `CachedAttention._update_cache`, is sliced along the sequence
+  axis. Other entries, e.g. encoder outputs, are returned unchanged.
+
+  Args:
+    cache: Nested dictionary of cached values.
+    length: Number of positions to keep.
+
+  Returns:
+    The truncated cache.
+  """
+  truncated = {}
+  is_attention_cache = "key" in cache and "value" in cache
+  for name, value in cache.items():
+    if is_attention_cache and name in ("key", "value"):
+      truncated[name] = value[:, :length]
+    elif isinstance(value, dict):
+      truncated[name] = truncate_cache(value, length)
+    else:
+      truncated[name] = value
+  return truncated
+
+
+class SpeculativeSamplingModule(sampling_module.SamplingModule):
+  """Speculative decoding with a draft model for top_k, top_p and greedy.
+
+  Each loop iteration lets the draft model propose `num_draft_tokens` tokens
+  and scores all of them with a single call of the target model. The longest
+  prefix of proposals agreeing with the target model is kept, followed by one
+  token of the target model, so an iteration emits between one and
+  `num_draft_tokens + 1` tokens. With greedy decoding a proposal is accepted
+  when it is the target model's argmax, so the output matches
+  `SamplingModule`'s. Otherwise proposals are accepted by rejection sampling,
+  which keeps the target model's distribution after temperature, top_k and
+  top_p filtering.
+
+  Both `symbols_to_logits_fn` and `draft_symbols_to_logits_fn` take
+  `(ids, i, cache)` where `ids` is an int tensor [batch_size, num_ids] holding
+  the tokens at positions `i` to `i + num_ids - 1` and `cache` holds the
+  positions before `i`. They return the logits for the next token of each
+  position, [batch_size, num_ids, vocab_size], and the cache extended by the
+  new positions. A `CachedAttention` decoder does this by calling the layer
+  with all `num_ids` queries and no `decode_loop_step`. Rejected positions are
+  dropped from both caches with `truncate_cache_fn`.
+
+  All sequences of the batch advance by the same number of tokens, the
+  smallest one accepted by a sequence still alive, so the caches stay
+  rectangular. Padded decoding is not supported since the one-hot cache
+  update of padded decoding writes a single position per call.
+  """
+
+  def __init__(self,
+               symbols_to_logits_fn,
+               draft_symbols_to_logits_fn,
+               vocab_size: int,
+               max_decode_length: int,
+               eos_id: int,
+               num_draft_tokens: int = 4,
+               truncate_cache_fn: Callable[[Dict[str, Any], tf.Tensor],
+                                           Dict[str, Any]] = truncate_cache,
+               length_normalization_fn: Optional[Callable[[int, tf.DType],
+                                                          float]] = None,
+               top_k=0,
+               top_p=1.0,
+               sample_temperature=0.0,
+               enable_greedy: bool = True,
+               dtype: tf.DType = tf.float32):
+    """Initialize speculative sampling module."""
+    if num_draft_tokens < 1:
+      raise ValueError("num_draft_tokens must be positive, got %d." %
+                       num_draft_tokens)
+    super(SpeculativeSamplingModule, self).__init__(
+        symbols_to_logits_fn=symbols_to_logits_fn,
+        vocab_size=vocab_size,
+        max_decode_length=max_decode_length,
+        eos_id=eos_id,
+        padded_decode=False,
+        length_normalization_fn=length_normalization_fn,
+        top_k=top_k,
+        top_p=top_p,
+        sample_temperature=sample_temperature,
+        enable_greedy=enable_greedy,
+        dtype=dtype)
+    self.draft_symbols_to_logits_fn = draft_symbols_to_logits_fn
+    self.num_draft_tokens = num_draft_tokens
+    self.truncate_cache_fn = truncate_cache_fn
+
+  def generate(self,
+               initial_ids: tf.Tensor,
+               initial_cache: Dict[str, tf.Tensor],
+               initial_draft_cache: Dict[str, tf.Tensor]
+               ) -> decoding_module.Output:
+    """Decodes with the draft model proposing tokens to the target model.
+
+    Args:
+      initial_ids: initial ids to pass into the symbols_to_logits_fn.
+                   int tensor with shape [batch_size, 1]
+      initial_cache: dictionary for caching target model outputs.
+      initial_draft_cache: dictionary for caching draft model outputs.
+    Returns:
+      Tuple of tensors representing
+        finished_sequence: shape [batch, max_seq_length]
+        finished_scores: [batch, 1]
+    """
+    batch_size = tf.shape(initial_ids)[0]
+    state, state_shapes = self._create_initial_state(initial_ids,
+                                                     initial_cache,
+                                                     batch_size)
+    # Finished sequences are kept in ALIVE_SEQ, padded with 0s after the EOS.
+    del state[_StateKeys.FINISHED_SEQ]
+    del state_shapes[_StateKeys.FINISHED_SEQ]
+    state[_StateKeys.DRAFT_CACHE] = initial_draft_cache
+    state_shapes[_StateKeys.DRAFT_CACHE] = tf.nest.map_structure(
+        decoding_module.get_shape_keep_last_dim, initial_draft_cache)
+
+    def _generate_step(state):
+      return [self._speculate(state)]
+
+    finished_state = tf.nest.map_structure(
+        tf.stop_gradient,
+        tf.while_loop(
+            self._continue_search,
+            _generate_step,
+            loop_vars=[state],
+            shape_invariants=[state_shapes],
+            parallel_iterations=1))
+    return self._process_finished_state(finished_state[0])
+
+  def _choose_ids(self, logits: tf.Tensor) -> tf.Tensor:
+    """Returns the greedy or sampled ids [batch, 1] of filtered `logits`."""
+    if self.enable_greedy:
+      return tf.argmax(logits, axis=-1, output_type=tf.int32)[:, tf.newaxis]
+    return tf.random.categorical(logits, dtype=tf.int32, num_samples=1)
+
+  def _speculate(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    """Proposes, verifies and appends the accepted tokens.
+
+    Args:
+      state: A dictionary with the current loop state.
+
+    Returns:
+      The new loop state.
+    """
+    i = state[_StateKeys.CUR_INDEX]
+    alive_seq = state[_StateKeys.ALIVE_SEQ]
+    alive_log_probs = state[_StateKeys.ALIVE_LOG_PROBS]
+    finished_scores = state[_StateKeys.FINISHED_SCORES]
+    finished_flags = state[_StateKeys.FINISHED_FLAGS]
+    num_draft_tokens = self.num_draft_tokens
+
+    # The draft model proposes tokens one at a time. It also consumes its last
+    # proposal so that its cache covers the same positions as the target's.
+    last_ids = alive_seq[:, -1:]
+    draft_cache = state[_StateKeys.DRAFT_CACHE]
+    ids = last_ids
+    draft_ids, draft_probs = [], []
+    for j in range(num_draft_tokens):
+      draft_logits, draft_cache = self.draft_symbols_to_logits_fn(
+          ids, i + j, draft_cache)
+      draft_logits = self._sampling_logits(draft_logits[:, -1])
+      ids = self._choose_ids(draft_logits)
+      draft_ids.append(ids)
+      draft_probs.append(tf.nn.softmax(draft_logits))
+    _, draft_cache = self.draft_symbols_to_logits_fn(
+        ids, i + num_draft_tokens, draft_cache)
+    draft_ids = tf.concat(draft_ids, axis=1)
+
+    # A single target model call scores every proposal.
+    target_logits, target_cache = self.symbols_to_logits_fn(
+        tf.concat([last_ids, draft_ids], axis=1), i,
+        state[_StateKeys.ALIVE_CACHE])
+    target_log_probs = decoding_module.log_prob_from_logits(target_logits)
+    if self.enable_greedy:
+      target_ids = tf.argmax(target_logits, axis=-1, output_type=tf.int32)
+      accepted = tf.equal(draft_ids, target_ids[:, :num_draft_tokens])
+    else:
+      logits_shape = decoding_module.shape_list(target_logits)
+      target_probs = tf.reshape(
+          tf.nn.softmax(
+              self._sampling_logits(
+                  tf.reshape(target_logits, [-1, logits_shape[-1]]))),
+          logits_shape)
+      draft_probs = tf.stack(draft_probs, axis=1)
+      p = tf.gather(
+          target_probs[:, :num_draft_tokens], draft_ids, axis=2, batch_dims=2)
+      q = tf.gather(draft_probs, draft_ids, axis=2, batch_dims=2)
+      # Accept each proposal with probability min(1, p / q).
+      accepted = tf.random.uniform(tf.shape(q), dtype=q.dtype) * q < p
+
+    num_accepted = tf.reduce_sum(
+        tf.math.cumprod(tf.cast(accepted, tf.int32), axis=1), axis=1)
+    num_accepted = tf.where(finished_flags[:, 0], num_draft_tokens,
+                            num_accepted)
+    num_new = tf.minimum(
+        tf.reduce_min(num_accepted) + 1, self.max_decode_length - i)
+    last = num_new - 1
+
+    if self.enable_greedy:
+      new_ids = target_ids[:, :num_new]
+    else:
+      # The token after the accepted ones is the proposal if this sequence
+      # accepted it, else a sample of the residual distribution max(0, p - q).
+      # It is a plain sample of the target model after all the proposals.
+      draft_probs = tf.pad(draft_probs, [[0, 0], [0, 1], [0, 0]])
+      draft_ids = tf.pad(draft_ids, [[0, 0], [0, 1]])
+      last_probs = tf.gather(target_probs, last, axis=1)
+      residual = tf.nn.relu(last_probs - tf.gather(draft_probs, last, axis=1))
+      residual = tf.where(
+          tf.reduce_sum(residual, axis=-1, keepdims=True) > 0, residual,
+          last_probs)
+      next_ids = tf.where(
+          num_accepted[:, tf.newaxis] > last, draft_ids[:, last:last + 1],
+          tf.random.categorical(
+              tf.math.log(residual), dtype=tf.int32, num_samples=1))
+      new_ids = tf.concat([draft_ids[:, :last], next_ids], axis=1)
+
+    # Tokens of finished sequences and tokens after an EOS are set to 0.
+    is_eos = tf.equal(new_ids, self.eos_id)
+    after_eos = tf.cumsum(tf.cast(is_eos, tf.int32), axis=1, exclusive=True)
+    is_valid = tf.logical_and(
+        tf.equal(after_eos, 0), tf.logical_not(finished_flags))
+    new_ids = tf.where(is_valid, new_ids, tf.zeros_like(new_ids))
+    new_log_probs = tf.gather(
+        target_log_probs[:, :num_new], new_ids, axis=2, batch_dims=2)
+    new_log_probs = alive_log_probs + tf.cumsum(
+        tf.where(is_valid, new_log_probs, tf.zeros_like(new_log_probs)),
+        axis=1)
+
+    new_scores = new_log_probs
+    if self.length_normalization_fn is not None:
+      length_norm = self.length_normalization_fn(
+          i + 1 + tf.range(num_new), self.dtype)
+      new_scores = new_log_probs / length_norm
+    new_eos = tf.logical_and(is_eos, is_valid)
+    finished_scores += tf.reduce_sum(
+        tf.where(new_eos, new_scores, tf.zeros_like(new_scores)),
+        axis=1,
+        keepdims=True)
+    finished_flags = tf.logical_or(
+        finished_flags, tf.reduce_any(new_eos, axis=1, keepdims=True))
+
+    # Both caches keep the positions up to the last accepted proposal.
+    return {
+        _StateKeys.CUR_INDEX: i + num_new,
+        _StateKeys.ALIVE_SEQ: tf.concat([alive_seq, new_ids], axis=1),
+        _StateKeys.ALIVE_LOG_PROBS: new_log_probs[:, -1][:, tf.newaxis],
+        _StateKeys.ALIVE_CACHE: self.truncate_cache_fn(target_cache,
+                                                       i + num_new),
+        _StateKeys.DRAFT_CACHE: self.truncate_cache_fn(draft_cache,
+                                                       i + num_new),
+        _StateKeys.FINISHED_SCORES: finished_scores,
+        _StateKeys.FINISHED_FLAGS: finished_flags
+    }
+
+  def _process_finished_state(
+      self, finished_state: Dict[str, Any]) -> decoding_module.Output:
+    """Process the alive/finished state to return final sequences and scores."""
+    alive_seq = finished_state[_StateKeys.ALIVE_SEQ]
+    alive_log_probs = finished_state[_StateKeys.ALIVE_LOG_PROBS]
+    finished_scores = finished_state[_StateKeys.FINISHED_SCORES]
+    finished_flags = finished_state[_StateKeys.FINISHED_FLAGS]
+    if self.length_normalization_fn is not None:
+      length_norm = self.length_normalization_fn(self.max_decode_length + 1,
+                                                 self.dtype)
+      alive_log_probs = alive_log_probs / length_norm
+    finished_scores = tf.where(finished_flags, finished_scores,
+                               alive_log_probs)
+    # Drop the padding after the last EOS, which the last iteration may have
+    # emitted past the point where SamplingModule stops.
+    eos_lengths = tf.argmax(
+        tf.cast(tf.equal(alive_seq[:, 1:], self.eos_id), tf.int32),
+        axis=1,
+        output_type=tf.int32) + 2
+    lengths = tf.where(finished_flags[:, 0], eos_lengths,
+                       tf.shape(alive_seq)[1])
+    return alive_seq[:, :tf.reduce_max(lengths)], finished_scores
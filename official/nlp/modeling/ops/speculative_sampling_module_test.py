@@ -0,0 +1,158 @@
+# Copyright 2021 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test speculative sampling module."""
+
+from absl.testing import parameterized
+import numpy as np
+import tensorflow as tf
+
+from official.nlp.modeling.layers import attention
+from official.nlp.modeling.ops import sampling_module
+from official.nlp.modeling.ops import speculative_sampling_module
+
+_VOCAB_SIZE = 8
+_NUM_HEADS = 2
+_KEY_DIM = 4
+
+
+def length_normalization(length, dtype):
+  """Return length normalization factor."""
+  return tf.pow(((5. + tf.cast(length, dtype)) / 6.), 0.6)
+
+
+def _get_decoder_fn(seed):
+  """Returns a one layer decoder with cached self attention."""
+  initializer = tf.keras.initializers.RandomNormal(stddev=2.0, seed=seed)
+  embedding = tf.keras.layers.Embedding(
+      _VOCAB_SIZE, _NUM_HEADS * _KEY_DIM, embeddings_initializer=initializer)
+  self_attention = attention.CachedAttention(
+      num_heads=_NUM_HEADS, key_dim=_KEY_DIM, kernel_initializer=initializer)
+  output_layer = tf.keras.layers.Dense(
+      _VOCAB_SIZE, kernel_initializer=initializer)
+
+  def symbols_to_logits_fn(ids, i, cache):
+    inputs = embedding(ids)
+    num_ids = tf.shape(ids)[1]
+    # Position i + j attends to the positions up to itself.
+    mask = (tf.range(i + num_ids)[tf.newaxis, :] <=
+            (i + tf.range(num_ids))[:, tf.newaxis])
+    mask = tf.tile(mask[tf.newaxis], [tf.shape(ids)[0], 1, 1])
+    outputs, _ = self_attention(
+        inputs, inputs, attention_mask=mask, cache=cache["layer_0"])
+    return output_layer(outputs + inputs), cache
+
+  return symbols_to_logits_fn
+
+
+def _get_initial_cache(batch_size):
+  return {
+      "layer_0": {
+          "key": tf.zeros([batch_size, 0, _NUM_HEADS, _KEY_DIM]),
+          "value": tf.zeros([batch_size, 0, _NUM_HEADS, _KEY_DIM])
+      }
+  }
+
+
+class SpeculativeSamplingModuleTest(tf.test.TestCase, parameterized.TestCase):
+
+  def test_truncate_cache(self):
+    cache = _get_initial_cache(2)
+    cache["layer_0"]["key"] = tf.ones([2, 5, _NUM_HEADS, _KEY_DIM])
+    cache["layer_0"]["value"] = tf.ones([2, 5, _NUM_HEADS, _KEY_DIM])
+    cache["encoder_outputs"] = tf.ones([2, 5, 3])
+    truncated = speculative_sampling_module.truncate_cache(cache, 3)
+    self.assertEqual(truncated["layer_0"]["key"].shape, [2, 3, 2, 4])
+    self.assertEqual(truncated["layer_0"]["value"].shape, [2, 3, 2, 4])
+    self.assertEqual(truncated["encoder_outputs"].shape, [2, 5, 3])
+
+  @parameterized.named_parameters(("one_draft_token", 1, 0.5),
+                                  ("three_draft_tokens", 3, 0.5),
+                                  ("exact_draft_model", 3, 0.0))
+  def test_greedy_matches_sampling_module(self, num_draft_tokens, noise_scale):
+    target_fn = _get_decoder_fn(seed=1)
+    noise_fn = _get_decoder_fn(seed=2)
+    batch_size = 4
+    initial_ids = tf.constant([0, 1, 2, 3])
+
+    def draft_fn(ids, i, cache):
+      logits, cache["target"] = target_fn(ids, i, cache["target"])
+      noise, cache["noise"] = noise_fn(ids, i, cache["noise"])
+      return logits + noise_scale * noise, cache
+
+    def single_token_fn(ids, i, cache):
+      logits, cache = target_fn(ids[:, -1:], i, cache)
+      return logits[:, -1], cache
+
+    decoder = sampling_module.SamplingModule(
+        symbols_to_logits_fn=single_token_fn,
+        vocab_size=_VOCAB_SIZE,
+        max_decode_length=12,
+        eos_id=4,
+        padded_decode=False,
+        length_normalization_fn=length_normalization)
+    expected_ids, expected_scores = decoder.generate(
+        initial_ids=initial_ids, initial_cache=_get_initial_cache(batch_size))
+
+    speculative_decoder = speculative_sampling_module.SpeculativeSamplingModule(
+        symbols_to_logits_fn=target_fn,
+        draft_symbols_to_logits_fn=draft_fn,
+        vocab_size=_VOCAB_SIZE,
+        max_decode_length=12,
+        eos_id=4,
+        num_draft_tokens=num_draft_tokens,
+        length_normalization_fn=length_normalization)
+    ids, scores = speculative_decoder.generate(
+        initial_ids=initial_ids,
+        initial_cache=_get_initial_cache(batch_size),
+        initial_draft_cache={
+            "target": _get_initial_cache(batch_size),
+            "noise": _get_initial_cache(batch_size)
+        })
+    self.assertAllEqual(ids, expected_ids)
+    self.assertAllClose(scores, expected_scores)
+
+  def test_sampling_keeps_target_distribution(self):
+    target_logits = tf.math.log([[0.4, 0.3, 0.2, 0.1]])
+    draft_logits = tf.math.log([[0.1, 0.2, 0.3, 0.4]])
+
+    def get_constant_fn(logits):
+
+      def symbols_to_logits_fn(ids, i, cache):
+        del i
+        return tf.tile(logits[tf.newaxis], [tf.shape(ids)[0],
+                                            tf.shape(ids)[1], 1]), cache
+
+      return symbols_to_logits_fn
+
+    tf.random.set_seed(1)
+    batch_size = 20000
+    speculative_decoder = speculative_sampling_module.SpeculativeSamplingModule(
+        symbols_to_logits_fn=get_constant_fn(target_logits),
+        draft_symbols_to_logits_fn=get_constant_fn(draft_logits),
+        vocab_size=4,
+        max_decode_length=1,
+        eos_id=5,
+        num_draft_tokens=2,
+        enable_greedy=False)
+    ids, _ = speculative_decoder.generate(
+        initial_ids=tf.zeros([batch_size], tf.int32),
+        initial_cache={},
+        initial_draft_cache={})
+    frequencies = np.bincount(ids[:, 1].numpy(), minlength=4) / batch_size
+    self.assertAllClose(frequencies, [0.4, 0.3, 0.2, 0.1], atol=0.02)
+
+
+if __name__ == "__main__":
+  tf.test.main()
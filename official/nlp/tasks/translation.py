@@ -109,6 +109,9 @@ class ModelConfig(base_config.Config):
   decode_max_length: Optional[int] = None
   beam_size: int = 4
   alpha: float = 0.6
+  # Whether beam search stops decoding the sentences whose translations are
+  # final. Requires `padded_decode` to be False.
+  compact_beam_search_batch: bool = False
 
   # Training.
   label_smoothing: float = 0.1
@@ -221,6 +224,7 @@ class TranslationTask(base_task.Task):
         decode_max_length=model_cfg.decode_max_length,
         beam_size=model_cfg.beam_size,
         alpha=model_cfg.alpha,
+        compact_beam_search_batch=model_cfg.compact_beam_search_batch,
         encoder_layer=encoder_layer,
         decoder_layer=decoder_layer,
         eos_id=self._eos_id)
@@ -0,0 +1,254 @@
+# Copyright 2021 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks the per-token latency of T5 greedy decoding on the host.
+
+Three decoding paths of `official.nlp.modeling.models.t5` are compared:
+  full_bias: the path before `RelativePositionEmbedding.decode_bias_table`.
+    The cache is updated through a one-hot mask of its whole length and every
+    step computes the full (max_decode_len, max_decode_len) relative position
+    bias, of which only the row of the decoded position is used.
+  one_hot: the cache is updated through a one-hot mask of its whole length and
+    the (2 * max_decode_len - 1) relative position bias table is computed at
+    every step, as on TPU.
+  slice: only the decoded position of the cache is written and the relative
+    position bias table is computed once per decoding run.
+
+The model has randomly initialized weights and defaults to the T5 small
+sizes. For example:
+
+  python3 -m official.nlp.tools.t5_decode_benchmark \
+    --decode_lengths=128,512,2048 \
+    --batch_size=1
+"""
+
+import dataclasses
+import json
+import time
+from typing import Dict, List
+
+from absl import app
+from absl import flags
+from absl import logging
+import numpy as np
+import tensorflow as tf
+
+from official.nlp.modeling.models import t5
+
+FLAGS = flags.FLAGS
+
+DECODE_PATHS = ("full_bias", "one_hot", "slice")
+
+
+def use_full_position_bias(relative_embedding: t5.RelativePositionEmbedding):
+  """Makes each decoding step compute the full relative position bias.
+
+  Instead of a row of `decode_bias_table`, the decoder then passes the whole
+  (1, num_heads, max_decode_len, max_decode_len) bias to the attention layers,
+  which keep the row of the decoded position.
+
+  Args:
+    relative_embedding: The relative position embedding of a `t5.Decoder`.
+  """
+  relative_embedding.decode_bias_table = (
+      lambda max_decode_len: relative_embedding(max_decode_len, max_decode_len))
+  relative_embedding.decode_position_bias = (
+      lambda bias, decode_position, max_decode_len: bias)
+
+
+def build_decode_fn(transformer: t5.T5Transformer, max_decode_len: int,
+                    precompute_position_bias: bool):
+  """Returns a `tf.function` greedily decoding `max_decode_len` tokens.
+
+  Args:
+    transformer: The model to decode with.
+    max_decode_len: The number of tokens to decode, which is also the length of
+      the cache.
+    precompute_position_bias: Whether the relative position bias table is
+      computed once before the decoding loop instead of at every step.
+
+  Returns:
+    A function of the encoder outputs and the encoder input tokens, returning
+    the decoded tokens of shape (batch_size, max_decode_len).
+  """
+  config = transformer.decoder_cfg
+
+  @tf.function
+  def decode(encoded, encoder_input_tokens):
+    batch_size = tf.shape(encoder_input_tokens)[0]
+    cache = {}
+    for i in range(config.num_decoder_layers):
+      cache[i] = {
+          "key":
+              tf.zeros(
+                  [batch_size, max_decode_len, config.num_heads, config.d_kv],
+                  transformer.compute_dtype),
+          "value":
+              tf.zeros(
+                  [batch_size, max_decode_len, config.num_heads, config.d_kv],
+                  transformer.compute_dtype)
+      }
+    position_bias_table = None
+    if precompute_position_bias:
+      position_bias_table = (
+          transformer.decoder.relative_embedding.decode_bias_table(
+              max_decode_len))
+
+    def _decode_step(i, ids, decoded, cache):
+      outputs = transformer.decode(
+          encoded=encoded,
+          decoder_target_tokens=ids,
+          encoder_input_tokens=encoder_input_tokens,
+          decode_position=i,
+          cache=cache,
+          max_decode_len=max_decode_len,
+          position_bias_table=position_bias_table,
+          decode=True)
+      ids = tf.argmax(outputs["logits"], axis=-1, output_type=tf.int32)
+      decoded = decoded.write(i, ids[:, 0])
+      return i + 1, ids, decoded, outputs["cache"]
+
+    _, _, decoded, _ = tf.while_loop(
+        lambda i, *_: i < max_decode_len,
+        _decode_step,
+        loop_vars=[
+            tf.constant(0),
+            tf.zeros([batch_size, 1], tf.int32),
+            tf.TensorArray(tf.int32, size=max_decode_len),
+            cache
+        ])
+    return tf.transpose(decoded.stack())
+
+  return decode
+
+
+def benchmark_decoding(config: t5.T5TransformerParams,
+                       decode_path: str,
+                       max_decode_len: int,
+                       batch_size: int = 1,
+                       input_length: int = 512,
+                       num_runs: int = 3) -> Dict[str, float]:
+  """Measures the per-token latency of greedy decoding.
+
+  Args:
+    config: The model parameters, `one_hot_cache_update` is overridden by
+      `decode_path`.
+    decode_path: One of `DECODE_PATHS`.
+    max_decode_len: The number of tokens to decode.
+    batch_size: The number of sequences decoded together.
+    input_length: The number of encoder input tokens.
+    num_runs: The number of decoding runs to time, after a warmup run that
+      traces the function.
+
+  Returns:
+    A dictionary with the time of the warmup run and percentiles of the
+    per-token latency over the timed runs.
+  """
+  if decode_path not in DECODE_PATHS:
+    raise ValueError("Unknown decode_path %s, expected one of %s." %
+                     (decode_path, DECODE_PATHS))
+  use_slice = decode_path == "slice"
+  transformer = t5.T5Transformer(
+      dataclasses.replace(config, one_hot_cache_update=not use_slice))
+  if decode_path == "full_bias":
+    use_full_position_bias(transformer.decoder.relative_embedding)
+  encoder_input_tokens = tf.random.uniform([batch_size, input_length],
+                                           minval=1,
+                                           maxval=config.vocab_size,
+                                           dtype=tf.int32)
+  encoded = transformer.encode(encoder_input_tokens)
+  decode = build_decode_fn(
+      transformer, max_decode_len, precompute_position_bias=use_slice)
+
+  start = time.time()
+  decode(encoded, encoder_input_tokens).numpy()
+  first_run_secs = time.time() - start
+  token_latencies_ms = []
+  for _ in range(num_runs):
+    start = time.time()
+    decode(encoded, encoder_input_tokens).numpy()
+    token_latencies_ms.append((time.time() - start) * 1000 / max_decode_len)
+  return {
+      "first_run_secs": first_run_secs,
+      "token_latency_ms_p50": float(np.percentile(token_latencies_ms, 50)),
+      "token_latency_ms_min": float(np.min(token_latencies_ms)),
+      "token_latency_ms_max": float(np.max(token_latencies_ms)),
+  }
+
+
+def define_flags():
+  """Defines the flags of the T5 decoding benchmark."""
+  flags.DEFINE_list(
+      "decode_lengths",
+      default=["128", "256", "512", "1024", "2048"],
+      help="Comma separated numbers of tokens to decode.")
+  flags.DEFINE_list(
+      "decode_paths",
+      default=list(DECODE_PATHS),
+      help="Comma separated decoding paths to benchmark.")
+  flags.DEFINE_integer("batch_size", default=1, help="The batch size.")
+  flags.DEFINE_integer(
+      "input_length", default=512, help="The number of encoder input tokens.")
+  flags.DEFINE_integer(
+      "num_runs", default=3, help="The number of timed decoding runs.")
+  flags.DEFINE_integer("num_layers", default=6, help="T5 num_layers.")
+  flags.DEFINE_integer("d_model", default=512, help="T5 d_model.")
+  flags.DEFINE_integer("d_kv", default=64, help="T5 d_kv.")
+  flags.DEFINE_integer("num_heads", default=8, help="T5 num_heads.")
+  flags.DEFINE_integer("d_ff", default=2048, help="T5 d_ff.")
+  flags.DEFINE_integer("vocab_size", default=32128, help="T5 vocab_size.")
+  flags.DEFINE_string(
+      "benchmark_output",
+      default=None,
+      help="An optional path to write the results to as JSON.")
+
+
+def main(_):
+  config = t5.T5TransformerParams(
+      num_layers=FLAGS.num_layers,
+      d_model=FLAGS.d_model,
+      d_kv=FLAGS.d_kv,
+      num_heads=FLAGS.num_heads,
+      d_ff=FLAGS.d_ff,
+      vocab_size=FLAGS.vocab_size,
+      shared_embedding=True)
+  all_results: List[Dict[str, object]] = []
+  for max_decode_len in [int(length) for length in FLAGS.decode_lengths]:
+    for decode_path in FLAGS.decode_paths:
+      logging.info("Benchmarking %s decoding of %d tokens...", decode_path,
+                   max_decode_len)
+      results = benchmark_decoding(
+          config,
+          decode_path,
+          max_decode_len,
+          batch_size=FLAGS.batch_size,
+          input_length=FLAGS.input_length,
+          num_runs=FLAGS.num_runs)
+      logging.info("Results: %s", results)
+      all_results.append({
+          "decode_path": decode_path,
+          "max_decode_len": max_decode_len,
+          "results": results
+      })
+
+  output = json.dumps(all_results, indent=2)
+  print(output)
+  if FLAGS.benchmark_output:
+    with tf.io.gfile.GFile(FLAGS.benchmark_output, "w") as f:
+      f.write(output)
+
+
+if __name__ == "__main__":
+  define_flags()
+  app.run(main)
@@ -0,0 +1,88 @@
+# Copyright 2021 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for official.nlp.tools.t5_decode_benchmark."""
+
+import tensorflow as tf
+
+from official.nlp.modeling.models import t5
+from official.nlp.tools import t5_decode_benchmark
+
+
+def _get_config():
+  return t5.T5TransformerParams(
+      num_layers=2,
+      d_model=8,
+      d_kv=4,
+      num_heads=2,
+      d_ff=16,
+      vocab_size=12,
+      shared_embedding=True)
+
+
+class T5DecodeBenchmarkTest(tf.test.TestCase):
+
+  def test_decode_paths_agree(self):
+    transformer = t5.T5Transformer(_get_config())
+    encoder_input_tokens = tf.constant([[3, 4, 5, 0], [6, 7, 8, 9]])
+    encoded = transformer.encode(encoder_input_tokens)
+    decoded = []
+    for use_slice in [False, True]:
+      for layer in transformer.decoder.decoder_layers:
+        layer.self_attention.self_attention.one_hot_cache_update = (
+            not use_slice)
+      decode = t5_decode_benchmark.build_decode_fn(
+          transformer, max_decode_len=5, precompute_position_bias=use_slice)
+      decoded.append(decode(encoded, encoder_input_tokens))
+    t5_decode_benchmark.use_full_position_bias(
+        transformer.decoder.relative_embedding)
+    decode = t5_decode_benchmark.build_decode_fn(
+        transformer, max_decode_len=5, precompute_position_bias=False)
+    decoded.append(decode(encoded, encoder_input_tokens))
+    self.assertEqual(decoded[0].shape, (2, 5))
+    self.assertAllEqual(decoded[0], decoded[1])
+    self.assertAllEqual(decoded[0], decoded[2])
+
+  def test_full_position_bias(self):
+    transformer = t5.T5Transformer(_get_config())
+    relative_embedding = transformer.decoder.relative_embedding
+    table = relative_embedding.decode_bias_table(5)
+    rows = [
+        relative_embedding.decode_position_bias(table, i, 5) for i in range(5)
+    ]
+    t5_decode_benchmark.use_full_position_bias(relative_embedding)
+    full_bias = relative_embedding.decode_position_bias(
+        relative_embedding.decode_bias_table(5), 2, 5)
+    self.assertEqual(full_bias.shape, (1, 2, 5, 5))
+    self.assertAllClose(full_bias, tf.concat(rows, axis=2))
+
+  def test_benchmark_decoding(self):
+    for decode_path in t5_decode_benchmark.DECODE_PATHS:
+      results = t5_decode_benchmark.benchmark_decoding(
+          _get_config(),
+          decode_path,
+          max_decode_len=4,
+          batch_size=2,
+          input_length=6,
+          num_runs=2)
+      self.assertGreater(results["token_latency_ms_p50"], 0)
+      self.assertLessEqual(results["token_latency_ms_min"],
+                           results["token_latency_ms_max"])
+    with self.assertRaises(ValueError):
+      t5_decode_benchmark.benchmark_decoding(
+          _get_config(), "unknown", max_decode_len=4)
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -14,7 +14,13 @@
 
 """Provides a `Controller` class for managing the outer training loop."""
 
+import collections
+import contextlib
+import json
+import math
+import os
 import pprint
+import threading
 import time
 
 from typing import Callable, List, Optional, Union
@@ -95,10 +101,15 @@ class Controller:
       eval_actions: Optional[List[Action]] = None,
       # Train related
       steps_per_loop: Optional[int] = None,
+      max_steps_per_loop: Optional[int] = None,
+      target_host_overhead: float = 0.05,
       checkpoint_manager: Optional[tf.train.CheckpointManager] = None,
+      enable_async_checkpointing: bool = False,
       # Summary related
       summary_interval: Optional[int] = None,
       summary_dir: Optional[str] = None,
+      enable_buffered_summaries: bool = False,
+      enable_phase_timing: bool = False,
       # Evaluation related
       eval_summary_dir: Optional[str] = None,
   ):
@@ -132,12 +143,31 @@ class Controller:
         evaluation. These will be called with the output of
         `evaluator.evaluate`.
       steps_per_loop: The number of steps to run in each inner loop of training
-        (passed as the `num_steps` parameter of `trainer.train`).
+        (passed as the `num_steps` parameter of `trainer.train`). If
+        `max_steps_per_loop` is set, this is the minimum number of steps per
+        inner loop instead.
+      max_steps_per_loop: If set, enables autotuning of the number of steps per
+        inner loop. After each loop, the `Controller` measures the host-side
+        overhead (everything outside of `trainer.train`, such as actions,
+        summaries, checkpointing and Python dispatch) relative to the device
+        time per step, and picks the smallest multiple of `steps_per_loop` (up
+        to `max_steps_per_loop`) that keeps the overhead below
+        `target_host_overhead`. Inner loops are still cut short so that they
+        end on `summary_interval` and checkpoint interval boundaries.
+      target_host_overhead: The target fraction of wall time spent outside of
+        `trainer.train` when `max_steps_per_loop` is set.
       checkpoint_manager: An instance of `tf.train.CheckpointManager`. If
         provided and there are checkpoints in the associated model directory,
         the model will be restored from the most recent checkpoint inside this
         `__init__` method. If not provided, the `Controller` will not
         automatically save to or restore from checkpoints.
+      enable_async_checkpointing: Whether to save checkpoints asynchronously.
+        If `True`, each save snapshots the checkpointed variables to host memory
+        and writes them to `checkpoint_manager.directory` on a background
+        thread, so training can continue while the files are written. At most
+        one save is in flight at a time; a new save blocks until the previous
+        write has completed. Pending saves are waited on before evaluation and
+        before `train()` returns (see `wait_for_pending_saves`).
       summary_interval: Step interval for training summaries. Note that this
         argument only applies to `tf.summary` calls inside the `trainer.train`
         function. Summaries written by the `Controller` (specifically
@@ -147,6 +177,27 @@ class Controller:
       summary_dir: The directory to write summaries to. To use the same
         directory as for checkpointing, pass `checkpoint_manager.directory`. If
         `None`, no training summaries will be written.
+      enable_buffered_summaries: Whether to buffer the training summaries
+        written by the `Controller` in memory and write them in bulk on a
+        background thread (see `orbit.utils.BufferedSummaryManager`), instead of
+        writing and flushing them after every loop. Buffered summaries are
+        handed off to the background thread at the end of every
+        `train_and_evaluate()` interval, and fully written by the time
+        `train()` or `train_and_evaluate()` returns.
+      enable_phase_timing: Whether to break down the wall time of each train
+        loop into phases ("train", "train_actions", "summaries" and
+        "checkpoint"). If `True`, the accumulated seconds per phase are written
+        as "phase_seconds/<phase>" training summaries, and a JSON timeline of
+        all recorded phases (in Chrome trace event format) is written to
+        "phase_timeline.json" inside `summary_dir` at the end of `train()`.
+        Phases that happen after the summaries of a loop have been written (the
+        summary writing itself and checkpointing) are reported with the next
+        loop. If the trainer has an `input_wait_seconds()` method returning
+        a number (e.g. a `StandardTrainer` with `enable_input_wait_timing`),
+        the time `trainer.train()` spent waiting for input is reported as an
+        "input_wait" phase and excluded from the "train" phase. In the
+        timeline, the input wait of a loop is shown as a single event at its
+        start. Otherwise, the "train" phase includes the input wait.
       eval_summary_dir: The directory to write eval summaries to. If `None`, it
         will be set to `summary_dir`. If both `summary_dir` and
         `eval_summary_dir` are `None`, no eval summaries will be written.
@@ -154,6 +205,8 @@ class Controller:
     Raises:
       ValueError: If both `trainer` and `evaluator` are `None`.
       ValueError: If `steps_per_loop` is not a positive integer.
+      ValueError: If `max_steps_per_loop` is smaller than `steps_per_loop`, or
+        `target_host_overhead` is not in (0, 1).
       ValueError: If `summary_interval` is not a positive integer or is not
         divisible by `steps_per_loop`.
     """
@@ -177,6 +230,16 @@ class Controller:
               f"`summary interval` ({summary_interval}) must be a multiple "
               f"of `steps_per_loop` ({steps_per_loop}).")
 
+      if max_steps_per_loop is not None:
+        if max_steps_per_loop < steps_per_loop:
+          raise ValueError(
+              f"`max_steps_per_loop` ({max_steps_per_loop}) must be at least "
+              f"`steps_per_loop` ({steps_per_loop}).")
+        if not 0 < target_host_overhead < 1:
+          raise ValueError(
+              f"`target_host_overhead` ({target_host_overhead}) must be "
+              "between 0 and 1.")
+
     if not isinstance(global_step, tf.Variable):
       raise ValueError("`global_step` must be a `tf.Variable`.")
 
@@ -190,12 +253,34 @@ class Controller:
 
     self.global_step = global_step
     self.checkpoint_manager = checkpoint_manager
+    self._last_checkpoint_step = None
+    self._enable_async_checkpointing = enable_async_checkpointing
+    self._checkpoint_options = None
+    if enable_async_checkpointing:
+      self._checkpoint_options = tf.train.CheckpointOptions(
+          experimental_enable_async_checkpoint=True)
 
     if self.trainer is not None:
       self.step_timer = None
+      self.phase_timer = PhaseTimer() if enable_phase_timing else None
+      self._phase_timeline_path = None
+      if enable_phase_timing and summary_dir is not None:
+        self._phase_timeline_path = os.path.join(
+            summary_dir, "phase_timeline.json")
       self.steps_per_loop = steps_per_loop
+      self.steps_per_loop_tuner = None
+      if max_steps_per_loop is not None:
+        self.steps_per_loop_tuner = StepsPerLoopTuner(
+            min_steps_per_loop=steps_per_loop,
+            max_steps_per_loop=max_steps_per_loop,
+            target_host_overhead=target_host_overhead)
+      self._last_train_seconds = None
       self.summary_interval = summary_interval
-      self.summary_manager = utils.SummaryManager(
+      if enable_buffered_summaries:
+        summary_manager_cls = utils.BufferedSummaryManager
+      else:
+        summary_manager_cls = utils.SummaryManager
+      self.summary_manager = summary_manager_cls(
           summary_dir, tf.summary.scalar, global_step=self.global_step)
 
     if self.evaluator is not None:
@@ -230,19 +315,27 @@ class Controller:
         returns (regardless of the checkpointing interval). Defaults to `True`.
     """
     self._require("trainer", for_method="train")
+    self._train_until(steps, checkpoint_at_completion)
+    self._finish_training()
 
+  def _train_until(self, steps: int, checkpoint_at_completion: bool):
+    """Runs the training loops of `train()`, without finishing training."""
     # TODO(momernick): Support steps=None or -1 (training to exhaustion).
     current_step = self.global_step.numpy()  # Cache, since this is expensive.
     _log(f"train | step: {current_step: 6d} | training until step {steps}...")
     while current_step < steps:
       # Calculates steps to run for the next train loop.
-      num_steps = min(steps - current_step, self.steps_per_loop)
+      num_steps = min(steps - current_step, self._next_loop_steps(current_step))
+      loop_start = time.time()
       self._train_n_steps(num_steps)
       self._maybe_save_checkpoint()
+      if self.steps_per_loop_tuner is not None:
+        self._update_steps_per_loop(num_steps, time.time() - loop_start)
       current_step = self.global_step.numpy()
 
     if checkpoint_at_completion:
       self._maybe_save_checkpoint(check_interval=False)
+    self.wait_for_pending_saves()
 
   def evaluate(self, steps: int = -1) -> Optional[runner.Output]:
     """Runs evaluation for the given number of steps.
@@ -273,6 +366,10 @@ class Controller:
     else:
       raise ValueError(f"`steps` ({steps}) should be > 0, or == -1.")
 
+    # Makes sure any checkpoint for the current step is fully written, e.g. so
+    # that eval actions exporting the latest checkpoint can find it.
+    self.wait_for_pending_saves()
+
     current_step = self.global_step.numpy()
     _log(f" eval | step: {current_step: 6d} | {steps_msg}")
 
@@ -302,11 +399,11 @@ class Controller:
                          eval_interval: Optional[int] = None) -> None:
     """Runs interleaved training and evaluation.
 
-    This method interleaves calls to `self.train()` and `self.evaluate()`,
-    training the model until the global step count equals `train_steps`, and
-    running an evaluation for `eval_steps` every `eval_interval` training steps.
-    In addition, this method will run a final evaluation at the end of the
-    training sequence.
+    This method interleaves training loops (as in `self.train()`) and calls to
+    `self.evaluate()`, training the model until the global step count equals
+    `train_steps`, and running an evaluation for `eval_steps` every
+    `eval_interval` training steps. In addition, this method will run a final
+    evaluation at the end of the training sequence.
 
     Args:
       train_steps: The global step count to train up to.
@@ -329,10 +426,93 @@ class Controller:
     while current_step < train_steps:
       interval = min(train_steps - current_step, eval_interval)
       num_steps = current_step + interval
-      self.train(steps=num_steps, checkpoint_at_completion=False)
+      self._train_until(steps=num_steps, checkpoint_at_completion=False)
+      if isinstance(self.summary_manager, utils.BufferedSummaryManager):
+        # Hands the interval's summaries off to be written in the background.
+        self.summary_manager.flush(force=True)
       self.evaluate(steps=eval_steps)
       current_step = self.global_step.numpy()
     self._maybe_save_checkpoint(check_interval=False)
+    self.wait_for_pending_saves()
+    self._finish_training()
+
+  def train_and_evaluate_concurrently(self,
+                                     evaluation_controller: "Controller",
+                                     train_steps: int,
+                                     eval_steps: int = -1,
+                                     eval_poll_timeout: Union[int, float] = 10):
+    """Runs training while evaluating saved checkpoints on a side-car thread.
+
+    Unlike `train_and_evaluate()`, training is never paused for evaluation.
+    Instead, `evaluation_controller.evaluate_continuously()` runs on a
+    background thread, evaluating the most recent checkpoint saved by this
+    controller whenever a new one appears. Once training completes (and the
+    final checkpoint has been saved), the side-car evaluates any checkpoint it
+    has not seen yet and then exits.
+
+    The `evaluation_controller` must not share variables with this controller,
+    since it restores checkpoints while training continues. Typically, it wraps
+    a second instance of the model with its own evaluator and a
+    `CheckpointManager` pointing at this controller's checkpoint directory, and
+    writes to the same eval summary directory (and eval actions) that
+    `train_and_evaluate()` would use.
+
+    Args:
+      evaluation_controller: A `Controller` with an `evaluator` and a
+        `checkpoint_manager` watching `self.checkpoint_manager.directory`.
+      train_steps: The global step count to train up to.
+      eval_steps: The number of steps to run during an evaluation. If -1, this
+        method will evaluate over the entire evaluation dataset.
+      eval_poll_timeout: The number of seconds the side-car waits for a new
+        checkpoint before checking whether training has finished. This bounds
+        how long this method waits after the final evaluation.
+
+    Raises:
+      ValueError: If this controller has no `trainer` or `checkpoint_manager`,
+        or if the `checkpoint_manager` has no `checkpoint_interval`.
+      ValueError: If `evaluation_controller` has no `evaluator` or
+        `checkpoint_manager`.
+    """
+    self._require("trainer", for_method="train_and_evaluate_concurrently")
+    self._require(
+        "checkpoint_manager", for_method="train_and_evaluate_concurrently")
+    evaluation_controller._require(  # pylint: disable=protected-access
+        "evaluator", for_method="train_and_evaluate_concurrently")
+    evaluation_controller._require(  # pylint: disable=protected-access
+        "checkpoint_manager", for_method="train_and_evaluate_concurrently")
+    if not self.checkpoint_manager.checkpoint_interval:
+      raise ValueError(
+          "`checkpoint_manager.checkpoint_interval` must be set for "
+          "`train_and_evaluate_concurrently()`, since evaluation only runs on "
+          "saved checkpoints.")
+
+    training_done = threading.Event()
+    eval_errors = []
+
+    def _evaluate_continuously():
+      # Summary steps and strategy scopes are thread local.
+      tf.summary.experimental.set_step(evaluation_controller.global_step)
+      try:
+        with evaluation_controller.strategy.scope():
+          evaluation_controller.evaluate_continuously(
+              steps=eval_steps,
+              timeout=eval_poll_timeout,
+              timeout_fn=training_done.is_set)
+      except Exception as e:  # pylint: disable=broad-except
+        eval_errors.append(e)
+
+    # Constructing `evaluation_controller` may have changed the default step.
+    tf.summary.experimental.set_step(self.global_step)
+    eval_thread = threading.Thread(
+        target=_evaluate_continuously, name="orbit_sidecar_eval", daemon=True)
+    eval_thread.start()
+    try:
+      self.train(steps=train_steps)
+    finally:
+      training_done.set()
+      eval_thread.join()
+    if eval_errors:
+      raise eval_errors[0]
 
   def evaluate_continuously(self,
                             steps: int = -1,
@@ -411,6 +591,17 @@ class Controller:
     self._require("checkpoint_manager", for_method="save_checkpoint")
     self._maybe_save_checkpoint(check_interval=False)
 
+  def wait_for_pending_saves(self):
+    """Blocks until all pending asynchronous checkpoint saves have completed.
+
+    This is a no-op unless `enable_async_checkpointing` was set when
+    constructing the `Controller`. It is called automatically before evaluation
+    and at the end of `train()` and `train_and_evaluate()`, and may be called
+    by users before e.g. exiting the program or copying checkpoint files.
+    """
+    if self.checkpoint_manager and self._enable_async_checkpointing:
+      self.checkpoint_manager.sync()
+
   def _train_n_steps(self, num_steps: int):
     """Runs training for `num_steps` steps.
 
@@ -418,6 +609,10 @@ class Controller:
     output (if output is returned from `self.trainer.train()`, and if
     `self.summary_dir` is set).
 
+    If phase timing is enabled, the time `self.trainer.train()` spends waiting
+    for input is split from the "train" phase when the trainer measures it
+    (see `enable_phase_timing` in `__init__`).
+
     Args:
       num_steps: An integer specifying how many steps of training to run.
 
@@ -436,11 +631,17 @@ class Controller:
         should_record = lambda: (self.global_step % self.summary_interval == 0)
       with tf.summary.record_if(should_record):
         num_steps_tensor = tf.convert_to_tensor(num_steps, dtype=tf.int32)
+        train_start = time.time()
         train_output = self.trainer.train(num_steps_tensor)
 
     # Verify that global_step was updated properly, then update current_step.
+    # Reading `global_step` also waits for the train steps to complete.
     expected_step = current_step + num_steps
-    if self.global_step.numpy() != expected_step:
+    updated_step = self.global_step.numpy()
+    self._last_train_seconds = time.time() - train_start
+    if self.phase_timer is not None:
+      self._record_train_phases(train_start, self._last_train_seconds)
+    if updated_step != expected_step:
       message = (
           f"`trainer.train({num_steps})` did not update `global_step` by "
           f"{num_steps}. Old value was {current_step}, expected updated value "
@@ -448,8 +649,9 @@ class Controller:
       logging.warning(message)
 
     train_output = train_output or {}
-    for action in self.train_actions:
-      action(train_output)
+    with self._time_phase("train_actions"):
+      for action in self.train_actions:
+        action(train_output)
     train_output = tf.nest.map_structure(utils.get_value, train_output)
 
     current_step = self.global_step.numpy()
@@ -459,8 +661,31 @@ class Controller:
          f"output: {_format_output(train_output)}")
 
     train_output["steps_per_second"] = steps_per_second
-    self.summary_manager.write_summaries(train_output)
-    self.summary_manager.flush()
+    if self.phase_timer is not None:
+      train_output["phase_seconds"] = self.phase_timer.durations()
+    with self._time_phase("summaries"):
+      self.summary_manager.write_summaries(train_output)
+      self.summary_manager.flush()
+
+  def _record_train_phases(self, train_start, train_seconds):
+    """Records the "train" phase, split from the input wait if available."""
+    input_wait_seconds = None
+    get_input_wait_seconds = getattr(self.trainer, "input_wait_seconds", None)
+    if callable(get_input_wait_seconds):
+      input_wait_seconds = get_input_wait_seconds()
+    if input_wait_seconds is not None:
+      input_wait_seconds = min(input_wait_seconds, train_seconds)
+      self.phase_timer.record("input_wait", train_start, input_wait_seconds)
+      train_start += input_wait_seconds
+      train_seconds -= input_wait_seconds
+    self.phase_timer.record("train", train_start, train_seconds)
+
+  def _finish_training(self):
+    """Writes out the buffered summaries and the phase timeline, if any."""
+    if isinstance(self.summary_manager, utils.BufferedSummaryManager):
+      self.summary_manager.close()
+    if self.phase_timer is not None and self._phase_timeline_path:
+      self.phase_timer.write_timeline(self._phase_timeline_path)
 
   def _maybe_save_checkpoint(self, check_interval: bool = True):
     """Conditionally saves a checkpoint.
@@ -479,14 +704,55 @@ class Controller:
       A boolean indicating whether a checkpoint was saved.
     """
     if self.checkpoint_manager and self.checkpoint_manager.checkpoint_interval:
-      ckpt_path = self.checkpoint_manager.save(
-          checkpoint_number=self.global_step.numpy(),
-          check_interval=check_interval)
+      with self._time_phase("checkpoint"):
+        ckpt_path = self.checkpoint_manager.save(
+            checkpoint_number=self.global_step.numpy(),
+            check_interval=check_interval,
+            options=self._checkpoint_options)
       if ckpt_path is not None:
-        _log(f"saved checkpoint to {ckpt_path}.")
+        self._last_checkpoint_step = self.global_step.numpy()
+        if self._enable_async_checkpointing:
+          _log(f"started async checkpoint save to {ckpt_path}.")
+        else:
+          _log(f"saved checkpoint to {ckpt_path}.")
         return True
     return False
 
+  def _next_loop_steps(self, current_step):
+    """Returns the number of steps to run in the next inner loop."""
+    if self.steps_per_loop_tuner is None:
+      return self.steps_per_loop
+    num_steps = self.steps_per_loop_tuner.steps_per_loop
+    # Ends the loop on summary and checkpoint boundaries, so that these still
+    # happen at the configured steps.
+    if self.summary_interval:
+      steps_to_summary = (
+          self.summary_interval - current_step % self.summary_interval)
+      num_steps = min(num_steps, steps_to_summary)
+    if self.checkpoint_manager and self._last_checkpoint_step is not None:
+      checkpoint_interval = self.checkpoint_manager.checkpoint_interval
+      if checkpoint_interval:
+        next_checkpoint_step = self._last_checkpoint_step + checkpoint_interval
+        if next_checkpoint_step > current_step:
+          num_steps = min(num_steps, next_checkpoint_step - current_step)
+    return num_steps
+
+  def _update_steps_per_loop(self, num_steps, loop_seconds):
+    """Updates the autotuned steps per loop from the last loop's timing."""
+    old_steps_per_loop = self.steps_per_loop_tuner.steps_per_loop
+    new_steps_per_loop = self.steps_per_loop_tuner.update(
+        num_steps, self._last_train_seconds, loop_seconds)
+    if new_steps_per_loop != old_steps_per_loop:
+      _log(f"train | step: {self.global_step.numpy(): 6d} | "
+           f"steps_per_loop: {old_steps_per_loop} -> {new_steps_per_loop}")
+
+  def _time_phase(self, name):
+    """Returns a context manager timing phase `name` if phase timing is on."""
+    phase_timer = getattr(self, "phase_timer", None)
+    if phase_timer is None:
+      return contextlib.nullcontext()
+    return phase_timer.time(name)
+
   def _require(self, attribute, for_method):
     """Utility method to raise an error if the given `attribute` is not set."""
     if getattr(self, attribute, None) is None:
@@ -512,3 +778,123 @@ class StepTimer:
     if restart:
       self.start()
     return value
+
+
+class StepsPerLoopTuner:
+  """Utility class for autotuning the number of steps per inner loop.
+
+  Each inner loop of `n` steps takes roughly `host + n * device` seconds, where
+  `host` is the per-loop overhead outside of `trainer.train` and `device` is the
+  time per training step. Given moving averages of both, this picks the
+  smallest multiple of `min_steps_per_loop` for which the host overhead stays
+  below `target_host_overhead` of the loop time. To avoid oscillation, the
+  value changes by at most a factor of two per update, and the first loop
+  (which usually includes tracing and compilation) is ignored.
+  """
+
+  def __init__(self,
+               min_steps_per_loop: int,
+               max_steps_per_loop: int,
+               target_host_overhead: float = 0.05,
+               smoothing: float = 0.5):
+    self.min_steps_per_loop = min_steps_per_loop
+    self.max_steps_per_loop = max_steps_per_loop
+    self.target_host_overhead = target_host_overhead
+    self.smoothing = smoothing
+    self.steps_per_loop = min_steps_per_loop
+    self._host_seconds = None
+    self._device_seconds_per_step = None
+    self._warmed_up = False
+
+  def _average(self, average, value):
+    if average is None:
+      return value
+    return self.smoothing * average + (1 - self.smoothing) * value
+
+  def update(self, num_steps: int, train_seconds: float,
+             loop_seconds: float) -> int:
+    """Records the timing of an inner loop and returns the new steps per loop.
+
+    Args:
+      num_steps: The number of steps run in the loop.
+      train_seconds: The time spent in `trainer.train`.
+      loop_seconds: The total wall time of the loop.
+
+    Returns:
+      The number of steps to run in subsequent inner loops.
+    """
+    if not self._warmed_up:
+      self._warmed_up = True
+      return self.steps_per_loop
+
+    self._host_seconds = self._average(self._host_seconds,
+                                       max(loop_seconds - train_seconds, 0.0))
+    self._device_seconds_per_step = self._average(
+        self._device_seconds_per_step, train_seconds / num_steps)
+    if self._device_seconds_per_step <= 0:
+      return self.steps_per_loop
+
+    # Solves host / (host + n * device) <= target for n.
+    target = self.target_host_overhead
+    desired_steps = (self._host_seconds * (1 - target) /
+                     (target * self._device_seconds_per_step))
+    desired_steps = min(max(desired_steps, self.steps_per_loop / 2),
+                        self.steps_per_loop * 2)
+    num_multiples = max(math.ceil(desired_steps / self.min_steps_per_loop), 1)
+    self.steps_per_loop = min(num_multiples * self.min_steps_per_loop,
+                              self.max_steps_per_loop)
+    return self.steps_per_loop
+
+
+class PhaseTimer:
+  """Utility class for measuring the wall time spent in named phases.
+
+  Durations are accumulated per phase name until they are retrieved through
+  `durations()`. In addition, the most recent `max_events` phases are kept as
+  a timeline that can be written out in Chrome trace event format (viewable in
+  e.g. chrome://tracing or Perfetto).
+
+  Phases are timed on the host. Work that the host only waits for as a whole,
+  such as the input fetched inside a compiled train loop, can be recorded with
+  `record()` from a duration measured elsewhere (see
+  `StandardTrainerOptions.enable_input_wait_timing`).
+  """
+
+  def __init__(self, max_events: int = 100000):
+    self._durations = collections.OrderedDict()
+    self._events = collections.deque(maxlen=max_events)
+
+  @contextlib.contextmanager
+  def time(self, name: str):
+    """Context manager that records the time spent in its body as `name`."""
+    start = time.time()
+    try:
+      yield
+    finally:
+      self.record(name, start, time.time() - start)
+
+  def record(self, name: str, start: float, elapsed: float):
+    """Records `elapsed` seconds spent in phase `name`, starting at `start`."""
+    self._durations[name] = self._durations.get(name, 0.0) + elapsed
+    self._events.append((name, start, elapsed))
+
+  def durations(self, reset: bool = True):
+    """Returns a dictionary mapping phase names to accumulated seconds."""
+    durations = dict(self._durations)
+    if reset:
+      self._durations.clear()
+    return durations
+
+  def write_timeline(self, path: str):
+    """Writes the recorded phases to `path` as a JSON trace event file."""
+    trace_events = [{
+        "name": name,
+        "ph": "X",
+        "ts": start * 1e6,
+        "dur": elapsed * 1e6,
+        "pid": 0,
+        "tid": 0,
+    } for name, start, elapsed in self._events]
+    tf.io.gfile.makedirs(os.path.dirname(path))
+    with tf.io.gfile.GFile(path, "w") as f:
+      json.dump({"traceEvents": trace_events}, f)
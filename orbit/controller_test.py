@@ -14,7 +14,9 @@
 
 """Tests for orbit.controller."""
 
+import json
 import os
+from unittest import mock
 
 from absl import logging
 from absl.testing import parameterized
@@ -61,7 +63,7 @@ class TestRunner(standard_runner.StandardTrainer,
                  standard_runner.StandardEvaluator):
   """Implements the training and evaluation APIs for the test model."""
 
-  def __init__(self, return_numpy=False):
+  def __init__(self, return_numpy=False, trainer_options=None):
     self.strategy = tf.distribute.get_strategy()
     self.model = create_model()
     self.optimizer = tf.keras.optimizers.RMSprop(learning_rate=0.1)
@@ -71,7 +73,8 @@ class TestRunner(standard_runner.StandardTrainer,
     self.return_numpy = return_numpy
     train_dataset = self.strategy.distribute_datasets_from_function(dataset_fn)
     eval_dataset = self.strategy.distribute_datasets_from_function(dataset_fn)
-    standard_runner.StandardTrainer.__init__(self, train_dataset)
+    standard_runner.StandardTrainer.__init__(
+        self, train_dataset, options=trainer_options)
     standard_runner.StandardEvaluator.__init__(self, eval_dataset)
 
   def train_step(self, iterator):
@@ -698,6 +701,245 @@ class ControllerTest(tf.test.TestCase, parameterized.TestCase):
     self.assertLen(
         summaries_with_matching_keyword("eval_loss", self.model_dir), 2)
 
+  def test_async_checkpointing(self):
+    test_runner = TestRunner()
+
+    checkpoint = tf.train.Checkpoint(
+        model=test_runner.model, optimizer=test_runner.optimizer)
+    checkpoint_manager = tf.train.CheckpointManager(
+        checkpoint,
+        self.model_dir,
+        max_to_keep=None,
+        step_counter=test_runner.global_step,
+        checkpoint_interval=5)
+    test_controller = controller.Controller(
+        trainer=test_runner,
+        evaluator=test_runner,
+        global_step=test_runner.global_step,
+        steps_per_loop=5,
+        checkpoint_manager=checkpoint_manager,
+        enable_async_checkpointing=True)
+    test_controller.train_and_evaluate(
+        train_steps=10, eval_steps=2, eval_interval=5)
+
+    # All saves have been written by the time `train_and_evaluate` returns.
+    self.assertLen(
+        tf.io.gfile.glob(os.path.join(self.model_dir, "ckpt-*.data*")), 2)
+    self.assertEqual(
+        checkpoint_manager.latest_checkpoint,
+        os.path.join(self.model_dir, "ckpt-10"))
+
+    # The async checkpoints can be restored as usual.
+    test_runner.global_step.assign(0)
+    test_controller.restore_checkpoint()
+    self.assertEqual(test_runner.global_step, 10)
+
+  @parameterized.named_parameters(("input_wait_timing", True), ("", False))
+  def test_phase_timing(self, enable_input_wait_timing):
+    test_runner = TestRunner(
+        trainer_options=standard_runner.StandardTrainerOptions(
+            enable_input_wait_timing=enable_input_wait_timing))
+
+    checkpoint = tf.train.Checkpoint(
+        model=test_runner.model, optimizer=test_runner.optimizer)
+    checkpoint_manager = tf.train.CheckpointManager(
+        checkpoint,
+        self.model_dir,
+        max_to_keep=None,
+        step_counter=test_runner.global_step,
+        checkpoint_interval=2)
+    summary_dir = os.path.join(self.model_dir, "summaries/train")
+    test_controller = controller.Controller(
+        trainer=test_runner,
+        global_step=test_runner.global_step,
+        steps_per_loop=2,
+        checkpoint_manager=checkpoint_manager,
+        summary_dir=summary_dir,
+        enable_phase_timing=True)
+    test_controller.train(steps=6)
+
+    self.assertNotEmpty(
+        summaries_with_matching_keyword(
+            "train", os.path.join(summary_dir, "phase_seconds")))
+    self.assertNotEmpty(
+        summaries_with_matching_keyword(
+            "checkpoint", os.path.join(summary_dir, "phase_seconds")))
+
+    with tf.io.gfile.GFile(
+        os.path.join(summary_dir, "phase_timeline.json")) as f:
+      timeline = json.load(f)
+    phases = [event["name"] for event in timeline["traceEvents"]]
+    self.assertEqual(phases.count("train"), 3)
+    self.assertEqual(phases.count("summaries"), 3)
+    self.assertContainsSubset(["train_actions", "checkpoint"], phases)
+    self.assertEqual(
+        phases.count("input_wait"), 3 if enable_input_wait_timing else 0)
+    self.assertEqual(
+        bool(
+            summaries_with_matching_keyword(
+                "input_wait", os.path.join(summary_dir, "phase_seconds"))),
+        enable_input_wait_timing)
+
+  def test_phase_timing_splits_input_wait(self):
+    test_runner = TestRunner()
+    # An input wait longer than the `trainer.train()` call is capped to it.
+    test_runner.input_wait_seconds = lambda: 1e6
+    summary_dir = os.path.join(self.model_dir, "summaries/train")
+    test_controller = controller.Controller(
+        trainer=test_runner,
+        global_step=test_runner.global_step,
+        steps_per_loop=2,
+        summary_dir=summary_dir,
+        enable_phase_timing=True)
+    test_controller.train(steps=2)
+
+    with tf.io.gfile.GFile(
+        os.path.join(summary_dir, "phase_timeline.json")) as f:
+      timeline = json.load(f)
+    durations = {
+        event["name"]: event["dur"] for event in timeline["traceEvents"]
+    }
+    self.assertGreater(durations["input_wait"], 0.0)
+    self.assertEqual(durations["train"], 0.0)
+
+  def test_train_and_evaluate_concurrently(self):
+    test_runner = TestRunner()
+    checkpoint = tf.train.Checkpoint(
+        model=test_runner.model, optimizer=test_runner.optimizer)
+    checkpoint_manager = tf.train.CheckpointManager(
+        checkpoint,
+        self.model_dir,
+        max_to_keep=None,
+        step_counter=test_runner.global_step,
+        checkpoint_interval=2)
+    test_controller = controller.Controller(
+        trainer=test_runner,
+        global_step=test_runner.global_step,
+        steps_per_loop=2,
+        checkpoint_manager=checkpoint_manager,
+        summary_dir=os.path.join(self.model_dir, "summaries/train"))
+
+    # The side-car evaluator uses its own copy of the model.
+    eval_runner = TestRunner()
+    eval_checkpoint = tf.train.Checkpoint(
+        model=eval_runner.model, optimizer=eval_runner.optimizer)
+    eval_controller = controller.Controller(
+        evaluator=eval_runner,
+        global_step=eval_runner.global_step,
+        checkpoint_manager=tf.train.CheckpointManager(
+            eval_checkpoint, self.model_dir, max_to_keep=None),
+        eval_summary_dir=os.path.join(self.model_dir, "summaries/eval"))
+
+    test_controller.train_and_evaluate_concurrently(
+        eval_controller, train_steps=10, eval_steps=2, eval_poll_timeout=1)
+    self.assertEqual(test_runner.global_step, 10)
+
+    # The final checkpoint is always evaluated.
+    self.assertEqual(eval_runner.global_step, 10)
+    eval_summaries = summaries_with_matching_keyword(
+        "eval_loss", os.path.join(self.model_dir, "summaries/eval"))
+    self.assertNotEmpty(eval_summaries)
+
+  def test_train_and_evaluate_concurrently_requires_checkpoint_interval(self):
+    test_runner = TestRunner()
+    checkpoint_manager = tf.train.CheckpointManager(
+        tf.train.Checkpoint(model=test_runner.model),
+        self.model_dir,
+        max_to_keep=None)
+    test_controller = controller.Controller(
+        trainer=test_runner,
+        evaluator=test_runner,
+        global_step=test_runner.global_step,
+        steps_per_loop=2,
+        checkpoint_manager=checkpoint_manager)
+    with self.assertRaisesRegex(ValueError, "checkpoint_interval"):
+      test_controller.train_and_evaluate_concurrently(
+          test_controller, train_steps=10)
+
+  def test_buffered_summaries(self):
+    test_runner = TestRunner()
+    test_controller = controller.Controller(
+        trainer=test_runner,
+        evaluator=test_runner,
+        global_step=test_runner.global_step,
+        steps_per_loop=2,
+        summary_dir=self.model_dir,
+        enable_buffered_summaries=True)
+    summary_manager = test_controller.summary_manager
+    with mock.patch.object(
+        summary_manager, "flush", wraps=summary_manager.flush) as mock_flush:
+      with mock.patch.object(
+          summary_manager, "close",
+          wraps=summary_manager.close) as mock_close:
+        test_controller.train_and_evaluate(
+            train_steps=10, eval_steps=2, eval_interval=6)
+
+    # The buffer is handed off after each of the two intervals, and only
+    # closed once at the end.
+    self.assertEqual(mock_flush.call_args_list.count(mock.call(force=True)), 2)
+    mock_close.assert_called_once()
+    self.assertLen(summaries_with_matching_keyword("loss", self.model_dir), 7)
+    self.assertLen(
+        summaries_with_matching_keyword("steps_per_second", self.model_dir), 5)
+    self.assertLen(
+        summaries_with_matching_keyword("eval_loss", self.model_dir), 2)
+
+  def test_autotune_steps_per_loop(self):
+    test_runner = TestRunner()
+    checkpoint = tf.train.Checkpoint(
+        model=test_runner.model, optimizer=test_runner.optimizer)
+    checkpoint_manager = tf.train.CheckpointManager(
+        checkpoint,
+        self.model_dir,
+        max_to_keep=None,
+        step_counter=test_runner.global_step,
+        checkpoint_interval=6)
+    train_output_recorder = []
+    test_controller = controller.Controller(
+        trainer=test_runner,
+        global_step=test_runner.global_step,
+        train_actions=[train_output_recorder.append],
+        steps_per_loop=1,
+        max_steps_per_loop=4,
+        # Forces the loops to grow as much as possible.
+        target_host_overhead=1e-6,
+        checkpoint_manager=checkpoint_manager)
+    test_controller.train(steps=20)
+    self.assertEqual(test_runner.global_step, 20)
+    self.assertEqual(test_controller.steps_per_loop_tuner.steps_per_loop, 4)
+    # Fewer loops than steps were run.
+    self.assertLess(len(train_output_recorder), 20)
+    # Checkpoints are still saved every `checkpoint_interval` steps.
+    self.assertEqual(
+        [os.path.basename(path) for path in checkpoint_manager.checkpoints],
+        ["ckpt-1", "ckpt-7", "ckpt-13", "ckpt-19", "ckpt-20"])
+
+  def test_steps_per_loop_tuner(self):
+    tuner = controller.StepsPerLoopTuner(
+        min_steps_per_loop=10, max_steps_per_loop=100,
+        target_host_overhead=0.1)
+    # The first loop is ignored.
+    self.assertEqual(tuner.update(10, train_seconds=1.0, loop_seconds=9.0), 10)
+    # 1 second of host time per loop and 0.01 seconds per step need 900 steps
+    # per loop, but the value at most doubles on each update.
+    self.assertEqual(tuner.update(10, train_seconds=0.1, loop_seconds=1.1), 20)
+    self.assertEqual(tuner.update(20, train_seconds=0.2, loop_seconds=1.2), 40)
+    self.assertEqual(tuner.update(40, train_seconds=0.4, loop_seconds=1.4), 80)
+    self.assertEqual(tuner.update(80, train_seconds=0.8, loop_seconds=1.8), 100)
+    # Without host overhead, the value shrinks back down.
+    for _ in range(10):
+      tuner.update(100, train_seconds=1.0, loop_seconds=1.0)
+    self.assertEqual(tuner.steps_per_loop, 10)
+
+  def test_max_steps_per_loop_validation(self):
+    test_runner = TestRunner()
+    with self.assertRaisesRegex(ValueError, "max_steps_per_loop"):
+      controller.Controller(
+          trainer=test_runner,
+          global_step=test_runner.global_step,
+          steps_per_loop=10,
+          max_steps_per_loop=5)
+
   def test_evaluate_with_nested_summaries(self):
     test_evaluator = TestEvaluatorWithNestedSummary()
     test_controller = controller.Controller(
@@ -62,10 +62,53 @@ class StandardTrainerOptions:
       `True`, this optimization creates two `tf.function`s with two XLA programs
       (one with summary calls, and one without). The program with summaries runs
       only for one step when summaries should be recorded.
+    enable_input_wait_timing: A boolean indicating whether to measure the time
+      `train_step` spends waiting for `next()` on the training iterators. The
+      iterators are wrapped so that each `next()` call is timed in the graph
+      with `tf.timestamp`, and the accumulated seconds can be retrieved with
+      `StandardTrainer.input_wait_seconds()`. Only `next()`/`get_next()` calls
+      are timed.
   """
   use_tf_function: bool = True
   use_tf_while_loop: bool = True
   use_tpu_summary_optimization: bool = False
+  enable_input_wait_timing: bool = False
+
+
+class _InputWaitTimingIterator:
+  """Wraps an iterator to accumulate the time spent waiting in `next()`."""
+
+  def __init__(self, iterator, input_wait_seconds: tf.Variable):
+    self._iterator = iterator
+    self._input_wait_seconds = input_wait_seconds
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    return self.get_next()
+
+  @property
+  def element_spec(self):
+    return self._iterator.element_spec
+
+  def get_next(self):
+    """Returns the next element, adding the time waited for it."""
+    start = tf.timestamp()
+    with tf.control_dependencies([start]):
+      element = next(self._iterator)
+    flat_element = tf.nest.flatten(element, expand_composites=True)
+    with tf.control_dependencies(flat_element):
+      wait_seconds = tf.timestamp() - start
+    update = self._input_wait_seconds.assign_add(wait_seconds)
+    # Makes the element depend on the update, so that it also runs inside
+    # `tf.while_loop` bodies.
+    outputs = []
+    with tf.control_dependencies([update]):
+      for tensor in flat_element:
+        with tf.device(tensor.device):
+          outputs.append(tf.identity(tensor))
+    return tf.nest.pack_sequence_as(element, outputs, expand_composites=True)
 
 
 class StandardTrainer(runner.AbstractTrainer, metaclass=abc.ABCMeta):
@@ -105,6 +148,10 @@ class StandardTrainer(runner.AbstractTrainer, metaclass=abc.ABCMeta):
     self._train_dataset = train_dataset
     self._train_iter = None
     self._train_loop_fn = None
+    self._input_wait_seconds = None
+    if options.enable_input_wait_timing:
+      self._input_wait_seconds = tf.Variable(
+          0.0, dtype=tf.float64, trainable=False, name="input_wait_seconds")
 
   def create_train_loop_fn(self):
     """Creates a training loop from the current step function and options.
@@ -142,10 +189,29 @@ class StandardTrainer(runner.AbstractTrainer, metaclass=abc.ABCMeta):
 
     if self._train_iter is None:
       self._train_iter = tf.nest.map_structure(iter, self.train_dataset)
+      if self._input_wait_seconds is not None:
+        self._train_iter = tf.nest.map_structure(
+            lambda it: _InputWaitTimingIterator(it, self._input_wait_seconds),
+            self._train_iter)
 
     self._train_loop_fn(self._train_iter, num_steps)
     return self.train_loop_end()
 
+  def input_wait_seconds(self) -> Optional[float]:
+    """Returns the seconds spent waiting for input since the last call.
+
+    Returns:
+      The seconds `train_step` spent in `next()` on the training iterators
+      since the previous call, or `None` if `enable_input_wait_timing` is not
+      set in the `StandardTrainerOptions`. Reading the value waits for pending
+      train steps to complete.
+    """
+    if self._input_wait_seconds is None:
+      return None
+    seconds = float(self._input_wait_seconds.numpy())
+    self._input_wait_seconds.assign(0.0)
+    return seconds
+
   def train_loop_begin(self):
     """Called once at the beginning of the training loop.
 
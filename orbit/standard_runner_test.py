@@ -14,6 +14,8 @@
 
 """Tests for orbit.standard_runner."""
 
+import time
+
 from absl.testing import parameterized
 
 from orbit import standard_runner
@@ -58,6 +60,30 @@ class TestTrainer(standard_runner.StandardTrainer):
     return self.global_step.numpy()
 
 
+class SlowInputTrainer(standard_runner.StandardTrainer):
+  """A StandardTrainer subclass whose input takes 10ms per element."""
+
+  def __init__(self, options=None):
+    self.strategy = tf.distribute.get_strategy()
+    self.num_examples = tf.Variable(0, dtype=tf.int64)
+
+    def dataset_fn(input_context=None):
+      del input_context
+      return tf.data.Dataset.range(100).map(
+          lambda x: tf.py_function(lambda y: (time.sleep(0.01), y)[1], [x],
+                                   tf.int64))
+
+    dataset = self.strategy.distribute_datasets_from_function(dataset_fn)
+    super().__init__(train_dataset=dataset, options=options)
+
+  def train_step(self, iterator):
+
+    def replica_step(x):
+      self.num_examples.assign_add(tf.size(x, out_type=tf.int64))
+
+    self.strategy.run(replica_step, args=(next(iterator),))
+
+
 class TestEvaluator(standard_runner.StandardEvaluator):
   """A StandardEvaluator subclass for tests."""
 
@@ -122,6 +148,26 @@ class StandardRunnerTest(parameterized.TestCase):
     trainer = TestTrainer(options)
     self.assertEqual(trainer.train(tf.constant(10)), 10)
 
+  @parameterized.named_parameters(("use_tf_while_loop", True, True),
+                                  ("use_tf_function", False, True),
+                                  ("eager", False, False))
+  def test_trainer_input_wait_timing(self, use_tf_while_loop, use_tf_function):
+    options = standard_runner.StandardTrainerOptions(
+        use_tf_while_loop=use_tf_while_loop,
+        use_tf_function=use_tf_function,
+        enable_input_wait_timing=True)
+    trainer = SlowInputTrainer(options)
+    for _ in range(2):
+      trainer.train(tf.constant(5))
+      self.assertBetween(trainer.input_wait_seconds(), 0.05, 5.0)
+    self.assertEqual(trainer.num_examples.numpy(), 10)
+    self.assertEqual(trainer.input_wait_seconds(), 0.0)
+
+  def test_trainer_without_input_wait_timing(self):
+    trainer = SlowInputTrainer()
+    trainer.train(tf.constant(5))
+    self.assertIsNone(trainer.input_wait_seconds())
+
   @parameterized.named_parameters(("use_tf_while_loop", True), ("", False))
   def test_default_evaluator(self, use_tf_while_loop):
     options = standard_runner.StandardEvaluatorOptions(
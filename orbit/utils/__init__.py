@@ -24,6 +24,7 @@ from orbit.utils.loop_fns import create_loop_fn
 from orbit.utils.loop_fns import create_tf_while_loop_fn
 from orbit.utils.loop_fns import LoopFnWithSummaries
 
+from orbit.utils.summary_manager import BufferedSummaryManager
 from orbit.utils.summary_manager import SummaryManager
 
 from orbit.utils.tpu_summaries import OptionalSummariesFunction
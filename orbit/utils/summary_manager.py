@@ -12,12 +12,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Provides a utility class for managing summary writing."""
+"""Provides utility classes for managing summary writing."""
 
+import atexit
 import os
+import threading
+import time
+import weakref
+
+from orbit.utils import common
 
 import tensorflow as tf
 
+# The enabled `BufferedSummaryManager` instances, closed at exit. They are
+# referenced weakly so that registering them does not keep them alive.
+_buffered_summary_managers = weakref.WeakSet()
+
+
+def _close_buffered_summary_managers():
+  for manager in list(_buffered_summary_managers):
+    manager.close()
+
+
+atexit.register(_close_buffered_summary_managers)
+
 
 class SummaryManager:
   """A utility class for managing summary writing."""
@@ -100,11 +118,136 @@ class SummaryManager:
       return
     self._write_summaries(summary_dict)
 
-  def _write_summaries(self, summary_dict, relative_path=""):
+  def _write_summaries(self, summary_dict, relative_path="", step=None):
+    step = self._global_step if step is None else step
     for name, value in summary_dict.items():
       if isinstance(value, dict):
         self._write_summaries(
-            value, relative_path=os.path.join(relative_path, name))
+            value, relative_path=os.path.join(relative_path, name), step=step)
       else:
         with self.summary_writer(relative_path).as_default():
-          self._summary_fn(name, value, step=self._global_step)
+          self._summary_fn(name, value, step=step)
+
+
+class BufferedSummaryManager(SummaryManager):
+  """A `SummaryManager` that writes summaries in bulk on a background thread.
+
+  Calls to `write_summaries` only record the values (converted to NumPy) along
+  with the current global step. The recorded summaries are written and flushed
+  by a background thread once `max_buffered_summaries` calls have accumulated,
+  or at least every `flush_secs` seconds. Since `flush()` is called after every
+  loop by the `Controller`, here it only hands the buffer off to the background
+  thread if one of these thresholds has been reached, unless `force=True` is
+  passed. Use `close()` to write all buffered summaries synchronously. `close()`
+  is also called at exit for all instances still alive.
+  """
+
+  def __init__(self,
+               summary_dir,
+               summary_fn,
+               global_step=None,
+               max_buffered_summaries=100,
+               flush_secs=30.0):
+    """Initializes the `BufferedSummaryManager` instance.
+
+    Args:
+      summary_dir: The directory in which to write summaries. If `None`, all
+        summary writing operations provided by this class are no-ops.
+      summary_fn: A callable defined accepting `name`, `value`, and `step`
+        parameters, making calls to `tf.summary` functions to write summaries.
+      global_step: A `tf.Variable` containing the global step value.
+      max_buffered_summaries: The number of `write_summaries` calls to buffer
+        before handing them off to the background thread.
+      flush_secs: The maximum number of seconds between background writes.
+    """
+    super().__init__(summary_dir, summary_fn, global_step=global_step)
+    self._max_buffered_summaries = max_buffered_summaries
+    self._flush_secs = flush_secs
+    self._buffer = []
+    self._last_write_time = time.time()
+    self._lock = threading.Lock()
+    # Serializes the actual writes, which may come from either thread.
+    self._write_lock = threading.Lock()
+    self._wake_up = threading.Event()
+    self._closed = False
+    self._thread = None
+    if self._enabled:
+      _buffered_summary_managers.add(self)
+
+  def write_summaries(self, summary_dict):
+    """Buffers summaries for the given dictionary of values.
+
+    See `SummaryManager.write_summaries` for the structure of `summary_dict`.
+
+    Args:
+      summary_dict: A dictionary of values, possibly nested.
+    """
+    if not self._enabled:
+      return
+    step = common.get_value(self._global_step)
+    values = tf.nest.map_structure(common.get_value, summary_dict)
+    with self._lock:
+      self._buffer.append((step, values))
+      num_buffered = len(self._buffer)
+      self._closed = False
+      if self._thread is None:
+        self._thread = threading.Thread(
+            target=self._run, name="orbit_summary_writer", daemon=True)
+        self._thread.start()
+    if num_buffered >= self._max_buffered_summaries:
+      self._wake_up.set()
+
+  def flush(self, force=False):
+    """Hands buffered summaries off to be written if a threshold is reached.
+
+    Args:
+      force: Whether to hand off all buffered summaries regardless of the
+        thresholds, e.g. at the end of a training interval. They are still
+        written by the background thread, without waiting for it.
+    """
+    if not self._enabled:
+      return
+    with self._lock:
+      num_buffered = len(self._buffer)
+    if (force or num_buffered >= self._max_buffered_summaries or
+        time.time() - self._last_write_time >= self._flush_secs):
+      self._wake_up.set()
+
+  def close(self):
+    """Synchronously writes and flushes all buffered summaries.
+
+    This also stops the background thread. It will be restarted if more
+    summaries are written afterwards.
+    """
+    if not self._enabled:
+      return
+    with self._lock:
+      self._closed = True
+      thread = self._thread
+    self._wake_up.set()
+    if thread is not None:
+      thread.join()
+    # Writes anything left over, e.g. if the background thread failed.
+    self._write_buffered()
+
+  def _run(self):
+    """Runs the background writer loop until `close()` is called."""
+    while True:
+      self._wake_up.wait(timeout=self._flush_secs)
+      self._wake_up.clear()
+      self._write_buffered()
+      with self._lock:
+        if self._closed and not self._buffer:
+          self._thread = None
+          return
+
+  def _write_buffered(self):
+    with self._write_lock:
+      with self._lock:
+        buffered, self._buffer = self._buffer, []
+        self._last_write_time = time.time()
+      if not buffered:
+        return
+      for step, summary_dict in buffered:
+        self._write_summaries(summary_dict, step=step)
+      super().flush()
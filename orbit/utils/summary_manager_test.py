@@ -0,0 +1,111 @@
+# Copyright 2021 The Orbit Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for orbit.utils.summary_manager."""
+
+import gc
+import os
+import time
+import weakref
+
+from orbit.utils import summary_manager
+
+import tensorflow as tf
+
+
+def read_scalars(summary_dir):
+  """Returns a list of (step, tag, value) tuples from the event files."""
+  scalars = []
+  for event_path in tf.io.gfile.glob(os.path.join(summary_dir, "events*")):
+    for event in tf.compat.v1.train.summary_iterator(event_path):
+      for value in event.summary.value:
+        scalars.append(
+            (event.step, value.tag, tf.make_ndarray(value.tensor).item()))
+  return sorted(scalars)
+
+
+class BufferedSummaryManagerTest(tf.test.TestCase):
+
+  def test_close_writes_buffered_summaries(self):
+    summary_dir = self.get_temp_dir()
+    step = tf.Variable(0, dtype=tf.int64)
+    manager = summary_manager.BufferedSummaryManager(
+        summary_dir, tf.summary.scalar, global_step=step, flush_secs=3600)
+    for i in range(3):
+      step.assign(i)
+      manager.write_summaries({
+          "loss": tf.constant(float(i)),
+          "nested": {
+              "accuracy": 0.5
+          },
+      })
+      manager.flush()
+    manager.close()
+
+    self.assertEqual(
+        read_scalars(summary_dir), [(0, "loss", 0.0), (1, "loss", 1.0),
+                                    (2, "loss", 2.0)])
+    self.assertLen(read_scalars(os.path.join(summary_dir, "nested")), 3)
+
+  def test_writes_when_buffer_is_full(self):
+    summary_dir = self.get_temp_dir()
+    step = tf.Variable(0, dtype=tf.int64)
+    manager = summary_manager.BufferedSummaryManager(
+        summary_dir,
+        tf.summary.scalar,
+        global_step=step,
+        max_buffered_summaries=2,
+        flush_secs=3600)
+    manager.write_summaries({"loss": 1.0})
+    manager.write_summaries({"loss": 2.0})
+    # The background thread writes the full buffer without a call to `close()`.
+    deadline = time.time() + 30
+    while len(read_scalars(summary_dir)) < 2 and time.time() < deadline:
+      time.sleep(0.1)
+    self.assertLen(read_scalars(summary_dir), 2)
+    manager.close()
+
+  def test_forced_flush_writes_in_background(self):
+    summary_dir = self.get_temp_dir()
+    manager = summary_manager.BufferedSummaryManager(
+        summary_dir, tf.summary.scalar, global_step=tf.Variable(0, tf.int64),
+        flush_secs=3600)
+    manager.write_summaries({"loss": 1.0})
+    manager.flush()
+    manager.flush(force=True)
+    deadline = time.time() + 30
+    while not read_scalars(summary_dir) and time.time() < deadline:
+      time.sleep(0.1)
+    self.assertEqual(read_scalars(summary_dir), [(0, "loss", 1.0)])
+    manager.close()
+
+  def test_closed_managers_are_not_kept_alive(self):
+    manager = summary_manager.BufferedSummaryManager(
+        self.get_temp_dir(), tf.summary.scalar,
+        global_step=tf.Variable(0, tf.int64))
+    manager.write_summaries({"loss": 1.0})
+    manager.close()
+    manager_ref = weakref.ref(manager)
+    del manager
+    gc.collect()
+    self.assertIsNone(manager_ref())
+
+  def test_disabled(self):
+    manager = summary_manager.BufferedSummaryManager(None, tf.summary.scalar)
+    manager.write_summaries({"loss": 1.0})
+    manager.flush()
+    manager.close()
+
+
+if __name__ == "__main__":
+  tf.test.main()